@@ -94,6 +94,10 @@ function deploy-lambda:cd {
     cd "$SRC_DIR"
     zip -r "$LAMBDA_HANDLER_ZIP_FPATH" ./
 
+    # ship the prebuilt OpenAPI schema so the function can serve it rather than generating it;
+    # set OPENAPI_SCHEMA_PATH=/var/task/openapi.json on the function to use it
+    zip -j "$LAMBDA_HANDLER_ZIP_FPATH" "$THIS_DIR/openapi.json"
+
     cd "$THIS_DIR"
 
     # publish the lambda "deployment package" (the handler)
@@ -136,6 +140,24 @@ function test:quick {
     run-tests -m "not slow" ${@:-"$THIS_DIR/tests/"}
 }
 
+# serve the API with the production, multi-worker server; options can be passed as flags
+# (example) ./run.sh serve --workers 4 --port 8000
+function serve {
+    python -m files_api.server "$@"
+}
+
+# measure the production server's throughput as its worker count grows
+# (example) ./run.sh load-test --workers 1 2 4 8 --duration 30
+function load-test {
+    python "$THIS_DIR/scripts/load-test.py" "$@"
+}
+
+# time the Lambda handler's cold start and break its import time down by package
+# (example) ./run.sh benchmark:cold-start --runs 10 --output cold-start.json
+function benchmark:cold-start {
+    python "$THIS_DIR/scripts/benchmark-cold-start.py" "$@"
+}
+
 # execute tests against the installed package; assumes the wheel is already installed
 function test:ci {
     INSTALLED_PKG_DIR="$(python -c 'import files_api; print(files_api.__path__[0])')"
@@ -0,0 +1,196 @@
+"""
+Benchmark the cold start of the Lambda handler.
+
+Each run starts a fresh Python process, like a Lambda cold start, and measures:
+
+- the time to import `files_api.aws_lambda_handler` (which creates the app),
+- the time for the handler to answer its first request, for the docs' OpenAPI schema,
+  with the schema generated from the routes and with the prebuilt `openapi.json`,
+- which packages the import time goes to, using `python -X importtime`.
+
+Run it with:
+
+    python scripts/benchmark-cold-start.py --runs 5 --output cold-start.json
+
+Keep the JSON output of each release to track the cold start over time.
+"""
+
+# pylint: disable=invalid-name
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import (
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+)
+
+THIS_DIR = Path(__file__).parent
+PROJECT_DIR = THIS_DIR.parent
+OPENAPI_SCHEMA_PATH = PROJECT_DIR / "openapi.json"
+
+HANDLER_MODULE = "files_api.aws_lambda_handler"
+
+# runs in a fresh interpreter and prints its timings as JSON
+PROBE_CODE = f"""
+import json, time
+start = time.perf_counter()
+from {HANDLER_MODULE} import handler
+imported = time.perf_counter()
+response = handler({{
+    "resource": "/{{proxy+}}",
+    "path": "/openapi.json",
+    "httpMethod": "GET",
+    "headers": {{"Host": "localhost"}},
+    "multiValueHeaders": {{"Host": ["localhost"]}},
+    "queryStringParameters": None,
+    "multiValueQueryStringParameters": None,
+    "requestContext": {{"stage": "prod", "resourcePath": "/{{proxy+}}", "identity": {{"sourceIp": "127.0.0.1"}}}},
+    "body": None,
+    "isBase64Encoded": False,
+}}, None)
+responded = time.perf_counter()
+print(json.dumps({{
+    "status_code": response["statusCode"],
+    "import_seconds": imported - start,
+    "first_response_seconds": responded - imported,
+}}))
+"""
+
+
+class Args(NamedTuple):
+    """CLI arguments for the script."""
+
+    runs: int
+    top: int
+    output: Optional[Path]
+
+
+class ImportTime(NamedTuple):
+    """Time spent importing a top-level package and its submodules."""
+
+    package: str
+    self_seconds: float
+
+
+def main() -> None:
+    args = parse_args()
+
+    results: Dict[str, object] = {
+        "version": (PROJECT_DIR / "version.txt").read_text().strip(),
+        "python": sys.version.split()[0],
+    }
+    for mode, openapi_schema_path in [
+        ("generated_openapi", None),
+        ("prebuilt_openapi", OPENAPI_SCHEMA_PATH),
+    ]:
+        probes = [run_probe(openapi_schema_path) for _ in range(args.runs)]
+        results[mode] = {
+            key: statistics.median(probe[key] for probe in probes)
+            for key in ["process_seconds", "import_seconds", "first_response_seconds"]
+        }
+        print(f"{mode} (median of {args.runs} runs):")
+        for key, seconds in results[mode].items():  # type: ignore[attr-defined]
+            print(f"  {key:<24} {seconds * 1000:8.1f} ms")
+
+    import_times = get_import_times()
+    results["import_seconds_by_package"] = {
+        import_time.package: import_time.self_seconds for import_time in import_times
+    }
+    print(f"\nimport time by package (top {args.top}):")
+    for import_time in import_times[: args.top]:
+        print(f"  {import_time.package:<24} {import_time.self_seconds * 1000:8.1f} ms")
+    print(f"  {'total':<24} {sum(t.self_seconds for t in import_times) * 1000:8.1f} ms")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"\n✅ Wrote results to {args.output}")
+
+
+def parse_args() -> Args:
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0].strip()
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="Cold starts to take the median of"
+    )
+    parser.add_argument(
+        "--top", type=int, default=15, help="Packages to show the import time of"
+    )
+    parser.add_argument("--output", type=Path, help="Path to write the results to")
+    args = parser.parse_args()
+    return Args(runs=args.runs, top=args.top, output=args.output)
+
+
+def get_probe_env(openapi_schema_path: Optional[Path] = None) -> Dict[str, str]:
+    env = {
+        **os.environ,
+        "S3_BUCKET_NAME": os.environ.get("S3_BUCKET_NAME", "placeholder"),
+        "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+    }
+    env.pop("OPENAPI_SCHEMA_PATH", None)
+    if openapi_schema_path:
+        env["OPENAPI_SCHEMA_PATH"] = str(openapi_schema_path)
+    return env
+
+
+def run_probe(openapi_schema_path: Optional[Path] = None) -> Dict[str, float]:
+    """Cold start the handler in a new process and time its first response."""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE_CODE],
+        env=get_probe_env(openapi_schema_path),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    process_seconds = time.perf_counter() - start
+
+    probe = json.loads(completed.stdout.strip().splitlines()[-1])
+    if probe["status_code"] != 200:
+        raise RuntimeError(f"The first request failed: {probe}")
+    return {**probe, "process_seconds": process_seconds}
+
+
+def get_import_times() -> List[ImportTime]:
+    """
+    Break the import time of the handler down by top-level package, slowest first.
+
+    Uses the self time of each module reported by `python -X importtime`, so that
+    packages importing each other are not counted twice.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {HANDLER_MODULE}"],
+        env=get_probe_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    self_microseconds_by_package: Dict[str, int] = {}
+    for line in completed.stderr.splitlines():
+        # e.g. "import time:       512 |       1024 |   files_api.routes"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_microseconds, _, module = line.removeprefix("import time:").split("|")
+        package = module.strip().split(".")[0]
+        self_microseconds_by_package[package] = self_microseconds_by_package.get(
+            package, 0
+        ) + int(self_microseconds)
+
+    import_times = [
+        ImportTime(package=package, self_seconds=microseconds / 1_000_000)
+        for package, microseconds in self_microseconds_by_package.items()
+    ]
+    return sorted(import_times, key=lambda t: t.self_seconds, reverse=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Benchmark the overhead of the app-wide exception handling middleware.
+
+Compares the pure ASGI `BroadExceptionMiddleware` with the `app.middleware("http")`
+(Starlette `BaseHTTPMiddleware`) implementation it replaced, and with no middleware at
+all, by calling the apps directly, without a server or network in between:
+
+- requests per second for a small JSON response,
+- the time added per chunk of a streamed response, as sent by `GET /v1/files`.
+
+Run it with:
+
+    python scripts/benchmark-error-middleware.py --requests 20000 --chunks 1000
+"""
+
+# pylint: disable=invalid-name
+
+import argparse
+import asyncio
+import time
+import traceback
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    NamedTuple,
+)
+
+from fastapi import (
+    FastAPI,
+    Request,
+    status,
+)
+from fastapi.responses import (
+    JSONResponse,
+    StreamingResponse,
+)
+
+from files_api.errors import BroadExceptionMiddleware
+
+CHUNK = b"x" * 64 * 1024
+
+
+class Args(NamedTuple):
+    """CLI arguments for the script."""
+
+    requests: int
+    chunks: int
+
+
+async def handle_broad_exceptions(request: Request, call_next):
+    """Catch exceptions like the `app.middleware("http")` function `BroadExceptionMiddleware` replaced."""
+    try:
+        return await call_next(request)
+
+    except Exception:  # pylint: disable=broad-except
+        traceback.print_exc()
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": "Internal server error"},
+        )
+
+
+def create_benchmark_app(add_middleware: Callable[[FastAPI], Any]) -> FastAPI:
+    app = FastAPI()
+    add_middleware(app)
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream(chunks: int):
+        async def iter_content():
+            for _ in range(chunks):
+                yield CHUNK
+
+        return StreamingResponse(iter_content())
+
+    return app
+
+
+APPS: Dict[str, Callable[[FastAPI], Any]] = {
+    "no middleware": lambda app: None,
+    "BaseHTTPMiddleware": lambda app: app.middleware("http")(handle_broad_exceptions),
+    # mypy can't match middleware classes to the `ParamSpec` protocol of the stubs
+    "pure ASGI": lambda app: app.add_middleware(BroadExceptionMiddleware),  # type: ignore[call-arg,arg-type]
+}
+
+
+def main() -> None:
+    args = parse_args()
+    print(f"{'':<20} {'req/s':>10} {'µs/chunk':>10}")
+    for name, add_middleware in APPS.items():
+        app = create_benchmark_app(add_middleware)
+        requests_per_second = asyncio.run(measure_requests_per_second(app, args))
+        microseconds_per_chunk = asyncio.run(measure_seconds_per_chunk(app, args)) * 1e6
+        print(
+            f"{name:<20} {requests_per_second:>10.0f} {microseconds_per_chunk:>10.2f}"
+        )
+
+
+def parse_args() -> Args:
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0].strip()
+    )
+    parser.add_argument(
+        "--requests", type=int, default=10_000, help="Small requests to time"
+    )
+    parser.add_argument(
+        "--chunks", type=int, default=1_000, help="Chunks per streamed response"
+    )
+    args = parser.parse_args()
+    return Args(requests=args.requests, chunks=args.chunks)
+
+
+async def measure_requests_per_second(app: FastAPI, args: Args) -> float:
+    await call(app, "/small")  # warm up
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        await call(app, "/small")
+    return args.requests / (time.perf_counter() - start)
+
+
+async def measure_seconds_per_chunk(app: FastAPI, args: Args) -> float:
+    query_string = f"chunks={args.chunks}".encode()
+    await call(app, "/stream", query_string)  # warm up
+    repeats = 20
+    start = time.perf_counter()
+    for _ in range(repeats):
+        await call(app, "/stream", query_string)
+    return (time.perf_counter() - start) / (repeats * args.chunks)
+
+
+async def call(app: FastAPI, path: str, query_string: bytes = b"") -> None:
+    """Send a GET request straight to the app, discarding the response."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string,
+        "headers": [(b"host", b"benchmark")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("benchmark", 80),
+    }
+    request_sent = False
+    response_complete = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            response_complete.set()
+
+    await app(scope, receive, send)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark generating text with a new OpenAI client per call vs. the app's shared clients.
+
+Runs the mock OpenAI server from `tests/mocks`, then times chat completions made the way
+`generate_files` used to (a new `AsyncOpenAI()`, and so new connections, per call) and
+through `GenerationClients`, whose pooled connections are reused across calls.
+
+The mock server is local and plain HTTP; against api.openai.com, every new connection
+also costs a TLS handshake, so the difference is larger.
+
+Run it with:
+
+    python scripts/benchmark-generation-clients.py --calls 200
+"""
+
+# pylint: disable=invalid-name
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import (
+    Awaitable,
+    Callable,
+    List,
+)
+
+import httpx
+
+from files_api.generate_files import get_text_chat_completion
+from files_api.generation_clients import GenerationClients
+from files_api.settings import Settings
+
+THIS_DIR = Path(__file__).parent
+MOCKED_OPENAI_SERVER_PY_PATH = THIS_DIR / "../tests/mocks/openai_fastapi_mock_app.py"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0].strip()
+    )
+    parser.add_argument("--calls", type=int, default=200, help="Completions to time")
+    args = parser.parse_args()
+
+    port = get_free_port()
+    mock_server = start_mock_server(port)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["OPENAI_API_KEY"] = "mocked_key"
+    try:
+        asyncio.run(run_benchmarks(args.calls))
+    finally:
+        mock_server.terminate()
+        mock_server.wait()
+
+
+async def run_benchmarks(calls: int) -> None:
+    clients = GenerationClients(Settings(s3_bucket_name="placeholder"))
+    try:
+        benchmarks = {
+            "new client per call": lambda: get_text_chat_completion("prompt"),
+            "shared clients": lambda: get_text_chat_completion(
+                "prompt", client=clients.openai_client
+            ),
+        }
+        print(f"{'':<22} {'mean':>9} {'p50':>9} {'p99':>9}")
+        for name, generate in benchmarks.items():
+            latencies = sorted(await time_calls(generate, calls))
+            print(
+                f"{name:<22} "
+                f"{statistics.mean(latencies) * 1000:7.2f}ms "
+                f"{statistics.median(latencies) * 1000:7.2f}ms "
+                f"{latencies[int(len(latencies) * 0.99)] * 1000:7.2f}ms"
+            )
+    finally:
+        await clients.aclose()
+
+
+async def time_calls(generate: Callable[[], Awaitable], calls: int) -> List[float]:
+    await generate()  # warm up
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await generate()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_server(port: int) -> subprocess.Popen:
+    # pylint: disable=consider-using-with
+    process = subprocess.Popen(
+        [sys.executable, str(MOCKED_OPENAI_SERVER_PY_PATH)],
+        env={**os.environ, "OPENAI_MOCK_PORT": str(port)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/")
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"The mock OpenAI server did not start on port {port}.")
+
+
+if __name__ == "__main__":
+    main()
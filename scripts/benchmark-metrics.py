@@ -0,0 +1,166 @@
+"""
+Benchmark the overhead of recording metrics.
+
+Times, without a server or network in between:
+
+- a call to a function decorated with `instrument_calls`, against the bare function,
+  for plain and coroutine functions,
+- a request to an app with and without `MetricsMiddleware`.
+
+Run it with:
+
+    python scripts/benchmark-metrics.py --calls 200000 --requests 20000
+"""
+
+# pylint: disable=invalid-name
+
+import argparse
+import asyncio
+import time
+from typing import (
+    Awaitable,
+    Callable,
+    NamedTuple,
+)
+
+from fastapi import FastAPI
+
+from files_api.metrics import (
+    MetricsMiddleware,
+    instrument_calls,
+)
+
+
+class Args(NamedTuple):
+    """CLI arguments for the script."""
+
+    calls: int
+    requests: int
+
+
+def noop() -> None:
+    ...
+
+
+async def async_noop() -> None:
+    ...
+
+
+def main() -> None:
+    args = parse_args()
+
+    print(f"{'':<24} {'µs/call':>10} {'overhead':>10}")
+    bare = measure_seconds_per_call(noop, args.calls)
+    instrumented = measure_seconds_per_call(
+        instrument_calls("benchmark")(noop), args.calls
+    )
+    print_row("function", bare, instrumented)
+
+    bare = asyncio.run(measure_seconds_per_await(async_noop, args.calls))
+    instrumented = asyncio.run(
+        measure_seconds_per_await(instrument_calls("benchmark")(async_noop), args.calls)
+    )
+    print_row("coroutine function", bare, instrumented)
+
+    bare = asyncio.run(measure_seconds_per_request(create_benchmark_app(False), args))
+    instrumented = asyncio.run(
+        measure_seconds_per_request(create_benchmark_app(True), args)
+    )
+    print_row("request", bare, instrumented)
+
+
+def print_row(name: str, bare_seconds: float, instrumented_seconds: float) -> None:
+    overhead_microseconds = (instrumented_seconds - bare_seconds) * 1e6
+    print(
+        f"{name:<24} {instrumented_seconds * 1e6:>10.2f} {overhead_microseconds:>10.2f}"
+    )
+
+
+def parse_args() -> Args:
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0].strip()
+    )
+    parser.add_argument(
+        "--calls", type=int, default=100_000, help="Function calls to time"
+    )
+    parser.add_argument("--requests", type=int, default=10_000, help="Requests to time")
+    args = parser.parse_args()
+    return Args(calls=args.calls, requests=args.requests)
+
+
+def create_benchmark_app(record_metrics: bool) -> FastAPI:
+    app = FastAPI()
+    if record_metrics:
+        # mypy can't match middleware classes to the `ParamSpec` protocol of the stubs
+        app.add_middleware(MetricsMiddleware)  # type: ignore[call-arg,arg-type]
+
+    @app.get("/small/{name}")
+    async def small(name: str):
+        return {"name": name}
+
+    return app
+
+
+def measure_seconds_per_call(function: Callable[[], None], calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls
+
+
+async def measure_seconds_per_await(
+    function: Callable[[], Awaitable[None]], calls: int
+) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        await function()
+    return (time.perf_counter() - start) / calls
+
+
+async def measure_seconds_per_request(app: FastAPI, args: Args) -> float:
+    await call(app, "/small/warm-up")
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        await call(app, "/small/benchmark")
+    return (time.perf_counter() - start) / args.requests
+
+
+async def call(app: FastAPI, path: str) -> None:
+    """Send a GET request straight to the app, discarding the response."""
+    # the benchmark scripts each run on their own, so this is a copy of the error
+    # middleware benchmark's `call`
+    # pylint: disable=duplicate-code
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"benchmark")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("benchmark", 80),
+    }
+    request_sent = False
+    response_complete = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            response_complete.set()
+
+    await app(scope, receive, send)
+
+
+if __name__ == "__main__":
+    main()
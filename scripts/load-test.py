@@ -0,0 +1,222 @@
+"""
+Load test the production server (`files_api.server`) with an increasing number of workers.
+
+For each worker count, the script starts the server, sends requests from several client
+processes over keep-alive connections for a while, and reports the throughput and
+latency. Throughput should grow roughly linearly with the workers, up to the number of
+CPUs left over by the load generator.
+
+Run it with:
+
+    python scripts/load-test.py --workers 1 2 4 --duration 10 --output load-test.json
+
+The default path needs no AWS resources. For a fair picture on a single host, leave some
+CPUs to the client processes, or point `--url` at a server running elsewhere.
+"""
+
+# pylint: disable=invalid-name
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import (
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+)
+
+import httpx
+
+DEFAULT_PATH = "/v1/stats/deduplication"
+SERVER_STARTUP_TIMEOUT_SECONDS = 30
+
+
+class Args(NamedTuple):
+    """CLI arguments for the script."""
+
+    workers: List[int]
+    duration: float
+    connections: int
+    clients: int
+    path: str
+    url: Optional[str]
+    output: Optional[Path]
+
+
+class LoadResult(NamedTuple):
+    """Requests sent by one client process."""
+
+    latencies_seconds: List[float]
+    errors: int
+
+
+def main() -> None:
+    args = parse_args()
+
+    results = []
+    for worker_count in args.workers if args.url is None else [0]:
+        if args.url is None:
+            port = get_free_port()
+            server = start_server(worker_count, port)
+            url = f"http://127.0.0.1:{port}{args.path}"
+        else:
+            server, url = None, args.url + args.path
+
+        try:
+            result = run_load(url, args.duration, args.connections, args.clients)
+        finally:
+            if server is not None:
+                stop_server(server)
+
+        result["workers"] = worker_count
+        results.append(result)
+        baseline = results[0]["requests_per_second"]
+        print(
+            f"workers={worker_count or 'n/a':<4} "
+            f"{result['requests_per_second']:10.0f} req/s "
+            f"(x{result['requests_per_second'] / baseline:.2f})  "
+            f"p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms "
+            f"errors={result['errors']}"
+        )
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"✅ Wrote results to {args.output}")
+
+
+def parse_args() -> Args:
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n", maxsplit=1)[0].strip()
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, max(1, cpu_count // 2)}),
+        help="Worker counts to test the server with",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=10, help="Seconds to send requests for"
+    )
+    parser.add_argument(
+        "--connections", type=int, default=64, help="Concurrent connections in total"
+    )
+    parser.add_argument(
+        "--clients",
+        type=int,
+        default=max(1, cpu_count // 2),
+        help="Client processes sending the requests",
+    )
+    parser.add_argument("--path", default=DEFAULT_PATH, help="Path to request")
+    parser.add_argument(
+        "--url", help="Load test a server that is already running, e.g. on another host"
+    )
+    parser.add_argument("--output", type=Path, help="Path to write the results to")
+    args = parser.parse_args()
+    return Args(
+        workers=args.workers,
+        duration=args.duration,
+        connections=args.connections,
+        clients=args.clients,
+        path=args.path,
+        url=args.url.rstrip("/") if args.url else None,
+        output=args.output,
+    )
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(worker_count: int, port: int) -> subprocess.Popen:
+    # pylint: disable=consider-using-with
+    server = subprocess.Popen(
+        [sys.executable, "-m", "files_api.server"],
+        env={
+            **os.environ,
+            "S3_BUCKET_NAME": os.environ.get("S3_BUCKET_NAME", "placeholder"),
+            "SERVER_HOST": "127.0.0.1",
+            "SERVER_PORT": str(port),
+            "SERVER_WORKERS": str(worker_count),
+        },
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + SERVER_STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}{DEFAULT_PATH}").raise_for_status()
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.1)
+
+    stop_server(server)
+    raise RuntimeError(f"The server did not start on port {port}.")
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.send_signal(signal.SIGTERM)
+    server.wait(timeout=60)
+
+
+def run_load(url: str, duration: float, connections: int, clients: int) -> Dict:
+    connections_per_client = max(1, connections // clients)
+    with multiprocessing.Pool(clients) as pool:
+        load_results = pool.starmap(
+            run_client, [(url, duration, connections_per_client)] * clients
+        )
+
+    latencies = sorted(
+        latency for result in load_results for latency in result.latencies_seconds
+    )
+    if not latencies:
+        raise RuntimeError("No request succeeded.")
+    return {
+        "requests_per_second": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "errors": sum(result.errors for result in load_results),
+    }
+
+
+def run_client(url: str, duration: float, connections: int) -> LoadResult:
+    return asyncio.run(send_requests(url, duration, connections))
+
+
+async def send_requests(url: str, duration: float, connections: int) -> LoadResult:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def send_until_deadline(client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        while (start := time.perf_counter()) < deadline:
+            try:
+                response = await client.get(url)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except httpx.HTTPError:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=connections)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await asyncio.gather(*[send_until_deadline(client) for _ in range(connections)])
+    return LoadResult(latencies_seconds=latencies, errors=errors)
+
+
+if __name__ == "__main__":
+    main()
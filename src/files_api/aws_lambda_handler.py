@@ -1,9 +1,49 @@
 """Handler for AWS Lambda."""
 
+import asyncio
+from typing import Any
+
 from mangum import Mangum
+from mangum.protocols.lifespan import LifespanCycle
 
 from files_api.main import create_app
+from files_api.metrics import METRICS
+from files_api.settings import Settings
+from files_api.warm_up import (
+    WARM_UP_RESPONSE,
+    is_warm_up_event,
+    prime_clients,
+)
+
+# Lambda freezes the process between invocations, so jobs can't run in the background;
+# mypy doesn't know the required settings are read from the environment
+APP = create_app(Settings(generation_jobs_enabled=False))  # type: ignore[call-arg]
+EMF_NAMESPACE = APP.state.settings.metrics_emf_namespace
+if EMF_NAMESPACE:
+    METRICS.start_recording_emf()
+
+# the app's startup runs once, below, rather than around every invocation,
+# so the clients it creates live as long as the execution environment
+MANGUM_HANDLER = Mangum(APP, lifespan="off")
+
+# runs during the init phase, before the first invocation; Mangum has set up the event loop.
+# The event loop only keeps a weak reference to the lifespan task, so the cycle is kept
+# here: were it garbage collected, the app's shutdown would run and close the clients.
+LIFESPAN_CYCLE = LifespanCycle(APP, lifespan="auto")
+LIFESPAN_CYCLE.__enter__()  # pylint: disable=unnecessary-dunder-call
+prime_clients(
+    APP.state.settings,
+    APP.state.generation_clients,
+    event_loop=asyncio.get_event_loop(),
+)
 
-APP = create_app()
 
-handler = Mangum(APP)
+def handler(event: Any, context: Any) -> Any:
+    """Answer warm-up pings directly and pass everything else to the app."""
+    if is_warm_up_event(event):
+        return WARM_UP_RESPONSE
+    try:
+        return MANGUM_HANDLER(event, context)
+    finally:
+        if EMF_NAMESPACE:
+            METRICS.print_emf(EMF_NAMESPACE)
@@ -0,0 +1,351 @@
+"""
+Handler for AWS Lambda with response streaming.
+
+`aws_lambda_handler` returns each response as a whole, so Mangum buffers streamed
+downloads in memory, they are capped by Lambda's response payload limit, and the first
+byte only leaves once the last one has been read from S3. Lambda can stream responses
+instead (function URLs with the `RESPONSE_STREAM` invoke mode), but the managed Python
+runtime cannot, so this module runs the Lambda Runtime API loop itself and sends each
+body chunk as soon as the app produces it.
+
+Run it in place of the managed runtime's loop, e.g. with an `AWS_LAMBDA_EXEC_WRAPPER`
+script that runs `exec python -m files_api.aws_lambda_streaming_handler`, or as the
+`bootstrap` of an OS-only runtime.
+
+Docs: https://docs.aws.amazon.com/lambda/latest/dg/runtimes-custom.html
+"""
+
+import asyncio
+import base64
+import http.client
+import json
+import os
+import traceback
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from urllib.parse import unquote
+
+from mangum.protocols.lifespan import LifespanCycle
+
+from files_api.main import create_app
+from files_api.metrics import METRICS
+from files_api.settings import Settings
+from files_api.warm_up import (
+    WARM_UP_RESPONSE,
+    is_warm_up_event,
+    prime_clients,
+)
+
+try:
+    from starlette.types import ASGIApp
+except ImportError:
+    ...
+
+RUNTIME_API_PATH = "/2018-06-01/runtime"
+
+# function URLs expect a JSON "prelude" with the status and headers, then 8 null bytes,
+# then the body
+HTTP_INTEGRATION_RESPONSE_CONTENT_TYPE = (
+    "application/vnd.awslambda.http-integration-response"
+)
+PRELUDE_DELIMITER = b"\x00" * 8
+
+
+class Invocation(NamedTuple):
+    """An event to handle, handed out by the Runtime API."""
+
+    request_id: str
+    event: Dict[str, Any]
+
+
+class ResponseStream:
+    """A response to an invocation, sent to the Runtime API as it is written."""
+
+    def __init__(self, runtime_api_address: str, request_id: str) -> None:
+        self.connection = http.client.HTTPConnection(runtime_api_address)
+        self.connection.putrequest(
+            "POST", f"{RUNTIME_API_PATH}/invocation/{request_id}/response"
+        )
+        self.connection.putheader("Lambda-Runtime-Function-Response-Mode", "streaming")
+        self.connection.putheader("Transfer-Encoding", "chunked")
+        self.connection.putheader(
+            "Content-Type", HTTP_INTEGRATION_RESPONSE_CONTENT_TYPE
+        )
+        self.connection.putheader(
+            "Trailer",
+            "Lambda-Runtime-Function-Error-Type, Lambda-Runtime-Function-Error-Body",
+        )
+        self.connection.endheaders()
+
+    def write(self, data: bytes) -> None:
+        """Send a chunk of the response; blocks until it is handed to the socket."""
+        if data:
+            self.connection.send(b"%X\r\n" % len(data))
+            self.connection.send(data)
+            self.connection.send(b"\r\n")
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """
+        End the response.
+
+        :param error: An error that interrupted the response, reported in the trailers
+            since the status code has already been sent.
+        """
+        trailers = b""
+        if error is not None:
+            error_body = base64.b64encode(json.dumps(get_error_body(error)).encode())
+            trailers = (
+                f"Lambda-Runtime-Function-Error-Type: {type(error).__name__}\r\n"
+                f"Lambda-Runtime-Function-Error-Body: {error_body.decode()}\r\n"
+            ).encode()
+        self.connection.send(b"0\r\n" + trailers + b"\r\n")
+        self.connection.getresponse().read()
+        self.connection.close()
+
+
+class LambdaRuntimeApi:
+    """Client of the Lambda Runtime API, which hands out invocations and takes their responses."""
+
+    def __init__(self, address: str) -> None:
+        """:param address: `host:port` of the API, from `AWS_LAMBDA_RUNTIME_API`."""
+        self.address = address
+
+    def next_invocation(self) -> Invocation:
+        """Wait for the next event to handle."""
+        status, headers, body = self._request("GET", "/invocation/next")
+        if status != http.HTTPStatus.OK:
+            raise RuntimeError(f"Failed to get the next invocation: {status} {body!r}")
+        return Invocation(
+            request_id=headers["Lambda-Runtime-Aws-Request-Id"], event=json.loads(body)
+        )
+
+    def stream_response(self, request_id: str) -> ResponseStream:
+        return ResponseStream(self.address, request_id)
+
+    def send_response(self, request_id: str, response: Any) -> None:
+        """Send a whole, non-streamed response."""
+        self._request("POST", f"/invocation/{request_id}/response", body=response)
+
+    def send_error(self, request_id: str, error: BaseException) -> None:
+        """Report that an invocation failed before its response started."""
+        self._request(
+            "POST",
+            f"/invocation/{request_id}/error",
+            body=get_error_body(error),
+            headers={"Lambda-Runtime-Function-Error-Type": type(error).__name__},
+        )
+
+    def send_init_error(self, error: BaseException) -> None:
+        """Report that the function failed to start."""
+        self._request(
+            "POST",
+            "/init/error",
+            body=get_error_body(error),
+            headers={"Lambda-Runtime-Function-Error-Type": type(error).__name__},
+        )
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        body: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        connection = http.client.HTTPConnection(self.address)
+        try:
+            connection.request(
+                method,
+                RUNTIME_API_PATH + path,
+                body=None if body is None else json.dumps(body).encode(),
+                headers=headers or {},
+            )
+            response = connection.getresponse()
+            return response.status, response.headers, response.read()
+        finally:
+            connection.close()
+
+
+def get_error_body(error: BaseException) -> Dict[str, Any]:
+    return {
+        "errorMessage": str(error),
+        "errorType": type(error).__name__,
+        "stackTrace": traceback.format_tb(error.__traceback__),
+    }
+
+
+def get_asgi_scope(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate a function URL event (payload format 2.0) into an ASGI HTTP scope."""
+    request_context = event["requestContext"]["http"]
+    event_headers: Dict[str, str] = event.get("headers") or {}
+    headers = [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in event_headers.items()
+    ]
+    if event.get("cookies"):
+        headers.append((b"cookie", "; ".join(event["cookies"]).encode("latin-1")))
+
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": request_context["method"],
+        "scheme": "https",
+        "path": unquote(event["rawPath"]),
+        "raw_path": event["rawPath"].encode(),
+        "root_path": "",
+        "query_string": (event.get("rawQueryString") or "").encode(),
+        "headers": headers,
+        "client": (request_context.get("sourceIp", ""), 0),
+        "server": (event_headers.get("host", "localhost"), 443),
+    }
+
+
+def get_request_body(event: Dict[str, Any]) -> bytes:
+    body = event.get("body") or ""
+    if event.get("isBase64Encoded"):
+        return base64.b64decode(body)
+    return body.encode("utf-8")
+
+
+def get_prelude(status: int, headers: Iterable[Tuple[bytes, bytes]]) -> bytes:
+    """Encode the status and headers of a response the way function URLs expect them."""
+    response_headers: Dict[str, str] = {}
+    cookies: List[str] = []
+    for raw_name, raw_value in headers:
+        name, value = raw_name.decode("latin-1").lower(), raw_value.decode("latin-1")
+        if name == "set-cookie":
+            cookies.append(value)
+        elif name in response_headers:
+            response_headers[name] += f", {value}"
+        else:
+            response_headers[name] = value
+
+    prelude = {"statusCode": status, "headers": response_headers, "cookies": cookies}
+    return json.dumps(prelude).encode() + PRELUDE_DELIMITER
+
+
+async def stream_app_response(
+    app: "ASGIApp",
+    invocation: Invocation,
+    runtime_api: LambdaRuntimeApi,
+    lifespan_state: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Run the app on an invocation's request, streaming its response to the Runtime API.
+
+    Each body chunk is written before the app is asked for the next one, so no more than
+    one chunk is held in memory and the first bytes leave as soon as they are ready.
+    """
+    scope = {
+        **get_asgi_scope(invocation.event),
+        "state": dict(lifespan_state or {}),
+    }
+    request_body: Optional[bytes] = get_request_body(invocation.event)
+    response_complete = asyncio.Event()
+    stream: Optional[ResponseStream] = None
+
+    async def receive() -> Dict[str, Any]:
+        nonlocal request_body
+        if request_body is not None:
+            message = {"type": "http.request", "body": request_body, "more_body": False}
+            request_body = None
+            return message
+        # the caller cannot disconnect mid-invocation; only report it once we're done
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Dict[str, Any]) -> None:
+        nonlocal stream
+        if message["type"] == "http.response.start":
+            stream = runtime_api.stream_response(invocation.request_id)
+            stream.write(get_prelude(message["status"], message.get("headers", [])))
+        elif message["type"] == "http.response.body" and stream is not None:
+            stream.write(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    try:
+        await app(scope, receive, send)  # type: ignore[arg-type]
+    except Exception as err:  # pylint: disable=broad-except
+        if stream is None:
+            raise
+        traceback.print_exc()
+        stream.close(error=err)
+        return
+
+    if stream is None:
+        raise RuntimeError("The app returned without starting a response.")
+    stream.close()
+
+
+def handle_next_invocation(
+    app: "ASGIApp",
+    runtime_api: LambdaRuntimeApi,
+    event_loop: asyncio.AbstractEventLoop,
+    lifespan_state: Optional[Dict[str, Any]] = None,
+    emf_namespace: Optional[str] = None,
+) -> None:
+    """
+    Wait for the next invocation and respond to it.
+
+    :param emf_namespace: If set, the metrics recorded during the invocation are then
+        printed as EMF log lines in this namespace.
+    """
+    invocation = runtime_api.next_invocation()
+
+    if is_warm_up_event(invocation.event):
+        runtime_api.send_response(invocation.request_id, WARM_UP_RESPONSE)
+        return
+
+    try:
+        event_loop.run_until_complete(
+            stream_app_response(app, invocation, runtime_api, lifespan_state)
+        )
+    except Exception as err:  # pylint: disable=broad-except
+        traceback.print_exc()
+        runtime_api.send_error(invocation.request_id, err)
+    finally:
+        if emf_namespace:
+            METRICS.print_emf(emf_namespace)
+
+
+def main() -> None:
+    runtime_api = LambdaRuntimeApi(os.environ["AWS_LAMBDA_RUNTIME_API"])
+    try:
+        # Lambda freezes the process between invocations, so jobs can't run in the background;
+        # mypy doesn't know the required settings are read from the environment
+        app = create_app(Settings(generation_jobs_enabled=False))  # type: ignore[call-arg]
+        event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(event_loop)
+        # run the app's startup once; Lambda does not announce when it shuts down
+        lifespan_cycle = LifespanCycle(app, lifespan="auto")
+        lifespan_cycle.__enter__()  # pylint: disable=unnecessary-dunder-call
+        prime_clients(
+            app.state.settings, app.state.generation_clients, event_loop=event_loop
+        )
+        emf_namespace = app.state.settings.metrics_emf_namespace
+        if emf_namespace:
+            METRICS.start_recording_emf()
+    except Exception as err:
+        runtime_api.send_init_error(err)
+        raise
+
+    while True:
+        handle_next_invocation(
+            app,
+            runtime_api,
+            event_loop,
+            lifespan_state=lifespan_cycle.lifespan_state,
+            emf_namespace=emf_namespace,
+        )
+
+
+if __name__ == "__main__":
+    main()
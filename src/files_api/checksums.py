@@ -0,0 +1,156 @@
+"""Checksums computed while file content is streamed, and their verification."""
+
+import base64
+import hashlib
+import io
+import zlib
+from dataclasses import dataclass
+from typing import (
+    BinaryIO,
+    Dict,
+    Mapping,
+    Optional,
+)
+
+# the algorithms a client may send expected checksums for, e.g. in `x-checksum-sha256`
+SUPPORTED_CHECKSUM_ALGORITHMS = ("sha256", "crc32", "md5")
+
+
+class ChecksumMismatchError(Exception):
+    """Raised when content does not match a checksum provided by the client."""
+
+    def __init__(self, algorithm: str, expected: str, actual: str) -> None:
+        super().__init__(
+            f"{algorithm} checksum mismatch: expected {expected}, computed {actual}"
+        )
+        self.algorithm = algorithm
+        self.expected = expected
+        self.actual = actual
+
+
+@dataclass(frozen=True)
+class ObjectChecksums:
+    """Base64-encoded checksums of an object's content, in the format S3 uses."""
+
+    sha256: str
+    crc32: str
+    md5: Optional[str] = None
+
+    @property
+    def sha256_hex(self) -> str:
+        return base64.b64decode(self.sha256).hex()
+
+    def as_dict(self) -> Dict[str, str]:
+        checksums = {"sha256": self.sha256, "crc32": self.crc32}
+        if self.md5 is not None:
+            checksums["md5"] = self.md5
+        return checksums
+
+
+class StreamingChecksums:
+    """Update several checksums at once from chunks of content as they stream by."""
+
+    def __init__(self, include_md5: bool = False) -> None:
+        self._sha256 = hashlib.sha256()
+        self._crc32 = 0
+        self._md5 = hashlib.md5(usedforsecurity=False) if include_md5 else None
+        self.size = 0
+
+    def update(self, chunk: bytes) -> None:
+        self._sha256.update(chunk)
+        self._crc32 = zlib.crc32(chunk, self._crc32)
+        if self._md5 is not None:
+            self._md5.update(chunk)
+        self.size += len(chunk)
+
+    def result(self) -> ObjectChecksums:
+        return ObjectChecksums(
+            sha256=_b64(self._sha256.digest()),
+            crc32=_b64(self._crc32.to_bytes(4, "big")),
+            md5=_b64(self._md5.digest()) if self._md5 is not None else None,
+        )
+
+
+class HashingReader(io.RawIOBase):
+    """
+    Compute checksums of a file's content as it is read, e.g. by boto3 to upload it.
+
+    Content read again after seeking back, as boto3 does to retry, is not counted twice.
+    Expected checksums are verified before the last bytes are handed out: on a mismatch
+    the read raises instead, so an upload of the content never completes. Empty content,
+    which may be sent without being read, is verified as soon as the reader is created.
+    """
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        checksums: StreamingChecksums,
+        expected_checksums: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        super().__init__()
+        self.file = file
+        self.checksums = checksums
+        self.expected_checksums = expected_checksums or {}
+        self._hashed_until = file.tell()
+        self._end = file.seek(0, io.SEEK_END)
+        file.seek(self._hashed_until)
+        self._verified = False
+        if self._hashed_until == self._end:
+            self._verify()
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self.file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        position = self.file.tell()
+        chunk = self.file.read(-1 if size is None else size)
+        end_position = position + len(chunk)
+        if end_position > self._hashed_until:
+            unhashed_start = self._hashed_until - position
+            self.checksums.update(chunk[unhashed_start:])
+            self._hashed_until = end_position
+        if end_position == self._end and not self._verified:
+            self._verify()
+        return chunk
+
+    def readinto(self, buffer) -> int:  # type: ignore[no-untyped-def]
+        chunk = self.read(len(buffer))
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+    def _verify(self) -> None:
+        verify_checksums(self.checksums.result(), self.expected_checksums)
+        self._verified = True
+
+
+def verify_checksums(
+    checksums: ObjectChecksums, expected_checksums: Mapping[str, str]
+) -> None:
+    """
+    Compare computed checksums against the ones a client expects.
+
+    :param checksums: Checksums computed from the content.
+    :param expected_checksums: Mapping of algorithm name to base64-encoded checksum.
+
+    :raises ChecksumMismatchError: If any expected checksum does not match.
+    """
+    actual_checksums = checksums.as_dict()
+    for algorithm, expected in expected_checksums.items():
+        actual = actual_checksums.get(algorithm)
+        if actual != expected:
+            raise ChecksumMismatchError(
+                algorithm=algorithm, expected=expected, actual=str(actual)
+            )
+
+
+def _b64(digest: bytes) -> str:
+    return base64.b64encode(digest).decode("ascii")
@@ -0,0 +1,368 @@
+"""Streaming compression for HTTP responses, negotiated by `Accept-Encoding`."""
+
+import zlib
+from typing import (
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+)
+
+from starlette.datastructures import (
+    Headers,
+    MutableHeaders,
+)
+from starlette.types import (
+    ASGIApp,
+    Message,
+    Receive,
+    Scope,
+    Send,
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_MINIMUM_SIZE_BYTES = 1024
+
+# media types that are worth compressing; anything else (png, jpeg, mp3, zip, ...)
+# is either already compressed or not known to compress well
+COMPRESSIBLE_MEDIA_TYPES = {
+    "application/csv",
+    "application/javascript",
+    "application/json",
+    "application/sql",
+    "application/toml",
+    "application/x-ndjson",
+    "application/x-yaml",
+    "application/xml",
+    "application/yaml",
+    "image/svg+xml",
+}
+
+# streamed event by event, each too small for compression to be worth flushing it
+INCOMPRESSIBLE_TEXT_MEDIA_TYPES = {"text/event-stream"}
+
+
+class Compressor(Protocol):
+    """Incremental compressor that never needs the whole payload at once."""
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk, returning whatever compressed output is ready."""
+
+    def flush_block(self) -> bytes:
+        """Return all output held back so far, without ending the stream."""
+
+    def flush(self) -> bytes:
+        """Return the remaining output, ending the stream."""
+
+
+class Decompressor(Protocol):
+    """Incremental decompressor that never needs the whole payload at once."""
+
+    def decompress(self, data: bytes) -> bytes:
+        """Decompress a chunk, returning whatever output is ready."""
+
+    def flush(self) -> bytes:
+        """Return the remaining output."""
+
+
+class _GzipCompressor:
+    """Adapt a gzip `zlib.compressobj` to the `Compressor` protocol."""
+
+    def __init__(self) -> None:
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush_block(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _ZstdCompressor:
+    """Adapt `zstandard.ZstdCompressionObj` to the `Compressor` protocol."""
+
+    def __init__(self) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush_block(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliCompressor:
+    """Adapt `brotli.Compressor` to the `Compressor` protocol."""
+
+    def __init__(self) -> None:
+        self._compressor = brotli.Compressor(quality=4)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush_block(self) -> bytes:
+        return self._compressor.flush()
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def get_supported_encodings() -> List[str]:
+    """
+    Return the content encodings available in this environment.
+
+    The list is ordered by server preference: zstd and br are only
+    available when the optional `compression` extras are installed.
+    """
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def create_compressor(encoding: str) -> Compressor:
+    """
+    Create a streaming compressor for the given content encoding.
+
+    :param encoding: One of the values returned by `get_supported_encodings`.
+    :raises ValueError: If the encoding is not supported.
+    """
+    if encoding == "gzip":
+        return _GzipCompressor()
+    if encoding == "zstd" and zstandard is not None:
+        return _ZstdCompressor()
+    if encoding == "br" and brotli is not None:
+        return _BrotliCompressor()
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def get_at_rest_encoding() -> str:
+    """Return the encoding used to compress objects stored in S3: zstd if available."""
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def create_decompressor(encoding: str) -> Decompressor:
+    """
+    Create a streaming decompressor for the given content encoding.
+
+    :param encoding: One of `zstd` or `gzip`.
+    :raises ValueError: If the encoding is not supported.
+    """
+    if encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def iter_decompressed(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Decompress a stream of compressed chunks, yielding decompressed chunks."""
+    decompressor = create_decompressor(encoding)
+    for chunk in chunks:
+        decompressed = decompressor.decompress(chunk)
+        if decompressed:
+            yield decompressed
+    # output the decompressor held back, waiting for more input
+    decompressed = decompressor.flush()
+    if decompressed:
+        yield decompressed
+
+
+def negotiate_content_encoding(
+    accept_encoding: str, supported_encodings: List[str]
+) -> Optional[str]:
+    """
+    Pick the best content encoding for an `Accept-Encoding` header value.
+
+    Client q-values take precedence; ties are broken by the order of
+    `supported_encodings`. Encodings with `q=0` are never chosen.
+
+    :param accept_encoding: The raw `Accept-Encoding` request header.
+    :param supported_encodings: Encodings the server can produce, most preferred first.
+
+    :return: The chosen encoding, or None if the response should not be compressed.
+    """
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+
+    wildcard_weight = weights.get("*", 0.0)
+    best_encoding, best_weight = None, 0.0
+    for encoding in supported_encodings:
+        weight = weights.get(encoding, wildcard_weight)
+        if weight > best_weight:
+            best_encoding, best_weight = encoding, weight
+
+    return best_encoding
+
+
+def is_compressible_content_type(content_type: Optional[str]) -> bool:
+    """Return True if responses of this content type should be compressed."""
+    if not content_type:
+        return False
+
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in INCOMPRESSIBLE_TEXT_MEDIA_TYPES:
+        return False
+
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_MEDIA_TYPES
+        or media_type.endswith(("+json", "+xml"))
+    )
+
+
+class CompressionMiddleware:
+    """
+    Compress response bodies on the fly with the best encoding the client accepts.
+
+    Unlike `starlette.middleware.gzip.GZipMiddleware`, this supports zstd and br,
+    and it leaves alone responses that are already encoded, are not of a compressible
+    content type, are partial (`Range` requests / `206`), or answer a `HEAD` request.
+    Bodies are compressed chunk by chunk, so memory use does not grow with object size,
+    and each chunk is flushed as it is sent, so streamed responses are not held back.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = DEFAULT_MINIMUM_SIZE_BYTES,
+        encodings: Optional[List[str]] = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = encodings or get_supported_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = None
+        if "range" not in request_headers:
+            encoding = negotiate_content_encoding(
+                request_headers.get("accept-encoding", ""), self.encodings
+            )
+
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """Wrap `send` for a single response, compressing its body if eligible."""
+
+    def __init__(self, send: Send, encoding: str, minimum_size: int) -> None:
+        self._send = send
+        self._encoding = encoding
+        self._minimum_size = minimum_size
+        self._start_message: Optional[Message] = None
+        self._compressor: Optional[Compressor] = None
+        self._passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if self._passthrough:
+            await self._send(message)
+            return
+
+        if message["type"] == "http.response.start":
+            self._start_message = message
+            if not self._is_eligible(message):
+                self._passthrough = True
+                await self._send(message)
+            return
+
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body: bytes = message.get("body", b"")
+        more_body: bool = message.get("more_body", False)
+
+        if self._compressor is None:
+            if not more_body and len(body) < self._minimum_size:
+                # the whole (small) body arrived at once, so it's not worth compressing
+                self._passthrough = True
+                await self._send(self._start_message)  # type: ignore[arg-type]
+                await self._send(message)
+                return
+
+            self._compressor = create_compressor(self._encoding)
+            await self._send_compressed_start()
+
+        compressed = self._compressor.compress(body)
+        if not more_body:
+            compressed += self._compressor.flush()
+        elif body:
+            # let the client decode this chunk now, rather than once the compressor's
+            # buffers fill up: streamed text or progress would otherwise arrive all at once
+            compressed += self._compressor.flush_block()
+
+        if compressed or not more_body:
+            await self._send(
+                {
+                    "type": "http.response.body",
+                    "body": compressed,
+                    "more_body": more_body,
+                }
+            )
+
+    def _is_eligible(self, message: Message) -> bool:
+        headers = Headers(raw=message["headers"])
+        if message["status"] == 206 or "content-range" in headers:
+            return False
+        if "content-encoding" in headers:
+            return False
+        if not is_compressible_content_type(headers.get("content-type")):
+            return False
+
+        content_length = headers.get("content-length")
+        if content_length is not None and int(content_length) < self._minimum_size:
+            return False
+
+        return True
+
+    async def _send_compressed_start(self) -> None:
+        message = self._start_message
+        assert message is not None
+
+        headers = MutableHeaders(raw=message["headers"])
+        del headers["Content-Length"]
+        headers["Content-Encoding"] = self._encoding
+        headers.add_vary_header("Accept-Encoding")
+
+        await self._send(message)
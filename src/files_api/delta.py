@@ -0,0 +1,293 @@
+"""
+Delta (rsync-style) uploads: send only the blocks of a file that changed.
+
+1. The server splits the current file into fixed-size blocks and publishes a *signature*
+   per block: a weak Adler-32 checksum, which can be rolled over the new content one
+   byte at a time, and a strong SHA-256 to confirm matches.
+2. The client slides a block-sized window over the new content with `compute_delta`.
+   Windows matching a block become references to it; everything else is sent as data.
+3. The server rebuilds the file from the referenced blocks (copied within S3) and the
+   data sent by the client.
+"""
+
+import hashlib
+import zlib
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Union,
+)
+
+from files_api.s3.patch_objects import (
+    CopiedRange,
+    Segment,
+)
+from files_api.s3.write_objects import iter_file_chunks
+
+ADLER32_MODULUS = 65521
+
+DEFAULT_DELTA_BLOCK_SIZE_BYTES = 1024 * 1024
+MIN_DELTA_BLOCK_SIZE_BYTES = 4 * 1024
+MAX_DELTA_BLOCK_SIZE_BYTES = 64 * 1024 * 1024
+
+
+class BlockSignature(NamedTuple):
+    """Checksums of one block of a file."""
+
+    weak: int
+    strong: str
+    size: int
+
+
+class CopyBlocks(NamedTuple):
+    """Reuse `block_count` consecutive blocks of the current file, from `block_index`."""
+
+    block_index: int
+    block_count: int
+
+
+class SendData(NamedTuple):
+    """Take the next `length` bytes of the data sent along with the delta."""
+
+    length: int
+
+
+DeltaInstruction = Union[CopyBlocks, SendData]
+
+
+def compute_block_signatures(
+    chunks: Iterable[bytes], block_size: int
+) -> List[BlockSignature]:
+    """
+    Compute the signature of every block of a file, read as a stream of chunks.
+
+    The last block is shorter than `block_size` unless the file size is a multiple of it.
+    """
+    signatures = []
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while len(buffer) >= block_size:
+            signatures.append(_sign_block(buffer[:block_size]))
+            del buffer[:block_size]
+    if buffer:
+        signatures.append(_sign_block(buffer))
+    return signatures
+
+
+def compute_delta(
+    signatures: List[BlockSignature], block_size: int, content: bytes
+) -> List[DeltaInstruction]:
+    """
+    Describe new content as blocks of the current file plus data to send.
+
+    This is the client side of the protocol; it reads `content` (bytes, or e.g. an
+    `mmap` of a large file) one window at a time using a rolling checksum.
+
+    :param signatures: Signatures of the current file, from the server.
+    :param block_size: The block size the signatures were computed with.
+    :param content: The new content of the file.
+
+    :return: Instructions to rebuild `content`, in order. The data to send with them
+        is yielded by `get_delta_data`.
+    """
+    full_blocks: Dict[int, List[int]] = {}
+    for block_index, signature in enumerate(signatures):
+        if signature.size == block_size:
+            full_blocks.setdefault(signature.weak, []).append(block_index)
+
+    instructions: List[DeltaInstruction] = []
+    data_start = position = 0
+    content_size = len(content)
+    weak = zlib.adler32(content[:block_size])
+
+    while position + block_size <= content_size:
+        window_end = position + block_size
+        block_index = _find_matching_block(
+            signatures, full_blocks, weak, content[position:window_end]
+        )
+        if block_index is not None:
+            _add_data(instructions, position - data_start)
+            _add_copy(instructions, block_index)
+            position = data_start = window_end
+            window_end = position + block_size
+            weak = zlib.adler32(content[position:window_end])
+        else:
+            if window_end < content_size:
+                weak = _roll_adler32(
+                    weak, content[position], content[window_end], block_size
+                )
+            position += 1
+
+    # the current file's last block may be short, in which case it can only match the end
+    remaining = content_size - data_start
+    last_block = signatures[-1] if signatures else None
+    last_block_start = content_size - last_block.size if last_block is not None else 0
+    if (
+        last_block is not None
+        and last_block.size < block_size
+        and last_block.size <= remaining
+        and _sign_block(content[last_block_start:]) == last_block
+    ):
+        _add_data(instructions, remaining - last_block.size)
+        _add_copy(instructions, len(signatures) - 1)
+    else:
+        _add_data(instructions, remaining)
+
+    return instructions
+
+
+def get_delta_data(
+    signatures: List[BlockSignature],
+    instructions: List[DeltaInstruction],
+    content: bytes,
+) -> Iterator[bytes]:
+    """Yield the data to send along with delta instructions computed from `content`."""
+    position = 0
+    for instruction in instructions:
+        if isinstance(instruction, CopyBlocks):
+            first_block = instruction.block_index
+            last_block = first_block + instruction.block_count
+            position += sum(block.size for block in signatures[first_block:last_block])
+        else:
+            data_end = position + instruction.length
+            yield content[position:data_end]
+            position = data_end
+
+
+def get_delta_segments(  # pylint: disable=too-many-arguments
+    object_key: str,
+    object_size: int,
+    block_size: int,
+    instructions: List[DeltaInstruction],
+    data: BinaryIO,
+    etag: Optional[str] = None,
+) -> Iterator[Segment]:
+    """
+    Turn delta instructions into segments for `assemble_s3_object`.
+
+    :param object_key: Key of the current file, which blocks are copied from.
+    :param object_size: Size of the current file.
+    :param block_size: The block size the client computed the delta with.
+    :param instructions: The client's delta instructions.
+    :param data: The data sent by the client, read in order.
+    :param etag: ETag of the current file, to fail if it changes while assembling.
+
+    :raises ValueError: If an instruction refers to blocks past the end of the file.
+    """
+    pending_copy: Optional[CopiedRange] = None
+    for instruction in instructions:
+        if isinstance(instruction, CopyBlocks):
+            start = instruction.block_index * block_size
+            end = min(start + instruction.block_count * block_size, object_size)
+            if instruction.block_count < 1 or start >= end:
+                raise ValueError(f"Blocks out of range: {instruction}")
+            # merge references to consecutive blocks into one copy
+            if pending_copy is not None and pending_copy.end == start:
+                pending_copy = pending_copy._replace(end=end)
+                continue
+            if pending_copy is not None:
+                yield pending_copy
+            pending_copy = CopiedRange(object_key, start, end, etag)
+        elif instruction.length > 0:
+            if pending_copy is not None:
+                yield pending_copy
+                pending_copy = None
+            yield _BoundedReader(data, instruction.length)  # type: ignore[misc]
+
+    if pending_copy is not None:
+        yield pending_copy
+
+
+def write_segments(
+    output: BinaryIO, segments: Iterable[Segment], current_content: BinaryIO
+) -> None:
+    """
+    Write segments to a file, reading copied ranges from a local copy of the current file.
+
+    Used for files whose stored bytes are not their content, e.g. compressed ones,
+    which S3 cannot copy ranges of.
+    """
+    for segment in segments:
+        if isinstance(segment, CopiedRange):
+            current_content.seek(segment.start)
+            for chunk in iter_file_chunks(
+                _BoundedReader(current_content, segment.end - segment.start)  # type: ignore[arg-type]
+            ):
+                output.write(chunk)
+        else:
+            for chunk in iter_file_chunks(segment):
+                output.write(chunk)
+
+
+def _sign_block(block: Union[bytes, bytearray, memoryview]) -> BlockSignature:
+    return BlockSignature(
+        weak=zlib.adler32(block),
+        strong=hashlib.sha256(block).hexdigest(),
+        size=len(block),
+    )
+
+
+def _roll_adler32(checksum: int, byte_out: int, byte_in: int, window_size: int) -> int:
+    """Slide the Adler-32 of a window one byte forward."""
+    low_sum = checksum & 0xFFFF
+    high_sum = checksum >> 16
+    low_sum = (low_sum - byte_out + byte_in) % ADLER32_MODULUS
+    high_sum = (high_sum - window_size * byte_out + low_sum - 1) % ADLER32_MODULUS
+    return (high_sum << 16) | low_sum
+
+
+def _find_matching_block(
+    signatures: List[BlockSignature],
+    full_blocks: Dict[int, List[int]],
+    weak: int,
+    window: bytes,
+) -> Optional[int]:
+    candidates = full_blocks.get(weak)
+    if not candidates:
+        return None
+    strong = hashlib.sha256(window).hexdigest()
+    for block_index in candidates:
+        if signatures[block_index].strong == strong:
+            return block_index
+    return None
+
+
+def _add_data(instructions: List[DeltaInstruction], length: int) -> None:
+    if length > 0:
+        instructions.append(SendData(length))
+
+
+def _add_copy(instructions: List[DeltaInstruction], block_index: int) -> None:
+    previous = instructions[-1] if instructions else None
+    if (
+        isinstance(previous, CopyBlocks)
+        and previous.block_index + previous.block_count == block_index
+    ):
+        instructions[-1] = previous._replace(block_count=previous.block_count + 1)
+    else:
+        instructions.append(CopyBlocks(block_index, 1))
+
+
+class _BoundedReader:
+    """Read exactly `length` bytes from a file object, e.g. for one `SendData` instruction."""
+
+    def __init__(self, file: BinaryIO, length: int) -> None:
+        self.file = file
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        chunk = self.file.read(size)
+        if len(chunk) < size:
+            raise ValueError(
+                "Content ended before all of the expected bytes were read."
+            )
+        self.remaining -= len(chunk)
+        return chunk
@@ -1,5 +1,6 @@
 """FastAPI custom error handlers."""
 
+import math
 import traceback
 
 import pydantic
@@ -8,19 +9,55 @@ from fastapi import (
     status,
 )
 from fastapi.responses import JSONResponse
+from starlette.types import (
+    ASGIApp,
+    Message,
+    Receive,
+    Scope,
+    Send,
+)
+
+from files_api.checksums import ChecksumMismatchError
+from files_api.openai_scheduler import OpenAIRateLimitedError
+
+
+class BroadExceptionMiddleware:
+    """
+    Handle any exception unhandled by a more specific handler.
+
+    A pure ASGI middleware: `app.middleware("http")` would run every request in an extra
+    task and pass each chunk of a streamed body through a memory stream.
+    """
 
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
 
-async def handle_broad_exceptions(request: Request, call_next):
-    """Handle any exception unhandled by a more specific handler."""
-    try:
-        return await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    except Exception:  # pylint: disable=broad-except
-        traceback.print_exc()
-        return JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content={"detail": "Internal server error"},
-        )
+        response_started = False
+
+        async def send_and_track(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_track)
+
+        except Exception:  # pylint: disable=broad-except
+            # once the headers are sent, the response can only be cut short
+            if response_started:
+                raise
+            traceback.print_exc()
+            response = JSONResponse(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                content={"detail": "Internal server error"},
+            )
+            await response(scope, receive, send)
 
 
 async def handle_pydantic_validation_errors(
@@ -36,3 +73,22 @@ async def handle_pydantic_validation_errors(
             ]
         },
     )
+
+
+async def handle_checksum_mismatch_errors(
+    request: Request, exc: ChecksumMismatchError  # pylint: disable=unused-argument
+):
+    return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content={"detail": str(exc)},
+    )
+
+
+async def handle_openai_rate_limited_errors(
+    request: Request, exc: OpenAIRateLimitedError  # pylint: disable=unused-argument
+):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after_seconds)))},
+    )
@@ -1,77 +1,239 @@
 """OpenAI calls for generating files."""
 
+import base64
+from contextlib import (
+    AsyncExitStack,
+    asynccontextmanager,
+)
 from typing import (
+    AsyncIterator,
+    Iterator,
     Literal,
+    Optional,
     Tuple,
-    Union,
 )
 
-from openai import AsyncOpenAI
-from openai.types.chat import ChatCompletion
+import httpx
+from openai import (
+    AsyncOpenAI,
+    AsyncStream,
+)
+from openai.types import Image
+from openai.types.chat import (
+    ChatCompletion,
+    ChatCompletionChunk,
+)
+
+from files_api.metrics import instrument_calls
+from files_api.openai_scheduler import (
+    OpenAIScheduler,
+    call_openai,
+    estimate_tokens,
+)
+
+TEXT_MODEL = "gpt-4.1-nano"
+IMAGE_MODEL = "dall-e-3"
+IMAGE_SIZE: Literal["1024x1024"] = "1024x1024"
+SPEECH_MODEL = "gpt-4o-mini-tts"
 
 SYSTEM_PROMPT = (
     "You are an autocompletion tool that produces text files given constraints."
 )
 
+# generated files are streamed in chunks of about this size; base64 text is decoded in
+# slices of a multiple of 4 characters, so each slice decodes on its own
+STREAM_CHUNK_SIZE_BYTES = 64 * 1024
+TEXT_MAX_TOKENS = 100  # avoid burning your credits
+BASE64_SLICE_SIZE_CHARS = STREAM_CHUNK_SIZE_BYTES // 3 * 4
 
-async def get_text_chat_completion(prompt: str) -> str:
+
+@instrument_calls("openai")
+async def get_text_chat_completion(
+    prompt: str,
+    client: Optional[AsyncOpenAI] = None,
+    scheduler: Optional[OpenAIScheduler] = None,
+) -> str:
     """Generate a text chat completion from a given prompt."""
     # get the OpenAI client
-    client = AsyncOpenAI()
+    client = client or AsyncOpenAI()
 
     # get the completion
-    response: ChatCompletion = await client.chat.completions.create(
-        model="gpt-4.1-nano",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": prompt},
-        ],
-        max_tokens=100,  # avoid burning your credits
-        n=1,  # number of responses
+    raw_response = await call_openai(
+        scheduler,
+        TEXT_MODEL,
+        lambda: client.chat.completions.with_raw_response.create(
+            model=TEXT_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            max_tokens=TEXT_MAX_TOKENS,
+            n=1,  # number of responses
+        ),
+        estimated_tokens=estimate_tokens(SYSTEM_PROMPT + prompt) + TEXT_MAX_TOKENS,
     )
+    response: ChatCompletion = raw_response.parse()
 
     return response.choices[0].message.content or ""
 
 
-async def generate_image(prompt: str) -> Union[str, None]:
-    """Generate an image from a given prompt."""
+@asynccontextmanager
+@instrument_calls("openai")
+async def stream_text_chat_completion(
+    prompt: str,
+    client: Optional[AsyncOpenAI] = None,
+    scheduler: Optional[OpenAIScheduler] = None,
+) -> AsyncIterator[AsyncIterator[str]]:
+    """
+    Generate a text chat completion from a given prompt, streaming it as it is generated.
+
+    Yields an async iterator of the pieces of text; they must be consumed before the
+    context exits.
+    """
     # get the OpenAI client
-    client = AsyncOpenAI()
+    client = client or AsyncOpenAI()
+
+    async with AsyncExitStack() as stack:
+        # only opening the stream is retried; it is closed when the context exits
+        raw_response = await call_openai(
+            scheduler,
+            TEXT_MODEL,
+            lambda: stack.enter_async_context(
+                client.chat.completions.with_streaming_response.create(
+                    model=TEXT_MODEL,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt},
+                    ],
+                    max_tokens=TEXT_MAX_TOKENS,
+                    n=1,  # number of responses
+                    # the stubs of `with_streaming_response` lose the overloads of
+                    # `create`, so they don't know it accepts, and then returns, a stream
+                    stream=True,  # type: ignore[arg-type]
+                )
+            ),
+            estimated_tokens=estimate_tokens(SYSTEM_PROMPT + prompt) + TEXT_MAX_TOKENS,
+        )
+        chunks: AsyncStream[ChatCompletionChunk] = await raw_response.parse()  # type: ignore[assignment]
+        yield iter_chat_completion_text(chunks)
+
+
+async def iter_chat_completion_text(
+    chunks: "AsyncStream[ChatCompletionChunk]",
+) -> AsyncIterator[str]:
+    async for chunk in chunks:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+@instrument_calls("openai")
+async def create_image(
+    prompt: str,
+    response_format: Literal["url", "b64_json"] = "url",
+    client: Optional[AsyncOpenAI] = None,
+    scheduler: Optional[OpenAIScheduler] = None,
+) -> Image:
+    """Generate an image from a given prompt, returned as a URL or as base64 data."""
+    # get the OpenAI client
+    client = client or AsyncOpenAI()
 
     # get image response from OpenAI
-    image_response = await client.images.generate(
-        model="dall-e-3",
-        prompt=prompt,
-        size="1024x1024",
-        quality="standard",
-        n=1,
+    raw_response = await call_openai(
+        scheduler,
+        IMAGE_MODEL,
+        lambda: client.images.with_raw_response.generate(
+            model=IMAGE_MODEL,
+            prompt=prompt,
+            size=IMAGE_SIZE,
+            quality="standard",
+            response_format=response_format,
+            n=1,
+        ),
     )
 
-    return image_response.data[0].url or None
+    return raw_response.parse().data[0]
 
 
-async def generate_text_to_speech(
+@instrument_calls("openai")
+async def stream_generated_image(
     prompt: str,
-    response_format: Literal["mp3", "opus", "aac", "flac", "wav", "pcm"] = "mp3",
-) -> Tuple[bytes, str]:
+    response_format: Literal["url", "b64_json"] = "url",
+    client: Optional[AsyncOpenAI] = None,
+    http_client: Optional[httpx.AsyncClient] = None,
+    scheduler: Optional[OpenAIScheduler] = None,
+) -> AsyncIterator[bytes]:
     """
-    Generate text-to-speech audio from a given prompt.
+    Generate an image from a given prompt and yield its content in chunks.
 
-    Returns the audio content as bytes and the MIME type as a string.
+    A URL is downloaded as a stream, and base64 data is decoded a slice at a time, so
+    the whole image is never held in memory in more than one form.
     """
-    # get the OpenAI client
-    client = AsyncOpenAI()
-
-    # get audio response from OpenAI
-    audio_response = await client.audio.speech.with_raw_response.create(
-        model="gpt-4o-mini-tts",
-        voice="echo",
-        input=prompt,
+    image = await create_image(
+        prompt=prompt,
         response_format=response_format,
+        client=client,
+        scheduler=scheduler,
     )
 
-    # Get the audio content as bytes
-    file_content_bytes: bytes = audio_response.content
-    file_mime_type: str = audio_response.headers.get("Content-Type")
+    if image.b64_json:
+        for chunk in iter_base64_decoded(image.b64_json):
+            yield chunk
+        return
+
+    if not image.url:
+        raise ValueError("OpenAI returned neither a URL nor data for the image.")
+
+    owns_http_client = http_client is None
+    http_client = http_client or httpx.AsyncClient()
+    try:
+        async with http_client.stream("GET", image.url) as image_response:
+            image_response.raise_for_status()
+            async for chunk in image_response.aiter_bytes(STREAM_CHUNK_SIZE_BYTES):
+                yield chunk
+    finally:
+        if owns_http_client:
+            await http_client.aclose()
+
+
+def iter_base64_decoded(data: str) -> Iterator[bytes]:
+    """Decode base64 text in chunks rather than all at once."""
+    for start in range(0, len(data), BASE64_SLICE_SIZE_CHARS):
+        end = start + BASE64_SLICE_SIZE_CHARS
+        yield base64.b64decode(data[start:end])
 
-    return file_content_bytes, file_mime_type
+
+@asynccontextmanager
+@instrument_calls("openai")
+async def stream_text_to_speech(
+    prompt: str,
+    response_format: Literal["mp3", "opus", "aac", "flac", "wav", "pcm"] = "mp3",
+    client: Optional[AsyncOpenAI] = None,
+    scheduler: Optional[OpenAIScheduler] = None,
+) -> AsyncIterator[Tuple[AsyncIterator[bytes], str]]:
+    """
+    Generate text-to-speech audio from a given prompt, streaming it as it is read.
+
+    Yields the audio content as an async iterator of chunks and the MIME type; the
+    chunks must be consumed before the context exits.
+    """
+    # get the OpenAI client
+    client = client or AsyncOpenAI()
+
+    async with AsyncExitStack() as stack:
+        # only opening the response is retried; it is closed when the context exits
+        audio_response = await call_openai(
+            scheduler,
+            SPEECH_MODEL,
+            lambda: stack.enter_async_context(
+                client.audio.speech.with_streaming_response.create(
+                    model=SPEECH_MODEL,
+                    voice="echo",
+                    input=prompt,
+                    response_format=response_format,
+                )
+            ),
+        )
+        yield (
+            audio_response.iter_bytes(STREAM_CHUNK_SIZE_BYTES),
+            audio_response.headers.get("Content-Type"),
+        )
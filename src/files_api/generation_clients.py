@@ -0,0 +1,104 @@
+"""
+Long-lived HTTP clients used to generate files, shared by all requests to an app.
+
+The app's lifespan (see `create_app`) stores one `GenerationClients` on `app.state` and
+closes it on shutdown, so generations reuse pooled (keep-alive) connections to OpenAI
+and to the hosts images are downloaded from, rather than paying for new connections and
+TLS handshakes every time.
+
+The clients are created on first use, because importing the OpenAI SDK is slow and
+most requests never need it (e.g. during a Lambda cold start).
+"""
+
+from typing import (
+    TYPE_CHECKING,
+    Optional,
+)
+
+from files_api.openai_scheduler import OpenAIScheduler
+from files_api.settings import Settings
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+
+class GenerationClients:
+    """
+    The OpenAI client, and an HTTP client to download what it generates.
+
+    OpenAI calls go through `openai_scheduler`, which rate limits and retries them, so
+    the client itself does not retry.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self._http_client: Optional["httpx.AsyncClient"] = None
+        self._openai_client: Optional["AsyncOpenAI"] = None
+        self.openai_scheduler = OpenAIScheduler(
+            requests_per_minute=settings.openai_requests_per_minute,
+            tokens_per_minute=settings.openai_tokens_per_minute,
+            max_retries=settings.openai_max_retries,
+        )
+
+    @property
+    def http_client(self) -> "httpx.AsyncClient":
+        if self._http_client is None:
+            import httpx  # pylint: disable=import-outside-toplevel
+
+            self._http_client = httpx.AsyncClient(
+                limits=self._get_limits(),
+                timeout=self._get_timeout(),
+                http2=self.settings.generation_client_http2,
+            )
+        return self._http_client
+
+    @property
+    def openai_client(self) -> "AsyncOpenAI":
+        """
+        The OpenAI client, configured from the `OPENAI_*` environment variables.
+
+        :raises openai.OpenAIError: If no API key is configured.
+        """
+        if self._openai_client is None:
+            # pylint: disable=import-outside-toplevel
+            from openai import (
+                AsyncOpenAI,
+                DefaultAsyncHttpxClient,
+            )
+
+            self._openai_client = AsyncOpenAI(
+                timeout=self._get_timeout(),
+                max_retries=0,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=self._get_limits(),
+                    timeout=self._get_timeout(),
+                    http2=self.settings.generation_client_http2,
+                ),
+            )
+        return self._openai_client
+
+    async def aclose(self) -> None:
+        """Close the connections of the clients created so far."""
+        if self._openai_client is not None:
+            await self._openai_client.close()
+            self._openai_client = None
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    def _get_limits(self) -> "httpx.Limits":
+        import httpx  # pylint: disable=import-outside-toplevel
+
+        return httpx.Limits(
+            max_connections=self.settings.generation_client_max_connections,
+            max_keepalive_connections=self.settings.generation_client_max_keepalive_connections,
+        )
+
+    def _get_timeout(self) -> "httpx.Timeout":
+        import httpx  # pylint: disable=import-outside-toplevel
+
+        return httpx.Timeout(
+            self.settings.generation_client_timeout_seconds,
+            connect=self.settings.generation_client_connect_timeout_seconds,
+        )
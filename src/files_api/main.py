@@ -1,26 +1,106 @@
 """FastAPI app definition."""
 
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from pathlib import Path
 from textwrap import dedent
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+)
 
 import pydantic
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
 
+from files_api.checksums import ChecksumMismatchError
+from files_api.compression import CompressionMiddleware
 from files_api.errors import (
-    handle_broad_exceptions,
+    BroadExceptionMiddleware,
+    handle_checksum_mismatch_errors,
+    handle_openai_rate_limited_errors,
     handle_pydantic_validation_errors,
 )
+from files_api.generation_clients import GenerationClients
+from files_api.metrics import MetricsMiddleware
+from files_api.openai_scheduler import OpenAIRateLimitedError
+from files_api.request_accounting import RequestAccountingMiddleware
 from files_api.routes import (
+    DELTA_UPLOADS_ROUTER,
     FILES_ROUTER,
     GENERATED_FILES_ROUTER,
+    MULTIPART_UPLOADS_ROUTER,
+    PRESIGNED_URLS_ROUTER,
+    STATS_ROUTER,
+    UPLOAD_SESSIONS_ROUTER,
 )
 from files_api.settings import Settings
+from files_api.single_flight import AsyncSingleFlight
+from files_api.worker_pool import WorkerPool
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.tags[0]}-{route.name}"
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Share long-lived clients between requests, and start the workers of generation jobs.
+
+    On shutdown, the jobs get some time to finish before the clients are closed.
+    """
+    settings: Settings = app.state.settings
+    app.state.generation_clients = GenerationClients(settings)
+    app.state.generation_job_pool = WorkerPool(
+        concurrency=settings.generation_job_concurrency,
+        max_queued=settings.generation_job_queue_size,
+    )
+    app.state.generation_job_pool.start()
+    # identical generation requests in flight at once share one generation
+    app.state.in_flight_generations = AsyncSingleFlight()
+    # concurrent reads of the same file share their S3 calls
+    app.state.coalesced_reads = AsyncSingleFlight(
+        wait_timeout_seconds=settings.coalesced_read_wait_timeout_seconds
+    )
+    # bounds the items generated at once by all the batches in flight, not each of them
+    app.state.generation_batch_slots = asyncio.Semaphore(
+        settings.generation_batch_concurrency
+    )
+    try:
+        yield
+    finally:
+        await app.state.generation_job_pool.aclose(
+            timeout_seconds=settings.generation_job_shutdown_timeout_seconds
+        )
+        await app.state.generation_clients.aclose()
+
+
+def use_prebuilt_openapi_schema(app: FastAPI, openapi_schema_path: Path) -> None:
+    """
+    Serve a prebuilt OpenAPI schema rather than generating one from the app's routes.
+
+    Generating the schema walks every route and model, which the first request for the
+    docs would otherwise pay for, e.g. right after a Lambda cold start.
+    """
+    prebuilt_openapi_schema: Dict[str, Any] = json.loads(
+        openapi_schema_path.read_text()
+    )
+
+    def openapi() -> Dict[str, Any]:
+        if app.openapi_schema is None:
+            # FastAPI adds the root path to the servers when the schema is first requested
+            app.openapi_schema = {
+                **prebuilt_openapi_schema,
+                **({"servers": app.servers} if app.servers else {}),
+            }
+        return app.openapi_schema
+
+    app.openapi = openapi  # type: ignore[method-assign]
+
+
 def create_app(settings: Settings | None = None) -> FastAPI:
     settings = settings or Settings()
 
@@ -45,16 +125,48 @@ def create_app(settings: Settings | None = None) -> FastAPI:
         docs_url="/",  # its easier to find the docs when they live on the base url
         root_path="/prod",
         generate_unique_id_function=custom_generate_unique_id,
+        lifespan=lifespan,
     )
     app.state.settings = settings
 
     app.include_router(FILES_ROUTER)
     app.include_router(GENERATED_FILES_ROUTER)
+    app.include_router(STATS_ROUTER)
+    app.include_router(PRESIGNED_URLS_ROUTER)
+    app.include_router(MULTIPART_UPLOADS_ROUTER)
+    app.include_router(UPLOAD_SESSIONS_ROUTER)
+    app.include_router(DELTA_UPLOADS_ROUTER)
     app.add_exception_handler(
         exc_class_or_status_code=pydantic.ValidationError,
         handler=handle_pydantic_validation_errors,
     )
-    app.middleware("http")(handle_broad_exceptions)
+    app.add_exception_handler(
+        exc_class_or_status_code=ChecksumMismatchError,
+        # the stubs want handlers of any `Exception`, not of the class they handle
+        handler=handle_checksum_mismatch_errors,  # type: ignore[arg-type]
+    )
+    app.add_exception_handler(
+        exc_class_or_status_code=OpenAIRateLimitedError,
+        handler=handle_openai_rate_limited_errors,  # type: ignore[arg-type]
+    )
+    if settings.compress_responses:
+        # mypy can't match middleware classes to the `ParamSpec` protocol of the stubs
+        app.add_middleware(  # type: ignore[call-arg]
+            CompressionMiddleware,  # type: ignore[arg-type]
+            minimum_size=settings.compression_minimum_size_bytes,
+        )
+    app.add_middleware(BroadExceptionMiddleware)  # type: ignore[call-arg,arg-type]
+    if settings.server_timing_header or settings.request_accounting_log:
+        app.add_middleware(  # type: ignore[call-arg]
+            RequestAccountingMiddleware,  # type: ignore[arg-type]
+            server_timing_header=settings.server_timing_header,
+            request_accounting_log=settings.request_accounting_log,
+        )
+    if settings.record_request_metrics:
+        # outermost, so that it sees the responses of the other middlewares
+        app.add_middleware(MetricsMiddleware)  # type: ignore[call-arg,arg-type]
+    if settings.openapi_schema_path:
+        use_prebuilt_openapi_schema(app, settings.openapi_schema_path)
 
     return app
 
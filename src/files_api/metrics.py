@@ -0,0 +1,642 @@
+"""
+Per-process metrics of the API: requests, and calls to S3 and OpenAI.
+
+- `MetricsMiddleware` records the latency, status and bytes of each request, by route
+  template (e.g. `/v1/files/{file_path:path}`), and the requests in flight.
+- `instrument_calls` records the latency of each call to a function, e.g. those of
+  `files_api.s3` and `files_api.generate_files`, by outcome.
+
+`GET /metrics` serves them in the Prometheus text format. Under the pre-forking server
+(`files_api.server`), each worker periodically writes its metrics to a directory shared
+by the workers, and whichever worker is scraped adds up those of all of them, so one
+scrape target covers the whole server. On Lambda, where nothing
+scrapes a single execution environment, the Lambda handlers can instead print what was
+recorded during each invocation as CloudWatch Embedded Metric Format (EMF) log lines,
+which CloudWatch turns into metrics.
+
+Recording is meant to stay in the order of a microsecond per call; see
+`scripts/benchmark-metrics.py`.
+
+Docs:
+- https://prometheus.io/docs/instrumenting/exposition_formats/
+- https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+"""
+
+import fcntl
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from starlette.types import (
+    ASGIApp,
+    Message,
+    Receive,
+    Scope,
+    Send,
+)
+
+FunctionT = TypeVar("FunctionT", bound=Callable[..., Any])
+
+MetricType = Literal["counter", "gauge", "histogram"]
+
+# the values of each series of each metric, by metric name: label values, the value,
+# the count and the bucket counts, as written to the shared directory
+Snapshot = Dict[str, List[Tuple[List[str], float, int, List[int]]]]
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS_SECONDS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+# EMF accepts at most this many values per metric in a log line
+MAX_EMF_VALUES_PER_METRIC = 100
+
+UNMATCHED_ROUTE = "unmatched"
+
+DEFAULT_SNAPSHOT_INTERVAL_SECONDS = 5.0
+
+# in the shared directory, the metrics of the processes that exited, added up
+ARCHIVED_SNAPSHOT_FILE_NAME = "archived.json"
+LOCK_FILE_NAME = ".lock"
+
+
+class Series:  # pylint: disable=too-many-instance-attributes
+    """The values of a metric for one combination of label values."""
+
+    def __init__(self, metric_type: MetricType, buckets: Sequence[float] = ()) -> None:
+        self.metric_type = metric_type
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        # the count of a counter, the level of a gauge, or the sum of a histogram
+        self.value = 0.0
+        self.count = 0
+        # what changed since EMF was last printed: observations, or counter increments
+        self.emf_values: List[float] = []
+        self.emf_delta = 0.0
+        self.record_emf = False
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+            if self.record_emf:
+                self.emf_delta += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.bucket_counts[bisect_left(self.buckets, value)] += 1
+            self.value += value
+            self.count += 1
+            if self.record_emf:
+                self.emf_values.append(value)
+
+    def snapshot(self) -> Tuple[float, int, List[int]]:
+        with self._lock:
+            return self.value, self.count, list(self.bucket_counts)
+
+    def merge(self, value: float, count: int, bucket_counts: Sequence[int]) -> None:
+        """Add the values of the same series in another process."""
+        with self._lock:
+            self.value += value
+            self.count += count
+            self.bucket_counts = [
+                own + other for own, other in zip(self.bucket_counts, bucket_counts)
+            ]
+
+    def take_emf_values(self) -> List[Union[float, List[float]]]:
+        """Take the values to print as EMF since the last call, one per log line."""
+        with self._lock:
+            if self.metric_type == "gauge":
+                return [self.value]
+            if self.metric_type == "counter":
+                delta, self.emf_delta = self.emf_delta, 0.0
+                return [delta] if delta else []
+            values, self.emf_values = self.emf_values, []
+            batches: List[Union[float, List[float]]] = []
+            for start in range(0, len(values), MAX_EMF_VALUES_PER_METRIC):
+                end = start + MAX_EMF_VALUES_PER_METRIC
+                batches.append(values[start:end])
+            return batches
+
+
+class Metric:  # pylint: disable=too-many-instance-attributes
+    """A named metric, with a series per combination of label values."""
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        name: str,
+        help_text: str,
+        metric_type: MetricType,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = (),
+        unit: str = "Count",
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.unit = unit  # as named by EMF
+        self.series: Dict[Tuple[str, ...], Series] = {}
+        self.record_emf = False
+        self._lock = threading.Lock()
+
+    def labels(self, *label_values: str) -> Series:
+        """Get the series of the given label values, in the order of `label_names`."""
+        series = self.series.get(label_values)
+        if series is None:
+            with self._lock:
+                series = self.series.setdefault(
+                    label_values, Series(self.metric_type, self.buckets)
+                )
+                series.record_emf = self.record_emf
+        return series
+
+
+class MetricsRegistry:
+    """The metrics of a process."""
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+        self.record_emf = False
+        self.shared_directory: Optional[str] = None
+
+    def counter(
+        self, name: str, help_text: str, label_names: Sequence[str] = (), unit="Count"
+    ) -> Metric:
+        return self._register(
+            Metric(name, help_text, "counter", label_names, unit=unit)
+        )
+
+    def gauge(
+        self, name: str, help_text: str, label_names: Sequence[str] = ()
+    ) -> Metric:
+        return self._register(Metric(name, help_text, "gauge", label_names))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS_SECONDS,
+    ) -> Metric:
+        return self._register(
+            Metric(name, help_text, "histogram", label_names, buckets, unit="Seconds")
+        )
+
+    def start_recording_emf(self) -> None:
+        """Keep what is recorded from now on, to print it with `drain_emf`."""
+        self.record_emf = True
+        for metric in self.metrics.values():
+            metric.record_emf = True
+            for series in list(metric.series.values()):
+                series.record_emf = True
+
+    def share_across_processes(self, directory: str) -> None:
+        """
+        Serve the metrics of all the processes sharing `directory`, rather than this one's.
+
+        Set before forking, e.g. the workers of a server, which then each call
+        `start_writing_snapshots`.
+        """
+        self.shared_directory = directory
+
+    def start_writing_snapshots(
+        self, interval_seconds: float = DEFAULT_SNAPSHOT_INTERVAL_SECONDS
+    ) -> None:
+        """Write the metrics of this process to the shared directory every interval."""
+        if self.shared_directory is None:
+            return
+
+        def write_snapshots() -> None:
+            while True:
+                time.sleep(interval_seconds)
+                self.write_snapshot()
+
+        threading.Thread(target=write_snapshots, daemon=True).start()
+
+    def write_snapshot(self) -> None:
+        """Write the metrics of this process to the shared directory, for the others."""
+        if self.shared_directory is None:
+            return
+        path = os.path.join(self.shared_directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file)
+        # readers see the previous snapshot or this one, never part of one
+        os.replace(f"{path}.tmp", path)
+
+    def archive_snapshot(self, pid: int) -> None:
+        """
+        Add the last metrics written by a process that exited to the archived ones.
+
+        Its counters and histograms keep counting in the totals, which so never go down
+        when a worker is replaced; its gauges, e.g. its requests in flight, are dropped.
+        """
+        if self.shared_directory is None:
+            return
+        path = os.path.join(self.shared_directory, f"{pid}.json")
+        archived_path = os.path.join(self.shared_directory, ARCHIVED_SNAPSHOT_FILE_NAME)
+        with lock_directory(self.shared_directory, fcntl.LOCK_EX):
+            snapshots = [read_snapshot(path), read_snapshot(archived_path)]
+            archived = self._merge_snapshots(snapshots, include_gauges=False)
+            with open(f"{archived_path}.tmp", "w", encoding="utf-8") as file:
+                json.dump(snapshot_series(archived), file)
+            os.replace(f"{archived_path}.tmp", archived_path)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def snapshot(self) -> Snapshot:
+        """Take the values of all series of this process."""
+        return snapshot_series(
+            {name: metric.series for name, metric in self.metrics.items()}
+        )
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        if self.shared_directory is None:
+            series_by_metric = {
+                name: metric.series for name, metric in self.metrics.items()
+            }
+        else:
+            series_by_metric = self._merge_snapshots(
+                [self.snapshot(), *self._read_other_snapshots()], include_gauges=True
+            )
+
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            for label_values, series in list(series_by_metric[metric.name].items()):
+                labels = dict(zip(metric.label_names, label_values))
+                lines.extend(render_prometheus_series(metric, labels, series))
+        return "\n".join(lines) + "\n"
+
+    def drain_emf(
+        self, namespace: str, timestamp_ms: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Take what was recorded since the last call, as EMF documents to print.
+
+        Histograms report their observations, counters their increase, and gauges their
+        level; histograms without observations and counters that did not increase are
+        left out.
+        """
+        timestamp_ms = timestamp_ms or int(time.time() * 1000)
+        documents: List[Dict[str, Any]] = []
+        for metric in self.metrics.values():
+            for label_values, series in list(metric.series.items()):
+                for value in series.take_emf_values():
+                    documents.append(
+                        {
+                            "_aws": {
+                                "Timestamp": timestamp_ms,
+                                "CloudWatchMetrics": [
+                                    {
+                                        "Namespace": namespace,
+                                        "Dimensions": [list(metric.label_names)],
+                                        "Metrics": [
+                                            {"Name": metric.name, "Unit": metric.unit}
+                                        ],
+                                    }
+                                ],
+                            },
+                            **dict(zip(metric.label_names, label_values)),
+                            metric.name: value,
+                        }
+                    )
+        return documents
+
+    def print_emf(self, namespace: str) -> None:
+        """Print what was recorded since the last call, as EMF log lines."""
+        for document in self.drain_emf(namespace):
+            print(json.dumps(document), flush=True)
+
+    def _read_other_snapshots(self) -> List[Snapshot]:
+        """Read the snapshots in the shared directory, but for this process's own."""
+        assert self.shared_directory is not None
+        own_file_name = f"{os.getpid()}.json"
+        with lock_directory(self.shared_directory, fcntl.LOCK_SH):
+            return [
+                read_snapshot(os.path.join(self.shared_directory, file_name))
+                for file_name in os.listdir(self.shared_directory)
+                if file_name.endswith(".json") and file_name != own_file_name
+            ]
+
+    def _merge_snapshots(
+        self, snapshots: List[Snapshot], include_gauges: bool
+    ) -> Dict[str, Dict[Tuple[str, ...], Series]]:
+        """Add up the series of the registered metrics across snapshots."""
+        merged: Dict[str, Dict[Tuple[str, ...], Series]] = {
+            name: {} for name in self.metrics
+        }
+        for snapshot in snapshots:
+            for name, series_values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or (
+                    metric.metric_type == "gauge" and not include_gauges
+                ):
+                    continue
+                for label_values, value, count, bucket_counts in series_values:
+                    series = merged[name].setdefault(
+                        tuple(label_values), Series(metric.metric_type, metric.buckets)
+                    )
+                    series.merge(value, count, bucket_counts)
+        return merged
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"A metric is already named {metric.name}")
+        metric.record_emf = self.record_emf
+        self.metrics[metric.name] = metric
+        return metric
+
+
+def snapshot_series(
+    series_by_metric: Dict[str, Dict[Tuple[str, ...], Series]],
+) -> Snapshot:
+    return {
+        name: [
+            [list(label_values), *series.snapshot()]  # type: ignore[misc]
+            for label_values, series in list(series_by_labels.items())
+        ]
+        for name, series_by_labels in series_by_metric.items()
+    }
+
+
+def read_snapshot(path: str) -> Snapshot:
+    """Read a snapshot from the shared directory; empty if there is none."""
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+@contextmanager
+def lock_directory(directory: str, operation: int) -> Iterator[None]:
+    """
+    Lock the shared directory, shared to read snapshots or exclusive to archive one.
+
+    Readers so never see a snapshot both archived and not yet removed, which would
+    count it twice.
+    """
+    with open(os.path.join(directory, LOCK_FILE_NAME), "a", encoding="utf-8") as file:
+        fcntl.flock(file, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def render_prometheus_series(
+    metric: Metric, labels: Dict[str, str], series: Series
+) -> List[str]:
+    if metric.metric_type != "histogram":
+        return [f"{metric.name}{format_labels(labels)} {format_number(series.value)}"]
+
+    lines = []
+    cumulative_count = 0
+    for upper_bound, bucket_count in zip(
+        [*metric.buckets, float("inf")], series.bucket_counts
+    ):
+        cumulative_count += bucket_count
+        bucket_labels = {**labels, "le": format_number(upper_bound)}
+        lines.append(
+            f"{metric.name}_bucket{format_labels(bucket_labels)} {cumulative_count}"
+        )
+    lines.append(
+        f"{metric.name}_sum{format_labels(labels)} {format_number(series.value)}"
+    )
+    lines.append(f"{metric.name}_count{format_labels(labels)} {series.count}")
+    return lines
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped_labels = ",".join(
+        f'{name}="{escape_label_value(value)}"' for name, value in labels.items()
+    )
+    return "{" + escaped_labels + "}"
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+METRICS = MetricsRegistry()
+
+HTTP_REQUESTS = METRICS.counter(
+    "files_api_http_requests_total",
+    "Requests handled, by method, route and status code.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DURATION = METRICS.histogram(
+    "files_api_http_request_duration_seconds",
+    "Time from receiving a request to sending the end of its response.",
+    ["method", "route"],
+)
+HTTP_REQUESTS_IN_FLIGHT = METRICS.gauge(
+    "files_api_http_requests_in_flight",
+    "Requests being handled.",
+)
+HTTP_REQUEST_BYTES = METRICS.counter(
+    "files_api_http_request_bytes_total",
+    "Bytes of request bodies received.",
+    ["method", "route"],
+    unit="Bytes",
+)
+HTTP_RESPONSE_BYTES = METRICS.counter(
+    "files_api_http_response_bytes_total",
+    "Bytes of response bodies sent, as sent, e.g. compressed.",
+    ["method", "route"],
+    unit="Bytes",
+)
+DEPENDENCY_CALL_DURATION = METRICS.histogram(
+    "files_api_dependency_call_duration_seconds",
+    "Duration of calls to functions calling S3 or OpenAI, by outcome.",
+    ["dependency", "function", "outcome"],
+)
+
+
+def instrument_calls(dependency: str) -> Callable[[FunctionT], FunctionT]:
+    """
+    Record the duration of each call to the decorated function, and whether it raised.
+
+    Coroutine functions are timed until they return, and async generator functions
+    until they are exhausted or closed, e.g. for the whole of a streamed download.
+
+    :param dependency: What the function calls, e.g. "s3" or "openai".
+    """
+
+    def decorator(function: FunctionT) -> FunctionT:
+        ok_series = DEPENDENCY_CALL_DURATION.labels(dependency, function.__name__, "ok")
+        error_series = DEPENDENCY_CALL_DURATION.labels(
+            dependency, function.__name__, "error"
+        )
+
+        if inspect.isasyncgenfunction(function):
+
+            @functools.wraps(function)
+            async def instrumented_async_generator(*args, **kwargs):
+                start = time.perf_counter()
+                series = error_series
+                generator = function(*args, **kwargs)
+                try:
+                    item = await anext(generator)
+                    while True:
+                        # pass what is thrown in on, e.g. by `asynccontextmanager`
+                        try:
+                            sent = yield item
+                        except GeneratorExit:
+                            series = ok_series  # the caller stopped early
+                            raise
+                        except BaseException as err:  # pylint: disable=broad-except
+                            item = await generator.athrow(err)
+                        else:
+                            item = await generator.asend(sent)
+                except StopAsyncIteration:
+                    series = ok_series
+                finally:
+                    await generator.aclose()
+                    series.observe(time.perf_counter() - start)
+
+            return instrumented_async_generator  # type: ignore[return-value]
+
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def instrumented_coroutine(*args, **kwargs):
+                start = time.perf_counter()
+                series = error_series
+                try:
+                    result = await function(*args, **kwargs)
+                    series = ok_series
+                    return result
+                finally:
+                    series.observe(time.perf_counter() - start)
+
+            return instrumented_coroutine  # type: ignore[return-value]
+
+        @functools.wraps(function)
+        def instrumented(*args, **kwargs):
+            start = time.perf_counter()
+            series = error_series
+            try:
+                result = function(*args, **kwargs)
+                series = ok_series
+                return result
+            finally:
+                series.observe(time.perf_counter() - start)
+
+        return instrumented  # type: ignore[return-value]
+
+    return decorator
+
+
+class ExchangeCounter:
+    """
+    Count the bytes of a request and of its response, and note its status.
+
+    Pass its `receive` and `send` to the app in place of the server's.
+    """
+
+    def __init__(self, receive: Receive, send: Send) -> None:
+        self.status_code = 500
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self._receive = receive
+        self._send = send
+
+    async def receive(self) -> Message:
+        message = await self._receive()
+        if message["type"] == "http.request":
+            self.request_bytes += len(message.get("body", b""))
+        return message
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.status_code = message["status"]
+        elif message["type"] == "http.response.body":
+            self.response_bytes += len(message.get("body", b""))
+        await self._send(message)
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, status and bytes of each request.
+
+    Requests are labelled by the template of the route they matched, so that the number of
+    series stays bounded, and those matching no route as "unmatched".
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        exchange = ExchangeCounter(receive, send)
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels()
+        in_flight.inc()
+        try:
+            await self.app(scope, exchange.receive, exchange.send)
+        finally:
+            in_flight.dec()
+            # routing sets the matched route in the scope
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.labels(method, route).observe(
+                time.perf_counter() - start
+            )
+            HTTP_REQUESTS.labels(method, route, str(exchange.status_code)).inc()
+            HTTP_REQUEST_BYTES.labels(method, route).inc(exchange.request_bytes)
+            HTTP_RESPONSE_BYTES.labels(method, route).inc(exchange.response_bytes)
@@ -0,0 +1,297 @@
+"""
+Client-side rate limiting and retries for OpenAI calls, shared by all requests to an app.
+
+OpenAI limits the requests and tokens per minute of each model. Rather than send calls
+that are bound to fail with `429 Too Many Requests`, every call first takes its share
+from a token bucket per model and limit, and waits (queues) while the buckets are empty.
+The buckets start from the configured limits and follow the `x-ratelimit-*` headers of
+each response, so they track the real quota and the usage of other clients of the key.
+
+Calls that still fail with a 429, a timeout, a connection error or a 5xx are retried
+with exponential backoff and full jitter, honoring `retry-after` headers. Once the
+retries are used up, `OpenAIRateLimitedError` is raised, which the app turns into a
+`503 Service Unavailable` with a `Retry-After` header rather than a `500`.
+
+Docs: https://platform.openai.com/docs/guides/rate-limits
+"""
+
+import asyncio
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Mapping,
+    Optional,
+    TypeVar,
+)
+
+from files_api.request_accounting import record_dependency_call
+
+ResponseT = TypeVar("ResponseT")
+
+SECONDS_PER_MINUTE = 60
+
+# e.g. "1s", "120ms", "6m0s" or "1h2m3.5s" in `x-ratelimit-reset-*` headers
+DURATION_PART_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNIT_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class OpenAIRateLimitedError(Exception):
+    """Raised when an OpenAI call still fails after all retries, e.g. with 429s."""
+
+    def __init__(self, model: str, retry_after_seconds: float) -> None:
+        super().__init__(
+            f"OpenAI is rate limiting or failing calls to {model}; retry later."
+        )
+        self.model = model
+        self.retry_after_seconds = retry_after_seconds
+
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously up to its capacity.
+
+    Waiters are served in order, so a large acquisition is not starved by small ones.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float) -> None:
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> float:
+        """
+        Take tokens from the bucket, waiting until there are enough.
+
+        :return: How long the call waited, in seconds.
+        """
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                self._refill()
+                # a call larger than the whole bucket would otherwise wait forever
+                needed = min(amount, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= needed
+                    return time.monotonic() - start
+                await asyncio.sleep((needed - self.tokens) / self.refill_per_second)
+
+    def update(
+        self,
+        limit: Optional[float] = None,
+        remaining: Optional[float] = None,
+        reset_seconds: Optional[float] = None,
+    ) -> None:
+        """Adjust the bucket to the quota reported by the server."""
+        self._refill()
+        if limit:
+            self.capacity = limit
+            self.refill_per_second = limit / SECONDS_PER_MINUTE
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+            if remaining == 0 and reset_seconds:
+                # hold off everyone until the server says the quota is back
+                self.tokens = -self.refill_per_second * reset_seconds
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self._updated_at) * self.refill_per_second,
+        )
+        self._updated_at = now
+
+
+@dataclass
+class OpenAISchedulerStats:
+    """Counters of the calls made through a scheduler."""
+
+    calls: int = 0
+    retries: int = 0
+    rate_limited_responses: int = 0
+    failed_calls: int = 0
+    queued_seconds: float = 0.0
+
+
+class ModelRateLimits:
+    """The request and token buckets of a model."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float) -> None:
+        self.requests = TokenBucket(
+            requests_per_minute, requests_per_minute / SECONDS_PER_MINUTE
+        )
+        self.tokens = TokenBucket(
+            tokens_per_minute, tokens_per_minute / SECONDS_PER_MINUTE
+        )
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """Follow the `x-ratelimit-*` headers of an OpenAI response."""
+        for name, bucket in [("requests", self.requests), ("tokens", self.tokens)]:
+            bucket.update(
+                limit=parse_float(headers.get(f"x-ratelimit-limit-{name}")),
+                remaining=parse_float(headers.get(f"x-ratelimit-remaining-{name}")),
+                reset_seconds=parse_duration_seconds(
+                    headers.get(f"x-ratelimit-reset-{name}")
+                ),
+            )
+
+
+class OpenAIScheduler:
+    """Rate limit and retry the OpenAI calls of an app."""
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_retries: int = 5,
+        initial_backoff_seconds: float = 0.5,
+        max_backoff_seconds: float = 20,
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.initial_backoff_seconds = initial_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.stats = OpenAISchedulerStats()
+        self._limits: Dict[str, ModelRateLimits] = {}
+
+    def get_limits(self, model: str) -> ModelRateLimits:
+        if model not in self._limits:
+            self._limits[model] = ModelRateLimits(
+                self.requests_per_minute, self.tokens_per_minute
+            )
+        return self._limits[model]
+
+    async def call(
+        self,
+        model: str,
+        send_request: Callable[[], Awaitable[ResponseT]],
+        estimated_tokens: int = 0,
+    ) -> ResponseT:
+        """
+        Make an OpenAI call once the model's limits allow it, retrying failures.
+
+        :param model: The model called, whose limits apply.
+        :param send_request: Makes the call, e.g. with `with_raw_response`, and returns
+            a response with `headers`, from which the limits are updated.
+        :param estimated_tokens: Tokens the call is expected to use, prompt and output.
+
+        :raises OpenAIRateLimitedError: If the call still fails after all retries.
+        """
+        limits = self.get_limits(model)
+
+        for attempt in range(self.max_retries + 1):
+            self.stats.queued_seconds += await limits.requests.acquire()
+            if estimated_tokens:
+                self.stats.queued_seconds += await limits.tokens.acquire(
+                    estimated_tokens
+                )
+            self.stats.calls += 1
+
+            try:
+                response = await send_request()
+            except Exception as err:  # pylint: disable=broad-except
+                if not is_retryable(err):
+                    raise
+                self.stats.failed_calls += 1
+                headers = get_error_headers(err)
+                if getattr(err, "status_code", None) == 429:
+                    self.stats.rate_limited_responses += 1
+                limits.update_from_headers(headers)
+
+                backoff_seconds = self.get_backoff_seconds(attempt, headers)
+                if attempt == self.max_retries:
+                    raise OpenAIRateLimitedError(model, backoff_seconds) from err
+                self.stats.retries += 1
+                await asyncio.sleep(backoff_seconds)
+                continue
+
+            limits.update_from_headers(getattr(response, "headers", {}))
+            return response
+
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    def get_backoff_seconds(self, attempt: int, headers: Mapping[str, str]) -> float:
+        """Honor the server's `retry-after`, else back off exponentially with jitter."""
+        retry_after_seconds = get_retry_after_seconds(headers)
+        if retry_after_seconds is not None:
+            return min(retry_after_seconds, self.max_backoff_seconds)
+        return random.uniform(
+            0,
+            min(self.max_backoff_seconds, self.initial_backoff_seconds * 2**attempt),
+        )
+
+
+async def call_openai(
+    scheduler: Optional[OpenAIScheduler],
+    model: str,
+    send_request: Callable[[], Awaitable[ResponseT]],
+    estimated_tokens: int = 0,
+) -> ResponseT:
+    """Make an OpenAI call through the scheduler, or directly if there is none."""
+    start = time.perf_counter()
+    try:
+        if scheduler is None:
+            return await send_request()
+        return await scheduler.call(model, send_request, estimated_tokens)
+    finally:
+        record_dependency_call("openai", model, time.perf_counter() - start)
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the tokens of a text, at about four characters per token."""
+    return len(text) // 4 + 1
+
+
+def is_retryable(err: Exception) -> bool:
+    """Whether an OpenAI call that failed with this error may succeed if retried."""
+    # the SDK is slow to import, and is already loaded by the time a call fails
+    # pylint: disable=import-outside-toplevel
+    from openai import (
+        APIConnectionError,
+        APIStatusError,
+    )
+
+    if isinstance(err, APIConnectionError):  # includes timeouts
+        return True
+    if isinstance(err, APIStatusError):
+        return err.status_code in (408, 409, 429) or err.status_code >= 500
+    return False
+
+
+def get_error_headers(err: Exception) -> Mapping[str, str]:
+    response: Any = getattr(err, "response", None)
+    return getattr(response, "headers", None) or {}
+
+
+def get_retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    retry_after_ms = parse_float(headers.get("retry-after-ms"))
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    return parse_float(headers.get("retry-after"))
+
+
+def parse_float(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_duration_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a duration like "6m0s" or "120ms" into seconds."""
+    if not value:
+        return None
+    parts = DURATION_PART_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNIT_SECONDS[unit] for amount, unit in parts)
@@ -0,0 +1,379 @@
+"""
+Per-request accounting of where the time of a request goes, and what it cost in S3 calls.
+
+`RequestAccountingMiddleware` starts a `RequestAccounting` for each request, in a context
+variable, which follows the request into the threads and tasks it starts (e.g. with
+`asyncio.to_thread`). While it is set:
+
+- every call made by the shared S3 client is counted, by operation, and timed until
+  its response is parsed (a streamed body is read later, as the response is sent),
+- every OpenAI call made through `call_openai` is counted and timed, including its
+  queueing and retries (a streamed completion, until its headers arrive),
+- routes of class `TimedRoute` record when their endpoint starts and returns, which
+  splits the time before the response starts into request parsing, the endpoint,
+  and serialization or stream setup.
+
+The middleware can then add a `Server-Timing` header to the response, which browser
+dev tools and load testers show, and print a JSON log line once the response is sent,
+with the same breakdown, the S3 operations made and their estimated cost. This log is
+distinct from the per-request access log of the server (`SERVER_ACCESS_LOG`).
+S3 calls on a key already called during the request are counted as repeated, so that
+patterns like `head_object` then `get_object` of the same file show up in the logs.
+
+Docs:
+- https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing
+- https://aws.amazon.com/s3/pricing/
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import threading
+import time
+from dataclasses import (
+    dataclass,
+    field,
+)
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+)
+
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+from starlette.types import (
+    ASGIApp,
+    Message,
+    Receive,
+    Scope,
+    Send,
+)
+
+from files_api.metrics import ExchangeCounter
+
+# S3 Standard request prices in us-east-1, in USD per 1,000 requests
+S3_WRITE_REQUEST_PRICE_PER_1000 = 0.005  # PUT, COPY, POST and LIST
+S3_READ_REQUEST_PRICE_PER_1000 = 0.0004  # GET, HEAD and all other requests
+S3_WRITE_OPERATIONS = {
+    "CompleteMultipartUpload",
+    "CopyObject",
+    "CreateMultipartUpload",
+    "ListMultipartUploads",
+    "ListObjects",
+    "ListObjectsV2",
+    "ListParts",
+    "PutObject",
+    "UploadPart",
+    "UploadPartCopy",
+}
+S3_FREE_OPERATIONS = {"AbortMultipartUpload", "DeleteObject", "DeleteObjects"}
+
+# where the S3 event hooks keep track of a call, in the botocore request context
+S3_CALL_CONTEXT_KEY = "files_api_request_accounting"
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+@dataclass
+class DependencyUsage:
+    """The calls a request made to a dependency, e.g. S3 or OpenAI."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    operations: Dict[str, int] = field(default_factory=dict)
+    repeated_calls: int = 0
+
+
+@dataclass
+class RequestAccounting:  # pylint: disable=too-many-instance-attributes
+    """Where the time of a request goes; times are `time.perf_counter()` values."""
+
+    started_at: float
+    endpoint_started_at: Optional[float] = None
+    endpoint_finished_at: Optional[float] = None
+    response_started_at: Optional[float] = None
+    first_body_at: Optional[float] = None
+    dependencies: Dict[str, DependencyUsage] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        # dependencies are called from threads as well as from the event loop
+        self._lock = threading.Lock()
+        self._called_resources: Set[str] = set()
+
+    def record_call(  # pylint: disable=too-many-arguments
+        self,
+        dependency: str,
+        operation: str,
+        seconds: float,
+        resource: Optional[str] = None,
+        requests: int = 1,
+    ) -> None:
+        """
+        Record a call to a dependency.
+
+        :param operation: What was called, e.g. "GetObject" or the model.
+        :param resource: What the call was about, e.g. the S3 object, to count the calls
+            on something already called during the request.
+        :param requests: How many requests the call took, counting retries.
+        """
+        with self._lock:
+            usage = self.dependencies.setdefault(dependency, DependencyUsage())
+            usage.calls += requests
+            usage.seconds += seconds
+            usage.operations[operation] = usage.operations.get(operation, 0) + requests
+            if resource is not None:
+                resource = f"{dependency}:{resource}"
+                if resource in self._called_resources:
+                    usage.repeated_calls += 1
+                self._called_resources.add(resource)
+
+
+CURRENT_REQUEST_ACCOUNTING: contextvars.ContextVar[
+    Optional[RequestAccounting]
+] = contextvars.ContextVar("current_request_accounting", default=None)
+
+
+def record_dependency_call(
+    dependency: str,
+    operation: str,
+    seconds: float,
+    resource: Optional[str] = None,
+    requests: int = 1,
+) -> None:
+    """Record a call to a dependency for the current request, if one is accounted."""
+    accounting = CURRENT_REQUEST_ACCOUNTING.get()
+    if accounting is not None:
+        accounting.record_call(dependency, operation, seconds, resource, requests)
+
+
+def estimate_s3_cost_usd(operations: Dict[str, int]) -> float:
+    """Estimate what S3 charges for the requests of each operation."""
+    cost = 0.0
+    for operation, requests in operations.items():
+        if operation in S3_FREE_OPERATIONS:
+            continue
+        if operation in S3_WRITE_OPERATIONS:
+            cost += requests * S3_WRITE_REQUEST_PRICE_PER_1000 / 1000
+        else:
+            cost += requests * S3_READ_REQUEST_PRICE_PER_1000 / 1000
+    return cost
+
+
+def instrument_s3_client(s3_client: Any) -> None:
+    """Record the calls made by an S3 client for the requests that make them."""
+    events = s3_client.meta.events
+    events.register("before-parameter-build.s3", start_s3_call)
+    events.register("after-call.s3", finish_s3_call)
+    events.register("after-call-error.s3", finish_s3_call)
+
+
+def start_s3_call(
+    params: Dict[str, Any], model: Any, context: Dict[str, Any], **_
+) -> None:
+    accounting = CURRENT_REQUEST_ACCOUNTING.get()
+    if accounting is None:
+        return
+    resource = None
+    if "Bucket" in params and "Key" in params:
+        resource = f"{params['Bucket']}/{params['Key']}"
+    context[S3_CALL_CONTEXT_KEY] = (
+        accounting,
+        model.name,
+        resource,
+        time.perf_counter(),
+    )
+
+
+def finish_s3_call(
+    context: Dict[str, Any], parsed: Optional[Dict[str, Any]] = None, **_
+) -> None:
+    # calls made outside of an accounted request are not tracked
+    call = context.pop(S3_CALL_CONTEXT_KEY, None)
+    if call is None:
+        return
+    accounting, operation, resource, started_at = call
+    retries = (parsed or {}).get("ResponseMetadata", {}).get("RetryAttempts", 0)
+    accounting.record_call(
+        "s3",
+        operation,
+        time.perf_counter() - started_at,
+        resource=resource,
+        requests=1 + retries,
+    )
+
+
+class TimedRoute(APIRoute):
+    """A route that records when its endpoint starts and returns, for the accounting."""
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        # FastAPI reads the parameters and return type through the wrapper
+        super().__init__(path, time_endpoint(endpoint), **kwargs)
+
+
+def time_endpoint(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    if inspect.isasyncgenfunction(endpoint) or inspect.isgeneratorfunction(endpoint):
+        return endpoint
+
+    if inspect.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def timed_coroutine_endpoint(*args, **kwargs):
+            accounting = CURRENT_REQUEST_ACCOUNTING.get()
+            if accounting is None:
+                return await endpoint(*args, **kwargs)
+            accounting.endpoint_started_at = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                accounting.endpoint_finished_at = time.perf_counter()
+
+        return timed_coroutine_endpoint
+
+    @functools.wraps(endpoint)
+    def timed_endpoint(*args, **kwargs):
+        accounting = CURRENT_REQUEST_ACCOUNTING.get()
+        if accounting is None:
+            return endpoint(*args, **kwargs)
+        accounting.endpoint_started_at = time.perf_counter()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            accounting.endpoint_finished_at = time.perf_counter()
+
+    return timed_endpoint
+
+
+class RequestAccountingMiddleware:
+    """
+    Account for the time and S3 calls of each request.
+
+    :param server_timing_header: Add a `Server-Timing` header to each response.
+    :param request_accounting_log: Print a JSON log line of the accounting once each
+        response is sent.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        server_timing_header: bool = True,
+        request_accounting_log: bool = True,
+    ) -> None:
+        self.app = app
+        self.server_timing_header = server_timing_header
+        self.request_accounting_log = request_accounting_log
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accounting = RequestAccounting(started_at=time.perf_counter())
+        exchange = ExchangeCounter(receive, send)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                accounting.response_started_at = time.perf_counter()
+                if self.server_timing_header:
+                    headers = MutableHeaders(raw=message["headers"])
+                    headers.append("Server-Timing", format_server_timing(accounting))
+            elif (
+                message["type"] == "http.response.body"
+                and message.get("body")
+                and accounting.first_body_at is None
+            ):
+                accounting.first_body_at = time.perf_counter()
+            await exchange.send(message)
+
+        token = CURRENT_REQUEST_ACCOUNTING.set(accounting)
+        try:
+            await self.app(scope, exchange.receive, send_with_timing)
+        finally:
+            CURRENT_REQUEST_ACCOUNTING.reset(token)
+            if self.request_accounting_log:
+                entry = to_request_accounting_log_entry(
+                    scope, accounting, exchange.status_code
+                )
+                entry.update(
+                    request_bytes=exchange.request_bytes,
+                    response_bytes=exchange.response_bytes,
+                )
+                print(json.dumps(entry), flush=True)
+
+
+def to_milliseconds(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start) * 1000, 3)
+
+
+def format_server_timing(accounting: RequestAccounting) -> str:
+    """Format the time of a request until its response starts as a `Server-Timing` value."""
+    metrics: List[str] = []
+    for dependency, usage in sorted(accounting.dependencies.items()):
+        calls = "call" if usage.calls == 1 else "calls"
+        metrics.append(
+            f'{dependency};dur={usage.seconds * 1000:.1f};desc="{usage.calls} {calls}"'
+        )
+
+    endpoint_ms = to_milliseconds(
+        accounting.endpoint_started_at, accounting.endpoint_finished_at
+    )
+    serialization_ms = to_milliseconds(
+        accounting.endpoint_finished_at, accounting.response_started_at
+    )
+    if endpoint_ms is not None:
+        metrics.append(f"endpoint;dur={endpoint_ms:.1f}")
+    if serialization_ms is not None:
+        metrics.append(
+            f'serialization;dur={serialization_ms:.1f};desc="Serialization and stream setup"'
+        )
+
+    total_ms = to_milliseconds(accounting.started_at, accounting.response_started_at)
+    metrics.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(metrics)
+
+
+def to_request_accounting_log_entry(
+    scope: Scope, accounting: RequestAccounting, status_code: int
+) -> Dict[str, Any]:
+    finished_at = time.perf_counter()
+    s3_usage = accounting.dependencies.get("s3", DependencyUsage())
+    return {
+        "type": "request_accounting",
+        "method": scope["method"],
+        "path": scope["path"],
+        # routing sets the matched route in the scope
+        "route": getattr(scope.get("route"), "path", UNMATCHED_ROUTE),
+        "status": status_code,
+        "duration_ms": to_milliseconds(accounting.started_at, finished_at),
+        "request_parsing_ms": to_milliseconds(
+            accounting.started_at, accounting.endpoint_started_at
+        ),
+        "endpoint_ms": to_milliseconds(
+            accounting.endpoint_started_at, accounting.endpoint_finished_at
+        ),
+        "serialization_ms": to_milliseconds(
+            accounting.endpoint_finished_at, accounting.response_started_at
+        ),
+        "time_to_first_body_byte_ms": to_milliseconds(
+            accounting.started_at, accounting.first_body_at
+        ),
+        "body_streaming_ms": to_milliseconds(
+            accounting.response_started_at, finished_at
+        ),
+        "dependencies": {
+            dependency: {
+                "calls": usage.calls,
+                "duration_ms": round(usage.seconds * 1000, 3),
+                "operations": usage.operations,
+                "repeated_calls": usage.repeated_calls,
+            }
+            for dependency, usage in accounting.dependencies.items()
+        },
+        "estimated_s3_cost_usd": estimate_s3_cost_usd(s3_usage.operations),
+    }
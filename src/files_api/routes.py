@@ -1,12 +1,43 @@
 """Route definitions."""
 
+# pylint: disable=too-many-lines
+
+import asyncio
 import mimetypes
-from typing import Annotated
+import traceback
+from contextlib import AsyncExitStack
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+from functools import partial
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import (
+    Annotated,
+    AsyncIterable,
+    AsyncIterator,
+    BinaryIO,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    NoReturn,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
-import httpx
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
 from fastapi import (
     APIRouter,
     Depends,
+    Form,
+    Header,
     HTTPException,
     Path,
     Request,
@@ -14,35 +45,206 @@ from fastapi import (
     UploadFile,
     status,
 )
-from fastapi.responses import StreamingResponse
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
+from starlette.background import BackgroundTask
 
-from files_api.generate_files import (
-    generate_image,
-    generate_text_to_speech,
-    get_text_chat_completion,
+from files_api.checksums import (
+    SUPPORTED_CHECKSUM_ALGORITHMS,
+    ObjectChecksums,
+)
+from files_api.compression import (
+    is_compressible_content_type,
+    iter_decompressed,
+    negotiate_content_encoding,
+)
+from files_api.delta import (
+    CopyBlocks,
+    DeltaInstruction,
+    SendData,
+    compute_block_signatures,
+    get_delta_segments,
+    write_segments,
+)
+from files_api.generation_clients import GenerationClients
+from files_api.metrics import (
+    METRICS,
+    PROMETHEUS_CONTENT_TYPE,
+)
+from files_api.request_accounting import TimedRoute
+from files_api.s3.content_addressed_objects import (
+    DEDUPLICATION_STATS,
+    copy_content_addressed_s3_object,
+    delete_content_addressed_s3_object,
+    get_blob_key,
+    resolve_blob_pointer,
+    upload_content_addressed_s3_object,
 )
 from files_api.s3.delete_objects import delete_s3_object
+from files_api.s3.delta_signatures import (
+    fetch_cached_delta_signatures,
+    save_delta_signatures,
+)
+from files_api.s3.generation_cache import (
+    GENERATION_CACHE_STATS,
+    get_generation_cache_key,
+    is_generation_cached,
+)
+from files_api.s3.generation_jobs import (
+    GenerationJob,
+    GenerationJobNotFoundError,
+    GenerationJobStatus,
+    create_generation_job,
+    fetch_generation_job,
+    update_generation_job,
+)
+from files_api.s3.idempotency_keys import (
+    IdempotencyKeyInUseError,
+    IdempotentResponse,
+    claim_idempotency_key,
+    get_request_fingerprint,
+    release_idempotency_key,
+    save_idempotent_response,
+)
+from files_api.s3.object_metadata import (
+    get_blob_sha256,
+    get_checksums,
+    get_content_version,
+    get_logical_size,
+    get_metadata_without_checksums,
+    get_stored_encoding,
+)
+from files_api.s3.patch_objects import (
+    ObjectPatch,
+    Segment,
+    assemble_s3_object,
+    patch_s3_object,
+    write_patched_content,
+)
 from files_api.s3.read_objects import (
+    fetch_s3_multipart_uploads,
     fetch_s3_object,
+    fetch_s3_object_head,
+    fetch_s3_objects_logical_sizes,
     fetch_s3_objects_metadata,
     fetch_s3_objects_using_page_token,
+    generate_presigned_download_url,
+    multipart_upload_exists_in_s3,
     object_exists_in_s3,
 )
-from files_api.s3.write_objects import upload_s3_object
+from files_api.s3.upload_sessions import (
+    UploadOffsetMismatchError,
+    UploadSession,
+    UploadSessionConflictError,
+    UploadSessionNotFoundError,
+    UploadSizeError,
+    append_to_upload_session,
+    complete_upload_session,
+    create_upload_session,
+    delete_upload_session,
+    fetch_upload_session,
+)
+from files_api.s3.write_objects import (
+    MAX_IN_MEMORY_SPOOL_SIZE_BYTES,
+    abort_multipart_upload,
+    complete_multipart_upload,
+    copy_s3_object,
+    create_multipart_upload,
+    generate_presigned_upload_part_urls,
+    generate_presigned_upload_post,
+    generate_presigned_upload_url,
+    upload_s3_object,
+    upload_s3_object_from_stream,
+)
 from files_api.schemas import (
     DEFAULT_GET_FILES_PAGE_SIZE,
+    CompleteMultipartUploadRequest,
+    CreateMultipartUploadQueryParams,
+    CreateUploadSessionQueryParams,
+    DeduplicationStatsResponse,
+    DeltaBlockSignature,
+    DeltaSignaturesQueryParams,
+    DeltaSignaturesResponse,
+    DeltaUploadRequest,
     FileMetadata,
+    GeneratedFileParams,
     GeneratedFileType,
+    GenerateFilesBatchRequest,
     GenerateFilesQueryParams,
+    GenerationBatchItemResult,
+    GenerationCacheStatsResponse,
+    GenerationJobResponse,
     GetFilesQueryParams,
     GetFilesResponse,
+    ListMultipartUploadsQueryParams,
+    ListMultipartUploadsResponse,
+    MultipartUploadQueryParams,
+    MultipartUploadResponse,
+    PatchFileQueryParams,
+    PatchFileResponse,
+    PresignedDownloadQueryParams,
+    PresignedPartUrl,
+    PresignedPartUrlsQueryParams,
+    PresignedPartUrlsResponse,
+    PresignedUploadQueryParams,
+    PresignedUrlResponse,
     PutFileResponse,
     PutGeneratedFileResponse,
+    ReadCoalescingStatsResponse,
+    UploadSessionResponse,
 )
 from files_api.settings import Settings
+from files_api.worker_pool import (
+    WorkerPool,
+    WorkerPoolFullError,
+)
+
+try:
+    from mypy_boto3_s3.type_defs import (
+        GetObjectOutputTypeDef,
+        HeadObjectOutputTypeDef,
+        ObjectTypeDef,
+    )
+except ImportError:
+    ...
+
+FILES_ROUTER = APIRouter(tags=["Files"], route_class=TimedRoute)
+GENERATED_FILES_ROUTER = APIRouter(tags=["Generated Files"], route_class=TimedRoute)
+STATS_ROUTER = APIRouter(tags=["Stats"], route_class=TimedRoute)
+PRESIGNED_URLS_ROUTER = APIRouter(tags=["Presigned URLs"], route_class=TimedRoute)
+MULTIPART_UPLOADS_ROUTER = APIRouter(tags=["Multipart Uploads"], route_class=TimedRoute)
+UPLOAD_SESSIONS_ROUTER = APIRouter(tags=["Upload Sessions"], route_class=TimedRoute)
+DELTA_UPLOADS_ROUTER = APIRouter(tags=["Delta Uploads"], route_class=TimedRoute)
+
+MULTIPART_UPLOAD_NOT_FOUND_DETAIL = (
+    "Multipart upload not found. It may have been completed or aborted."
+)
+
+# S3 download bodies are streamed to clients in chunks of this size
+DOWNLOAD_CHUNK_SIZE_BYTES = 64 * 1024
+
+# bodies up to this size are read once and shared by concurrent coalesced reads;
+# larger ones are streamed, each by its own `get_object`
+MAX_SHARED_BODY_SIZE_BYTES = 1024 * 1024
+
+# reports whether a generation was served from the cache: "hit", "miss" or "bypass"
+GENERATION_CACHE_HEADER = "X-Generation-Cache"
+
+# set on responses replayed for a request with an `Idempotency-Key` header
+IDEMPOTENT_REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
 
-FILES_ROUTER = APIRouter(tags=["Files"])
-GENERATED_FILES_ROUTER = APIRouter(tags=["Generated Files"])
+# generated text streamed back with `stream=true`
+STREAMED_TEXT_CONTENT_TYPE = "text/plain; charset=utf-8"
+
+# suggested to clients whose generation jobs were refused because too many are queued
+GENERATION_JOBS_BUSY_RETRY_AFTER_SECONDS = 10
+
+ResultT = TypeVar("ResultT")
 
 ValidFilePath = Path(
     ...,
@@ -52,11 +254,469 @@ ValidFilePath = Path(
 )
 
 
+def raise_if_reserved_path(settings: Settings, file_path: str) -> None:
+    """Raise an HTTPException if the given path is reserved for internal objects."""
+    if file_path.startswith(settings.internal_key_prefix):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Paths starting with '{settings.internal_key_prefix}' are reserved.",
+        )
+
+
+def store_file(
+    settings: Settings,
+    file_path: str,
+    file_content: Union[bytes, BinaryIO],
+    content_type: Optional[str],
+    expected_checksums: Optional[Dict[str, str]] = None,
+) -> ObjectChecksums:
+    """Upload file content to S3 using the storage modes enabled in the settings."""
+    if settings.content_addressed_storage:
+        return upload_content_addressed_s3_object(
+            bucket_name=settings.s3_bucket_name,
+            object_key=file_path,
+            file_content=file_content,
+            internal_key_prefix=settings.internal_key_prefix,
+            content_type=content_type,
+            compress=settings.compress_uploads_at_rest,
+            expected_checksums=expected_checksums,
+        ).checksums
+
+    return upload_s3_object(
+        bucket_name=settings.s3_bucket_name,
+        object_key=file_path,
+        file_content=file_content,
+        content_type=content_type,
+        compress=settings.compress_uploads_at_rest,
+        expected_checksums=expected_checksums,
+    )
+
+
+async def store_file_from_stream(
+    settings: Settings,
+    file_path: str,
+    chunks: AsyncIterable[bytes],
+    content_type: Optional[str],
+) -> ObjectChecksums:
+    """
+    Upload file content to S3 while it is produced, e.g. downloaded from elsewhere.
+
+    Content-addressed storage and compression at rest need the whole content before it
+    is stored, so for those it is spooled first (to disk past a few MiB), as uploads are.
+    """
+    if settings.content_addressed_storage or (
+        settings.compress_uploads_at_rest and is_compressible_content_type(content_type)
+    ):
+        with SpooledTemporaryFile(max_size=MAX_IN_MEMORY_SPOOL_SIZE_BYTES) as spool:
+            async for chunk in chunks:
+                spool.write(chunk)
+            spool.seek(0)
+            return await asyncio.to_thread(
+                store_file, settings, file_path, spool, content_type  # type: ignore[arg-type]
+            )
+
+    return await upload_s3_object_from_stream(
+        bucket_name=settings.s3_bucket_name,
+        object_key=file_path,
+        chunks=chunks,
+        content_type=content_type,
+    )
+
+
+def copy_stored_file(settings: Settings, source_path: str, file_path: str) -> None:
+    """Copy a file within S3, server-side, using the storage modes enabled in the settings."""
+    if settings.content_addressed_storage:
+        copy_content_addressed_s3_object(
+            bucket_name=settings.s3_bucket_name,
+            source_key=source_path,
+            object_key=file_path,
+            internal_key_prefix=settings.internal_key_prefix,
+        )
+    else:
+        copy_s3_object(
+            bucket_name=settings.s3_bucket_name,
+            source_key=source_path,
+            object_key=file_path,
+        )
+
+
+async def generate_and_store_file(
+    settings: Settings,
+    clients: GenerationClients,
+    file_type: GeneratedFileType,
+    prompt: str,
+    file_path: str,
+) -> None:
+    """Generate a file with OpenAI and upload it to S3."""
+    # the OpenAI SDK is slow to import and only needed here,
+    # so it is imported on first use rather than when the app starts (e.g. a cold start)
+    # pylint: disable=import-outside-toplevel
+    from files_api.generate_files import (
+        get_text_chat_completion,
+        stream_generated_image,
+        stream_text_to_speech,
+    )
+
+    # try to guess the mimetype from the file path's extension if we don't know it otherwise
+    guessed_content_type = mimetypes.guess_type(file_path)[0]
+
+    # generate text
+    if file_type == GeneratedFileType.TEXT:
+        file_content = await get_text_chat_completion(
+            prompt=prompt,
+            client=clients.openai_client,
+            scheduler=clients.openai_scheduler,
+        )
+        file_content_bytes: bytes = file_content.encode(
+            "utf-8"
+        )  # convert string to bytes
+
+        # Upload the generated file to S3
+        store_file(
+            settings=settings,
+            file_path=file_path,
+            file_content=file_content_bytes,
+            content_type="text/plain",
+        )
+
+    # generate an image, and upload it to S3 as it is downloaded
+    elif file_type == GeneratedFileType.IMAGE:
+        await store_file_from_stream(
+            settings=settings,
+            file_path=file_path,
+            chunks=stream_generated_image(
+                prompt=prompt,
+                response_format=settings.generated_image_response_format,
+                client=clients.openai_client,
+                http_client=clients.http_client,
+                scheduler=clients.openai_scheduler,
+            ),
+            content_type=guessed_content_type,
+        )
+
+    # generate audio, and upload it to S3 as it is downloaded
+    else:
+        response_audio_file_format = file_path.split(".")[-1]  # the file extension
+        async with stream_text_to_speech(
+            prompt=prompt,
+            response_format=response_audio_file_format,  # type: ignore
+            client=clients.openai_client,
+            scheduler=clients.openai_scheduler,
+        ) as (audio_chunks, audio_content_type):
+            await store_file_from_stream(
+                settings=settings,
+                file_path=file_path,
+                chunks=audio_chunks,
+                content_type=audio_content_type or guessed_content_type,
+            )
+
+
+async def run_generation(
+    settings: Settings,
+    clients: GenerationClients,
+    query_params: GeneratedFileParams,
+) -> str:
+    """
+    Store a generated file, copying it from the generation cache if it is there.
+
+    :return: Whether the cache was a "hit", a "miss", or bypassed ("bypass").
+    """
+    cache_key, cache_hit = await look_up_generation_cache(settings, query_params)
+
+    if cache_hit:
+        await asyncio.to_thread(
+            copy_stored_file, settings, cache_key, query_params.file_path  # type: ignore[arg-type]
+        )
+        return "hit"
+
+    await generate_and_store_file(
+        settings,
+        clients,
+        file_type=query_params.file_type,
+        prompt=query_params.prompt,
+        file_path=query_params.file_path,
+    )
+    if cache_key is not None:
+        await asyncio.to_thread(
+            copy_stored_file, settings, query_params.file_path, cache_key
+        )
+    return "miss" if cache_key is not None else "bypass"
+
+
+async def look_up_generation_cache(
+    settings: Settings, query_params: GeneratedFileParams
+) -> Tuple[Optional[str], bool]:
+    """
+    Look up a generation in the cache, unless the cache is disabled or bypassed.
+
+    :return: The key of the cache entry, or None if the cache is not used, and whether
+        the entry is cached.
+    """
+    if not query_params.use_cache or settings.generation_cache_ttl_seconds <= 0:
+        GENERATION_CACHE_STATS.record_bypass()
+        return None, False
+
+    cache_key = get_generation_cache_key_for(settings, query_params)
+    cache_hit = await asyncio.to_thread(
+        is_generation_cached,
+        settings.s3_bucket_name,
+        cache_key,
+        settings.generation_cache_ttl_seconds,
+    )
+    GENERATION_CACHE_STATS.record_lookup(hit=cache_hit)
+    return cache_key, cache_hit
+
+
+async def stream_generated_text(
+    settings: Settings,
+    clients: GenerationClients,
+    query_params: GenerateFilesQueryParams,
+) -> StreamingResponse:
+    """
+    Respond with generated text as it is generated, storing it at the same time.
+
+    A cached generation is copied, then streamed from S3.
+    """
+    # pylint: disable=import-outside-toplevel
+    from files_api.generate_files import stream_text_chat_completion
+
+    cache_key, cache_hit = await look_up_generation_cache(settings, query_params)
+    if cache_hit:
+        await asyncio.to_thread(
+            copy_stored_file, settings, cache_key, query_params.file_path  # type: ignore[arg-type]
+        )
+        return StreamingResponse(
+            content=await asyncio.to_thread(
+                iter_file_content, settings, query_params.file_path
+            ),
+            status_code=status.HTTP_201_CREATED,
+            media_type=STREAMED_TEXT_CONTENT_TYPE,
+            headers={GENERATION_CACHE_HEADER: "hit"},
+        )
+
+    # open the stream before responding, so that failing to (e.g. rate limiting)
+    # still gets its own status code
+    stack = AsyncExitStack()
+    text = await stack.enter_async_context(
+        stream_text_chat_completion(
+            prompt=query_params.prompt,
+            client=clients.openai_client,
+            scheduler=clients.openai_scheduler,
+        )
+    )
+    return StreamingResponse(
+        content=stream_and_store_text(
+            settings, query_params.file_path, text, cache_key, stack
+        ),
+        status_code=status.HTTP_201_CREATED,
+        media_type=STREAMED_TEXT_CONTENT_TYPE,
+        headers={GENERATION_CACHE_HEADER: "miss" if cache_key else "bypass"},
+        # closes the stream if the response ends before the body is iterated
+        background=BackgroundTask(stack.aclose),
+    )
+
+
+async def stream_and_store_text(  # pylint: disable=too-many-arguments
+    settings: Settings,
+    file_path: str,
+    text: AsyncIterator[str],
+    cache_key: Optional[str],
+    stack: AsyncExitStack,
+) -> AsyncIterator[bytes]:
+    """
+    Yield generated text as it arrives, while uploading it to S3.
+
+    The upload only completes once the text does; if the generation fails or the client
+    disconnects midway, it is aborted and no file is stored.
+    """
+    chunks: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue()
+
+    async def iter_queued_chunks() -> AsyncIterator[bytes]:
+        while (chunk := await chunks.get()) is not None:
+            yield chunk
+
+    store = asyncio.ensure_future(
+        store_file_from_stream(
+            settings, file_path, iter_queued_chunks(), content_type="text/plain"
+        )
+    )
+    try:
+        async for piece in text:
+            chunk = piece.encode("utf-8")
+            chunks.put_nowait(chunk)
+            yield chunk
+        chunks.put_nowait(None)
+        await store
+    finally:
+        # cancelling an unfinished upload aborts it
+        store.cancel()
+        await asyncio.gather(store, return_exceptions=True)
+        await stack.aclose()
+
+    if cache_key is not None:
+        await asyncio.to_thread(copy_stored_file, settings, file_path, cache_key)
+
+
+async def submit_generation_job(
+    settings: Settings,
+    clients: GenerationClients,
+    generation_job_pool: WorkerPool,
+    query_params: GenerateFilesQueryParams,
+) -> GenerationJob:
+    """
+    Record a generation job and queue it to run in the background.
+
+    :raises HTTPException: 503 if too many jobs are queued already.
+    """
+    if generation_job_pool.is_full():
+        raise_generation_jobs_busy()
+
+    job = await asyncio.to_thread(
+        create_generation_job,
+        bucket_name=settings.s3_bucket_name,
+        file_path=query_params.file_path,
+        file_type=query_params.file_type.value,
+        internal_key_prefix=settings.internal_key_prefix,
+    )
+    try:
+        generation_job_pool.submit(
+            partial(run_generation_job, settings, clients, query_params, job),
+            on_drop=partial(
+                fail_generation_job,
+                settings,
+                job,
+                error="Dropped by a shutdown of the server before it started.",
+            ),
+        )
+    except WorkerPoolFullError:
+        await fail_generation_job(
+            settings, job, error="Too many generation jobs are queued."
+        )
+        raise_generation_jobs_busy()
+
+    return job
+
+
+async def run_generation_job(
+    settings: Settings,
+    clients: GenerationClients,
+    query_params: GenerateFilesQueryParams,
+    job: GenerationJob,
+) -> None:
+    """Run a queued generation job, recording its progress in its persisted state."""
+
+    async def update(
+        job_status: GenerationJobStatus, error: Optional[str] = None
+    ) -> None:
+        await asyncio.to_thread(
+            update_generation_job,
+            settings.s3_bucket_name,
+            job,
+            settings.internal_key_prefix,
+            status=job_status,
+            error=error,
+        )
+
+    await update("running")
+    try:
+        await run_generation(settings, clients, query_params)
+    except asyncio.CancelledError:
+        await update("failed", error="Interrupted by a shutdown of the server.")
+        raise
+    except Exception as err:  # pylint: disable=broad-except
+        traceback.print_exc()
+        await update("failed", error=f"{type(err).__name__}: {err}")
+        return
+    await update("done")
+
+
+async def fail_generation_job(
+    settings: Settings, job: GenerationJob, error: str
+) -> None:
+    """Record that a generation job will never run."""
+    await asyncio.to_thread(
+        update_generation_job,
+        settings.s3_bucket_name,
+        job,
+        settings.internal_key_prefix,
+        status="failed",
+        error=error,
+    )
+
+
+def raise_generation_jobs_busy() -> NoReturn:
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many generation jobs are queued. Retry later.",
+        headers={"Retry-After": str(GENERATION_JOBS_BUSY_RETRY_AFTER_SECONDS)},
+    )
+
+
+def to_generation_job_response(job: GenerationJob) -> GenerationJobResponse:
+    return GenerationJobResponse(
+        job_id=job.job_id,
+        status=job.status,
+        file_path=job.file_path,
+        file_type=job.file_type,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+        error=job.error,
+    )
+
+
+def get_generation_cache_key_for(
+    settings: Settings, query_params: GeneratedFileParams
+) -> str:
+    """Get the generation cache key for the parameters a generation request implies."""
+    # pylint: disable=import-outside-toplevel
+    from files_api.generate_files import (
+        IMAGE_MODEL,
+        IMAGE_SIZE,
+        SPEECH_MODEL,
+        TEXT_MODEL,
+    )
+
+    model, size = {
+        GeneratedFileType.TEXT: (TEXT_MODEL, None),
+        GeneratedFileType.IMAGE: (IMAGE_MODEL, IMAGE_SIZE),
+        GeneratedFileType.AUDIO: (SPEECH_MODEL, None),
+    }[query_params.file_type]
+
+    return get_generation_cache_key(
+        internal_key_prefix=settings.internal_key_prefix,
+        file_type=query_params.file_type.value,
+        model=model,
+        prompt=query_params.prompt,
+        response_format=query_params.file_path.rsplit(".", 1)[-1],
+        size=size,
+    )
+
+
+def get_expected_checksums(request: Request) -> Dict[str, str]:
+    """Collect the checksums a client sent in `Content-MD5` or `x-checksum-*` headers."""
+    expected_checksums = {}
+    if content_md5 := request.headers.get("Content-MD5"):
+        expected_checksums["md5"] = content_md5
+    for algorithm in SUPPORTED_CHECKSUM_ALGORITHMS:
+        if checksum := request.headers.get(f"x-checksum-{algorithm}"):
+            expected_checksums[algorithm] = checksum
+    return expected_checksums
+
+
+def set_checksum_headers(response: Response, checksums: Dict[str, str]) -> None:
+    """Expose the stored checksums of a file as `x-checksum-*` response headers."""
+    for algorithm, checksum in checksums.items():
+        response.headers[f"x-checksum-{algorithm}"] = checksum
+
+
 @FILES_ROUTER.put(
     "/v1/files/{file_path:path}",
     responses={
         status.HTTP_200_OK: {"model": PutFileResponse},
         status.HTTP_201_CREATED: {"model": PutFileResponse},
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "The content does not match a checksum sent by the client.",
+        },
     },
 )
 async def upload_file(
@@ -75,9 +735,16 @@ async def upload_file(
     - **file_path**: The destination path where the file should be stored
     - **file_content**: The file content to upload (multipart/form-data)
 
+    ### Optional Headers
+    - **Content-MD5**, **x-checksum-md5**, **x-checksum-sha256**, **x-checksum-crc32**:
+      base64-encoded checksums of the file content; the upload is rejected if they don't match
+
     ### Response
     - **200 OK**: File was successfully updated (file already existed)
     - **201 Created**: File was successfully uploaded (new file created)
+    - **400 Bad Request**: The file content does not match a provided checksum
+
+    The response includes the SHA-256 and CRC32 of the stored content.
 
     ### Example
     ```bash
@@ -85,7 +752,10 @@ async def upload_file(
          -F "file=@local-file.pdf"
     ```
     """
-    s3_bucket_name = request.app.state.settings.s3_bucket_name
+    settings: Settings = request.app.state.settings
+    s3_bucket_name = settings.s3_bucket_name
+
+    raise_if_reserved_path(settings, file_path)
 
     object_already_exists = object_exists_in_s3(
         bucket_name=s3_bucket_name, object_key=file_path
@@ -98,18 +768,20 @@ async def upload_file(
         response_message = f"New file uploaded at path: /{file_path}"
         response.status_code = status.HTTP_201_CREATED
 
-    file_content_bytes: bytes = await file_content.read()
-
-    upload_s3_object(
-        bucket_name=s3_bucket_name,
-        object_key=file_path,
-        file_content=file_content_bytes,
+    # stream the spooled upload to S3 rather than reading it all into memory
+    checksums = store_file(
+        settings=settings,
+        file_path=file_path,
+        file_content=file_content.file,
         content_type=file_content.content_type,
+        expected_checksums=get_expected_checksums(request),
     )
 
     return PutFileResponse(
         file_path=file_path,
         message=response_message,
+        checksum_sha256=checksums.sha256,
+        checksum_crc32=checksums.crc32,
     )
 
 
@@ -128,6 +800,9 @@ async def list_files(
     - **directory** (optional): Filter files by directory prefix
     - **page_size** (optional): Number of files to return per page (default: 100)
     - **page_token** (optional): Token for retrieving the next page of results
+    - **logical_sizes** (optional): Report the size of each file's content (default), or
+      `false` for its stored size, which saves an S3 request per file compressed at rest
+      or content-addressed
 
     ### Response
     Returns a list of files with metadata including:
@@ -148,27 +823,75 @@ async def list_files(
     curl "https://api.example.com/v1/files?page_token=abc123"
     ```
     """
-    s3_bucket_name = request.app.state.settings.s3_bucket_name
+    settings: Settings = request.app.state.settings
+    s3_bucket_name = settings.s3_bucket_name
+    page_size = query_params.page_size or DEFAULT_GET_FILES_PAGE_SIZE
 
     if query_params.page_token is None:
-        objects, token = fetch_s3_objects_metadata(
+        listed_objects, token = fetch_s3_objects_metadata(
             bucket_name=s3_bucket_name,
             prefix=query_params.directory,
-            max_keys=query_params.page_size or DEFAULT_GET_FILES_PAGE_SIZE,
+            max_keys=page_size,
         )
 
     else:
-        objects, token = fetch_s3_objects_using_page_token(
+        listed_objects, token = fetch_s3_objects_using_page_token(
             bucket_name=s3_bucket_name,
             continuation_token=query_params.page_token,
-            max_keys=query_params.page_size or DEFAULT_GET_FILES_PAGE_SIZE,
+            max_keys=page_size,
+        )
+
+    # internal objects such as content-addressed blobs are not files, so pages that run
+    # into them are topped up from past them; listing is never asked for more keys than
+    # are missing, so that the token resumes right after the last key of the page
+    objects: List["ObjectTypeDef"] = []
+    while True:
+        objects.extend(
+            file
+            for file in listed_objects
+            if not str(file["Key"]).startswith(settings.internal_key_prefix)
+        )
+        if token is None or len(objects) >= page_size:
+            break
+
+        last_key = str(listed_objects[-1]["Key"]) if listed_objects else ""
+        if last_key.startswith(settings.internal_key_prefix):
+            listed_objects, token = fetch_s3_objects_metadata(
+                bucket_name=s3_bucket_name,
+                prefix=query_params.directory,
+                max_keys=page_size - len(objects),
+                start_after=get_internal_keys_end(settings),
+            )
+        else:
+            listed_objects, token = fetch_s3_objects_using_page_token(
+                bucket_name=s3_bucket_name,
+                continuation_token=token,
+                max_keys=page_size - len(objects),
+            )
+
+    # compressed objects and pointers are listed with their stored size; their logical
+    # size takes a `head_object` call each, unless the stored sizes are asked for
+    sizes = {str(file["Key"]): file["Size"] for file in objects}
+    if query_params.logical_sizes and settings.compress_uploads_at_rest:
+        sizes.update(
+            fetch_s3_objects_logical_sizes(
+                bucket_name=s3_bucket_name, object_keys=list(sizes)
+            )
+        )
+    elif query_params.logical_sizes and settings.content_addressed_storage:
+        # pointers are empty, so no other object needs its size fetched
+        sizes.update(
+            fetch_s3_objects_logical_sizes(
+                bucket_name=s3_bucket_name,
+                object_keys=[key for key, size in sizes.items() if size == 0],
+            )
         )
 
     files = [
         FileMetadata(
             file_path=str(file["Key"]),
             last_modified=file["LastModified"],
-            size_bytes=file["Size"],
+            size_bytes=sizes[str(file["Key"])],
         )
         for file in objects
     ]
@@ -179,6 +902,50 @@ async def list_files(
     )
 
 
+def get_internal_keys_end(settings: Settings) -> str:
+    """Get a key that sorts after every internal key, to list the keys past them."""
+    # S3 sorts keys by their UTF-8 bytes, and no character encodes higher than U+10FFFF
+    return f"{settings.internal_key_prefix}\U0010ffff"
+
+
+def get_presigned_download_url(
+    settings: Settings,
+    file_path: str,
+    object_response: Union["HeadObjectOutputTypeDef", "GetObjectOutputTypeDef"],
+    stored_object_response: Union[
+        "HeadObjectOutputTypeDef", "GetObjectOutputTypeDef", None
+    ] = None,
+    expires_in_seconds: Optional[int] = None,
+) -> str:
+    """
+    Presign a direct S3 download of a file.
+
+    Content-addressed pointers are followed to their blob, and S3 is told to respond
+    with the file's content type and, for files compressed at rest, content encoding.
+
+    :param object_response: `head_object` or `get_object` response for `file_path`.
+    :param stored_object_response: Response for the object holding the content, if
+        already fetched; looked up when `object_response` is a pointer otherwise.
+    """
+    object_key = file_path
+    stored_object_response = stored_object_response or object_response
+    if (sha256 := get_blob_sha256(object_response)) is not None:
+        object_key = get_blob_key(settings.internal_key_prefix, sha256)
+        if stored_object_response is object_response:
+            stored_object_response = fetch_s3_object_head(
+                bucket_name=settings.s3_bucket_name, object_key=object_key
+            )
+
+    return generate_presigned_download_url(
+        bucket_name=settings.s3_bucket_name,
+        object_key=object_key,
+        expires_in_seconds=expires_in_seconds
+        or settings.presigned_url_expiration_seconds,
+        response_content_type=object_response["ContentType"],
+        response_content_encoding=get_stored_encoding(stored_object_response),
+    )
+
+
 def raise_if_file_not_found(bucket_name: str, file_path: str) -> None:
     """Raise an HTTPException is the given file is not in the bucket."""
     if not object_exists_in_s3(bucket_name=bucket_name, object_key=file_path):
@@ -187,6 +954,144 @@ def raise_if_file_not_found(bucket_name: str, file_path: str) -> None:
         )
 
 
+def fetch_object_head_if_exists(
+    bucket_name: str, object_key: str
+) -> Optional["HeadObjectOutputTypeDef"]:
+    """Fetch the metadata of an object, or None if it does not exist."""
+    try:
+        return fetch_s3_object_head(bucket_name=bucket_name, object_key=object_key)
+    except ClientError as err:
+        if err.response["Error"]["Code"] != "404":
+            raise err
+        return None
+
+
+def fetch_file_to_read(
+    settings: Settings, file_path: str
+) -> Tuple["GetObjectOutputTypeDef", "GetObjectOutputTypeDef"]:
+    """
+    Open a file to serve it.
+
+    :return: The `get_object` responses of the file, and of the object holding its
+        content (the file's blob, or the file itself if it is not a pointer).
+    """
+    object_response = fetch_s3_object(
+        bucket_name=settings.s3_bucket_name, object_key=file_path
+    )
+    return object_response, resolve_blob_pointer(
+        bucket_name=settings.s3_bucket_name,
+        object_response=object_response,
+        internal_key_prefix=settings.internal_key_prefix,
+    )
+
+
+def fetch_file_to_share(
+    settings: Settings, file_path: str
+) -> Tuple["GetObjectOutputTypeDef", "GetObjectOutputTypeDef", Optional[bytes]]:
+    """Open a file to serve it, and read its content if it is small enough to share."""
+    object_response, response = fetch_file_to_read(settings, file_path)
+    if response["ContentLength"] > MAX_SHARED_BODY_SIZE_BYTES:
+        return object_response, response, None
+    return object_response, response, response["Body"].read()
+
+
+async def read_coalesced(
+    request: Request, key: Hashable, read: Callable[[], ResultT]
+) -> Tuple[ResultT, bool]:
+    """
+    Make a blocking S3 read in a thread, sharing it with concurrent reads if enabled.
+
+    Reads are shared on the event loop, so requests waiting for another's read don't
+    hold a thread.
+
+    :return: The result, and whether it came from another request's read. Callers
+        must not mutate a shared result.
+    """
+    if not request.app.state.settings.coalesce_concurrent_reads:
+        return await asyncio.to_thread(read), False
+    return await request.app.state.coalesced_reads.run(
+        key, lambda: asyncio.to_thread(read)
+    )
+
+
+async def look_up_file(request: Request, file_path: str) -> "HeadObjectOutputTypeDef":
+    """
+    Fetch the metadata of a file, sharing the call with concurrent reads if enabled.
+
+    :raises HTTPException: If the file does not exist.
+    """
+    bucket_name = request.app.state.settings.s3_bucket_name
+    head_object_response, _ = await read_coalesced(
+        request,
+        ("head_object", file_path),
+        partial(fetch_object_head_if_exists, bucket_name, file_path),
+    )
+    if head_object_response is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="File not found."
+        )
+    return head_object_response
+
+
+async def fetch_file_metadata(
+    request: Request, file_path: str
+) -> "HeadObjectOutputTypeDef":
+    """
+    Fetch the metadata of a file and of its content, without opening any body.
+
+    :return: The `head_object` response of the object holding the file's content,
+        with the content type and last modified date of the file.
+    :raises HTTPException: If the file does not exist.
+    """
+    head_object_response = await look_up_file(request, file_path)
+    sha256 = get_blob_sha256(head_object_response)
+    if sha256 is None:
+        return head_object_response
+
+    blob_key = get_blob_key(request.app.state.settings.internal_key_prefix, sha256)
+    blob_head_object_response = await look_up_file(request, blob_key)
+    file_head_object_response = blob_head_object_response.copy()
+    file_head_object_response["ContentType"] = head_object_response["ContentType"]
+    file_head_object_response["LastModified"] = head_object_response["LastModified"]
+    return file_head_object_response
+
+
+async def open_file_to_read(
+    request: Request, file_path: str
+) -> Tuple["GetObjectOutputTypeDef", "GetObjectOutputTypeDef"]:
+    """
+    Look up a file and open it to serve it, sharing the S3 calls of concurrent reads if enabled.
+
+    Bodies up to `MAX_SHARED_BODY_SIZE_BYTES` are read once, and each request gets its
+    own stream over them.
+
+    :return: The `get_object` responses of the file, and of the object holding its
+        content (the file's blob, or the file itself if it is not a pointer).
+    :raises HTTPException: If the file does not exist.
+    """
+    settings = request.app.state.settings
+    await look_up_file(request, file_path)
+    if not settings.coalesce_concurrent_reads:
+        return await asyncio.to_thread(fetch_file_to_read, settings, file_path)
+
+    (object_response, response, body), shared = await read_coalesced(
+        request,
+        ("get_object", file_path),
+        partial(fetch_file_to_share, settings, file_path),
+    )
+    if body is None:
+        # a body too large to buffer can only be streamed by the request that opened it
+        if shared:
+            return await asyncio.to_thread(fetch_file_to_read, settings, file_path)
+        return object_response, response
+
+    own_response = response.copy()
+    own_response["Body"] = StreamingBody(BytesIO(body), len(body))
+    if object_response is response:
+        return own_response, own_response
+    return object_response, own_response
+
+
 @FILES_ROUTER.head(
     "/v1/files/{file_path:path}",
     responses={
@@ -210,6 +1115,14 @@ def raise_if_file_not_found(bucket_name: str, file_path: str) -> None:
                     "example": "Thu, 01 Jan 2022 00:00:00 GMT",
                     "schema": {"type": "string", "format": "date-time"},
                 },
+                "x-checksum-sha256": {
+                    "description": "Base64-encoded SHA-256 of the file content.",
+                    "schema": {"type": "string"},
+                },
+                "x-checksum-crc32": {
+                    "description": "Base64-encoded CRC32 of the file content.",
+                    "schema": {"type": "string"},
+                },
             }
         },
     },
@@ -232,6 +1145,8 @@ async def get_file_metadata(
     - **Content-Type**: The MIME type of the file
     - **Content-Length**: The size of the file in bytes
     - **Last-Modified**: The last modification date of the file
+    - **x-checksum-sha256**, **x-checksum-crc32**: Checksums of the file content
+      recorded when it was uploaded through this API; not every file has both
 
     ### Status Codes
     - **200 OK**: File exists and metadata retrieved successfully
@@ -244,19 +1159,14 @@ async def get_file_metadata(
 
     Note: This endpoint returns only headers, no response body.
     """
-    settings = request.app.state.settings
-
-    raise_if_file_not_found(bucket_name=settings.s3_bucket_name, file_path=file_path)
-
-    get_object_response = fetch_s3_object(
-        bucket_name=settings.s3_bucket_name, object_key=file_path
-    )
+    head_object_response = await fetch_file_metadata(request, file_path)
 
-    response.headers["Content-Type"] = get_object_response["ContentType"]
-    response.headers["Content-Length"] = str(get_object_response["ContentLength"])
-    response.headers["Last-Modified"] = get_object_response["LastModified"].strftime(
+    response.headers["Content-Type"] = head_object_response["ContentType"]
+    response.headers["Content-Length"] = str(get_logical_size(head_object_response))
+    response.headers["Last-Modified"] = head_object_response["LastModified"].strftime(
         "%a, %d %b %Y %H:%M:%S GMT"
     )
+    set_checksum_headers(response, get_checksums(head_object_response))
     response.status_code = status.HTTP_200_OK
 
     return response
@@ -276,12 +1186,15 @@ async def get_file_metadata(
                 },
             },
         },
+        status.HTTP_307_TEMPORARY_REDIRECT: {
+            "description": "Redirect to a presigned S3 URL for large files, if enabled.",
+        },
     },
 )
 async def get_file(
     request: Request,
     file_path: str = ValidFilePath,
-) -> StreamingResponse:
+) -> Response:
     """
     ## Download a File
 
@@ -293,11 +1206,20 @@ async def get_file(
 
     ### Response
     - **200 OK**: File content streamed successfully
+    - **307 Temporary Redirect**: The file is larger than the configured redirect threshold;
+      follow the `Location` header to download it directly from S3
     - **404 Not Found**: File does not exist
 
     ### Response Headers
     - **Content-Type**: The MIME type of the file
-    - **Content-Length**: The size of the file in bytes
+    - **Content-Length**: The size of the file in bytes (omitted when compressed)
+    - **Content-Encoding**: `zstd`, `br` or `gzip` if the file was compressed on the fly
+    - **x-checksum-sha256**, **x-checksum-crc32**: Checksums of the file content
+      recorded when it was uploaded through this API; not every file has both
+
+    Text-like files (e.g. `text/*`, JSON, CSV) larger than the configured minimum size
+    are compressed using the best encoding in the request's `Accept-Encoding` header.
+    Already-compressed media such as images and audio are sent as-is.
 
     ### Example
     ```bash
@@ -311,57 +1233,267 @@ async def get_file(
     """
     settings = request.app.state.settings
 
-    raise_if_file_not_found(settings.s3_bucket_name, file_path)
+    object_response, response = await open_file_to_read(request, file_path)
 
-    response = fetch_s3_object(
-        bucket_name=settings.s3_bucket_name, object_key=file_path
+    stored_encoding = get_stored_encoding(response)
+    accept_encoding = request.headers.get("Accept-Encoding", "")
+    client_accepts_stored_encoding = stored_encoding is None or bool(
+        negotiate_content_encoding(accept_encoding, [stored_encoding])
     )
-    return StreamingResponse(
-        content=response["Body"], media_type=response["ContentType"]
+
+    # let large files be downloaded straight from S3 rather than through the API
+    redirect_threshold = settings.redirect_downloads_above_bytes
+    if (
+        redirect_threshold is not None
+        and get_logical_size(response) > redirect_threshold
+        and client_accepts_stored_encoding
+    ):
+        response["Body"].close()
+        return RedirectResponse(
+            url=get_presigned_download_url(
+                settings=settings,
+                file_path=file_path,
+                object_response=object_response,
+                stored_object_response=response,
+            ),
+            status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+        )
+
+    content = response["Body"].iter_chunks(chunk_size=DOWNLOAD_CHUNK_SIZE_BYTES)
+    headers = {"Content-Length": str(response["ContentLength"])}
+
+    # objects compressed at rest are passed through as-is if the client accepts
+    # their encoding, and are otherwise decompressed as they are streamed
+    if stored_encoding is not None:
+        if client_accepts_stored_encoding:
+            headers["Content-Encoding"] = stored_encoding
+            headers["Vary"] = "Accept-Encoding"
+        else:
+            content = iter_decompressed(content, stored_encoding)
+            headers["Content-Length"] = str(get_logical_size(response))
+
+    streaming_response = StreamingResponse(
+        content=content,
+        media_type=response["ContentType"],
+        headers=headers,
     )
+    set_checksum_headers(streaming_response, get_checksums(response))
 
+    return streaming_response
 
-@FILES_ROUTER.delete(
+
+def iter_file_content(settings: Settings, file_path: str) -> Iterator[bytes]:
+    """Stream the content of a file as uploaded, however it is stored."""
+    response = resolve_blob_pointer(
+        bucket_name=settings.s3_bucket_name,
+        object_response=fetch_s3_object(
+            bucket_name=settings.s3_bucket_name, object_key=file_path
+        ),
+        internal_key_prefix=settings.internal_key_prefix,
+    )
+    content = response["Body"].iter_chunks(chunk_size=DOWNLOAD_CHUNK_SIZE_BYTES)
+    if (stored_encoding := get_stored_encoding(response)) is not None:
+        content = iter_decompressed(content, stored_encoding)
+    return content
+
+
+def is_stored_transformed(object_response: "HeadObjectOutputTypeDef") -> bool:
+    """Whether a file's stored bytes differ from its content, i.e. S3 cannot copy ranges."""
+    return bool(
+        get_stored_encoding(object_response) or get_blob_sha256(object_response)
+    )
+
+
+def rewrite_patched_file(
+    settings: Settings,
+    file_path: str,
+    object_response: "HeadObjectOutputTypeDef",
+    patch: ObjectPatch,
+) -> int:
+    """
+    Apply a patch by storing the whole patched file anew.
+
+    Used for files whose stored bytes are not their content, i.e. files compressed at
+    rest or stored by content hash, which cannot be patched by byte range in place.
+    """
+    content = iter_file_content(settings, file_path)
+
+    with SpooledTemporaryFile(max_size=MAX_IN_MEMORY_SPOOL_SIZE_BYTES) as patched:
+        write_patched_content(patched, content, patch)  # type: ignore[arg-type]
+        size_bytes = patched.tell()
+        patched.seek(0)
+        store_file(
+            settings=settings,
+            file_path=file_path,
+            file_content=patched,  # type: ignore[arg-type]
+            content_type=object_response["ContentType"],
+        )
+
+    return size_bytes
+
+
+@FILES_ROUTER.patch(
     "/v1/files/{file_path:path}",
     responses={
         status.HTTP_404_NOT_FOUND: {
             "description": "File not found for the given `file_path`.",
         },
-        status.HTTP_204_NO_CONTENT: {
-            "description": "File deleted successfully.",
+        status.HTTP_409_CONFLICT: {
+            "description": "The file was modified by another request while being patched.",
+        },
+        status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE: {
+            "description": "`offset` is past the end of the file.",
+        },
+    },
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/octet-stream": {
+                    "schema": {"type": "string", "format": "binary"},
+                },
+            },
         },
     },
 )
-async def delete_file(
+async def patch_file(
     request: Request,
-    response: Response,
     file_path: str = ValidFilePath,
-) -> Response:
+    query_params: PatchFileQueryParams = Depends(),
+) -> PatchFileResponse:
     """
-    ## Delete a File
+    ## Patch File
 
-    Permanently delete a file from the specified path. This operation cannot be undone.
+    Overwrite, insert, or append bytes in an existing file without re-uploading it.
+    The new bytes are sent as the raw request body.
+
+    The unchanged parts of the file are copied within S3, so a small edit to a large
+    file costs about the size of the edit (plus up to 5 MiB, the minimum S3 part size).
+    Files compressed at rest or stored by content hash are rewritten in full.
 
     ### Parameters
-    - **file_path**: The path to the file to delete
+    - **file_path**: The path to the file
+    - **offset**: Where the new bytes go; defaults to the end of the file (append)
+    - **replace_length**: How many existing bytes are replaced; defaults to the length
+      of the new bytes (overwrite), use 0 to insert
 
     ### Response
-    - **204 No Content**: File deleted successfully
+    - **200 OK**: The file was patched
     - **404 Not Found**: File does not exist
+    - **409 Conflict**: The file changed while it was being patched; retry
+    - **416 Range Not Satisfiable**: `offset` is past the end of the file
 
     ### Example
     ```bash
-    curl -X DELETE "https://api.example.com/v1/files/documents/old-report.pdf"
+    # append a line to a log file
+    echo "new log line" | curl -X PATCH --data-binary @- "https://api.example.com/v1/files/logs/app.log"
     ```
-
-    **Warning**: This operation permanently removes the file and cannot be reversed.
     """
-    settings = request.app.state.settings
-
-    raise_if_file_not_found(settings.s3_bucket_name, file_path)
+    settings: Settings = request.app.state.settings
 
-    delete_s3_object(bucket_name=settings.s3_bucket_name, object_key=file_path)
-    response.status_code = status.HTTP_204_NO_CONTENT
+    raise_if_reserved_path(settings, file_path)
+    raise_if_file_not_found(bucket_name=settings.s3_bucket_name, file_path=file_path)
+
+    object_response = fetch_s3_object_head(
+        bucket_name=settings.s3_bucket_name, object_key=file_path
+    )
+    file_size = get_logical_size(object_response)
+
+    with SpooledTemporaryFile(max_size=MAX_IN_MEMORY_SPOOL_SIZE_BYTES) as content:
+        async for body_chunk in request.stream():
+            content.write(body_chunk)
+        content_length = content.tell()
+        content.seek(0)
+
+        offset = file_size if query_params.offset is None else query_params.offset
+        if offset > file_size:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail=f"Offset {offset} is past the end of the file ({file_size} bytes).",
+                headers={"Content-Range": f"bytes */{file_size}"},
+            )
+        replace_length = query_params.replace_length
+        patch = ObjectPatch(
+            offset=offset,
+            content=content,  # type: ignore[arg-type]
+            replace_length=content_length if replace_length is None else replace_length,
+        )
+
+        if is_stored_transformed(object_response):
+            size_bytes = rewrite_patched_file(
+                settings, file_path, object_response, patch
+            )
+        else:
+            try:
+                size_bytes = patch_s3_object(
+                    bucket_name=settings.s3_bucket_name,
+                    object_key=file_path,
+                    patch=patch,
+                )
+            except ClientError as err:
+                if err.response["Error"]["Code"] != "PreconditionFailed":
+                    raise err
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="The file was modified while it was being patched.",
+                ) from err
+
+    return PatchFileResponse(
+        file_path=file_path,
+        message=f"File patched at path: /{file_path}",
+        size_bytes=size_bytes,
+    )
+
+
+@FILES_ROUTER.delete(
+    "/v1/files/{file_path:path}",
+    responses={
+        status.HTTP_404_NOT_FOUND: {
+            "description": "File not found for the given `file_path`.",
+        },
+        status.HTTP_204_NO_CONTENT: {
+            "description": "File deleted successfully.",
+        },
+    },
+)
+async def delete_file(
+    request: Request,
+    response: Response,
+    file_path: str = ValidFilePath,
+) -> Response:
+    """
+    ## Delete a File
+
+    Permanently delete a file from the specified path. This operation cannot be undone.
+
+    ### Parameters
+    - **file_path**: The path to the file to delete
+
+    ### Response
+    - **204 No Content**: File deleted successfully
+    - **404 Not Found**: File does not exist
+
+    ### Example
+    ```bash
+    curl -X DELETE "https://api.example.com/v1/files/documents/old-report.pdf"
+    ```
+
+    **Warning**: This operation permanently removes the file and cannot be reversed.
+    """
+    settings = request.app.state.settings
+
+    raise_if_reserved_path(settings, file_path)
+    raise_if_file_not_found(settings.s3_bucket_name, file_path)
+
+    if settings.content_addressed_storage:
+        delete_content_addressed_s3_object(
+            bucket_name=settings.s3_bucket_name,
+            object_key=file_path,
+            internal_key_prefix=settings.internal_key_prefix,
+        )
+    else:
+        delete_s3_object(bucket_name=settings.s3_bucket_name, object_key=file_path)
+    response.status_code = status.HTTP_204_NO_CONTENT
 
     return response
 
@@ -388,15 +1520,38 @@ async def delete_file(
                         ][2],
                     },
                 },
+                "text/plain": {
+                    "example": "Roses are red, violets are blue...",
+                },
             },
         },
+        status.HTTP_202_ACCEPTED: {
+            "model": GenerationJobResponse,
+            "description": "Generation job queued (`respond_async=true`)",
+        },
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "`respond_async=true` where generation jobs are disabled, e.g. on Lambda",
+        },
+        status.HTTP_409_CONFLICT: {
+            "description": "A request with the same `Idempotency-Key` is in progress; retry later",
+        },
+        status.HTTP_503_SERVICE_UNAVAILABLE: {
+            "description": "Too many generation jobs are queued; retry later",
+        },
     },
 )
 async def generate_file_using_openai(
     request: Request,
-    response: Response,
     query_params: Annotated[GenerateFilesQueryParams, Depends()],
-) -> PutGeneratedFileResponse:
+    idempotency_key: Annotated[
+        Optional[str],
+        Header(
+            alias="Idempotency-Key",
+            max_length=MAX_IDEMPOTENCY_KEY_LENGTH,
+            description="A unique key, so that retries of the request are only generated once.",
+        ),
+    ] = None,
+) -> Union[PutGeneratedFileResponse, GenerationJobResponse]:
     """
     Generate a File using AI.
 
@@ -407,52 +1562,1360 @@ async def generate_file_using_openai(
 
     Note: the generated file type is derived from the file_path extension. So the file_path must have
     an extension matching one of the supported file types in the list above.
+
+    Generations repeating the parameters of an earlier one (file type, prompt and format) are
+    served by copying its file, unless `use_cache=false`. The `X-Generation-Cache` response
+    header reports whether the cache was a `hit`, a `miss`, or bypassed (`bypass`).
+
+    With `respond_async=true`, the response is a `202 Accepted` with a generation job, whose
+    status is at the URL in the `Location` header (`GET /v1/generation-jobs/{job_id}`).
+    Jobs run in the background of the server, so deployments that can't run them, such as
+    Lambda, answer `respond_async=true` with a `400 Bad Request`.
+
+    Identical requests made while one is in flight (e.g. retries, or double clicks) wait for it
+    and get its response, rather than generate the file again. With an `Idempotency-Key`
+    header, the response is also kept for a while and replayed, with an `Idempotent-Replayed`
+    header, to later requests with the same key; reusing a key for a different request is a
+    `422 Unprocessable Entity`, and a request whose key is in use by one still in progress is
+    a `409 Conflict`.
+
+    With `stream=true` (text only), the response body is the text itself, streamed as it is
+    generated, so it starts arriving after the first token rather than the last. The file is
+    written to S3 meanwhile and stored only once the text is complete.
     """
     settings: Settings = request.app.state.settings
-    s3_bucket_name = settings.s3_bucket_name
+    clients: GenerationClients = request.app.state.generation_clients
 
-    content_type = None
+    raise_if_reserved_path(settings, query_params.file_path)
+    if query_params.respond_async and not settings.generation_jobs_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Generation jobs (`respond_async=true`) are disabled on this deployment.",
+        )
 
-    # generate text
-    if query_params.file_type == GeneratedFileType.TEXT:
-        file_content = await get_text_chat_completion(prompt=query_params.prompt)
-        file_content_bytes: bytes = file_content.encode(
-            "utf-8"
-        )  # convert string to bytes
-        content_type = "text/plain"
-
-    # generate/download an image
-    elif query_params.file_type == GeneratedFileType.IMAGE:
-        image_url = await generate_image(prompt=query_params.prompt)
-        async with httpx.AsyncClient() as client:
-            image_response = await client.get(
-                image_url
-            )  # pylint: disable=missing-timeout
-        file_content_bytes = image_response.content
-
-    # generate audio
+    # streamed text is not replayed, so it is neither shared nor kept
+    if query_params.stream:
+        return await stream_generated_text(settings, clients, query_params)  # type: ignore[return-value]
+
+    request_fingerprint = get_request_fingerprint(query_params.model_dump(mode="json"))
+    uses_idempotency_key = (
+        idempotency_key is not None and settings.idempotency_key_ttl_seconds > 0
+    )
+    if uses_idempotency_key:
+        try:
+            stored_response = await asyncio.to_thread(
+                claim_idempotency_key,
+                settings.s3_bucket_name,
+                idempotency_key,
+                request_fingerprint,
+                settings.internal_key_prefix,
+                settings.idempotency_key_ttl_seconds,
+            )
+        except IdempotencyKeyInUseError as err:
+            raise_idempotency_key_in_use(err, request_fingerprint)
+        if stored_response is not None:
+            return replay_idempotent_response(stored_response, request_fingerprint)  # type: ignore[return-value]
+
+    try:
+        generated_response, _ = await request.app.state.in_flight_generations.run(
+            request_fingerprint,
+            lambda: respond_to_generation(
+                request, settings, clients, query_params, request_fingerprint
+            ),
+        )
+    except BaseException:
+        # failed requests are not replayed, so retries are free to claim the key again
+        if uses_idempotency_key:
+            await asyncio.to_thread(
+                release_idempotency_key,
+                settings.s3_bucket_name,
+                idempotency_key,
+                settings.internal_key_prefix,
+            )
+        raise
+
+    if uses_idempotency_key:
+        await asyncio.to_thread(
+            save_idempotent_response,
+            settings.s3_bucket_name,
+            idempotency_key,
+            generated_response,
+            settings.internal_key_prefix,
+        )
+
+    return JSONResponse(  # type: ignore[return-value]
+        content=generated_response.body,
+        status_code=generated_response.status_code,
+        headers=generated_response.headers,
+    )
+
+
+async def respond_to_generation(
+    request: Request,
+    settings: Settings,
+    clients: GenerationClients,
+    query_params: GenerateFilesQueryParams,
+    request_fingerprint: str,
+) -> IdempotentResponse:
+    """Generate a file, or queue a job to, and describe the response to send."""
+    if query_params.respond_async:
+        job = await submit_generation_job(
+            settings, clients, request.app.state.generation_job_pool, query_params
+        )
+        status_code = status.HTTP_202_ACCEPTED
+        headers = {
+            "Location": str(request.url_for("get_generation_job", job_id=job.job_id))
+        }
+        body = to_generation_job_response(job).model_dump(mode="json")
     else:
-        response_audio_file_format = query_params.file_path.split(".")[
-            -1
-        ]  # the file extension
-        file_content_bytes, content_type = await generate_text_to_speech(
-            prompt=query_params.prompt, response_format=response_audio_file_format  # type: ignore
+        status_code = status.HTTP_201_CREATED
+        headers = {
+            GENERATION_CACHE_HEADER: await run_generation(
+                settings, clients, query_params
+            )
+        }
+        body = PutGeneratedFileResponse(
+            file_path=query_params.file_path,
+            message=f"New {query_params.file_type.value} file generated and uploaded at path: {query_params.file_path}",
+        ).model_dump(mode="json")
+
+    return IdempotentResponse(
+        request_fingerprint=request_fingerprint,
+        status_code=status_code,
+        headers=headers,
+        body=body,
+        created_at=datetime.now(timezone.utc),
+    )
+
+
+def raise_idempotency_key_in_use(
+    err: IdempotencyKeyInUseError, request_fingerprint: str
+) -> NoReturn:
+    """
+    Refuse a request whose idempotency key is held by another request in progress.
+
+    :raises HTTPException: 422 if the key is used for a different request, else 409.
+    """
+    if err.request_fingerprint != request_fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="This Idempotency-Key was already used for a different request.",
+        ) from err
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is in progress; retry later.",
+    ) from err
+
+
+def replay_idempotent_response(
+    stored_response: IdempotentResponse, request_fingerprint: str
+) -> JSONResponse:
+    """
+    Send the response stored for an idempotency key again.
+
+    :raises HTTPException: If the key was used for a different request.
+    """
+    if stored_response.request_fingerprint != request_fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="This Idempotency-Key was already used for a different request.",
         )
+    return JSONResponse(
+        content=stored_response.body,
+        status_code=stored_response.status_code,
+        headers={**stored_response.headers, IDEMPOTENT_REPLAYED_HEADER: "true"},
+    )
 
-    # try to guess the mimetype from the file path's extension if we don't already know it
-    content_type: str | None = content_type or mimetypes.guess_type(query_params.file_path)[0]  # type: ignore
 
-    # Upload the generated file to S3
-    upload_s3_object(
-        bucket_name=s3_bucket_name,
-        object_key=query_params.file_path,
-        file_content=file_content_bytes,
-        content_type=content_type,
+@GENERATED_FILES_ROUTER.get(
+    "/v1/generation-jobs/{job_id}",
+    responses={status.HTTP_404_NOT_FOUND: {"description": "Job not found"}},
+)
+async def get_generation_job(request: Request, job_id: str) -> GenerationJobResponse:
+    """
+    ## Get a Generation Job
+
+    Report the status of a generation started with `respond_async=true`: `queued`,
+    `running`, `done` once the file is stored at `file_path`, or `failed`.
+
+    ### Example
+    ```bash
+    curl "https://api.example.com/v1/generation-jobs/9f2c4d1e8b7a4c3d9e0f1a2b3c4d5e6f"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+    try:
+        job = await asyncio.to_thread(
+            fetch_generation_job,
+            bucket_name=settings.s3_bucket_name,
+            job_id=job_id,
+            internal_key_prefix=settings.internal_key_prefix,
+        )
+    except GenerationJobNotFoundError as err:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=str(err)
+        ) from err
+
+    return to_generation_job_response(job)
+
+
+@GENERATED_FILES_ROUTER.post(
+    "/v1/generation-batches",
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "description": (
+                "One `GenerationBatchItemResult` per line, in the order the items finish"
+            ),
+            "content": {
+                "application/x-ndjson": {
+                    "schema": GenerationBatchItemResult.model_json_schema()
+                }
+            },
+        },
+    },
+)
+async def generate_files_in_batch(
+    request: Request, batch: GenerateFilesBatchRequest
+) -> StreamingResponse:
+    """
+    ## Generate Files in a Batch
+
+    Generate many files with one request. Up to `GENERATION_BATCH_CONCURRENCY` items, of
+    all the batches in flight, are generated at once, and each is uploaded to S3 while
+    later ones are generating.
+
+    The response streams a JSON line per item as soon as it finishes, so it doubles as a
+    progress feed. An item that fails is reported on its line without failing the others.
+    Closing the connection cancels the items not finished yet.
+
+    ### Example
+    ```bash
+    curl -X POST "https://api.example.com/v1/generation-batches" \
+         -H "Content-Type: application/json" \
+         -d '{"items": [{"file_path": "a.txt", "prompt": "A poem", "file_type": "text"}]}'
+    ```
+    """
+    settings: Settings = request.app.state.settings
+    clients: GenerationClients = request.app.state.generation_clients
+
+    for item in batch.items:
+        raise_if_reserved_path(settings, item.file_path)
+
+    return StreamingResponse(
+        iter_generation_batch_results(
+            settings,
+            clients,
+            batch.items,
+            generation_slots=request.app.state.generation_batch_slots,
+        ),
+        media_type="application/x-ndjson",
     )
 
-    # return response
-    response.status_code = status.HTTP_201_CREATED
-    return PutGeneratedFileResponse(
-        file_path=query_params.file_path,
-        message=f"New {query_params.file_type.value} file generated and uploaded at path: {query_params.file_path}",
+
+async def iter_generation_batch_results(
+    settings: Settings,
+    clients: GenerationClients,
+    items: List[GeneratedFileParams],
+    generation_slots: asyncio.Semaphore,
+) -> AsyncIterator[bytes]:
+    """
+    Generate the items of a batch concurrently, yielding a JSON line as each finishes.
+
+    :param generation_slots: Shared by all batches, to bound the generations in flight.
+    """
+
+    async def generate(
+        index: int, item: GeneratedFileParams
+    ) -> GenerationBatchItemResult:
+        async with generation_slots:
+            try:
+                generation_cache = await run_generation(settings, clients, item)
+            except Exception as err:  # pylint: disable=broad-except
+                traceback.print_exc()
+                return GenerationBatchItemResult(
+                    index=index,
+                    file_path=item.file_path,
+                    status="failed",
+                    error=f"{type(err).__name__}: {err}",
+                )
+        return GenerationBatchItemResult(
+            index=index,
+            file_path=item.file_path,
+            status="done",
+            generation_cache=generation_cache,  # type: ignore[arg-type]
+        )
+
+    tasks = [
+        asyncio.create_task(generate(index, item)) for index, item in enumerate(items)
+    ]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            result = await next_result
+            yield result.model_dump_json().encode("utf-8") + b"\n"
+    finally:
+        # e.g. the client disconnected
+        for task in tasks:
+            task.cancel()
+
+
+@STATS_ROUTER.get("/v1/stats/deduplication")
+async def get_deduplication_stats() -> DeduplicationStatsResponse:
+    """
+    ## Get Deduplication Stats
+
+    Report how much upload volume content-addressed storage avoided storing.
+    Counters cover the uploads handled by the serving process since it started.
+
+    ### Example
+    ```bash
+    curl "https://api.example.com/v1/stats/deduplication"
+    ```
+    """
+    return DeduplicationStatsResponse(
+        uploads=DEDUPLICATION_STATS.uploads,
+        deduplicated_uploads=DEDUPLICATION_STATS.deduplicated_uploads,
+        logical_bytes=DEDUPLICATION_STATS.logical_bytes,
+        stored_bytes=DEDUPLICATION_STATS.stored_bytes,
+        deduplication_ratio=DEDUPLICATION_STATS.deduplication_ratio,
+    )
+
+
+@PRESIGNED_URLS_ROUTER.post(
+    "/v1/presigned-urls/download/{file_path:path}",
+    responses={
+        status.HTTP_404_NOT_FOUND: {
+            "description": "File not found for the given `file_path`.",
+        },
+    },
+)
+async def create_presigned_download_url(
+    request: Request,
+    file_path: str = ValidFilePath,
+    query_params: PresignedDownloadQueryParams = Depends(),
+) -> PresignedUrlResponse:
+    """
+    ## Create Presigned Download URL
+
+    Get a short-lived URL to download a file directly from S3, so that large files
+    do not have to be streamed through the API.
+
+    ### Parameters
+    - **file_path**: The path to the file
+    - **expires_in_seconds**: How long the URL stays valid (defaults to the server's setting)
+
+    ### Response
+    - **200 OK**: The presigned URL; fetch it with `GET`
+    - **404 Not Found**: File does not exist
+
+    Files compressed at rest are served by S3 with a matching `Content-Encoding` header.
+
+    ### Example
+    ```bash
+    curl -X POST "https://api.example.com/v1/presigned-urls/download/videos/talk.mp4"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+    expires_in_seconds = (
+        query_params.expires_in_seconds or settings.presigned_url_expiration_seconds
+    )
+
+    raise_if_file_not_found(bucket_name=settings.s3_bucket_name, file_path=file_path)
+
+    object_response = fetch_s3_object_head(
+        bucket_name=settings.s3_bucket_name, object_key=file_path
+    )
+    url = get_presigned_download_url(
+        settings=settings,
+        file_path=file_path,
+        object_response=object_response,
+        expires_in_seconds=expires_in_seconds,
+    )
+
+    return PresignedUrlResponse(
+        file_path=file_path,
+        method="GET",
+        url=url,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=expires_in_seconds),
+    )
+
+
+@PRESIGNED_URLS_ROUTER.post(
+    "/v1/presigned-urls/upload/{file_path:path}",
+    responses={
+        status.HTTP_403_FORBIDDEN: {
+            "description": "The `file_path` is reserved for internal objects.",
+        },
+    },
+)
+async def create_presigned_upload_url(
+    request: Request,
+    file_path: str = ValidFilePath,
+    query_params: PresignedUploadQueryParams = Depends(),
+) -> PresignedUrlResponse:
+    """
+    ## Create Presigned Upload URL
+
+    Get a short-lived URL to upload a file directly to S3, so that large uploads
+    do not have to be streamed through the API.
+
+    ### Parameters
+    - **file_path**: The path the file will be stored at
+    - **method**: `PUT` for a URL to send the raw file to, or `POST` for a form policy
+      to send as `multipart/form-data` together with the returned `fields`
+    - **content_type**: If set, the upload must use this content type
+    - **max_size_bytes**: If set, S3 rejects larger uploads (`POST` only)
+    - **expires_in_seconds**: How long the URL stays valid (defaults to the server's setting)
+
+    ### Response
+    - **200 OK**: The presigned URL, and for `POST` the form fields to include
+    - **403 Forbidden**: The path is reserved for internal objects
+
+    Files uploaded this way are stored as sent: they are not compressed at rest,
+    deduplicated, or checksummed by the API.
+
+    ### Example
+    ```bash
+    url=$(curl -s -X POST "https://api.example.com/v1/presigned-urls/upload/videos/talk.mp4" | jq -r .url)
+    curl -X PUT --upload-file talk.mp4 "$url"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+    expires_in_seconds = (
+        query_params.expires_in_seconds or settings.presigned_url_expiration_seconds
+    )
+
+    raise_if_reserved_path(settings, file_path)
+
+    fields = None
+    if query_params.method == "PUT":
+        url = generate_presigned_upload_url(
+            bucket_name=settings.s3_bucket_name,
+            object_key=file_path,
+            expires_in_seconds=expires_in_seconds,
+            content_type=query_params.content_type,
+        )
+    else:
+        presigned_post = generate_presigned_upload_post(
+            bucket_name=settings.s3_bucket_name,
+            object_key=file_path,
+            expires_in_seconds=expires_in_seconds,
+            content_type=query_params.content_type,
+            max_size_bytes=query_params.max_size_bytes,
+        )
+        url, fields = presigned_post["url"], presigned_post["fields"]
+
+    return PresignedUrlResponse(
+        file_path=file_path,
+        method=query_params.method,
+        url=url,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=expires_in_seconds),
+        fields=fields,
+    )
+
+
+def raise_for_multipart_upload_error(err: ClientError) -> None:
+    """Turn S3 errors caused by the client's multipart upload requests into HTTP errors."""
+    error_code = err.response["Error"]["Code"]
+    if error_code == "NoSuchUpload":
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=MULTIPART_UPLOAD_NOT_FOUND_DETAIL,
+        ) from err
+    if error_code in ("InvalidPart", "InvalidPartOrder", "EntityTooSmall"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=err.response["Error"].get("Message", error_code),
+        ) from err
+    raise err
+
+
+def get_multipart_uploads(
+    settings: Settings, query_params: ListMultipartUploadsQueryParams
+) -> list[MultipartUploadResponse]:
+    """Fetch the in-progress multipart uploads matching the query parameters."""
+    initiated_before = None
+    if query_params.older_than_seconds is not None:
+        initiated_before = datetime.now(timezone.utc) - timedelta(
+            seconds=query_params.older_than_seconds
+        )
+
+    uploads = fetch_s3_multipart_uploads(
+        bucket_name=settings.s3_bucket_name,
+        prefix=query_params.directory,
+        initiated_before=initiated_before,
+    )
+    return [
+        MultipartUploadResponse(
+            file_path=upload["Key"],
+            upload_id=upload["UploadId"],
+            initiated=upload["Initiated"],
+        )
+        for upload in uploads
+        if not upload["Key"].startswith(settings.internal_key_prefix)
+    ]
+
+
+@MULTIPART_UPLOADS_ROUTER.post(
+    "/v1/multipart-uploads/initiate/{file_path:path}",
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_403_FORBIDDEN: {
+            "description": "The `file_path` is reserved for internal objects.",
+        },
+    },
+)
+async def initiate_multipart_upload(
+    request: Request,
+    file_path: str = ValidFilePath,
+    query_params: CreateMultipartUploadQueryParams = Depends(),
+) -> MultipartUploadResponse:
+    """
+    ## Initiate Multipart Upload
+
+    Start uploading a large file in parts that clients send straight to S3, in parallel.
+
+    1. Initiate the upload to get an `upload_id`.
+    2. Request presigned URLs for batches of parts from `/v1/multipart-uploads/part-urls`.
+    3. `PUT` each part (at least 5 MiB, except the last) to its URL and keep the returned `ETag`.
+    4. Complete the upload with the part numbers and ETags, or abort it.
+
+    ### Parameters
+    - **file_path**: The path the file will be stored at
+    - **content_type**: The MIME type of the file
+
+    ### Response
+    - **201 Created**: The upload was initiated
+    - **403 Forbidden**: The path is reserved for internal objects
+
+    ### Example
+    ```bash
+    curl -X POST "https://api.example.com/v1/multipart-uploads/initiate/videos/talk.mp4?content_type=video/mp4"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+
+    raise_if_reserved_path(settings, file_path)
+
+    upload_id = create_multipart_upload(
+        bucket_name=settings.s3_bucket_name,
+        object_key=file_path,
+        content_type=query_params.content_type,
+    )
+
+    return MultipartUploadResponse(file_path=file_path, upload_id=upload_id)
+
+
+@MULTIPART_UPLOADS_ROUTER.post(
+    "/v1/multipart-uploads/part-urls/{file_path:path}",
+    responses={
+        status.HTTP_404_NOT_FOUND: {
+            "description": "No multipart upload in progress with the given `upload_id`.",
+        },
+    },
+)
+async def create_presigned_part_urls(
+    request: Request,
+    file_path: str = ValidFilePath,
+    query_params: PresignedPartUrlsQueryParams = Depends(),
+) -> PresignedPartUrlsResponse:
+    """
+    ## Create Presigned Part URLs
+
+    Get a batch of presigned URLs to `PUT` consecutive parts of a multipart upload to.
+
+    ### Parameters
+    - **file_path**: The path the upload was initiated for
+    - **upload_id**: The ID returned when the upload was initiated
+    - **first_part_number**: The part number of the first URL (1 to 10,000)
+    - **part_count**: How many consecutive part URLs to generate (up to 1,000)
+    - **expires_in_seconds**: How long the URLs stay valid (defaults to the server's setting)
+
+    ### Response
+    - **200 OK**: The part URLs
+    - **404 Not Found**: The upload does not exist
+
+    ### Example
+    ```bash
+    curl -X POST "https://api.example.com/v1/multipart-uploads/part-urls/videos/talk.mp4?upload_id=...&part_count=100"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+    expires_in_seconds = (
+        query_params.expires_in_seconds or settings.presigned_url_expiration_seconds
+    )
+
+    # presigning happens locally, so check that the upload exists to fail early
+    if not multipart_upload_exists_in_s3(
+        bucket_name=settings.s3_bucket_name,
+        object_key=file_path,
+        upload_id=query_params.upload_id,
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=MULTIPART_UPLOAD_NOT_FOUND_DETAIL,
+        )
+
+    first_part_number = query_params.first_part_number
+    part_numbers = range(first_part_number, first_part_number + query_params.part_count)
+    urls = generate_presigned_upload_part_urls(
+        bucket_name=settings.s3_bucket_name,
+        object_key=file_path,
+        upload_id=query_params.upload_id,
+        part_numbers=part_numbers,
+        expires_in_seconds=expires_in_seconds,
+    )
+
+    return PresignedPartUrlsResponse(
+        file_path=file_path,
+        upload_id=query_params.upload_id,
+        parts=[
+            PresignedPartUrl(part_number=part_number, url=url)
+            for part_number, url in urls.items()
+        ],
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=expires_in_seconds),
+    )
+
+
+@MULTIPART_UPLOADS_ROUTER.post(
+    "/v1/multipart-uploads/complete/{file_path:path}",
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "A part is missing, too small, or its ETag does not match.",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "description": "No multipart upload in progress with the given `upload_id`.",
+        },
+    },
+)
+async def complete_file_multipart_upload(
+    request: Request,
+    body: CompleteMultipartUploadRequest,
+    file_path: str = ValidFilePath,
+    query_params: MultipartUploadQueryParams = Depends(),
+) -> PutFileResponse:
+    r"""
+    ## Complete Multipart Upload
+
+    Assemble the uploaded parts into the file, replacing any existing file at the path.
+
+    ### Parameters
+    - **file_path**: The path the upload was initiated for
+    - **upload_id**: The ID returned when the upload was initiated
+    - **parts** (body): The `part_number` and `etag` of every uploaded part
+
+    ### Response
+    - **201 Created**: The file was assembled
+    - **400 Bad Request**: A part is missing, too small, or its ETag does not match
+    - **404 Not Found**: The upload does not exist
+
+    ### Example
+    ```bash
+    curl -X POST "https://api.example.com/v1/multipart-uploads/complete/videos/talk.mp4?upload_id=..." \
+      -H "Content-Type: application/json" \
+      -d '{"parts": [{"part_number": 1, "etag": "\"d41d8...\""}]}'
+    ```
+    """
+    settings: Settings = request.app.state.settings
+
+    try:
+        complete_multipart_upload(
+            bucket_name=settings.s3_bucket_name,
+            object_key=file_path,
+            upload_id=query_params.upload_id,
+            parts=[
+                {"PartNumber": part.part_number, "ETag": part.etag}
+                for part in body.parts
+            ],
+        )
+    except ClientError as err:
+        raise_for_multipart_upload_error(err)
+
+    return PutFileResponse(
+        file_path=file_path,
+        message=f"Multipart upload completed at path: /{file_path}",
+    )
+
+
+@MULTIPART_UPLOADS_ROUTER.delete(
+    "/v1/multipart-uploads/abort/{file_path:path}",
+    responses={
+        status.HTTP_404_NOT_FOUND: {
+            "description": "No multipart upload in progress with the given `upload_id`.",
+        },
+    },
+)
+async def abort_file_multipart_upload(
+    request: Request,
+    file_path: str = ValidFilePath,
+    query_params: MultipartUploadQueryParams = Depends(),
+) -> Response:
+    """
+    ## Abort Multipart Upload
+
+    Cancel a multipart upload and delete the parts uploaded so far.
+
+    ### Parameters
+    - **file_path**: The path the upload was initiated for
+    - **upload_id**: The ID returned when the upload was initiated
+
+    ### Response
+    - **204 No Content**: The upload was aborted
+    - **404 Not Found**: The upload does not exist
+
+    ### Example
+    ```bash
+    curl -X DELETE "https://api.example.com/v1/multipart-uploads/abort/videos/talk.mp4?upload_id=..."
+    ```
+    """
+    settings: Settings = request.app.state.settings
+
+    try:
+        abort_multipart_upload(
+            bucket_name=settings.s3_bucket_name,
+            object_key=file_path,
+            upload_id=query_params.upload_id,
+        )
+    except ClientError as err:
+        raise_for_multipart_upload_error(err)
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@MULTIPART_UPLOADS_ROUTER.get("/v1/multipart-uploads")
+async def list_multipart_uploads(
+    request: Request,
+    query_params: ListMultipartUploadsQueryParams = Depends(),
+) -> ListMultipartUploadsResponse:
+    """
+    ## List Multipart Uploads
+
+    List multipart uploads that were initiated but never completed or aborted.
+    Their parts take up (billed) storage until the upload is aborted.
+
+    ### Parameters
+    - **directory**: Only include uploads of files under this directory
+    - **older_than_seconds**: Only include uploads initiated at least this long ago
+
+    ### Example
+    ```bash
+    curl "https://api.example.com/v1/multipart-uploads?older_than_seconds=86400"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+
+    return ListMultipartUploadsResponse(
+        uploads=get_multipart_uploads(settings, query_params)
+    )
+
+
+@MULTIPART_UPLOADS_ROUTER.delete("/v1/multipart-uploads")
+async def abort_stale_multipart_uploads(
+    request: Request,
+    query_params: ListMultipartUploadsQueryParams = Depends(),
+) -> ListMultipartUploadsResponse:
+    """
+    ## Abort Stale Multipart Uploads
+
+    Abort every in-progress multipart upload matching the parameters, e.g. all uploads
+    older than a day, and return the aborted uploads.
+
+    ### Parameters
+    - **directory**: Only abort uploads of files under this directory
+    - **older_than_seconds**: Only abort uploads initiated at least this long ago
+
+    ### Example
+    ```bash
+    curl -X DELETE "https://api.example.com/v1/multipart-uploads?older_than_seconds=86400"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+
+    uploads = get_multipart_uploads(settings, query_params)
+    for upload in uploads:
+        abort_multipart_upload(
+            bucket_name=settings.s3_bucket_name,
+            object_key=upload.file_path,
+            upload_id=upload.upload_id,
+        )
+
+    return ListMultipartUploadsResponse(uploads=uploads)
+
+
+def get_upload_session(settings: Settings, session_id: str) -> UploadSession:
+    """Load an upload session, raising a 404 HTTPException if it does not exist."""
+    try:
+        return fetch_upload_session(
+            bucket_name=settings.s3_bucket_name,
+            session_id=session_id,
+            internal_key_prefix=settings.internal_key_prefix,
+        )
+    except UploadSessionNotFoundError as err:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=str(err)
+        ) from err
+
+
+def to_upload_session_response(
+    session: UploadSession, response: Response
+) -> UploadSessionResponse:
+    """Describe an upload session, exposing its offset as the `Upload-Offset` header."""
+    response.headers["Upload-Offset"] = str(session.offset)
+    return UploadSessionResponse(
+        session_id=session.session_id,
+        file_path=session.file_path,
+        offset=session.offset,
+        size_bytes=session.size_bytes,
+        created_at=session.created_at,
+    )
+
+
+@UPLOAD_SESSIONS_ROUTER.post(
+    "/v1/upload-sessions/create/{file_path:path}",
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_403_FORBIDDEN: {
+            "description": "The `file_path` is reserved for internal objects.",
+        },
+    },
+)
+async def create_file_upload_session(
+    request: Request,
+    response: Response,
+    file_path: str = ValidFilePath,
+    query_params: CreateUploadSessionQueryParams = Depends(),
+) -> UploadSessionResponse:
+    """
+    ## Create Upload Session
+
+    Start a resumable upload, for clients on connections that may drop partway through.
+
+    1. Create a session to get a `session_id`.
+    2. `PATCH` chunks of the file to the session, each with the `Upload-Offset` it starts at.
+    3. If a request fails, `GET` the session to find the offset to resume from.
+    4. Complete the session to store the file, or delete it to give up.
+
+    Sessions are stored in S3, so any API instance can continue them.
+
+    ### Parameters
+    - **file_path**: The path the file will be stored at
+    - **content_type**: The MIME type of the file
+    - **size_bytes**: The size of the whole file, if known
+
+    ### Response
+    - **201 Created**: The session was created
+    - **403 Forbidden**: The path is reserved for internal objects
+
+    ### Example
+    ```bash
+    curl -X POST "https://api.example.com/v1/upload-sessions/create/videos/talk.mp4?size_bytes=52428800"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+
+    raise_if_reserved_path(settings, file_path)
+
+    session = create_upload_session(
+        bucket_name=settings.s3_bucket_name,
+        file_path=file_path,
+        internal_key_prefix=settings.internal_key_prefix,
+        content_type=query_params.content_type,
+        size_bytes=query_params.size_bytes,
+    )
+
+    return to_upload_session_response(session, response)
+
+
+@UPLOAD_SESSIONS_ROUTER.get(
+    "/v1/upload-sessions/{session_id}",
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "Upload session not found."},
+    },
+)
+async def get_file_upload_session(
+    request: Request,
+    response: Response,
+    session_id: str,
+) -> UploadSessionResponse:
+    """
+    ## Get Upload Session
+
+    Get the offset to send the next chunk from, e.g. after a dropped connection.
+    The offset is also returned in the `Upload-Offset` header.
+
+    ### Example
+    ```bash
+    curl "https://api.example.com/v1/upload-sessions/3f2c1f0b9a4e4d5c8b7a6f5e4d3c2b1a"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+
+    session = get_upload_session(settings, session_id)
+
+    return to_upload_session_response(session, response)
+
+
+@UPLOAD_SESSIONS_ROUTER.patch(
+    "/v1/upload-sessions/{session_id}",
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "Upload session not found."},
+        status.HTTP_409_CONFLICT: {
+            "description": (
+                "`Upload-Offset` is not the session's current offset, or another chunk "
+                "was appended meanwhile."
+            ),
+        },
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {
+            "description": "The chunk goes past the declared size of the file.",
+        },
+    },
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/offset+octet-stream": {
+                    "schema": {"type": "string", "format": "binary"},
+                },
+            },
+        },
+    },
+)
+async def append_to_file_upload_session(
+    request: Request,
+    response: Response,
+    session_id: str,
+    upload_offset: int = Header(
+        alias="Upload-Offset",
+        ge=0,
+        description="The position in the file the chunk in the body starts at.",
+    ),
+) -> UploadSessionResponse:
+    r"""
+    ## Append to Upload Session
+
+    Send the next chunk of the file as the raw request body. Chunks may be any size;
+    only the bytes from a failed request need to be sent again.
+
+    ### Response
+    - **200 OK**: The chunk was stored; the new offset is in `Upload-Offset`
+    - **404 Not Found**: The session does not exist
+    - **409 Conflict**: The chunk does not start at the session's current offset, or another
+      request appended a chunk while this one was being stored; `GET` the session for its
+      offset
+    - **413 Request Entity Too Large**: The chunk goes past the declared file size
+
+    ### Example
+    ```bash
+    curl -X PATCH "https://api.example.com/v1/upload-sessions/3f2c1f0b9a4e4d5c8b7a6f5e4d3c2b1a" \
+      -H "Upload-Offset: 0" -H "Content-Type: application/offset+octet-stream" \
+      --data-binary @chunk-0.bin
+    ```
+    """
+    settings: Settings = request.app.state.settings
+
+    session = get_upload_session(settings, session_id)
+
+    with SpooledTemporaryFile(max_size=MAX_IN_MEMORY_SPOOL_SIZE_BYTES) as chunk:
+        async for body_chunk in request.stream():
+            chunk.write(body_chunk)
+        chunk.seek(0)
+
+        try:
+            session = append_to_upload_session(
+                bucket_name=settings.s3_bucket_name,
+                session=session,
+                offset=upload_offset,
+                chunk=chunk,  # type: ignore[arg-type]
+                internal_key_prefix=settings.internal_key_prefix,
+            )
+        except UploadOffsetMismatchError as err:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=str(err),
+                headers={"Upload-Offset": str(err.expected_offset)},
+            ) from err
+        except UploadSessionConflictError as err:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT, detail=str(err)
+            ) from err
+        except UploadSizeError as err:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(err)
+            ) from err
+
+    return to_upload_session_response(session, response)
+
+
+@UPLOAD_SESSIONS_ROUTER.post(
+    "/v1/upload-sessions/{session_id}/complete",
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "Upload session not found."},
+        status.HTTP_409_CONFLICT: {
+            "description": "Fewer bytes than the declared file size were received.",
+        },
+    },
+)
+async def complete_file_upload_session(
+    request: Request,
+    session_id: str,
+) -> PutFileResponse:
+    """
+    ## Complete Upload Session
+
+    Store the received chunks as the file, replacing any existing file at its path.
+
+    ### Example
+    ```bash
+    curl -X POST "https://api.example.com/v1/upload-sessions/3f2c1f0b9a4e4d5c8b7a6f5e4d3c2b1a/complete"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+
+    session = get_upload_session(settings, session_id)
+
+    try:
+        complete_upload_session(
+            bucket_name=settings.s3_bucket_name,
+            session=session,
+            internal_key_prefix=settings.internal_key_prefix,
+        )
+    except UploadSizeError as err:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(err)
+        ) from err
+
+    return PutFileResponse(
+        file_path=session.file_path,
+        message=f"Resumable upload completed at path: /{session.file_path}",
+    )
+
+
+@UPLOAD_SESSIONS_ROUTER.delete(
+    "/v1/upload-sessions/{session_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "Upload session not found."},
+    },
+)
+async def delete_file_upload_session(
+    request: Request,
+    session_id: str,
+) -> Response:
+    """
+    ## Delete Upload Session
+
+    Abort a resumable upload and delete the chunks received so far.
+
+    ### Example
+    ```bash
+    curl -X DELETE "https://api.example.com/v1/upload-sessions/3f2c1f0b9a4e4d5c8b7a6f5e4d3c2b1a"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+
+    session = get_upload_session(settings, session_id)
+    delete_upload_session(
+        bucket_name=settings.s3_bucket_name,
+        session=session,
+        internal_key_prefix=settings.internal_key_prefix,
+    )
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@DELTA_UPLOADS_ROUTER.get(
+    "/v1/delta/signatures/{file_path:path}",
+    responses={
+        status.HTTP_404_NOT_FOUND: {
+            "description": "File not found for the given `file_path`.",
+        },
+    },
+)
+async def get_delta_signatures(
+    request: Request,
+    file_path: str = ValidFilePath,
+    query_params: DeltaSignaturesQueryParams = Depends(),
+) -> DeltaSignaturesResponse:
+    """
+    ## Get Delta Signatures
+
+    Get checksums of every block of a file, to compute a delta upload against it.
+    Signatures are cached per version of the file, so repeated requests are cheap.
+
+    ### Parameters
+    - **file_path**: The path to the file
+    - **block_size**: Size of the blocks; smaller blocks find more unchanged content
+      but make the signatures larger
+
+    ### Response
+    - **200 OK**: The block signatures and the `version` of the file they describe
+    - **404 Not Found**: File does not exist
+
+    ### Example
+    ```bash
+    curl "https://api.example.com/v1/delta/signatures/artifacts/model.bin?block_size=1048576"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+    block_size = query_params.block_size
+
+    raise_if_reserved_path(settings, file_path)
+    raise_if_file_not_found(bucket_name=settings.s3_bucket_name, file_path=file_path)
+
+    object_response = fetch_s3_object_head(
+        bucket_name=settings.s3_bucket_name, object_key=file_path
+    )
+    version = get_content_version(object_response)
+
+    signatures = fetch_cached_delta_signatures(
+        bucket_name=settings.s3_bucket_name,
+        file_path=file_path,
+        version=version,
+        block_size=block_size,
+        internal_key_prefix=settings.internal_key_prefix,
+    )
+    if signatures is None:
+        signatures = compute_block_signatures(
+            iter_file_content(settings, file_path), block_size
+        )
+        save_delta_signatures(
+            bucket_name=settings.s3_bucket_name,
+            file_path=file_path,
+            version=version,
+            block_size=block_size,
+            signatures=signatures,
+            internal_key_prefix=settings.internal_key_prefix,
+        )
+
+    return DeltaSignaturesResponse(
+        file_path=file_path,
+        version=version,
+        size_bytes=get_logical_size(object_response),
+        block_size=block_size,
+        blocks=[DeltaBlockSignature(**block._asdict()) for block in signatures],
+    )
+
+
+@DELTA_UPLOADS_ROUTER.post(
+    "/v1/delta/apply/{file_path:path}",
+    responses={
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "The instructions refer to missing blocks or data.",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "description": "File not found for the given `file_path`.",
+        },
+        status.HTTP_409_CONFLICT: {
+            "description": "The file changed since its signatures were fetched.",
+        },
+    },
+)
+async def apply_delta_upload(
+    request: Request,
+    delta: Annotated[str, Form(description="`DeltaUploadRequest` as JSON.")],
+    data: Annotated[UploadFile, Form(description="The data the instructions take.")],
+    file_path: str = ValidFilePath,
+) -> PatchFileResponse:
+    r"""
+    ## Apply Delta Upload
+
+    Update a file by sending only what changed since the version its signatures describe.
+
+    1. Fetch the signatures from `/v1/delta/signatures/{file_path}`.
+    2. Slide a block-sized window over the new content. Where its rolling Adler-32
+       and SHA-256 match a block, reference the block; otherwise send the bytes.
+       `files_api.delta.compute_delta` implements this for Python clients.
+    3. Send the instructions as the `delta` form field and the bytes as `data`.
+
+    Referenced blocks are copied within S3, so the upload costs about the size of
+    the changes rather than the size of the file.
+
+    ### Response
+    - **200 OK**: The file was updated
+    - **400 Bad Request**: The instructions refer to missing blocks or data
+    - **404 Not Found**: File does not exist
+    - **409 Conflict**: The file changed since the signatures were fetched; fetch them again
+
+    ### Example
+    ```bash
+    curl -X POST "https://api.example.com/v1/delta/apply/artifacts/model.bin" \
+      -F 'delta={"base_version": "...", "block_size": 1048576, "instructions": [...]}' \
+      -F "data=@changed-bytes.bin"
+    ```
+    """
+    settings: Settings = request.app.state.settings
+    delta_request = DeltaUploadRequest.model_validate_json(delta)
+
+    raise_if_reserved_path(settings, file_path)
+    raise_if_file_not_found(bucket_name=settings.s3_bucket_name, file_path=file_path)
+
+    object_response = fetch_s3_object_head(
+        bucket_name=settings.s3_bucket_name, object_key=file_path
+    )
+    if get_content_version(object_response) != delta_request.base_version:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The file changed since its signatures were fetched.",
+        )
+
+    instructions: list[DeltaInstruction] = [
+        (
+            SendData(instruction.data_length)
+            if instruction.data_length is not None
+            else CopyBlocks(instruction.block_index, instruction.block_count)  # type: ignore[arg-type]
+        )
+        for instruction in delta_request.instructions
+    ]
+    segments = get_delta_segments(
+        object_key=file_path,
+        object_size=get_logical_size(object_response),
+        block_size=delta_request.block_size,
+        instructions=instructions,
+        data=data.file,
+        etag=object_response["ETag"],
+    )
+
+    try:
+        if is_stored_transformed(object_response):
+            size_bytes = rewrite_delta_file(
+                settings, file_path, object_response, segments
+            )
+        else:
+            size_bytes = assemble_s3_object(
+                bucket_name=settings.s3_bucket_name,
+                object_key=file_path,
+                segments=segments,
+                content_type=object_response["ContentType"],
+                metadata=get_metadata_without_checksums(object_response),
+            )
+    except ValueError as err:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(err)
+        ) from err
+    except ClientError as err:
+        if err.response["Error"]["Code"] != "PreconditionFailed":
+            raise err
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The file was modified while the delta was being applied.",
+        ) from err
+
+    return PatchFileResponse(
+        file_path=file_path,
+        message=f"Delta applied to file at path: /{file_path}",
+        size_bytes=size_bytes,
+    )
+
+
+def rewrite_delta_file(
+    settings: Settings,
+    file_path: str,
+    object_response: "HeadObjectOutputTypeDef",
+    segments: Iterator[Segment],
+) -> int:
+    """
+    Apply a delta by storing the whole new file anew.
+
+    Used for files whose stored bytes are not their content, which S3 cannot copy
+    ranges of; the current content is read into a local copy to take blocks from.
+    """
+    with (
+        SpooledTemporaryFile(max_size=MAX_IN_MEMORY_SPOOL_SIZE_BYTES) as current,
+        SpooledTemporaryFile(max_size=MAX_IN_MEMORY_SPOOL_SIZE_BYTES) as updated,
+    ):
+        for chunk in iter_file_content(settings, file_path):
+            current.write(chunk)
+        write_segments(updated, segments, current)  # type: ignore[arg-type]
+        size_bytes = updated.tell()
+        updated.seek(0)
+        store_file(
+            settings=settings,
+            file_path=file_path,
+            file_content=updated,  # type: ignore[arg-type]
+            content_type=object_response["ContentType"],
+        )
+
+    return size_bytes
+
+
+@STATS_ROUTER.get("/v1/stats/generation-cache")
+async def get_generation_cache_stats() -> GenerationCacheStatsResponse:
+    """
+    ## Get Generation Cache Stats
+
+    Report how many generations were served by copying a cached file rather than
+    calling OpenAI. Counters cover the requests handled by the serving process since
+    it started.
+
+    ### Example
+    ```bash
+    curl "https://api.example.com/v1/stats/generation-cache"
+    ```
+    """
+    return GenerationCacheStatsResponse(
+        hits=GENERATION_CACHE_STATS.hits,
+        misses=GENERATION_CACHE_STATS.misses,
+        bypasses=GENERATION_CACHE_STATS.bypasses,
+        hit_ratio=GENERATION_CACHE_STATS.hit_ratio,
+    )
+
+
+@STATS_ROUTER.get("/v1/stats/read-coalescing")
+async def get_read_coalescing_stats(request: Request) -> ReadCoalescingStatsResponse:
+    """
+    ## Get Read Coalescing Stats
+
+    Report how many S3 lookups concurrent `GET` and `HEAD` requests for the same file
+    shared rather than made. Counters cover the lookups of the serving process since
+    it started.
+
+    ### Example
+    ```bash
+    curl "https://api.example.com/v1/stats/read-coalescing"
+    ```
+    """
+    stats = request.app.state.coalesced_reads.stats
+    return ReadCoalescingStatsResponse(
+        s3_calls=stats.calls,
+        shared_results=stats.shared_results,
+        calls_saved_ratio=stats.calls_saved_ratio,
+        wait_timeouts=stats.wait_timeouts,
+    )
+
+
+@STATS_ROUTER.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Metrics in the Prometheus text format.",
+            "content": {"text/plain": {"schema": {"type": "string"}}},
+        },
+    },
+)
+async def get_metrics() -> PlainTextResponse:
+    """
+    ## Get Metrics
+
+    Report the metrics of the server, in the Prometheus text format. Under the
+    pre-forking server, those of all its workers are added up, with the other workers'
+    as of their last snapshot (every 5 seconds by default):
+
+    - **files_api_http_request_duration_seconds**: latency of requests, by method and route
+    - **files_api_http_requests_total**: requests, by method, route and status code
+    - **files_api_http_requests_in_flight**: requests being handled
+    - **files_api_http_request_bytes_total**, **files_api_http_response_bytes_total**:
+      bytes received and sent, by method and route
+    - **files_api_dependency_call_duration_seconds**: latency of the calls to S3 and
+      OpenAI, by function and outcome
+
+    ### Example
+    ```bash
+    curl "https://api.example.com/metrics"
+    ```
+    """
+    return PlainTextResponse(
+        content=METRICS.render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE
     )
@@ -0,0 +1,43 @@
+"""
+The S3 client shared by the functions in this package.
+
+Creating a boto3 client loads and parses the S3 service model, which takes tens of
+milliseconds. The client is created on first use, so it does not slow down importing
+the app (e.g. a Lambda cold start), and then reused, so requests do not pay for it
+again and can reuse its pooled connections.
+"""
+
+import threading
+from typing import Optional
+
+import boto3
+
+from files_api.request_accounting import instrument_s3_client
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+_S3_CLIENT: Optional["S3Client"] = None
+_S3_CLIENT_LOCK = threading.Lock()
+
+
+def get_s3_client() -> "S3Client":
+    """Return the shared S3 client, creating it on first use."""
+    global _S3_CLIENT  # pylint: disable=global-statement
+    if _S3_CLIENT is None:
+        with _S3_CLIENT_LOCK:
+            if _S3_CLIENT is None:
+                # boto3's default session is not thread-safe, so use a session of our own
+                s3_client = boto3.session.Session().client("s3")
+                instrument_s3_client(s3_client)
+                _S3_CLIENT = s3_client
+    return _S3_CLIENT
+
+
+def reset_s3_client() -> None:
+    """Forget the shared S3 client, e.g. after changing the AWS credentials or endpoint."""
+    global _S3_CLIENT  # pylint: disable=global-statement
+    with _S3_CLIENT_LOCK:
+        _S3_CLIENT = None
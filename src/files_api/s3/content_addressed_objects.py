@@ -0,0 +1,500 @@
+"""
+Functions for storing objects by content hash so that identical content is stored once.
+
+Layout under the internal key prefix (e.g. `.files-api/`):
+
+- `blobs/sha256/<digest>`: the content, stored once per unique SHA-256.
+- `refs/<digest>/<reference id>`: an empty marker per pointer referencing the blob.
+- `tombstones/<digest>/<random id>`: an empty marker per delete of the blob in progress.
+
+The object at the logical key is an empty *pointer* whose metadata names the blob and
+its reference. A blob is deleted once its last reference marker is removed.
+
+Every write of a pointer references the blob under a new, random id, so a concurrent
+delete or overwrite of the same key removes the reference of the pointer it replaced,
+never the one just written. Pointers written before references had ids are referenced
+under the SHA-256 of their key.
+
+A delete can't be made conditional on no reference being added meanwhile, so a
+delete writes a tombstone before it checks for references for the last time, and
+removes it once the blob is gone. A writer adds its reference, waits out any live
+tombstone, and only then checks whether the blob exists: either the delete saw the
+reference and kept the blob, or the blob is gone by the time the writer looks.
+"""
+
+import hashlib
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+from typing import (
+    BinaryIO,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Union,
+)
+
+from files_api.checksums import (
+    ObjectChecksums,
+    StreamingChecksums,
+    verify_checksums,
+)
+from files_api.metrics import instrument_calls
+from files_api.s3.client import get_s3_client
+from files_api.s3.object_metadata import (
+    BLOB_REFERENCE_METADATA_KEY,
+    BLOB_SHA256_METADATA_KEY,
+    LOGICAL_SIZE_METADATA_KEY,
+    get_blob_sha256,
+    get_checksum_metadata,
+)
+from files_api.s3.read_objects import (
+    fetch_s3_object,
+    object_exists_in_s3,
+)
+from files_api.s3.write_objects import (
+    copy_s3_object,
+    iter_file_chunks,
+    upload_s3_object,
+)
+
+try:  # pylint: disable=duplicate-code
+    from mypy_boto3_s3 import S3Client
+    from mypy_boto3_s3.type_defs import (
+        GetObjectOutputTypeDef,
+        HeadObjectOutputTypeDef,
+    )
+except ImportError:
+    ...
+
+
+@dataclass
+class DeduplicationStats:
+    """Per-process counters for content-addressed uploads."""
+
+    uploads: int = 0
+    deduplicated_uploads: int = 0
+    logical_bytes: int = 0
+    stored_bytes: int = 0
+
+    def __post_init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def record_upload(self, size_bytes: int, deduplicated: bool) -> None:
+        with self._lock:
+            self.uploads += 1
+            self.logical_bytes += size_bytes
+            if deduplicated:
+                self.deduplicated_uploads += 1
+            else:
+                self.stored_bytes += size_bytes
+
+    @property
+    def deduplication_ratio(self) -> float:
+        """Bytes uploaded per byte stored; 1.0 means nothing was deduplicated."""
+        if self.stored_bytes == 0:
+            return 1.0
+        return self.logical_bytes / self.stored_bytes
+
+
+DEDUPLICATION_STATS = DeduplicationStats()
+
+# a delete takes a few S3 calls; a tombstone older than this was left by a crashed one
+STALE_TOMBSTONE_AGE = timedelta(seconds=30)
+
+# how often a writer checks whether a delete of the blob it references is done
+TOMBSTONE_POLL_INTERVAL_SECONDS = 0.05
+
+
+class BlobNotFoundError(Exception):
+    """Raised when a pointer is copied while the blob it names is being deleted."""
+
+    def __init__(self, sha256: str) -> None:
+        self.sha256 = sha256
+        super().__init__(f"Blob {sha256} was deleted while it was being referenced.")
+
+
+class BlobReference(NamedTuple):
+    """The blob a pointer object refers to, and the id of its reference to it."""
+
+    sha256: str
+    reference_id: str
+
+
+class ContentAddressedUpload(NamedTuple):
+    """Result of `upload_content_addressed_s3_object`."""
+
+    deduplicated: bool
+    checksums: ObjectChecksums
+
+
+def get_blob_key(internal_key_prefix: str, sha256: str) -> str:
+    return f"{internal_key_prefix}blobs/sha256/{sha256}"
+
+
+def get_reference_key(internal_key_prefix: str, sha256: str, reference_id: str) -> str:
+    return f"{internal_key_prefix}refs/{sha256}/{reference_id}"
+
+
+def get_blob_reference(
+    object_key: str, object_response: "HeadObjectOutputTypeDef"
+) -> Optional[BlobReference]:
+    """
+    Get the blob a pointer object refers to, and the id of its reference.
+
+    :param object_key: The logical path of the object.
+    :param object_response: Response of `head_object` or `get_object` for the object.
+
+    :return: The reference, or None if the object holds its own content.
+    """
+    sha256 = get_blob_sha256(object_response)
+    if sha256 is None:
+        return None
+
+    metadata: Mapping[str, str] = object_response.get("Metadata", {})
+    reference_id = metadata.get(BLOB_REFERENCE_METADATA_KEY)
+    if reference_id is None:
+        reference_id = hashlib.sha256(object_key.encode("utf-8")).hexdigest()
+    return BlobReference(sha256=sha256, reference_id=reference_id)
+
+
+def get_tombstone_prefix(internal_key_prefix: str, sha256: str) -> str:
+    return f"{internal_key_prefix}tombstones/{sha256}/"
+
+
+def hash_file_content(
+    file_content: Union[bytes, BinaryIO], include_md5: bool = False
+) -> tuple[ObjectChecksums, int]:
+    """
+    Compute the checksums and size of file content as a stream.
+
+    File objects are rewound to where they started so they can be uploaded afterwards.
+
+    :return: Tuple of the checksums and the size in bytes.
+    """
+    start_position = None if isinstance(file_content, bytes) else file_content.tell()
+
+    checksums = StreamingChecksums(include_md5=include_md5)
+    for chunk in iter_file_chunks(file_content):
+        checksums.update(chunk)
+
+    if start_position is not None:
+        file_content.seek(start_position)  # type: ignore[union-attr]
+
+    return checksums.result(), checksums.size
+
+
+@instrument_calls("s3")
+def upload_content_addressed_s3_object(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    object_key: str,
+    file_content: Union[bytes, BinaryIO],
+    internal_key_prefix: str,
+    content_type: Optional[str] = None,
+    s3_client: Optional["S3Client"] = None,
+    compress: bool = False,
+    expected_checksums: Optional[Mapping[str, str]] = None,
+) -> ContentAddressedUpload:
+    """
+    Upload a file, storing its content only if no identical content is stored yet.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: The logical path of the object in the S3 bucket.
+    :param file_content: The content of the file to upload, as bytes or a binary file object.
+    :param internal_key_prefix: Key prefix under which blobs and references are stored.
+    :param content_type: The MIME type of the file, e.g. "text/plain" for a text file.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+    :param compress: Passed on to `upload_s3_object` when a new blob is stored.
+    :param expected_checksums: Optional mapping of algorithm ("sha256", "crc32", "md5")
+        to base64-encoded checksum that the content must match.
+
+    :raises ChecksumMismatchError: If the content does not match `expected_checksums`.
+
+    :return: Whether the data upload was skipped, and the checksums of the content.
+    """
+    s3_client = s3_client or get_s3_client()
+    content_type = content_type or "application/octet-stream"
+    expected_checksums = expected_checksums or {}
+
+    checksums, size = hash_file_content(
+        file_content, include_md5="md5" in expected_checksums
+    )
+    verify_checksums(checksums, expected_checksums)
+    sha256 = checksums.sha256_hex
+    previous_reference = _get_pointer_reference(bucket_name, object_key, s3_client)
+
+    # the reference is written, and deletes that may have missed it are waited out,
+    # before checking for the blob (see the module docstring)
+    reference_id = uuid.uuid4().hex
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=get_reference_key(internal_key_prefix, sha256, reference_id),
+        Body=b"",
+    )
+    wait_for_blob_deletes(bucket_name, sha256, internal_key_prefix, s3_client)
+
+    blob_key = get_blob_key(internal_key_prefix, sha256)
+    deduplicated = object_exists_in_s3(bucket_name, blob_key, s3_client=s3_client)
+    if not deduplicated:
+        upload_s3_object(
+            bucket_name=bucket_name,
+            object_key=blob_key,
+            file_content=file_content,
+            content_type=content_type,
+            s3_client=s3_client,
+            compress=compress,
+            content_checksums=checksums,
+        )
+
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=object_key,
+        Body=b"",
+        ContentType=content_type,
+        Metadata={
+            BLOB_SHA256_METADATA_KEY: sha256,
+            BLOB_REFERENCE_METADATA_KEY: reference_id,
+            LOGICAL_SIZE_METADATA_KEY: str(size),
+            **get_checksum_metadata(checksums),
+        },
+    )
+
+    if previous_reference is not None:
+        release_blob_reference(
+            bucket_name, previous_reference, internal_key_prefix, s3_client
+        )
+
+    DEDUPLICATION_STATS.record_upload(size_bytes=size, deduplicated=deduplicated)
+
+    return ContentAddressedUpload(deduplicated=deduplicated, checksums=checksums)
+
+
+@instrument_calls("s3")
+def copy_content_addressed_s3_object(
+    bucket_name: str,
+    source_key: str,
+    object_key: str,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """
+    Copy an object, adding a reference to its blob rather than copying the content.
+
+    Objects that are not pointers are simply copied.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param source_key: The logical path of the object to copy.
+    :param object_key: The logical path to copy the object to.
+    :param internal_key_prefix: Key prefix under which blobs and references are stored.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :raises BlobNotFoundError: If the source's blob was deleted, along with the source's
+        reference to it, before the copy referenced it.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    source_response = _fetch_pointer_head(bucket_name, source_key, s3_client)
+    source_reference = (
+        None
+        if source_response is None
+        else get_blob_reference(source_key, source_response)
+    )
+    previous_reference = _get_pointer_reference(bucket_name, object_key, s3_client)
+
+    if source_response is None or source_reference is None:
+        copy_s3_object(bucket_name, source_key, object_key, s3_client=s3_client)
+    else:
+        # as in `upload_content_addressed_s3_object`, the reference comes first
+        sha256 = source_reference.sha256
+        reference = BlobReference(sha256=sha256, reference_id=uuid.uuid4().hex)
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=get_reference_key(internal_key_prefix, sha256, reference.reference_id),
+            Body=b"",
+        )
+        wait_for_blob_deletes(bucket_name, sha256, internal_key_prefix, s3_client)
+
+        blob_key = get_blob_key(internal_key_prefix, sha256)
+        if not object_exists_in_s3(bucket_name, blob_key, s3_client=s3_client):
+            # the content is gone with the source, so there is nothing left to copy
+            release_blob_reference(
+                bucket_name, reference, internal_key_prefix, s3_client
+            )
+            raise BlobNotFoundError(sha256)
+
+        # the copy is a pointer of its own, with its own reference to the blob
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=object_key,
+            Body=b"",
+            ContentType=source_response["ContentType"],
+            Metadata={
+                **source_response["Metadata"],
+                BLOB_REFERENCE_METADATA_KEY: reference.reference_id,
+            },
+        )
+
+    if previous_reference is not None:
+        release_blob_reference(
+            bucket_name, previous_reference, internal_key_prefix, s3_client
+        )
+
+
+@instrument_calls("s3")
+def resolve_blob_pointer(
+    bucket_name: str,
+    object_response: "GetObjectOutputTypeDef",
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> "GetObjectOutputTypeDef":
+    """
+    Follow a pointer object to the blob holding its content.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_response: Response of `get_object` for the logical key.
+    :param internal_key_prefix: Key prefix under which blobs are stored.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :return: The `get_object` response of the blob, with the content type and last
+        modified date of the pointer; or `object_response` if it is not a pointer.
+    """
+    sha256 = get_blob_sha256(object_response)
+    if sha256 is None:
+        return object_response
+
+    s3_client = s3_client or get_s3_client()
+    object_response["Body"].close()
+
+    blob_response = fetch_s3_object(
+        bucket_name, get_blob_key(internal_key_prefix, sha256), s3_client=s3_client
+    )
+    blob_response["ContentType"] = object_response["ContentType"]
+    blob_response["LastModified"] = object_response["LastModified"]
+
+    return blob_response
+
+
+@instrument_calls("s3")
+def delete_content_addressed_s3_object(
+    bucket_name: str,
+    object_key: str,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """
+    Delete an object, and its blob if no other object references it.
+
+    Objects that are not pointers are simply deleted.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: The logical path of the object to delete.
+    :param internal_key_prefix: Key prefix under which blobs and references are stored.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    reference = _get_pointer_reference(bucket_name, object_key, s3_client)
+    s3_client.delete_object(Bucket=bucket_name, Key=object_key)
+
+    if reference is not None:
+        release_blob_reference(bucket_name, reference, internal_key_prefix, s3_client)
+
+
+@instrument_calls("s3")
+def release_blob_reference(
+    bucket_name: str,
+    reference: BlobReference,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """
+    Remove a pointer's reference to a blob, deleting the blob if it was the last.
+
+    Writers that reference the blob meanwhile wait for the delete to be done before
+    checking whether they need to upload it again (see the module docstring).
+    """
+    s3_client = s3_client or get_s3_client()
+    sha256 = reference.sha256
+
+    s3_client.delete_object(
+        Bucket=bucket_name,
+        Key=get_reference_key(internal_key_prefix, sha256, reference.reference_id),
+    )
+    if _has_references(bucket_name, sha256, internal_key_prefix, s3_client):
+        return
+
+    tombstone_key = (
+        f"{get_tombstone_prefix(internal_key_prefix, sha256)}{uuid.uuid4().hex}"
+    )
+    s3_client.put_object(Bucket=bucket_name, Key=tombstone_key, Body=b"")
+    try:
+        # a reference written before the tombstone is seen now, and a writer
+        # referencing the blob after this check sees the tombstone and waits
+        if not _has_references(bucket_name, sha256, internal_key_prefix, s3_client):
+            s3_client.delete_object(
+                Bucket=bucket_name, Key=get_blob_key(internal_key_prefix, sha256)
+            )
+    finally:
+        s3_client.delete_object(Bucket=bucket_name, Key=tombstone_key)
+
+
+def wait_for_blob_deletes(
+    bucket_name: str,
+    sha256: str,
+    internal_key_prefix: str,
+    s3_client: "S3Client",
+) -> None:
+    """
+    Wait until no delete of a blob is in progress, once a reference to it is written.
+
+    Tombstones older than `STALE_TOMBSTONE_AGE`, left by deletes that crashed, are ignored.
+    """
+    while True:
+        response = s3_client.list_objects_v2(
+            Bucket=bucket_name,
+            Prefix=get_tombstone_prefix(internal_key_prefix, sha256),
+        )
+        stale_before = datetime.now(timezone.utc) - STALE_TOMBSTONE_AGE
+        if all(
+            tombstone["LastModified"] < stale_before
+            for tombstone in response.get("Contents", [])
+        ):
+            return
+        time.sleep(TOMBSTONE_POLL_INTERVAL_SECONDS)
+
+
+def _has_references(
+    bucket_name: str, sha256: str, internal_key_prefix: str, s3_client: "S3Client"
+) -> bool:
+    remaining_references = s3_client.list_objects_v2(
+        Bucket=bucket_name, Prefix=f"{internal_key_prefix}refs/{sha256}/", MaxKeys=1
+    )
+    return remaining_references.get("KeyCount", 0) > 0
+
+
+def _get_pointer_reference(
+    bucket_name: str, object_key: str, s3_client: "S3Client"
+) -> Optional[BlobReference]:
+    """Return the blob reference of the pointer at `object_key`, if there is one."""
+    head_object_response = _fetch_pointer_head(bucket_name, object_key, s3_client)
+    if head_object_response is None:
+        return None
+    return get_blob_reference(object_key, head_object_response)
+
+
+def _fetch_pointer_head(
+    bucket_name: str, object_key: str, s3_client: "S3Client"
+) -> Optional["HeadObjectOutputTypeDef"]:
+    """Return the `head_object` response for `object_key`, or None if there is no object."""
+    try:
+        return s3_client.head_object(Bucket=bucket_name, Key=object_key)
+    except s3_client.exceptions.ClientError as err:
+        if err.response["Error"]["Code"] != "404":
+            raise err
+        return None
@@ -2,7 +2,8 @@
 
 from typing import Optional
 
-import boto3
+from files_api.metrics import instrument_calls
+from files_api.s3.client import get_s3_client
 
 try:
     from mypy_boto3_s3 import S3Client
@@ -10,6 +11,7 @@ except ImportError:
     ...
 
 
+@instrument_calls("s3")
 def delete_s3_object(
     bucket_name: str, object_key: str, s3_client: Optional["S3Client"] = None
 ) -> None:
@@ -19,8 +21,8 @@ def delete_s3_object(
     :param bucket_name: Name of the S3 bucket.
     :param object_key: Key of the object to delete.
     :param s3_client: Optional S3 client to use.
-        If not provided, a new client will be created.
+        If not provided, the shared client is used.
     """
-    s3_client = s3_client or boto3.client("s3")
+    s3_client = s3_client or get_s3_client()
 
     s3_client.delete_object(Bucket=bucket_name, Key=object_key)
@@ -0,0 +1,83 @@
+"""
+Cache of delta block signatures, so a file is only read to sign it once per version.
+
+Signatures are stored under the internal key prefix (e.g. `.files-api/`) at
+`delta-signatures/<sha256 of file path>/<block size>.json`, together with the version
+of the file they were computed from.
+"""
+
+import hashlib
+import json
+from typing import (
+    List,
+    Optional,
+)
+
+from files_api.delta import BlockSignature
+from files_api.metrics import instrument_calls
+from files_api.s3.client import get_s3_client
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+
+def get_delta_signatures_key(
+    internal_key_prefix: str, file_path: str, block_size: int
+) -> str:
+    file_path_hash = hashlib.sha256(file_path.encode("utf-8")).hexdigest()
+    return f"{internal_key_prefix}delta-signatures/{file_path_hash}/{block_size}.json"
+
+
+@instrument_calls("s3")
+def fetch_cached_delta_signatures(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    file_path: str,
+    version: str,
+    block_size: int,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> Optional[List[BlockSignature]]:
+    """
+    Load the cached signatures of a file.
+
+    :param version: The version of the file the signatures must have been computed from.
+
+    :return: The signatures, or None if none are cached for this version of the file.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    try:
+        response = s3_client.get_object(
+            Bucket=bucket_name,
+            Key=get_delta_signatures_key(internal_key_prefix, file_path, block_size),
+        )
+    except s3_client.exceptions.NoSuchKey:
+        return None
+
+    cached = json.loads(response["Body"].read())
+    if cached["version"] != version:
+        return None
+    return [BlockSignature(*block) for block in cached["blocks"]]
+
+
+@instrument_calls("s3")
+def save_delta_signatures(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    file_path: str,
+    version: str,
+    block_size: int,
+    signatures: List[BlockSignature],
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """Cache the signatures of a version of a file, replacing those of older versions."""
+    s3_client = s3_client or get_s3_client()
+
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=get_delta_signatures_key(internal_key_prefix, file_path, block_size),
+        Body=json.dumps({"version": version, "blocks": signatures}).encode("utf-8"),
+        ContentType="application/json",
+    )
@@ -0,0 +1,127 @@
+"""
+A cache of generated files, so that repeating a generation copies its earlier result.
+
+Entries live under the internal key prefix, at `generation-cache/<digest>`, where the
+digest hashes the parameters of the generation (see `get_generation_cache_key`). Each
+entry is a copy of the first file generated with those parameters; a later generation
+with the same parameters is served by copying the entry to its path, server-side,
+rather than calling OpenAI again. Entries older than the TTL are replaced.
+"""
+
+import hashlib
+import json
+import threading
+import unicodedata
+from dataclasses import dataclass
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+from typing import Optional
+
+from files_api.metrics import instrument_calls
+from files_api.s3.client import get_s3_client
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+
+@dataclass
+class GenerationCacheStats:
+    """Per-process counters for generation cache lookups."""
+
+    hits: int = 0
+    misses: int = 0
+    bypasses: int = 0
+
+    def __post_init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def record_lookup(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypasses += 1
+
+    @property
+    def hit_ratio(self) -> float:
+        """Share of lookups served from the cache; 0.0 before any lookup."""
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+
+GENERATION_CACHE_STATS = GenerationCacheStats()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt so that trivially different spellings share a cache entry."""
+    return " ".join(unicodedata.normalize("NFC", prompt).split())
+
+
+def get_generation_cache_key(  # pylint: disable=too-many-arguments
+    internal_key_prefix: str,
+    file_type: str,
+    model: str,
+    prompt: str,
+    response_format: str,
+    size: Optional[str] = None,
+) -> str:
+    """
+    Get the key of the cache entry for a generation with the given parameters.
+
+    :param internal_key_prefix: Key prefix under which the cache is stored.
+    :param file_type: The type of file generated, e.g. "image".
+    :param model: The OpenAI model generating it.
+    :param prompt: The prompt, normalized with `normalize_prompt`.
+    :param response_format: The format of the file, e.g. "mp3".
+    :param size: The size of generated images.
+    """
+    parameters = {
+        "file_type": file_type,
+        "model": model,
+        "prompt": normalize_prompt(prompt),
+        "response_format": response_format.lower(),
+        "size": size,
+    }
+    digest = hashlib.sha256(
+        json.dumps(parameters, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return f"{internal_key_prefix}generation-cache/{digest}"
+
+
+@instrument_calls("s3")
+def is_generation_cached(
+    bucket_name: str,
+    cache_key: str,
+    ttl_seconds: int,
+    s3_client: Optional["S3Client"] = None,
+) -> bool:
+    """
+    Check if a cache entry exists and is younger than the TTL.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param cache_key: The key returned by `get_generation_cache_key`.
+    :param ttl_seconds: How long an entry stays valid after it is stored.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    try:
+        head_object_response = s3_client.head_object(Bucket=bucket_name, Key=cache_key)
+    except s3_client.exceptions.ClientError as err:
+        if err.response["Error"]["Code"] != "404":
+            raise err
+        return False
+
+    age = datetime.now(timezone.utc) - head_object_response["LastModified"]
+    return age < timedelta(seconds=ttl_seconds)
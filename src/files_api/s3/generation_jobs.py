@@ -0,0 +1,168 @@
+"""
+State of generation jobs, which generate files in the background of the API.
+
+The state of each job is persisted under the internal key prefix (e.g. `.files-api/`)
+at `generation-jobs/<job id>.json`, so that any API instance can report it, whichever
+instance runs the job.
+"""
+
+import json
+import re
+import uuid
+from dataclasses import (
+    asdict,
+    dataclass,
+)
+from datetime import (
+    datetime,
+    timezone,
+)
+from typing import (
+    Literal,
+    Optional,
+    Union,
+)
+
+from files_api.metrics import instrument_calls
+from files_api.s3.client import get_s3_client
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+GenerationJobStatus = Literal["queued", "running", "done", "failed"]
+
+
+class GenerationJobNotFoundError(Exception):
+    """Raised when a generation job does not exist."""
+
+    def __init__(self, job_id: str) -> None:
+        super().__init__(f"Generation job not found: {job_id}")
+        self.job_id = job_id
+
+
+@dataclass
+class GenerationJob:
+    """State of a generation job, persisted as JSON."""
+
+    job_id: str
+    file_path: str
+    file_type: str
+    status: GenerationJobStatus
+    created_at: datetime
+    updated_at: datetime
+    error: Optional[str] = None
+
+    def to_json(self) -> str:
+        state = asdict(self)
+        state["created_at"] = self.created_at.isoformat()
+        state["updated_at"] = self.updated_at.isoformat()
+        return json.dumps(state)
+
+    @classmethod
+    def from_json(cls, state_json: Union[str, bytes]) -> "GenerationJob":
+        state = json.loads(state_json)
+        state["created_at"] = datetime.fromisoformat(state["created_at"])
+        state["updated_at"] = datetime.fromisoformat(state["updated_at"])
+        return cls(**state)
+
+
+def get_generation_job_key(internal_key_prefix: str, job_id: str) -> str:
+    return f"{internal_key_prefix}generation-jobs/{job_id}.json"
+
+
+@instrument_calls("s3")
+def create_generation_job(
+    bucket_name: str,
+    file_path: str,
+    file_type: str,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> GenerationJob:
+    """
+    Record a new, queued generation job.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param file_path: The path the generated file will be stored at.
+    :param file_type: The type of file to generate, e.g. "image".
+    :param internal_key_prefix: Key prefix under which job state is stored.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :return: The new job.
+    """
+    now = datetime.now(timezone.utc)
+    job = GenerationJob(
+        job_id=uuid.uuid4().hex,
+        file_path=file_path,
+        file_type=file_type,
+        status="queued",
+        created_at=now,
+        updated_at=now,
+    )
+    save_generation_job(bucket_name, job, internal_key_prefix, s3_client)
+
+    return job
+
+
+@instrument_calls("s3")
+def fetch_generation_job(
+    bucket_name: str,
+    job_id: str,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> GenerationJob:
+    """
+    Load the state of a generation job.
+
+    :raises GenerationJobNotFoundError: If there is no job with this ID.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    if not JOB_ID_PATTERN.match(job_id):
+        raise GenerationJobNotFoundError(job_id)
+
+    try:
+        response = s3_client.get_object(
+            Bucket=bucket_name, Key=get_generation_job_key(internal_key_prefix, job_id)
+        )
+    except s3_client.exceptions.NoSuchKey as err:
+        raise GenerationJobNotFoundError(job_id) from err
+
+    return GenerationJob.from_json(response["Body"].read())
+
+
+@instrument_calls("s3")
+def save_generation_job(
+    bucket_name: str,
+    job: GenerationJob,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """Persist the state of a generation job."""
+    s3_client = s3_client or get_s3_client()
+
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=get_generation_job_key(internal_key_prefix, job.job_id),
+        Body=job.to_json().encode("utf-8"),
+        ContentType="application/json",
+    )
+
+
+@instrument_calls("s3")
+def update_generation_job(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    job: GenerationJob,
+    internal_key_prefix: str,
+    status: GenerationJobStatus,
+    error: Optional[str] = None,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """Move a generation job to a new status and persist it."""
+    job.status = status
+    job.error = error
+    job.updated_at = datetime.now(timezone.utc)
+    save_generation_job(bucket_name, job, internal_key_prefix, s3_client)
@@ -0,0 +1,220 @@
+"""
+Responses to requests made with an `Idempotency-Key` header, kept to replay them.
+
+A client retrying a request with the same key gets the response to the first one rather
+than repeating its work. Responses live under the internal key prefix, at
+`idempotency-keys/<digest of the key>.json`, so that any API instance can replay them.
+They are replayed only for requests identical to the first one, and only for a while.
+
+A request claims its key before doing any work, by storing an in-progress record with a
+conditional write, so that concurrent requests with the same key can't both do it.
+
+Docs: https://datatracker.ietf.org/doc/draft-ietf-httpapi-idempotency-key-header/
+"""
+
+import hashlib
+import json
+from dataclasses import (
+    asdict,
+    dataclass,
+    field,
+)
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+from typing import (
+    Any,
+    Dict,
+    Optional,
+    Union,
+)
+
+from files_api.metrics import instrument_calls
+from files_api.s3.client import get_s3_client
+from files_api.s3.write_objects import put_json_object_if_unchanged
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+# after this long, a claim is taken to belong to a request that died without releasing it
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class IdempotencyKeyInUseError(Exception):
+    """Raised when another request holds the idempotency key and is still in progress."""
+
+    def __init__(self, request_fingerprint: str) -> None:
+        super().__init__("A request with this idempotency key is in progress")
+        self.request_fingerprint = request_fingerprint
+
+
+@dataclass
+class IdempotentResponse:
+    """
+    A response stored for an idempotency key, persisted as JSON.
+
+    While the request that claimed the key is in progress, the record has no response yet.
+    """
+
+    request_fingerprint: str
+    status_code: int
+    headers: Dict[str, str]
+    body: Any
+    created_at: datetime
+    in_progress: bool = False
+    # ETag of the stored record, to replace it only if it did not change; not persisted
+    etag: Optional[str] = field(default=None, repr=False)
+
+    def to_json(self) -> str:
+        state = asdict(self)
+        del state["etag"]
+        state["created_at"] = self.created_at.isoformat()
+        return json.dumps(state)
+
+    @classmethod
+    def from_json(cls, state_json: Union[str, bytes]) -> "IdempotentResponse":
+        state = json.loads(state_json)
+        state["created_at"] = datetime.fromisoformat(state["created_at"])
+        return cls(**state)
+
+
+def get_idempotency_key_key(internal_key_prefix: str, idempotency_key: str) -> str:
+    # keys are chosen by clients, so they are hashed into a safe, fixed-length name
+    digest = hashlib.sha256(idempotency_key.encode("utf-8")).hexdigest()
+    return f"{internal_key_prefix}idempotency-keys/{digest}.json"
+
+
+def get_request_fingerprint(request_params: Dict[str, Any]) -> str:
+    """Digest the parameters of a request, to tell if a key is reused for another one."""
+    return hashlib.sha256(
+        json.dumps(request_params, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+@instrument_calls("s3")
+def claim_idempotency_key(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    idempotency_key: str,
+    request_fingerprint: str,
+    internal_key_prefix: str,
+    ttl_seconds: int,
+    s3_client: Optional["S3Client"] = None,
+) -> Optional[IdempotentResponse]:
+    """
+    Claim an idempotency key for a request, unless a response is already stored for it.
+
+    The claim is an in-progress record, written only if there is no record for the key, or
+    if the record there has not changed since it was found expired (or its claim abandoned).
+    Of concurrent requests with the same key, a single one gets to claim it.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param idempotency_key: The `Idempotency-Key` header of the request.
+    :param request_fingerprint: Digest of the parameters of the request.
+    :param internal_key_prefix: Key prefix under which responses are stored.
+    :param ttl_seconds: How long a response is replayed after it is stored.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :return: The response stored for the key, to replay, or None if the key was claimed.
+
+    :raises IdempotencyKeyInUseError: If another request holds the key.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    record = _fetch_idempotency_record(
+        bucket_name, idempotency_key, internal_key_prefix, s3_client=s3_client
+    )
+    if record is not None:
+        age = datetime.now(timezone.utc) - record.created_at
+        if not record.in_progress and age < timedelta(seconds=ttl_seconds):
+            return record
+        if record.in_progress and age < CLAIM_TIMEOUT:
+            raise IdempotencyKeyInUseError(record.request_fingerprint)
+
+    claim = IdempotentResponse(
+        request_fingerprint=request_fingerprint,
+        status_code=0,
+        headers={},
+        body=None,
+        created_at=datetime.now(timezone.utc),
+        in_progress=True,
+    )
+    claimed_etag = put_json_object_if_unchanged(
+        bucket_name,
+        get_idempotency_key_key(internal_key_prefix, idempotency_key),
+        claim.to_json(),
+        record.etag if record is not None else None,
+        s3_client=s3_client,
+    )
+    if claimed_etag is not None:
+        return None
+
+    # another request claimed the key first
+    winner = _fetch_idempotency_record(
+        bucket_name, idempotency_key, internal_key_prefix, s3_client=s3_client
+    )
+    if winner is not None and not winner.in_progress:
+        return winner
+    raise IdempotencyKeyInUseError(
+        winner.request_fingerprint if winner is not None else request_fingerprint
+    )
+
+
+@instrument_calls("s3")
+def release_idempotency_key(
+    bucket_name: str,
+    idempotency_key: str,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """Give up the claim on an idempotency key, e.g. when the request failed, so it can be retried."""
+    s3_client = s3_client or get_s3_client()
+
+    s3_client.delete_object(
+        Bucket=bucket_name,
+        Key=get_idempotency_key_key(internal_key_prefix, idempotency_key),
+    )
+
+
+@instrument_calls("s3")
+def save_idempotent_response(
+    bucket_name: str,
+    idempotency_key: str,
+    idempotent_response: IdempotentResponse,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """Store the response to a request made with an idempotency key, in place of its claim."""
+    s3_client = s3_client or get_s3_client()
+
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=get_idempotency_key_key(internal_key_prefix, idempotency_key),
+        Body=idempotent_response.to_json().encode("utf-8"),
+        ContentType="application/json",
+    )
+
+
+def _fetch_idempotency_record(
+    bucket_name: str,
+    idempotency_key: str,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> Optional[IdempotentResponse]:
+    """Load the record stored for an idempotency key, however old, or None if there is none."""
+    s3_client = s3_client or get_s3_client()
+
+    try:
+        response = s3_client.get_object(
+            Bucket=bucket_name,
+            Key=get_idempotency_key_key(internal_key_prefix, idempotency_key),
+        )
+    except s3_client.exceptions.NoSuchKey:
+        return None
+
+    record = IdempotentResponse.from_json(response["Body"].read())
+    record.etag = response["ETag"]
+    return record
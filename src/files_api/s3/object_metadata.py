@@ -0,0 +1,145 @@
+"""User-defined S3 object metadata written and read by the files API."""
+
+from typing import (
+    Dict,
+    Mapping,
+    Optional,
+    Union,
+)
+
+from files_api.checksums import ObjectChecksums
+
+try:
+    from mypy_boto3_s3.type_defs import (
+        GetObjectOutputTypeDef,
+        HeadObjectOutputTypeDef,
+    )
+except ImportError:
+    ...
+
+# the content encoding the object's bytes were compressed with before storing them
+STORED_ENCODING_METADATA_KEY = "stored-encoding"
+
+# the size of the object before it was compressed, i.e. what clients upload and download
+LOGICAL_SIZE_METADATA_KEY = "logical-size"
+
+# set on pointer objects: the SHA-256 of the content-addressed blob holding the content
+BLOB_SHA256_METADATA_KEY = "blob-sha256"
+
+# set on pointer objects: the id of the reference to the blob written along with the pointer
+BLOB_REFERENCE_METADATA_KEY = "blob-reference"
+
+# base64-encoded checksums of the logical (uncompressed) content
+CHECKSUM_METADATA_KEY_PREFIX = "checksum-"
+
+
+def get_stored_encoding(
+    object_response: Union["HeadObjectOutputTypeDef", "GetObjectOutputTypeDef"]
+) -> Optional[str]:
+    """
+    Get the encoding an object was compressed with at rest.
+
+    :param object_response: Response of `head_object` or `get_object`.
+
+    :return: The encoding, e.g. "zstd", or None if the object is stored as-is.
+    """
+    metadata: Mapping[str, str] = object_response.get("Metadata", {})
+    return metadata.get(STORED_ENCODING_METADATA_KEY)
+
+
+def get_logical_size(
+    object_response: Union["HeadObjectOutputTypeDef", "GetObjectOutputTypeDef"]
+) -> int:
+    """
+    Get the size of an object as uploaded, regardless of how it is stored.
+
+    :param object_response: Response of `head_object` or `get_object`.
+
+    :return: The logical size of the object in bytes.
+    """
+    metadata: Mapping[str, str] = object_response.get("Metadata", {})
+    logical_size = metadata.get(LOGICAL_SIZE_METADATA_KEY)
+    if logical_size is not None:
+        return int(logical_size)
+    return object_response["ContentLength"]
+
+
+def get_blob_sha256(
+    object_response: Union["HeadObjectOutputTypeDef", "GetObjectOutputTypeDef"]
+) -> Optional[str]:
+    """
+    Get the SHA-256 of the blob a pointer object refers to.
+
+    :param object_response: Response of `head_object` or `get_object`.
+
+    :return: The hex digest, or None if the object holds its own content.
+    """
+    metadata: Mapping[str, str] = object_response.get("Metadata", {})
+    return metadata.get(BLOB_SHA256_METADATA_KEY)
+
+
+def get_content_version(object_response: "HeadObjectOutputTypeDef") -> str:
+    """
+    Get a token that changes whenever an object's content changes.
+
+    This is the ETag, except for pointer objects: those are all empty, so their ETags
+    are identical and the SHA-256 of the blob they point to is used instead.
+
+    :param object_response: Response of `head_object` or `get_object`.
+    """
+    return get_blob_sha256(object_response) or object_response["ETag"]
+
+
+def get_checksum_metadata(checksums: ObjectChecksums) -> Dict[str, str]:
+    """Build the object metadata recording the SHA-256 and CRC32 of its content."""
+    return {
+        f"{CHECKSUM_METADATA_KEY_PREFIX}sha256": checksums.sha256,
+        f"{CHECKSUM_METADATA_KEY_PREFIX}crc32": checksums.crc32,
+    }
+
+
+def get_checksums(
+    object_response: Union["HeadObjectOutputTypeDef", "GetObjectOutputTypeDef"]
+) -> Dict[str, str]:
+    """
+    Get the checksums of an object's content, recorded in its metadata or kept by S3.
+
+    S3 keeps the checksum it verified when the object was stored, if it was uploaded
+    with one, but only returns it to a read made with `ChecksumMode="ENABLED"`. Checksums
+    of a multipart upload's parts, rather than its content, are left out.
+
+    :param object_response: Response of `head_object` or `get_object`.
+
+    :return: Mapping of algorithm (e.g. "sha256") to base64-encoded checksum;
+        empty if the object was not uploaded through the files API.
+    """
+    native_checksums = {
+        "sha256": object_response.get("ChecksumSHA256"),
+        "crc32": object_response.get("ChecksumCRC32"),
+    }
+    checksums: Dict[str, str] = {}
+    if object_response.get("ChecksumType", "FULL_OBJECT") == "FULL_OBJECT":
+        for algorithm, checksum in native_checksums.items():
+            # composite checksums of multipart uploads end with the number of parts
+            if checksum is not None and "-" not in checksum:
+                checksums[algorithm] = checksum
+
+    metadata: Mapping[str, str] = object_response.get("Metadata", {})
+    checksums.update(
+        (key.removeprefix(CHECKSUM_METADATA_KEY_PREFIX), value)
+        for key, value in metadata.items()
+        if key.startswith(CHECKSUM_METADATA_KEY_PREFIX)
+    )
+    return checksums
+
+
+def get_metadata_without_checksums(
+    object_response: "HeadObjectOutputTypeDef",
+) -> Dict[str, str]:
+    """Get an object's metadata minus the checksums, for rewriting its content in place."""
+    metadata: Mapping[str, str] = object_response.get("Metadata", {})
+    return {
+        key: value
+        for key, value in metadata.items()
+        if not key.startswith(CHECKSUM_METADATA_KEY_PREFIX)
+    }
@@ -0,0 +1,345 @@
+"""
+Functions for rewriting byte ranges of objects in an S3 bucket without re-uploading them.
+
+An object is rebuilt from *segments*: ranges copied server-side from existing objects
+with `upload_part_copy`, and new bytes uploaded as parts. Since every part but the last
+must be at least 5 MiB, new bytes are topped up with bytes downloaded from the next
+copied range, and copied ranges too small to be a part are downloaded instead.
+"""
+
+import math
+from tempfile import SpooledTemporaryFile
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Union,
+)
+
+from files_api.metrics import instrument_calls
+from files_api.s3.client import get_s3_client
+from files_api.s3.object_metadata import get_metadata_without_checksums
+from files_api.s3.write_objects import (
+    MAX_IN_MEMORY_SPOOL_SIZE_BYTES,
+    MIN_MULTIPART_PART_SIZE_BYTES,
+    READ_CHUNK_SIZE_BYTES,
+    iter_file_chunks,
+)
+
+try:
+    from mypy_boto3_s3 import S3Client
+    from mypy_boto3_s3.type_defs import CompletedPartTypeDef
+except ImportError:
+    ...
+
+# S3 copies at most this many bytes per `upload_part_copy`
+MAX_COPY_PART_SIZE_BYTES = 5 * 1024 * 1024 * 1024
+
+
+class CopiedRange(NamedTuple):
+    """Bytes `[start, end)` of an existing object, copied without downloading them."""
+
+    source_key: str
+    start: int
+    end: int
+    source_etag: Optional[str] = None
+    """If set, the copy fails if the source object changed since this ETag was read."""
+
+
+Segment = Union[CopiedRange, bytes, BinaryIO]
+
+
+class ObjectPatch(NamedTuple):
+    """Replace `replace_length` bytes at `offset` with `content`."""
+
+    offset: int
+    content: Union[bytes, BinaryIO]
+    replace_length: int
+
+
+def get_patch_segments(
+    object_key: str, object_size: int, patch: ObjectPatch, etag: Optional[str] = None
+) -> List[Segment]:
+    """
+    Describe a patched object as the unchanged ranges around the new content.
+
+    :param object_key: Key of the object being patched.
+    :param object_size: Current size of the object.
+    :param patch: The patch to apply. `offset` must be at most `object_size`.
+    :param etag: Current ETag of the object, to fail if it changes while patching.
+    """
+    segments: List[Segment] = []
+    if patch.offset > 0:
+        segments.append(CopiedRange(object_key, 0, patch.offset, etag))
+    segments.append(patch.content)
+    resume_at = patch.offset + patch.replace_length
+    if resume_at < object_size:
+        segments.append(CopiedRange(object_key, resume_at, object_size, etag))
+    return segments
+
+
+def write_patched_content(
+    output: BinaryIO, chunks: Iterable[bytes], patch: ObjectPatch
+) -> None:
+    """
+    Write content with a patch applied, reading the original content as a stream.
+
+    Used for objects whose stored bytes are not their content, e.g. compressed ones.
+    """
+    position = 0
+    patch_written = False
+    resume_at = patch.offset + patch.replace_length
+    for chunk in chunks:
+        chunk_end = position + len(chunk)
+        if position < patch.offset:
+            output.write(chunk[: patch.offset - position])
+        if not patch_written and chunk_end >= patch.offset:
+            for patch_chunk in iter_file_chunks(patch.content):
+                output.write(patch_chunk)
+            patch_written = True
+        if chunk_end > resume_at:
+            resume_from = max(resume_at - position, 0)
+            output.write(chunk[resume_from:])
+        position = chunk_end
+
+    if not patch_written:
+        for patch_chunk in iter_file_chunks(patch.content):
+            output.write(patch_chunk)
+
+
+@instrument_calls("s3")
+def assemble_s3_object(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    object_key: str,
+    segments: Iterable[Segment],
+    content_type: Optional[str] = None,
+    metadata: Optional[Dict[str, str]] = None,
+    s3_client: Optional["S3Client"] = None,
+) -> int:
+    """
+    Write an object made of copied ranges of existing objects and new bytes.
+
+    Objects without any range large enough to copy are uploaded with a single
+    `put_object`; otherwise a multipart upload is used. The source objects may include
+    `object_key` itself, since it is only replaced once every part is in place.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param segments: The content of the object, in order.
+    :param content_type: The MIME type of the object.
+    :param metadata: User-defined metadata for the object.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :return: The size of the new object in bytes.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    assembler = _ObjectAssembler(
+        bucket_name=bucket_name,
+        object_key=object_key,
+        content_type=content_type or "application/octet-stream",
+        metadata=metadata or {},
+        s3_client=s3_client,
+    )
+    try:
+        for segment in segments:
+            if isinstance(segment, CopiedRange):
+                assembler.copy(segment)
+            else:
+                for chunk in iter_file_chunks(segment):
+                    assembler.write(chunk)
+        return assembler.finish()
+    except Exception:
+        assembler.abort()
+        raise
+
+
+@instrument_calls("s3")
+def patch_s3_object(
+    bucket_name: str,
+    object_key: str,
+    patch: ObjectPatch,
+    s3_client: Optional["S3Client"] = None,
+) -> int:
+    """
+    Replace a byte range of an object, copying the unchanged bytes server-side.
+
+    The object keeps its content type and metadata, except for recorded checksums,
+    which no longer match the content.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param patch: The patch to apply. Its `offset` must be at most the object's size;
+        an offset equal to the size appends to the object.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :raises ValueError: If the patch starts past the end of the object.
+
+    :return: The size of the patched object in bytes.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    head_object_response = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+    object_size = head_object_response["ContentLength"]
+    if patch.offset > object_size:
+        raise ValueError(
+            f"Patch offset {patch.offset} is past the end of the object ({object_size} bytes)"
+        )
+
+    return assemble_s3_object(
+        bucket_name=bucket_name,
+        object_key=object_key,
+        segments=get_patch_segments(
+            object_key, object_size, patch, etag=head_object_response["ETag"]
+        ),
+        content_type=head_object_response["ContentType"],
+        metadata=get_metadata_without_checksums(head_object_response),
+        s3_client=s3_client,
+    )
+
+
+class _ObjectAssembler:  # pylint: disable=too-many-instance-attributes
+    """Turn a stream of copied ranges and new bytes into valid multipart upload parts."""
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        bucket_name: str,
+        object_key: str,
+        content_type: str,
+        metadata: Dict[str, str],
+        s3_client: "S3Client",
+    ) -> None:
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+        self.content_type = content_type
+        self.metadata = metadata
+        self.s3_client = s3_client
+
+        # closed by `finish` or `abort`, as the buffer outlives this call
+        self.buffer = SpooledTemporaryFile(  # pylint: disable=consider-using-with
+            max_size=MAX_IN_MEMORY_SPOOL_SIZE_BYTES
+        )
+        self.upload_id: Optional[str] = None
+        self.parts: List["CompletedPartTypeDef"] = []
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.buffer.write(chunk)
+        self.size += len(chunk)
+
+    def copy(self, copied_range: CopiedRange) -> None:
+        start, end = copied_range.start, copied_range.end
+
+        # buffered bytes can only become a part once there are enough of them
+        buffered_size = self.buffer.tell()
+        if 0 < buffered_size < MIN_MULTIPART_PART_SIZE_BYTES:
+            top_up_end = min(start + MIN_MULTIPART_PART_SIZE_BYTES - buffered_size, end)
+            self._download(copied_range, start, top_up_end)
+            start = top_up_end
+
+        if end - start < MIN_MULTIPART_PART_SIZE_BYTES:
+            self._download(copied_range, start, end)
+            return
+
+        self._flush_buffer()
+        part_count = math.ceil((end - start) / MAX_COPY_PART_SIZE_BYTES)
+        part_size = math.ceil((end - start) / part_count)
+        for part_start in range(start, end, part_size):
+            self._upload_part_copy(
+                copied_range, part_start, min(part_start + part_size, end)
+            )
+
+    def finish(self) -> int:
+        if self.upload_id is None:
+            self.buffer.seek(0)
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=self.object_key,
+                Body=self.buffer,
+                ContentType=self.content_type,
+                Metadata=self.metadata,
+            )
+        else:
+            self._flush_buffer()
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.object_key,
+                UploadId=self.upload_id,
+                MultipartUpload={"Parts": self.parts},
+            )
+        self.buffer.close()
+        return self.size
+
+    def abort(self) -> None:
+        self.buffer.close()
+        if self.upload_id is not None:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.object_key, UploadId=self.upload_id
+            )
+
+    def _get_upload_id(self) -> str:
+        if self.upload_id is None:
+            self.upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.object_key,
+                ContentType=self.content_type,
+                Metadata=self.metadata,
+            )["UploadId"]
+        return self.upload_id
+
+    def _download(self, copied_range: CopiedRange, start: int, end: int) -> None:
+        if start >= end:
+            return
+        extra_args = {}
+        if copied_range.source_etag is not None:
+            extra_args["IfMatch"] = copied_range.source_etag
+        response = self.s3_client.get_object(
+            Bucket=self.bucket_name,
+            Key=copied_range.source_key,
+            Range=f"bytes={start}-{end - 1}",
+            **extra_args,
+        )
+        for chunk in response["Body"].iter_chunks(READ_CHUNK_SIZE_BYTES):
+            self.write(chunk)
+
+    def _flush_buffer(self) -> None:
+        if self.buffer.tell() == 0:
+            return
+        upload_id = self._get_upload_id()
+        part_number = len(self.parts) + 1
+        self.buffer.seek(0)
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.object_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=self.buffer,
+        )
+        self.parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def _upload_part_copy(
+        self, copied_range: CopiedRange, start: int, end: int
+    ) -> None:
+        upload_id = self._get_upload_id()
+        part_number = len(self.parts) + 1
+        extra_args = {}
+        if copied_range.source_etag is not None:
+            extra_args["CopySourceIfMatch"] = copied_range.source_etag
+        response = self.s3_client.upload_part_copy(
+            Bucket=self.bucket_name,
+            Key=self.object_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            CopySource={"Bucket": self.bucket_name, "Key": copied_range.source_key},
+            CopySourceRange=f"bytes={start}-{end - 1}",
+            **extra_args,
+        )
+        self.parts.append(
+            {"PartNumber": part_number, "ETag": response["CopyPartResult"]["ETag"]}
+        )
+        self.size += end - start
@@ -1,22 +1,36 @@
 """Functions for reading objects from an S3 bucket--the "R" in CRUD."""
 
-from typing import Optional
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import (
+    Dict,
+    List,
+    Optional,
+)
 
-import boto3
+from files_api.metrics import instrument_calls
+from files_api.s3.client import get_s3_client
+from files_api.s3.object_metadata import get_logical_size
 
 try:
     from mypy_boto3_s3 import S3Client
     from mypy_boto3_s3.type_defs import (
         GetObjectOutputTypeDef,
+        HeadObjectOutputTypeDef,
         ListObjectsV2OutputTypeDef,
+        MultipartUploadTypeDef,
         ObjectTypeDef,
     )
 except ImportError:
     ...
 
 DEFAULT_MAX_KEYS = 1_000
+DEFAULT_MAX_CONCURRENT_HEAD_REQUESTS = 16
+DEFAULT_PRESIGNED_URL_EXPIRATION_SECONDS = 300
 
 
+@instrument_calls("s3")
 def object_exists_in_s3(
     bucket_name: str, object_key: str, s3_client: Optional["S3Client"] = None
 ) -> bool:
@@ -26,11 +40,11 @@ def object_exists_in_s3(
     :param bucket_name: Name of the S3 bucket.
     :param object_key: Key of the object to check.
     :param s3_client: Optional S3 client to use.
-        If not provided, a new client will be created.
+        If not provided, the shared client is used.
 
     :return: True if the object exists, False otherwise.
     """
-    s3_client = s3_client or boto3.client("s3")
+    s3_client = s3_client or get_s3_client()
 
     flag = False
 
@@ -45,6 +59,39 @@ def object_exists_in_s3(
     return flag
 
 
+@instrument_calls("s3")
+def multipart_upload_exists_in_s3(
+    bucket_name: str,
+    object_key: str,
+    upload_id: str,
+    s3_client: Optional["S3Client"] = None,
+) -> bool:
+    """
+    Check if a multipart upload is still in progress using list_parts.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param object_key: Key of the object being uploaded.
+    :param upload_id: ID of the multipart upload.
+    :param s3_client: Optional S3 client to use.
+        If not provided, the shared client is used.
+
+    :return: True if the upload exists and was neither completed nor aborted.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    try:
+        s3_client.list_parts(
+            Bucket=bucket_name, Key=object_key, UploadId=upload_id, MaxParts=1
+        )
+    except s3_client.exceptions.ClientError as err:
+        if err.response["Error"]["Code"] != "NoSuchUpload":
+            raise err
+        return False
+
+    return True
+
+
+@instrument_calls("s3")
 def fetch_s3_object(
     bucket_name: str,
     object_key: str,
@@ -56,15 +103,76 @@ def fetch_s3_object(
     :param bucket_name: Name of the S3 bucket.
     :param object_key: Key of the object to fetch.
     :param s3_client: Optional S3 client to use.
-        If not provided, a new client will be created.
+        If not provided, the shared client is used.
+
+    :return: Metadata of the object, with the checksum S3 keeps of its content if any.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    return s3_client.get_object(
+        Bucket=bucket_name, Key=object_key, ChecksumMode="ENABLED"
+    )
+
+
+@instrument_calls("s3")
+def fetch_s3_object_head(
+    bucket_name: str,
+    object_key: str,
+    s3_client: Optional["S3Client"] = None,
+) -> "HeadObjectOutputTypeDef":
+    """
+    Fetch metadata of an object in the S3 bucket without opening its body.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param object_key: Key of the object to fetch.
+    :param s3_client: Optional S3 client to use.
+        If not provided, the shared client is used.
 
-    :return: Metadata of the object.
+    :return: Metadata of the object, with the checksum S3 keeps of its content if any.
     """
-    s3_client = s3_client or boto3.client("s3")
+    s3_client = s3_client or get_s3_client()
 
-    return s3_client.get_object(Bucket=bucket_name, Key=object_key)
+    return s3_client.head_object(
+        Bucket=bucket_name, Key=object_key, ChecksumMode="ENABLED"
+    )
 
 
+@instrument_calls("s3")
+def generate_presigned_download_url(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    object_key: str,
+    expires_in_seconds: int = DEFAULT_PRESIGNED_URL_EXPIRATION_SECONDS,
+    response_content_type: Optional[str] = None,
+    response_content_encoding: Optional[str] = None,
+    s3_client: Optional["S3Client"] = None,
+) -> str:
+    """
+    Generate a presigned URL that downloads an object directly from S3.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param object_key: Key of the object to download.
+    :param expires_in_seconds: How long the URL stays valid.
+    :param response_content_type: Optional `Content-Type` for S3 to respond with.
+    :param response_content_encoding: Optional `Content-Encoding` for S3 to respond with.
+    :param s3_client: Optional S3 client to use.
+        If not provided, the shared client is used.
+
+    :return: The presigned URL for a `GET` request.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    params = {"Bucket": bucket_name, "Key": object_key}
+    if response_content_type is not None:
+        params["ResponseContentType"] = response_content_type
+    if response_content_encoding is not None:
+        params["ResponseContentEncoding"] = response_content_encoding
+
+    return s3_client.generate_presigned_url(
+        "get_object", Params=params, ExpiresIn=expires_in_seconds
+    )
+
+
+@instrument_calls("s3")
 def fetch_s3_objects_using_page_token(
     bucket_name: str,
     continuation_token: str,
@@ -79,13 +187,13 @@ def fetch_s3_objects_using_page_token(
         where the last page left off.
     :param max_keys: Maximum number of keys to return within this page.
     :param s3_client: Optional S3 client to use.
-        If not provided, a new client will be created.
+        If not provided, the shared client is used.
 
     :return: Tuple of a list of objects and the next continuation token.
         1. Possibly empty list of objects in the current page.
         2. Next continuation token if there are more pages, otherwise None.
     """
-    s3_client = s3_client or boto3.client("s3")
+    s3_client = s3_client or get_s3_client()
     response: "ListObjectsV2OutputTypeDef" = s3_client.list_objects_v2(
         Bucket=bucket_name,
         ContinuationToken=continuation_token,
@@ -97,11 +205,13 @@ def fetch_s3_objects_using_page_token(
     return files, next_continuation_token
 
 
+@instrument_calls("s3")
 def fetch_s3_objects_metadata(
     bucket_name: str,
     prefix: Optional[str] = None,
     max_keys: int = DEFAULT_MAX_KEYS,
     s3_client: Optional["S3Client"] = None,
+    start_after: Optional[str] = None,
 ) -> tuple[list["ObjectTypeDef"], Optional[str]]:
     """
     Fetch list of object keys and their metadata.
@@ -110,17 +220,97 @@ def fetch_s3_objects_metadata(
     :param prefix: Prefix to filter objects by.
     :param max_keys: Maximum number of keys to return within this page.
     :param s3_client: Optional S3 client to use.
-        If not provided, a new client will be created.
+        If not provided, the shared client is used.
+    :param start_after: Only list the keys that sort after this one.
 
     :return: Tuple of a list of objects and the next continuation token.
         1. Possibly empty list of objects in the current page.
         2. Next continuation token if there are more pages, otherwise None.
     """
-    s3_client = s3_client or boto3.client("s3")
+    s3_client = s3_client or get_s3_client()
     response = s3_client.list_objects_v2(
-        Bucket=bucket_name, Prefix=prefix or "", MaxKeys=max_keys
+        Bucket=bucket_name,
+        Prefix=prefix or "",
+        MaxKeys=max_keys,
+        StartAfter=start_after or "",
     )
     files: list["ObjectTypeDef"] = response.get("Contents", [])
     next_page_token: str | None = response.get("NextContinuationToken")
 
     return files, next_page_token
+
+
+@instrument_calls("s3")
+def fetch_s3_objects_logical_sizes(
+    bucket_name: str,
+    object_keys: List[str],
+    s3_client: Optional["S3Client"] = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENT_HEAD_REQUESTS,
+) -> Dict[str, int]:
+    """
+    Fetch the logical (uncompressed) sizes of objects.
+
+    `list_objects_v2` only reports the stored size, which differs from the logical
+    size for objects compressed at rest, so this issues concurrent `head_object` calls.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param object_keys: Keys of the objects to fetch sizes for.
+    :param s3_client: Optional S3 client to use.
+        If not provided, the shared client is used.
+    :param max_concurrency: Maximum number of `head_object` calls in flight at once.
+
+    :return: Mapping of object key to logical size in bytes.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    def fetch_logical_size(object_key: str) -> int:
+        return get_logical_size(
+            s3_client.head_object(Bucket=bucket_name, Key=object_key)
+        )
+
+    if not object_keys:
+        return {}
+
+    # the pool's threads don't inherit the context, e.g. the request accounting
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(
+        max_workers=min(max_concurrency, len(object_keys))
+    ) as executor:
+        sizes = executor.map(
+            lambda object_key: context.copy().run(fetch_logical_size, object_key),
+            object_keys,
+        )
+        return dict(zip(object_keys, sizes))
+
+
+@instrument_calls("s3")
+def fetch_s3_multipart_uploads(
+    bucket_name: str,
+    prefix: Optional[str] = None,
+    initiated_before: Optional[datetime] = None,
+    s3_client: Optional["S3Client"] = None,
+) -> List["MultipartUploadTypeDef"]:
+    """
+    Fetch the multipart uploads that were started but not yet completed or aborted.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param prefix: Prefix to filter the uploads' object keys by.
+    :param initiated_before: If given, only uploads started before this time are returned.
+    :param s3_client: Optional S3 client to use.
+        If not provided, the shared client is used.
+
+    :return: The in-progress uploads, with their `Key`, `UploadId` and `Initiated` date.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    uploads: List["MultipartUploadTypeDef"] = []
+    paginator = s3_client.get_paginator("list_multipart_uploads")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix or ""):
+        uploads.extend(page.get("Uploads", []))
+
+    if initiated_before is not None:
+        uploads = [
+            upload for upload in uploads if upload["Initiated"] < initiated_before
+        ]
+
+    return uploads
@@ -0,0 +1,547 @@
+"""
+Resumable upload sessions that receive the content of a file in chunks across requests.
+
+A session maps onto an S3 multipart upload of the file. Its state is persisted under the
+internal key prefix (e.g. `.files-api/`) so that any API instance can continue it:
+
+- `upload-sessions/<session id>.json`: the session state, including the uploaded parts.
+- `upload-sessions/<session id>.tail/<offset>-<random id>`: a chunk received since the
+  last part, held back until there are enough bytes for a part (S3 requires 5 MiB for all
+  but the last). Each chunk is stored on its own, so an append writes only its own bytes.
+
+The state object is the source of truth: a tail chunk written by a request that failed
+before saving the state is ignored, and a part is overwritten when the chunk is re-sent. The
+state is only saved if it did not change since it was read, so of concurrent appends at
+the same offset only one is kept; the others fail with `UploadSessionConflictError`.
+"""
+
+import io
+import itertools
+import json
+import re
+import uuid
+from dataclasses import (
+    asdict,
+    dataclass,
+    field,
+)
+from datetime import (
+    datetime,
+    timezone,
+)
+from tempfile import SpooledTemporaryFile
+from typing import (
+    IO,
+    BinaryIO,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+
+from files_api.metrics import instrument_calls
+from files_api.s3.client import get_s3_client
+from files_api.s3.write_objects import (
+    MAX_IN_MEMORY_SPOOL_SIZE_BYTES,
+    MAX_MULTIPART_PART_SIZE_BYTES,
+    MIN_MULTIPART_PART_SIZE_BYTES,
+    READ_CHUNK_SIZE_BYTES,
+    abort_multipart_upload,
+    complete_multipart_upload,
+    create_multipart_upload,
+    iter_file_chunks,
+    put_json_object_if_unchanged,
+    upload_multipart_part,
+)
+
+try:
+    from mypy_boto3_s3 import S3Client
+except ImportError:
+    ...
+
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadSessionError(Exception):
+    """Base class for errors caused by requests to an upload session."""
+
+
+class UploadSessionNotFoundError(UploadSessionError):
+    """Raised when an upload session does not exist, e.g. because it was completed."""
+
+    def __init__(self, session_id: str) -> None:
+        super().__init__(f"Upload session not found: {session_id}")
+        self.session_id = session_id
+
+
+class UploadOffsetMismatchError(UploadSessionError):
+    """Raised when a chunk is sent for a different offset than the session is at."""
+
+    def __init__(self, expected_offset: int, offset: int) -> None:
+        super().__init__(
+            f"Upload is at offset {expected_offset}, but the chunk starts at {offset}"
+        )
+        self.expected_offset = expected_offset
+        self.offset = offset
+
+
+class UploadSizeError(UploadSessionError):
+    """Raised when the content received does not add up to the declared file size."""
+
+
+class UploadSessionConflictError(UploadSessionError):
+    """Raised when a session was changed by another request since it was read."""
+
+    def __init__(self, session_id: str) -> None:
+        super().__init__(
+            f"Upload session {session_id} was changed by another request; "
+            "check its offset and retry"
+        )
+        self.session_id = session_id
+
+
+@dataclass
+class UploadSessionPart:
+    """A part of the session's multipart upload that was uploaded to S3."""
+
+    part_number: int
+    etag: str
+    size_bytes: int
+
+
+@dataclass
+class UploadSession:  # pylint: disable=too-many-instance-attributes,duplicate-code
+    """State of a resumable upload, persisted as JSON between requests."""
+
+    session_id: str
+    file_path: str
+    content_type: str
+    upload_id: str
+    created_at: datetime
+    size_bytes: Optional[int] = None
+    parts: List[UploadSessionPart] = field(default_factory=list)
+    tail_chunk_sizes: List[int] = field(default_factory=list)
+    # random part of each tail chunk's key, so that racing appends can't overwrite each
+    # other's chunks; empty for chunks stored before keys had one
+    tail_chunk_ids: List[str] = field(default_factory=list)
+    # ETag of the stored state, to save it only if it did not change; not persisted
+    etag: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def tail_offset(self) -> int:
+        """Number of bytes uploaded as parts; the held back bytes start here."""
+        return sum(part.size_bytes for part in self.parts)
+
+    @property
+    def offset(self) -> int:
+        """Number of bytes received so far; the next chunk must start here."""
+        return self.tail_offset + sum(self.tail_chunk_sizes)
+
+    def to_json(self) -> str:
+        state = asdict(self)
+        del state["etag"]
+        state["created_at"] = self.created_at.isoformat()
+        return json.dumps(state)
+
+    @classmethod
+    def from_json(cls, state_json: Union[str, bytes]) -> "UploadSession":
+        state = json.loads(state_json)
+        state["created_at"] = datetime.fromisoformat(state["created_at"])
+        state["parts"] = [UploadSessionPart(**part) for part in state["parts"]]
+        state.setdefault("tail_chunk_ids", [""] * len(state["tail_chunk_sizes"]))
+        return cls(**state)
+
+
+def get_upload_session_key(internal_key_prefix: str, session_id: str) -> str:
+    return f"{internal_key_prefix}upload-sessions/{session_id}.json"
+
+
+def get_upload_session_tail_prefix(internal_key_prefix: str, session_id: str) -> str:
+    return f"{internal_key_prefix}upload-sessions/{session_id}.tail/"
+
+
+def get_upload_session_tail_keys(
+    internal_key_prefix: str, session: UploadSession
+) -> List[str]:
+    """Get the keys of the chunks held back since the last part, in order."""
+    tail_prefix = get_upload_session_tail_prefix(
+        internal_key_prefix, session.session_id
+    )
+    chunk_offsets = itertools.accumulate(
+        session.tail_chunk_sizes[:-1], initial=session.tail_offset
+    )
+    return [
+        get_upload_session_tail_key(tail_prefix, chunk_offset, chunk_id)
+        for chunk_offset, chunk_id in zip(chunk_offsets, session.tail_chunk_ids)
+    ]
+
+
+def get_upload_session_tail_key(tail_prefix: str, offset: int, chunk_id: str) -> str:
+    if not chunk_id:
+        return f"{tail_prefix}{offset}"
+    return f"{tail_prefix}{offset}-{chunk_id}"
+
+
+@instrument_calls("s3")
+def create_upload_session(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    file_path: str,
+    internal_key_prefix: str,
+    content_type: Optional[str] = None,
+    size_bytes: Optional[int] = None,
+    s3_client: Optional["S3Client"] = None,
+) -> UploadSession:
+    """
+    Start a resumable upload of a file.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param file_path: The path the file will be stored at.
+    :param internal_key_prefix: Key prefix under which session state is stored.
+    :param content_type: The MIME type of the file, e.g. "text/plain" for a text file.
+    :param size_bytes: The size of the whole file, if known up front.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :return: The new session.
+    """
+    s3_client = s3_client or get_s3_client()
+    content_type = content_type or "application/octet-stream"
+
+    session = UploadSession(
+        session_id=uuid.uuid4().hex,
+        file_path=file_path,
+        content_type=content_type,
+        upload_id=create_multipart_upload(
+            bucket_name, file_path, content_type=content_type, s3_client=s3_client
+        ),
+        created_at=datetime.now(timezone.utc),
+        size_bytes=size_bytes,
+    )
+    save_upload_session(bucket_name, session, internal_key_prefix, s3_client)
+
+    return session
+
+
+@instrument_calls("s3")
+def fetch_upload_session(
+    bucket_name: str,
+    session_id: str,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> UploadSession:
+    """
+    Load the state of an upload session.
+
+    :raises UploadSessionNotFoundError: If there is no session with this ID.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    if not SESSION_ID_PATTERN.match(session_id):
+        raise UploadSessionNotFoundError(session_id)
+
+    try:
+        response = s3_client.get_object(
+            Bucket=bucket_name,
+            Key=get_upload_session_key(internal_key_prefix, session_id),
+        )
+    except s3_client.exceptions.NoSuchKey as err:
+        raise UploadSessionNotFoundError(session_id) from err
+
+    session = UploadSession.from_json(response["Body"].read())
+    session.etag = response["ETag"]
+    return session
+
+
+@instrument_calls("s3")
+def save_upload_session(
+    bucket_name: str,
+    session: UploadSession,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """
+    Persist the state of an upload session, unless it changed since it was read.
+
+    New sessions are saved only if no session with the same ID exists.
+
+    :raises UploadSessionConflictError: If the stored state changed since it was read.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    etag = put_json_object_if_unchanged(
+        bucket_name,
+        get_upload_session_key(internal_key_prefix, session.session_id),
+        session.to_json(),
+        session.etag,
+        s3_client=s3_client,
+    )
+    if etag is None:
+        raise UploadSessionConflictError(session.session_id)
+    session.etag = etag
+
+
+@instrument_calls("s3")
+def append_to_upload_session(  # pylint: disable=too-many-arguments,too-many-locals
+    bucket_name: str,
+    session: UploadSession,
+    offset: int,
+    chunk: Union[bytes, BinaryIO],
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> UploadSession:
+    """
+    Append a chunk of the file to an upload session.
+
+    Until the bytes held back since the last part reach the minimum part size, the chunk
+    is stored on its own. Once they do, they are read back and uploaded, with the chunk,
+    as the next parts of the multipart upload: a single part, or several if they are
+    larger than the maximum part size. Bytes left over past the last full part are held
+    back again.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param session: The session to append to.
+    :param offset: The position in the file the chunk starts at.
+    :param chunk: The content of the chunk, as bytes or a seekable binary file object.
+    :param internal_key_prefix: Key prefix under which session state is stored.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :raises UploadOffsetMismatchError: If `offset` is not the session's current offset.
+    :raises UploadSizeError: If the chunk goes past the declared size of the file.
+    :raises UploadSessionConflictError: If another request appended to the session since
+        it was read.
+
+    :return: The updated session.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    if offset != session.offset:
+        raise UploadOffsetMismatchError(expected_offset=session.offset, offset=offset)
+
+    if isinstance(chunk, bytes):
+        chunk = io.BytesIO(chunk)
+    chunk_start = chunk.tell()
+    chunk_size = chunk.seek(0, io.SEEK_END) - chunk_start
+    chunk.seek(chunk_start)
+    new_offset = session.offset + chunk_size
+    if session.size_bytes is not None and new_offset > session.size_bytes:
+        raise UploadSizeError(
+            f"Chunk ends at offset {new_offset}, "
+            f"past the declared file size of {session.size_bytes} bytes"
+        )
+    if chunk_size == 0:
+        return session
+
+    tail_keys = get_upload_session_tail_keys(internal_key_prefix, session)
+    tail_prefix = get_upload_session_tail_prefix(
+        internal_key_prefix, session.session_id
+    )
+    held_back_size = new_offset - session.tail_offset
+    if held_back_size < MIN_MULTIPART_PART_SIZE_BYTES:
+        chunk_id = uuid.uuid4().hex
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=get_upload_session_tail_key(tail_prefix, session.offset, chunk_id),
+            Body=chunk,
+        )
+        session.tail_chunk_sizes.append(chunk_size)
+        session.tail_chunk_ids.append(chunk_id)
+        save_upload_session(bucket_name, session, internal_key_prefix, s3_client)
+        return session
+
+    content = _ChunksReader(
+        itertools.chain(
+            _iter_tail_chunks(bucket_name, session, tail_keys, s3_client),
+            iter_file_chunks(chunk),
+        )
+    )
+    while held_back_size >= MIN_MULTIPART_PART_SIZE_BYTES:
+        part_size = min(held_back_size, MAX_MULTIPART_PART_SIZE_BYTES)
+        part_number = len(session.parts) + 1
+        with SpooledTemporaryFile(max_size=MAX_IN_MEMORY_SPOOL_SIZE_BYTES) as part:
+            content.copy_to(part, part_size)
+            part.seek(0)
+            etag = upload_multipart_part(
+                bucket_name=bucket_name,
+                object_key=session.file_path,
+                upload_id=session.upload_id,
+                part_number=part_number,
+                file_content=part,  # type: ignore[arg-type]
+                s3_client=s3_client,
+            )
+        session.parts.append(
+            UploadSessionPart(part_number=part_number, etag=etag, size_bytes=part_size)
+        )
+        held_back_size -= part_size
+
+    session.tail_chunk_sizes = []
+    session.tail_chunk_ids = []
+    if held_back_size > 0:
+        chunk_id = uuid.uuid4().hex
+        with SpooledTemporaryFile(max_size=MAX_IN_MEMORY_SPOOL_SIZE_BYTES) as rest:
+            content.copy_to(rest, held_back_size)
+            rest.seek(0)
+            s3_client.put_object(
+                Bucket=bucket_name,
+                Key=get_upload_session_tail_key(
+                    tail_prefix, session.tail_offset, chunk_id
+                ),
+                Body=rest,
+            )
+        session.tail_chunk_sizes.append(held_back_size)
+        session.tail_chunk_ids.append(chunk_id)
+
+    save_upload_session(bucket_name, session, internal_key_prefix, s3_client)
+    _delete_objects(bucket_name, tail_keys, s3_client)
+
+    return session
+
+
+class _ChunksReader:
+    """Read exact amounts of bytes from an iterator of chunks of any size."""
+
+    def __init__(self, chunks: Iterator[bytes]) -> None:
+        self._chunks = chunks
+        self._pending = b""
+
+    def copy_to(self, file: IO[bytes], size_bytes: int) -> None:
+        """Write the next `size_bytes` bytes to `file`."""
+        while size_bytes > 0:
+            if not self._pending:
+                self._pending = next(self._chunks)
+            piece = self._pending[:size_bytes]
+            file.write(piece)
+            piece_size = len(piece)
+            self._pending = self._pending[piece_size:]
+            size_bytes -= piece_size
+
+
+def _iter_tail_chunks(
+    bucket_name: str,
+    session: UploadSession,
+    tail_keys: List[str],
+    s3_client: "S3Client",
+) -> Iterator[bytes]:
+    """Read back the chunks held back since the last part."""
+    for tail_key, size_bytes in zip(tail_keys, session.tail_chunk_sizes):
+        response = s3_client.get_object(
+            Bucket=bucket_name, Key=tail_key, Range=f"bytes=0-{size_bytes - 1}"
+        )
+        yield from response["Body"].iter_chunks(READ_CHUNK_SIZE_BYTES)
+
+
+@instrument_calls("s3")
+def complete_upload_session(
+    bucket_name: str,
+    session: UploadSession,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """
+    Upload the held back bytes as the last part and assemble the file.
+
+    :raises UploadSizeError: If fewer bytes than the declared file size were received.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    if session.size_bytes is not None and session.offset != session.size_bytes:
+        raise UploadSizeError(
+            f"Received {session.offset} of {session.size_bytes} bytes; "
+            "send the rest before completing the upload"
+        )
+
+    # S3 needs at least one part, so empty files are uploaded as a single empty part
+    if session.tail_chunk_sizes or not session.parts:
+        tail_content = b"".join(
+            _iter_tail_chunks(
+                bucket_name,
+                session,
+                get_upload_session_tail_keys(internal_key_prefix, session),
+                s3_client,
+            )
+        )
+        part_number = len(session.parts) + 1
+        etag = upload_multipart_part(
+            bucket_name=bucket_name,
+            object_key=session.file_path,
+            upload_id=session.upload_id,
+            part_number=part_number,
+            file_content=tail_content,
+            s3_client=s3_client,
+        )
+        session.parts.append(
+            UploadSessionPart(
+                part_number=part_number, etag=etag, size_bytes=len(tail_content)
+            )
+        )
+
+    complete_multipart_upload(
+        bucket_name=bucket_name,
+        object_key=session.file_path,
+        upload_id=session.upload_id,
+        parts=[
+            {"PartNumber": part.part_number, "ETag": part.etag}
+            for part in session.parts
+        ],
+        s3_client=s3_client,
+    )
+    _delete_upload_session_state(bucket_name, session, internal_key_prefix, s3_client)
+
+
+@instrument_calls("s3")
+def delete_upload_session(
+    bucket_name: str,
+    session: UploadSession,
+    internal_key_prefix: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """Abort an upload session, deleting everything received so far."""
+    s3_client = s3_client or get_s3_client()
+
+    try:
+        abort_multipart_upload(
+            bucket_name, session.file_path, session.upload_id, s3_client=s3_client
+        )
+    except s3_client.exceptions.ClientError as err:
+        if err.response["Error"]["Code"] != "NoSuchUpload":
+            raise err
+    _delete_upload_session_state(bucket_name, session, internal_key_prefix, s3_client)
+
+
+def _delete_upload_session_state(
+    bucket_name: str,
+    session: UploadSession,
+    internal_key_prefix: str,
+    s3_client: "S3Client",
+) -> None:
+    # tail chunks left behind by failed requests are deleted too
+    tail_keys = [
+        tail_object["Key"]
+        for page in s3_client.get_paginator("list_objects_v2").paginate(
+            Bucket=bucket_name,
+            Prefix=get_upload_session_tail_prefix(
+                internal_key_prefix, session.session_id
+            ),
+        )
+        for tail_object in page.get("Contents", [])
+    ]
+    _delete_objects(
+        bucket_name,
+        [get_upload_session_key(internal_key_prefix, session.session_id), *tail_keys],
+        s3_client,
+    )
+
+
+def _delete_objects(
+    bucket_name: str, object_keys: List[str], s3_client: "S3Client"
+) -> None:
+    # `delete_objects` takes at most 1,000 keys at once
+    for batch_start in range(0, len(object_keys), 1000):
+        batch_end = batch_start + 1000
+        s3_client.delete_objects(
+            Bucket=bucket_name,
+            Delete={
+                "Objects": [
+                    {"Key": object_key}
+                    for object_key in object_keys[batch_start:batch_end]
+                ]
+            },
+        )
@@ -1,35 +1,626 @@
 """Functions for writing objects from an S3 bucket--the "C" and "U" in CRUD."""
 
-from typing import Optional
+import asyncio
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import (
+    Any,
+    AsyncIterable,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Union,
+)
 
-import boto3
+from botocore.exceptions import ClientError
+
+from files_api.checksums import (
+    HashingReader,
+    ObjectChecksums,
+    StreamingChecksums,
+    verify_checksums,
+)
+from files_api.compression import (
+    create_compressor,
+    get_at_rest_encoding,
+    is_compressible_content_type,
+)
+from files_api.metrics import instrument_calls
+from files_api.s3.client import get_s3_client
+from files_api.s3.object_metadata import (
+    LOGICAL_SIZE_METADATA_KEY,
+    STORED_ENCODING_METADATA_KEY,
+    get_checksum_metadata,
+)
 
 try:
     from mypy_boto3_s3 import S3Client
+    from mypy_boto3_s3.type_defs import CompletedPartTypeDef
 except ImportError:
     ...
 
+# chunk size used when reading file content to checksum and compress it
+READ_CHUNK_SIZE_BYTES = 1024 * 1024
+
+# compressed output larger than this is spooled to disk rather than kept in memory
+MAX_IN_MEMORY_SPOOL_SIZE_BYTES = 8 * 1024 * 1024
+
+DEFAULT_PRESIGNED_URL_EXPIRATION_SECONDS = 300
+
+# every part of a multipart upload except the last must be at least this large
+MIN_MULTIPART_PART_SIZE_BYTES = 5 * 1024 * 1024
+
+# and no part can be larger than this
+MAX_MULTIPART_PART_SIZE_BYTES = 5 * 1024 * 1024 * 1024
+
 
-def upload_s3_object(
+@instrument_calls("s3")
+def upload_s3_object(  # pylint: disable=too-many-arguments
     bucket_name: str,
     object_key: str,
-    file_content: bytes,
+    file_content: Union[bytes, BinaryIO],
     content_type: Optional[str] = None,
     s3_client: Optional["S3Client"] = None,
-) -> None:
+    compress: bool = False,
+    expected_checksums: Optional[Mapping[str, str]] = None,
+    content_checksums: Optional[ObjectChecksums] = None,
+) -> ObjectChecksums:
     """
     Upload a file to an S3 bucket.
 
+    Checksums of the content are computed in the same pass that uploads it, or that
+    compresses it if enabled, and S3 verifies the SHA-256 of the bytes it stores. If they
+    are known before the upload starts, they are stored in the object's metadata;
+    otherwise S3 keeps the SHA-256 it verified, which `get_checksums` reads back.
+
     :param bucket_name: The name of the S3 bucket.
     :param object_key: path to the object in the S3 bucket.
-    :param file_content: The content of the file to upload.
+    :param file_content: The content of the file to upload, as bytes or a seekable
+        binary file object.
     :param content_type: The MIME type of the file, e.g. "text/plain" for a text file.
-    :param s3_client: An optional boto3 S3 client. If not provided, one will be created.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+    :param compress: If True and the content type is compressible, the content is
+        compressed as a stream before uploading, and the encoding and uncompressed size
+        are recorded in the object's metadata.
+    :param expected_checksums: Optional mapping of algorithm ("sha256", "crc32", "md5")
+        to base64-encoded checksum that the content must match.
+    :param content_checksums: The checksums of the content, if the caller computed them
+        already (e.g. to address it by its SHA-256), so that it is not hashed again.
+
+    :raises ChecksumMismatchError: If the content does not match `expected_checksums`,
+        in which case nothing is uploaded.
+
+    :return: The checksums of the (uncompressed) content.
     """
-    s3_client = s3_client or boto3.client("s3")
+    s3_client = s3_client or get_s3_client()
 
     content_type = content_type or "application/octet-stream"
+    expected_checksums = expected_checksums or {}
+    if isinstance(file_content, bytes):
+        file_content = BytesIO(file_content)
+
+    if compress and is_compressible_content_type(content_type):
+        return upload_compressed_s3_object(
+            bucket_name=bucket_name,
+            object_key=object_key,
+            file_content=file_content,
+            content_type=content_type,
+            s3_client=s3_client,
+            expected_checksums=expected_checksums,
+        )
 
+    if content_checksums is not None:
+        verify_checksums(content_checksums, expected_checksums)
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=object_key,
+            Body=file_content,
+            ContentType=content_type,
+            ChecksumSHA256=content_checksums.sha256,
+            Metadata=get_checksum_metadata(content_checksums),
+        )
+        return content_checksums
+
+    # the reader raises before handing out the last bytes of mismatched content, so the
+    # upload never completes and an object already at the key is left as it was
+    checksums = StreamingChecksums(include_md5="md5" in expected_checksums)
     s3_client.put_object(
-        Bucket=bucket_name, Key=object_key, Body=file_content, ContentType=content_type
+        Bucket=bucket_name,
+        Key=object_key,
+        Body=HashingReader(file_content, checksums, expected_checksums),
+        ContentType=content_type,
+        ChecksumAlgorithm="SHA256",
+    )
+
+    return checksums.result()
+
+
+def upload_compressed_s3_object(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    object_key: str,
+    file_content: BinaryIO,
+    content_type: str,
+    s3_client: "S3Client",
+    expected_checksums: Mapping[str, str],
+) -> ObjectChecksums:
+    """
+    Compress a file as a stream, spooled to disk past a few MiB, then upload it.
+
+    The checksums of the content and of the compressed bytes are computed in the same
+    pass that compresses it, so they are all known before the upload starts.
+    """
+    encoding = get_at_rest_encoding()
+    checksums = StreamingChecksums(include_md5="md5" in expected_checksums)
+    stored_checksums = StreamingChecksums()
+    compressor = create_compressor(encoding)
+
+    with SpooledTemporaryFile(max_size=MAX_IN_MEMORY_SPOOL_SIZE_BYTES) as spool:
+        for chunk in iter_file_chunks(file_content):
+            checksums.update(chunk)
+            compressed_chunk = compressor.compress(chunk)
+            stored_checksums.update(compressed_chunk)
+            spool.write(compressed_chunk)
+        compressed_chunk = compressor.flush()
+        stored_checksums.update(compressed_chunk)
+        spool.write(compressed_chunk)
+        spool.seek(0)
+
+        content_checksums = checksums.result()
+        verify_checksums(content_checksums, expected_checksums)
+
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=object_key,
+            Body=spool,
+            ContentType=content_type,
+            ChecksumSHA256=stored_checksums.result().sha256,
+            Metadata={
+                STORED_ENCODING_METADATA_KEY: encoding,
+                LOGICAL_SIZE_METADATA_KEY: str(checksums.size),
+                **get_checksum_metadata(content_checksums),
+            },
+        )
+
+    return content_checksums
+
+
+@instrument_calls("s3")
+async def upload_s3_object_from_stream(  # pylint: disable=too-many-arguments,too-many-locals
+    bucket_name: str,
+    object_key: str,
+    chunks: AsyncIterable[bytes],
+    content_type: Optional[str] = None,
+    s3_client: Optional["S3Client"] = None,
+    part_size_bytes: int = MIN_MULTIPART_PART_SIZE_BYTES,
+) -> ObjectChecksums:
+    """
+    Upload content to an S3 bucket as it is produced, e.g. while it is downloaded.
+
+    Content that ends within the first part is uploaded with a single `PUT`, with its
+    checksums in the metadata. S3 needs the length of a `PUT` or part before it starts,
+    and parts but the last must be at least 5 MiB, so such content can't be sent before
+    it ends. Past that, it is uploaded as a multipart upload, each part as soon as it is
+    full and while the next one is read, so no more than two parts are held in memory at
+    once. The checksums are then only known once the upload is done: S3 verifies the
+    CRC32 of the whole content when it is completed, and keeps it as the object's
+    checksum, while the SHA-256 is only returned.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param chunks: The content of the file to upload, in chunks.
+    :param content_type: The MIME type of the file, e.g. "text/plain" for a text file.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+    :param part_size_bytes: Size of the parts of a multipart upload, at least 5 MiB.
+
+    :return: The checksums of the content.
+    """
+    s3_client = s3_client or get_s3_client()
+    content_type = content_type or "application/octet-stream"
+    checksums = StreamingChecksums()
+
+    part = bytearray()
+    upload_id: Optional[str] = None
+    parts: List["CompletedPartTypeDef"] = []
+    part_upload: Optional["asyncio.Future[str]"] = None
+
+    async def start_part_upload() -> "asyncio.Future[str]":
+        nonlocal upload_id
+        if upload_id is None:
+            upload_id = await asyncio.to_thread(
+                create_multipart_upload,
+                bucket_name,
+                object_key,
+                content_type,
+                checksum_algorithm="CRC32",
+                s3_client=s3_client,
+            )
+        part_number = len(parts) + 1
+        return asyncio.ensure_future(
+            asyncio.to_thread(
+                upload_multipart_part,
+                bucket_name,
+                object_key,
+                upload_id,
+                part_number,
+                bytes(part),
+                checksum_algorithm="CRC32",
+                s3_client=s3_client,
+            )
+        )
+
+    async def finish_part_upload() -> None:
+        nonlocal part_upload
+        if part_upload is not None:
+            etag = await part_upload
+            parts.append({"PartNumber": len(parts) + 1, "ETag": etag})
+            part_upload = None
+
+    try:
+        async for chunk in chunks:
+            checksums.update(chunk)
+            part += chunk
+            if len(part) >= part_size_bytes:
+                # the previous part must be done before its number is known to be taken
+                await finish_part_upload()
+                part_upload = await start_part_upload()
+                part = bytearray()
+
+        content_checksums = checksums.result()
+
+        if upload_id is None:
+            await asyncio.to_thread(
+                s3_client.put_object,
+                Bucket=bucket_name,
+                Key=object_key,
+                Body=bytes(part),
+                ContentType=content_type,
+                ChecksumSHA256=content_checksums.sha256,
+                Metadata=get_checksum_metadata(content_checksums),
+            )
+            return content_checksums
+
+        await finish_part_upload()
+        if part:
+            part_upload = await start_part_upload()
+            await finish_part_upload()
+        await asyncio.to_thread(
+            complete_multipart_upload,
+            bucket_name,
+            object_key,
+            upload_id,
+            parts,
+            checksum_crc32=content_checksums.crc32,
+            s3_client=s3_client,
+        )
+    except BaseException:
+        if part_upload is not None:
+            await asyncio.gather(part_upload, return_exceptions=True)
+        if upload_id is not None:
+            await asyncio.to_thread(
+                abort_multipart_upload,
+                bucket_name,
+                object_key,
+                upload_id,
+                s3_client=s3_client,
+            )
+        raise
+
+    return content_checksums
+
+
+@instrument_calls("s3")
+def copy_s3_object(
+    bucket_name: str,
+    source_key: str,
+    object_key: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """
+    Copy an object within an S3 bucket, server-side, keeping its content type and metadata.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param source_key: path to the object to copy.
+    :param object_key: path to copy the object to; an object already there is replaced.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    s3_client.copy_object(
+        Bucket=bucket_name,
+        Key=object_key,
+        CopySource={"Bucket": bucket_name, "Key": source_key},
+        MetadataDirective="COPY",
+    )
+
+
+def put_json_object_if_unchanged(
+    bucket_name: str,
+    object_key: str,
+    state_json: str,
+    etag: Optional[str],
+    s3_client: "S3Client",
+) -> Optional[str]:
+    """
+    Write a JSON object, unless the object at its key changed since it was read.
+
+    :param etag: ETag of the object when it was read, or None if there was no object, in
+        which case the object is written only if there still is none.
+
+    :return: The ETag of the written object, or None if the object changed and was not written.
+    """
+    condition = {"IfNoneMatch": "*"} if etag is None else {"IfMatch": etag}
+    try:
+        response = s3_client.put_object(
+            Bucket=bucket_name,
+            Key=object_key,
+            Body=state_json.encode("utf-8"),
+            ContentType="application/json",
+            **condition,
+        )
+    except ClientError as err:
+        if err.response["Error"]["Code"] != "PreconditionFailed":
+            raise err
+        return None
+    return response["ETag"]
+
+
+@instrument_calls("s3")
+def generate_presigned_upload_url(
+    bucket_name: str,
+    object_key: str,
+    expires_in_seconds: int = DEFAULT_PRESIGNED_URL_EXPIRATION_SECONDS,
+    content_type: Optional[str] = None,
+    s3_client: Optional["S3Client"] = None,
+) -> str:
+    """
+    Generate a presigned URL that uploads an object directly to S3 with a `PUT` request.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param expires_in_seconds: How long the URL stays valid.
+    :param content_type: If given, the upload must be sent with this `Content-Type` header.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :return: The presigned URL.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    params = {"Bucket": bucket_name, "Key": object_key}
+    if content_type is not None:
+        params["ContentType"] = content_type
+
+    return s3_client.generate_presigned_url(
+        "put_object", Params=params, ExpiresIn=expires_in_seconds
     )
+
+
+@instrument_calls("s3")
+def generate_presigned_upload_post(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    object_key: str,
+    expires_in_seconds: int = DEFAULT_PRESIGNED_URL_EXPIRATION_SECONDS,
+    content_type: Optional[str] = None,
+    max_size_bytes: Optional[int] = None,
+    s3_client: Optional["S3Client"] = None,
+) -> Dict[str, Any]:
+    """
+    Generate a presigned POST policy that uploads an object directly to S3 from a form.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param expires_in_seconds: How long the policy stays valid.
+    :param content_type: If given, the form must set this `Content-Type` field.
+    :param max_size_bytes: If given, S3 rejects uploads larger than this.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :return: Dict with the `url` to post to and the form `fields` to include.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    fields: Dict[str, str] = {}
+    conditions: list[Any] = []
+    if content_type is not None:
+        fields["Content-Type"] = content_type
+        conditions.append({"Content-Type": content_type})
+    if max_size_bytes is not None:
+        conditions.append(["content-length-range", 0, max_size_bytes])
+
+    return s3_client.generate_presigned_post(
+        Bucket=bucket_name,
+        Key=object_key,
+        Fields=fields,
+        Conditions=conditions,
+        ExpiresIn=expires_in_seconds,
+    )
+
+
+@instrument_calls("s3")
+def create_multipart_upload(
+    bucket_name: str,
+    object_key: str,
+    content_type: Optional[str] = None,
+    checksum_algorithm: Optional[str] = None,
+    s3_client: Optional["S3Client"] = None,
+) -> str:
+    """
+    Start a multipart upload whose parts are uploaded separately, possibly in parallel.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param content_type: The MIME type of the file, e.g. "text/plain" for a text file.
+    :param checksum_algorithm: If given, e.g. "CRC32", S3 verifies a checksum of the
+        whole object with it when the upload is completed, and keeps it; every part must
+        then be uploaded with the same algorithm.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :return: The upload ID identifying the multipart upload.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    checksum_args: Dict[str, Any] = {}
+    if checksum_algorithm is not None:
+        checksum_args = {
+            "ChecksumAlgorithm": checksum_algorithm,
+            "ChecksumType": "FULL_OBJECT",
+        }
+    response = s3_client.create_multipart_upload(
+        Bucket=bucket_name,
+        Key=object_key,
+        ContentType=content_type or "application/octet-stream",
+        **checksum_args,
+    )
+    return response["UploadId"]
+
+
+@instrument_calls("s3")
+def generate_presigned_upload_part_urls(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    object_key: str,
+    upload_id: str,
+    part_numbers: Iterable[int],
+    expires_in_seconds: int = DEFAULT_PRESIGNED_URL_EXPIRATION_SECONDS,
+    s3_client: Optional["S3Client"] = None,
+) -> Dict[int, str]:
+    """
+    Generate presigned URLs that upload parts of a multipart upload directly to S3.
+
+    Each part is uploaded with a `PUT` request to its URL; S3 returns the part's
+    `ETag` header, which is needed to complete the upload.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param upload_id: The ID returned by `create_multipart_upload`.
+    :param part_numbers: The part numbers (1 to 10,000) to generate URLs for.
+    :param expires_in_seconds: How long the URLs stay valid.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :return: Mapping of part number to presigned URL.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    return {
+        part_number: s3_client.generate_presigned_url(
+            "upload_part",
+            Params={
+                "Bucket": bucket_name,
+                "Key": object_key,
+                "UploadId": upload_id,
+                "PartNumber": part_number,
+            },
+            ExpiresIn=expires_in_seconds,
+        )
+        for part_number in part_numbers
+    }
+
+
+@instrument_calls("s3")
+def upload_multipart_part(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    object_key: str,
+    upload_id: str,
+    part_number: int,
+    file_content: Union[bytes, BinaryIO],
+    checksum_algorithm: Optional[str] = None,
+    s3_client: Optional["S3Client"] = None,
+) -> str:
+    """
+    Upload one part of a multipart upload.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param upload_id: The ID returned by `create_multipart_upload`.
+    :param part_number: The number of the part, from 1 to 10,000. Uploading a part
+        number again replaces the part.
+    :param file_content: The content of the part, as bytes or a binary file object.
+    :param checksum_algorithm: The algorithm the upload was created with, if any.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+
+    :return: The ETag of the part, needed to complete the upload.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    checksum_args: Dict[str, Any] = {}
+    if checksum_algorithm is not None:
+        checksum_args = {"ChecksumAlgorithm": checksum_algorithm}
+    response = s3_client.upload_part(
+        Bucket=bucket_name,
+        Key=object_key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=file_content,
+        **checksum_args,
+    )
+    return response["ETag"]
+
+
+@instrument_calls("s3")
+def complete_multipart_upload(  # pylint: disable=too-many-arguments
+    bucket_name: str,
+    object_key: str,
+    upload_id: str,
+    parts: List["CompletedPartTypeDef"],
+    checksum_crc32: Optional[str] = None,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """
+    Assemble the uploaded parts of a multipart upload into the final object.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param upload_id: The ID returned by `create_multipart_upload`.
+    :param parts: The `PartNumber` and `ETag` of every part, in any order.
+    :param checksum_crc32: The base64-encoded CRC32 of the whole object, which S3
+        verifies, for an upload created with the "CRC32" checksum algorithm.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    checksum_args: Dict[str, Any] = {}
+    if checksum_crc32 is not None:
+        checksum_args = {"ChecksumCRC32": checksum_crc32, "ChecksumType": "FULL_OBJECT"}
+    s3_client.complete_multipart_upload(
+        Bucket=bucket_name,
+        Key=object_key,
+        UploadId=upload_id,
+        MultipartUpload={"Parts": sorted(parts, key=lambda part: part["PartNumber"])},
+        **checksum_args,
+    )
+
+
+@instrument_calls("s3")
+def abort_multipart_upload(
+    bucket_name: str,
+    object_key: str,
+    upload_id: str,
+    s3_client: Optional["S3Client"] = None,
+) -> None:
+    """
+    Abort a multipart upload, deleting the parts uploaded so far.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param object_key: path to the object in the S3 bucket.
+    :param upload_id: The ID returned by `create_multipart_upload`.
+    :param s3_client: An optional boto3 S3 client. If not provided, the shared client is used.
+    """
+    s3_client = s3_client or get_s3_client()
+
+    s3_client.abort_multipart_upload(
+        Bucket=bucket_name, Key=object_key, UploadId=upload_id
+    )
+
+
+def iter_file_chunks(file_content: Union[bytes, BinaryIO]) -> Iterator[bytes]:
+    """Yield the file content in chunks without copying it when given bytes."""
+    if isinstance(file_content, bytes):
+        view = memoryview(file_content)
+        for start in range(0, len(view), READ_CHUNK_SIZE_BYTES):
+            end = start + READ_CHUNK_SIZE_BYTES
+            yield view[start:end]  # type: ignore[misc]
+        return
+
+    while chunk := file_content.read(READ_CHUNK_SIZE_BYTES):
+        yield chunk
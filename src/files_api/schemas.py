@@ -4,7 +4,9 @@ import re
 from datetime import datetime
 from enum import Enum
 from typing import (
+    Dict,
     List,
+    Literal,
     Optional,
     Self,
 )
@@ -17,11 +19,26 @@ from pydantic import (
     model_validator,
 )
 
+from files_api.delta import (
+    DEFAULT_DELTA_BLOCK_SIZE_BYTES,
+    MAX_DELTA_BLOCK_SIZE_BYTES,
+    MIN_DELTA_BLOCK_SIZE_BYTES,
+)
+
 DEFAULT_GET_FILES_PAGE_SIZE = 10
 DEFAULT_GET_FILES_MIN_PAGE_SIZE = 10
 DEFAULT_GET_FILES_MAX_PAGE_SIZE = 1000
 DEFAULT_GET_FILES_DIRECTORY = ""
 
+# the longest expiration S3 allows for presigned URLs signed with SigV4
+MAX_PRESIGNED_URL_EXPIRATION_SECONDS = 7 * 24 * 60 * 60
+
+# S3 numbers the parts of a multipart upload from 1 to 10,000
+MAX_MULTIPART_PART_NUMBER = 10_000
+MAX_PRESIGNED_PART_URLS_PER_REQUEST = 1_000
+
+MAX_GENERATION_BATCH_ITEMS = 500
+
 
 class FileMetadata(BaseModel):
     """Represents a file in the filesystem."""
@@ -35,7 +52,11 @@ class FileMetadata(BaseModel):
         json_schema_extra={"example": "2025-01-25T00:00:00Z"},
     )
     size_bytes: int = Field(
-        description="The size of the file in bytes.",
+        description=(
+            "The size of the file in bytes. With `logical_sizes=false`, the size as "
+            "stored: compressed bytes for files compressed at rest, and 0 for "
+            "content-addressed files."
+        ),
         json_schema_extra={"example": 512},
     )
 
@@ -51,6 +72,255 @@ class PutFileResponse(BaseModel):
         description="Success message for the file creation.",
         json_schema_extra={"example": "File uploaded successfully"},
     )
+    checksum_sha256: Optional[str] = Field(
+        default=None,
+        description="Base64-encoded SHA-256 of the uploaded content.",
+        json_schema_extra={"example": "n4bQgYhMfWWaL+qgxVrQFaO/TxsrC4Is0V1sFbDwCgg="},
+    )
+    checksum_crc32: Optional[str] = Field(
+        default=None,
+        description="Base64-encoded CRC32 of the uploaded content.",
+        json_schema_extra={"example": "2Xr0GA=="},
+    )
+
+
+class PatchFileQueryParams(BaseModel):
+    """Query parameters for `PATCH /v1/files/:file_path`."""
+
+    offset: Optional[int] = Field(
+        None,
+        ge=0,
+        description="Where the new bytes go. Defaults to the end of the file, i.e. append.",
+        json_schema_extra={"example": 1024},
+    )
+    replace_length: Optional[int] = Field(
+        None,
+        ge=0,
+        description=(
+            "How many existing bytes the new bytes replace. Defaults to the length of "
+            "the new bytes, i.e. overwrite; use 0 to insert."
+        ),
+        json_schema_extra={"example": 16},
+    )
+
+
+class PatchFileResponse(BaseModel):
+    """Response for `PATCH /v1/files/:file_path`."""
+
+    file_path: str = Field(
+        description="The path of the patched file.",
+        json_schema_extra={"example": "logs/app.log"},
+    )
+    message: str = Field(
+        description="Success message for the file update.",
+        json_schema_extra={"example": "File patched successfully"},
+    )
+    size_bytes: int = Field(
+        description="The size of the file after the patch, in bytes.",
+        json_schema_extra={"example": 1040},
+    )
+
+
+class DeltaSignaturesQueryParams(BaseModel):
+    """Query parameters for `GET /v1/delta/signatures/:file_path`."""
+
+    block_size: int = Field(
+        DEFAULT_DELTA_BLOCK_SIZE_BYTES,
+        ge=MIN_DELTA_BLOCK_SIZE_BYTES,
+        le=MAX_DELTA_BLOCK_SIZE_BYTES,
+        description="Size of the blocks the file is split into, in bytes.",
+        json_schema_extra={"example": DEFAULT_DELTA_BLOCK_SIZE_BYTES},
+    )
+
+
+class DeltaBlockSignature(BaseModel):
+    """Checksums of one block of a file."""
+
+    weak: int = Field(
+        description="Adler-32 checksum of the block, which can be computed rolling.",
+        json_schema_extra={"example": 1938818435},
+    )
+    strong: str = Field(
+        description="Hex SHA-256 of the block, to confirm matches of the weak checksum.",
+        json_schema_extra={
+            "example": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
+        },
+    )
+    size: int = Field(
+        description="Size of the block; only the last block may be smaller.",
+        json_schema_extra={"example": DEFAULT_DELTA_BLOCK_SIZE_BYTES},
+    )
+
+
+class DeltaSignaturesResponse(BaseModel):
+    """Response for `GET /v1/delta/signatures/:file_path`."""
+
+    file_path: str = Field(
+        description="The path of the file.",
+        json_schema_extra={"example": "artifacts/model.bin"},
+    )
+    version: str = Field(
+        description="Version of the file the signatures describe. Send it back as `base_version`.",
+        json_schema_extra={"example": '"9b2cf535f27731c974343645a3985328"'},
+    )
+    size_bytes: int = Field(
+        description="Size of the file in bytes.",
+        json_schema_extra={"example": 5368709120},
+    )
+    block_size: int = Field(
+        description="Size of the blocks the file was split into, in bytes.",
+        json_schema_extra={"example": DEFAULT_DELTA_BLOCK_SIZE_BYTES},
+    )
+    blocks: List[DeltaBlockSignature]
+
+
+class DeltaInstructionModel(BaseModel):
+    """Either copy blocks of the current file, or take bytes from the uploaded data."""
+
+    block_index: Optional[int] = Field(
+        None,
+        ge=0,
+        description="First block of the current file to copy.",
+        json_schema_extra={"example": 0},
+    )
+    block_count: Optional[int] = Field(
+        None,
+        ge=1,
+        description="Number of consecutive blocks to copy.",
+        json_schema_extra={"example": 12},
+    )
+    data_length: Optional[int] = Field(
+        None,
+        ge=0,
+        description="Number of bytes to take from the uploaded data, in order.",
+        json_schema_extra={"example": 4096},
+    )
+
+    @model_validator(mode="after")
+    def check_copy_or_data(self) -> Self:
+        """Ensure the instruction either copies blocks or takes data."""
+        copies = self.block_index is not None and self.block_count is not None
+        if copies == (self.data_length is not None):
+            raise ValueError(
+                "Set either `block_index` and `block_count`, or `data_length`."
+            )
+        return self
+
+
+class DeltaUploadRequest(BaseModel):
+    """The `delta` form field of `POST /v1/delta/apply/:file_path`."""
+
+    base_version: str = Field(
+        description="The `version` from the signatures the delta was computed against.",
+        json_schema_extra={"example": '"9b2cf535f27731c974343645a3985328"'},
+    )
+    block_size: int = Field(
+        ge=MIN_DELTA_BLOCK_SIZE_BYTES,
+        le=MAX_DELTA_BLOCK_SIZE_BYTES,
+        description="The `block_size` of the signatures.",
+        json_schema_extra={"example": DEFAULT_DELTA_BLOCK_SIZE_BYTES},
+    )
+    instructions: List[DeltaInstructionModel] = Field(
+        description="How to build the new file, in order.",
+    )
+
+
+class DeduplicationStatsResponse(BaseModel):
+    """Response for `GET /v1/stats/deduplication`."""
+
+    uploads: int = Field(
+        description="Number of content-addressed uploads handled by this process.",
+        json_schema_extra={"example": 10},
+    )
+    deduplicated_uploads: int = Field(
+        description="Number of uploads whose content was already stored.",
+        json_schema_extra={"example": 4},
+    )
+    logical_bytes: int = Field(
+        description="Total size of all uploads in bytes.",
+        json_schema_extra={"example": 10240},
+    )
+    stored_bytes: int = Field(
+        description="Total size of the uploads whose content had to be stored.",
+        json_schema_extra={"example": 6144},
+    )
+    deduplication_ratio: float = Field(
+        description="`logical_bytes / stored_bytes`; 1.0 means nothing was deduplicated.",
+        json_schema_extra={"example": 1.67},
+    )
+
+
+class GenerationJobResponse(BaseModel):
+    """Response for `GET /v1/generation-jobs/:job_id`, and for asynchronous generations."""
+
+    job_id: str = Field(
+        description="The ID of the job.",
+        json_schema_extra={"example": "9f2c4d1e8b7a4c3d9e0f1a2b3c4d5e6f"},
+    )
+    status: Literal["queued", "running", "done", "failed"] = Field(
+        description="`queued`, `running`, `done` once the file is stored, or `failed`.",
+        json_schema_extra={"example": "running"},
+    )
+    file_path: str = Field(
+        description="The path the generated file is stored at once the job is done.",
+        json_schema_extra={"example": "path/to/image.png"},
+    )
+    file_type: str = Field(
+        description="The type of file generated.",
+        json_schema_extra={"example": "image"},
+    )
+    created_at: datetime = Field(description="When the job was submitted.")
+    updated_at: datetime = Field(description="When the status last changed.")
+    error: Optional[str] = Field(
+        default=None,
+        description="Why the job failed, if it did.",
+        json_schema_extra={"example": "APIConnectionError: Connection error."},
+    )
+
+
+class GenerationCacheStatsResponse(BaseModel):
+    """Response for `GET /v1/stats/generation-cache`."""
+
+    hits: int = Field(
+        description="Generations served by copying a cached file.",
+        json_schema_extra={"example": 6},
+    )
+    misses: int = Field(
+        description="Generations looked up in the cache and not found.",
+        json_schema_extra={"example": 4},
+    )
+    bypasses: int = Field(
+        description="Generations that skipped the cache, e.g. with `use_cache=false`.",
+        json_schema_extra={"example": 1},
+    )
+    hit_ratio: float = Field(
+        description="`hits / (hits + misses)`; 0.0 before any lookup.",
+        json_schema_extra={"example": 0.6},
+    )
+
+
+class ReadCoalescingStatsResponse(BaseModel):
+    """Response for `GET /v1/stats/read-coalescing`."""
+
+    s3_calls: int = Field(
+        description="Coalesced S3 lookups made by this process.",
+        json_schema_extra={"example": 3},
+    )
+    shared_results: int = Field(
+        description="Lookups served by a concurrent lookup of the same object.",
+        json_schema_extra={"example": 297},
+    )
+    calls_saved_ratio: float = Field(
+        description="`shared_results / (s3_calls + shared_results)`; 0.0 before any lookup.",
+        json_schema_extra={"example": 0.99},
+    )
+    wait_timeouts: int = Field(
+        description=(
+            "Lookups that gave up waiting for a concurrent lookup of the same object and "
+            "made their own, counted in `s3_calls`."
+        ),
+        json_schema_extra={"example": 0},
+    )
 
 
 class GetFilesQueryParams(BaseModel):
@@ -73,6 +343,14 @@ class GetFilesQueryParams(BaseModel):
         description="Token for retrieving the next page of results.",
         json_schema_extra={"example": "abc123xyz"},
     )
+    logical_sizes: bool = Field(
+        True,
+        description=(
+            "Report the size of the content of each file. With compression at rest or "
+            "content-addressed storage, this takes an extra S3 request per file listed; "
+            "`false` reports the stored sizes instead, without those requests."
+        ),
+    )
 
     @model_validator(mode="after")
     def check_page_token_only_argument_if_set(self) -> Self:
@@ -117,6 +395,263 @@ class GetFilesResponse(BaseModel):
     )
 
 
+class PresignedDownloadQueryParams(BaseModel):
+    """Query parameters for `POST /v1/presigned-urls/download/:file_path`."""
+
+    expires_in_seconds: Optional[int] = Field(
+        None,
+        ge=1,
+        le=MAX_PRESIGNED_URL_EXPIRATION_SECONDS,
+        description="How long the URL stays valid. Defaults to the server's setting.",
+        json_schema_extra={"example": 300},
+    )
+
+
+class PresignedUploadQueryParams(PresignedDownloadQueryParams):
+    """Query parameters for `POST /v1/presigned-urls/upload/:file_path`."""
+
+    method: Literal["PUT", "POST"] = Field(
+        "PUT",
+        description="`PUT` for a presigned URL, `POST` for a presigned form policy.",
+        json_schema_extra={"example": "PUT"},
+    )
+    content_type: Optional[str] = Field(
+        None,
+        description="If set, the upload must use this content type.",
+        json_schema_extra={"example": "text/plain"},
+    )
+    max_size_bytes: Optional[int] = Field(
+        None,
+        ge=0,
+        description="If set, S3 rejects larger uploads. Only enforced for `POST`.",
+        json_schema_extra={"example": 10485760},
+    )
+
+
+class PresignedUrlResponse(BaseModel):
+    """Response for `POST /v1/presigned-urls/:operation/:file_path`."""
+
+    file_path: str = Field(
+        description="The path of the file the URL is for.",
+        json_schema_extra={"example": "uploads/video.mp4"},
+    )
+    method: Literal["GET", "PUT", "POST"] = Field(
+        description="The HTTP method to use with the URL.",
+        json_schema_extra={"example": "PUT"},
+    )
+    url: str = Field(
+        description="The presigned S3 URL.",
+        json_schema_extra={
+            "example": "https://bucket.s3.amazonaws.com/uploads/video.mp4?X-Amz-Signature=..."
+        },
+    )
+    expires_at: datetime = Field(
+        description="When the URL stops being valid.",
+        json_schema_extra={"example": "2025-01-25T00:05:00Z"},
+    )
+    fields: Optional[Dict[str, str]] = Field(
+        default=None,
+        description="For `POST`, the form fields to send along with the file.",
+        json_schema_extra={"example": {"key": "uploads/video.mp4", "policy": "..."}},
+    )
+
+
+class CreateMultipartUploadQueryParams(BaseModel):
+    """Query parameters for `POST /v1/multipart-uploads/initiate/:file_path`."""
+
+    content_type: Optional[str] = Field(
+        None,
+        description="The MIME type of the file. Defaults to `application/octet-stream`.",
+        json_schema_extra={"example": "video/mp4"},
+    )
+
+
+class MultipartUploadQueryParams(BaseModel):
+    """Query parameters identifying a multipart upload of a file."""
+
+    upload_id: str = Field(
+        description="The ID returned when the multipart upload was initiated.",
+        json_schema_extra={
+            "example": "VXBsb2FkIElEIGZvciBlbHZpbmcncyBteS1tb3ZpZS5tMnRz"
+        },
+    )
+
+
+class PresignedPartUrlsQueryParams(
+    MultipartUploadQueryParams, PresignedDownloadQueryParams
+):
+    """Query parameters for `POST /v1/multipart-uploads/part-urls/:file_path`."""
+
+    first_part_number: int = Field(
+        1,
+        ge=1,
+        le=MAX_MULTIPART_PART_NUMBER,
+        description="The part number of the first URL in the batch.",
+        json_schema_extra={"example": 1},
+    )
+    part_count: int = Field(
+        1,
+        ge=1,
+        le=MAX_PRESIGNED_PART_URLS_PER_REQUEST,
+        description="How many consecutive part URLs to generate.",
+        json_schema_extra={"example": 100},
+    )
+
+    @model_validator(mode="after")
+    def check_part_numbers_in_range(self) -> Self:
+        """Ensure the batch does not go past the last part number S3 allows."""
+        last_part_number = self.first_part_number + self.part_count - 1
+        if last_part_number > MAX_MULTIPART_PART_NUMBER:
+            raise ValueError(
+                f"Part numbers must not exceed {MAX_MULTIPART_PART_NUMBER}, "
+                f"but this batch ends at {last_part_number}."
+            )
+        return self
+
+
+class ListMultipartUploadsQueryParams(BaseModel):
+    """Query parameters for `GET` and `DELETE /v1/multipart-uploads`."""
+
+    directory: str = Field(
+        DEFAULT_GET_FILES_DIRECTORY,
+        description="Only include uploads of files under this directory.",
+        json_schema_extra={"example": "uploads/videos"},
+    )
+    older_than_seconds: Optional[int] = Field(
+        None,
+        ge=0,
+        description="Only include uploads initiated at least this many seconds ago.",
+        json_schema_extra={"example": 86400},
+    )
+
+
+class PresignedPartUrl(BaseModel):
+    """A presigned URL to upload one part of a multipart upload."""
+
+    part_number: int = Field(
+        description="The number of the part, which determines its position in the file.",
+        json_schema_extra={"example": 1},
+    )
+    url: str = Field(
+        description="The presigned S3 URL to `PUT` the part to.",
+        json_schema_extra={
+            "example": "https://bucket.s3.amazonaws.com/uploads/video.mp4?partNumber=1&uploadId=..."
+        },
+    )
+
+
+class UploadedPart(BaseModel):
+    """A part uploaded to S3, as reported by the client."""
+
+    part_number: int = Field(
+        ge=1,
+        le=MAX_MULTIPART_PART_NUMBER,
+        description="The number of the part.",
+        json_schema_extra={"example": 1},
+    )
+    etag: str = Field(
+        description="The `ETag` header S3 returned for the part upload.",
+        json_schema_extra={"example": '"d41d8cd98f00b204e9800998ecf8427e"'},
+    )
+
+
+class CompleteMultipartUploadRequest(BaseModel):
+    """Request body for `POST /v1/multipart-uploads/complete/:file_path`."""
+
+    parts: List[UploadedPart] = Field(
+        min_length=1,
+        description="Every uploaded part. Parts not listed are discarded.",
+    )
+
+
+class MultipartUploadResponse(BaseModel):
+    """An in-progress multipart upload."""
+
+    file_path: str = Field(
+        description="The path the file will be stored at.",
+        json_schema_extra={"example": "uploads/video.mp4"},
+    )
+    upload_id: str = Field(
+        description="The ID of the multipart upload.",
+        json_schema_extra={
+            "example": "VXBsb2FkIElEIGZvciBlbHZpbmcncyBteS1tb3ZpZS5tMnRz"
+        },
+    )
+    initiated: Optional[datetime] = Field(
+        default=None,
+        description="When the multipart upload was initiated.",
+        json_schema_extra={"example": "2025-01-25T00:00:00Z"},
+    )
+
+
+class ListMultipartUploadsResponse(BaseModel):
+    """Response for `GET` and `DELETE /v1/multipart-uploads`."""
+
+    uploads: List[MultipartUploadResponse]
+
+
+class PresignedPartUrlsResponse(BaseModel):
+    """Response for `POST /v1/multipart-uploads/part-urls/:file_path`."""
+
+    file_path: str = Field(
+        description="The path the file will be stored at.",
+        json_schema_extra={"example": "uploads/video.mp4"},
+    )
+    upload_id: str = Field(
+        description="The ID of the multipart upload.",
+        json_schema_extra={
+            "example": "VXBsb2FkIElEIGZvciBlbHZpbmcncyBteS1tb3ZpZS5tMnRz"
+        },
+    )
+    parts: List[PresignedPartUrl]
+    expires_at: datetime = Field(
+        description="When the URLs stop being valid.",
+        json_schema_extra={"example": "2025-01-25T00:05:00Z"},
+    )
+
+
+class CreateUploadSessionQueryParams(BaseModel):
+    """Query parameters for `POST /v1/upload-sessions/create/:file_path`."""
+
+    content_type: Optional[str] = Field(
+        None,
+        description="The MIME type of the file. Defaults to `application/octet-stream`.",
+        json_schema_extra={"example": "video/mp4"},
+    )
+    size_bytes: Optional[int] = Field(
+        None,
+        ge=0,
+        description="The size of the whole file, if known. Checked when completing.",
+        json_schema_extra={"example": 52428800},
+    )
+
+
+class UploadSessionResponse(BaseModel):
+    """The state of a resumable upload session."""
+
+    session_id: str = Field(
+        description="The ID of the upload session.",
+        json_schema_extra={"example": "3f2c1f0b9a4e4d5c8b7a6f5e4d3c2b1a"},
+    )
+    file_path: str = Field(
+        description="The path the file will be stored at.",
+        json_schema_extra={"example": "uploads/video.mp4"},
+    )
+    offset: int = Field(
+        description="Number of bytes received so far; the next chunk must start here.",
+        json_schema_extra={"example": 10485760},
+    )
+    size_bytes: Optional[int] = Field(
+        None,
+        description="The declared size of the whole file, if known.",
+        json_schema_extra={"example": 52428800},
+    )
+    created_at: datetime = Field(
+        description="When the session was created.",
+        json_schema_extra={"example": "2025-01-25T00:00:00Z"},
+    )
+
+
 class GeneratedFileType(str, Enum):
     """The type of file generated by OpenAI."""
 
@@ -125,14 +660,13 @@ class GeneratedFileType(str, Enum):
     AUDIO = "text-to-speech"
 
 
-class GenerateFilesQueryParams(BaseModel):
-    """Query parameters for `POST /v1/files/generated`."""
+class GeneratedFileParams(BaseModel):
+    """Parameters of a file to generate."""
 
-    file_path: str = Path(
+    file_path: str = Field(
         ...,
         description="The path to the file to generate.",
         json_schema_extra={"example": "path/to/file.txt"},
-        # pattern="^.*\.(txt|png|jpg|jpeg|mp3|opus|aac|flac|wav|pcm)$",
     )
     prompt: str = Field(
         ...,
@@ -144,6 +678,13 @@ class GenerateFilesQueryParams(BaseModel):
         description="The type of file to generate.",
         json_schema_extra={"example": "Text"},
     )
+    use_cache: bool = Field(
+        default=True,
+        description=(
+            "Serve a copy of an earlier file generated with the same parameters, if one is "
+            "cached. If false, the file is generated anew and the cache is left alone."
+        ),
+    )
 
     @model_validator(mode="after")
     def validate_file_path_extension(self) -> Self:
@@ -173,6 +714,78 @@ class GenerateFilesQueryParams(BaseModel):
         return self
 
 
+class GenerateFilesQueryParams(GeneratedFileParams):
+    """Query parameters for `POST /v1/files/generated`."""
+
+    file_path: str = Path(
+        ...,
+        description="The path to the file to generate.",
+        json_schema_extra={"example": "path/to/file.txt"},
+        # pattern="^.*\.(txt|png|jpg|jpeg|mp3|opus|aac|flac|wav|pcm)$",
+    )
+    respond_async: bool = Field(
+        default=False,
+        description=(
+            "Respond right away with `202 Accepted` and a generation job to poll, rather "
+            "than once the file is generated."
+        ),
+    )
+    stream: bool = Field(
+        default=False,
+        description=(
+            "Stream the text back as it is generated, as `text/plain`, rather than respond "
+            "once the file is stored. The file is stored only once the text is complete. "
+            "Text files only."
+        ),
+    )
+
+    @model_validator(mode="after")
+    def validate_stream(self) -> Self:
+        """Ensure that only text generations answered right away are streamed."""
+        if self.stream and self.file_type != GeneratedFileType.TEXT:
+            raise ValueError("Only text files can be streamed")
+        if self.stream and self.respond_async:
+            raise ValueError("stream and respond_async cannot be combined")
+        return self
+
+
+class GenerateFilesBatchRequest(BaseModel):
+    """Request body for `POST /v1/generation-batches`."""
+
+    items: List[GeneratedFileParams] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_GENERATION_BATCH_ITEMS,
+        description="The files to generate.",
+    )
+
+
+class GenerationBatchItemResult(BaseModel):
+    """A line of the response of `POST /v1/generation-batches`."""
+
+    index: int = Field(
+        description="Position of the item in the request.",
+        json_schema_extra={"example": 0},
+    )
+    file_path: str = Field(
+        description="The path the file was generated at.",
+        json_schema_extra={"example": "path/to/file.txt"},
+    )
+    status: Literal["done", "failed"] = Field(
+        description="`done` once the file is stored, or `failed`.",
+        json_schema_extra={"example": "done"},
+    )
+    generation_cache: Optional[Literal["hit", "miss", "bypass"]] = Field(
+        default=None,
+        description="Whether the file was copied from the generation cache.",
+        json_schema_extra={"example": "miss"},
+    )
+    error: Optional[str] = Field(
+        default=None,
+        description="Why the item failed, if it did.",
+    )
+
+
 # create/update (Crud)
 class PutGeneratedFileResponse(BaseModel):
     """Response model for `POST /v1/files/generated/:file_path`."""
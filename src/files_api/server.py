@@ -0,0 +1,242 @@
+"""
+Production server: a pre-forking launcher for uvicorn workers.
+
+The parent process builds the app and binds the listening socket once, then freezes
+everything loaded so far out of the garbage collector's reach (`gc.freeze()`) and forks
+the workers. The workers share the imported code and the app copy-on-write, rather than
+each importing and building their own, and accept connections from the same socket.
+
+On SIGTERM, the workers stop accepting connections and finish the requests in flight
+(up to `timeout_graceful_shutdown`) before exiting, and the parent exits once they have.
+Workers that die otherwise are replaced, except those that fail to start (e.g. the app's
+lifespan startup raised): their replacements would fail the same way, so the server
+stops and exits with an error instead.
+
+The workers share their metrics through a temporary directory, so that `GET /metrics`
+reports those of the whole server whichever worker serves it.
+
+    python -m files_api.server --workers 4 --port 8000
+
+Every option can also be set with an environment variable, e.g. `SERVER_WORKERS=4`.
+"""
+
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+from typing import (
+    Optional,
+    Set,
+)
+
+import uvicorn
+from pydantic import Field
+from pydantic_settings import (
+    BaseSettings,
+    SettingsConfigDict,
+)
+
+from files_api.main import create_app
+from files_api.metrics import (
+    DEFAULT_SNAPSHOT_INTERVAL_SECONDS,
+    METRICS,
+)
+from files_api.settings import Settings
+
+# don't replace workers faster than this if they keep crashing
+MIN_WORKER_RESTART_INTERVAL_SECONDS = 1.0
+
+# exit code of a worker whose server did not start, telling the supervisor to stop
+WORKER_STARTUP_FAILED_EXIT_CODE = 3
+
+
+class ServerSettings(BaseSettings):
+    """Settings for the production server, as opposed to those of the app."""
+
+    host: str = Field(default="0.0.0.0", description="Address to listen on.")
+    port: int = Field(default=8000, description="Port to listen on.")
+    workers: int = Field(
+        default_factory=lambda: os.cpu_count() or 1,
+        description="Worker processes to fork. Defaults to the number of CPUs.",
+    )
+    backlog: int = Field(
+        default=2048,
+        description="Connections the kernel queues while all workers are busy.",
+    )
+    timeout_keep_alive: int = Field(
+        default=75,
+        description=(
+            "Seconds to keep idle connections open. Keep this above the idle timeout of "
+            "any load balancer in front (60s for an ALB), so it never reuses a "
+            "connection the server is closing."
+        ),
+    )
+    timeout_graceful_shutdown: int = Field(
+        default=30,
+        description="Seconds to let requests in flight finish after a SIGTERM.",
+    )
+    limit_max_requests: Optional[int] = Field(
+        default=None,
+        description="Replace each worker after about this many requests, e.g. to bound leaks.",
+    )
+    access_log: bool = Field(default=False, description="Log every request.")
+    metrics_snapshot_interval_seconds: float = Field(
+        default=DEFAULT_SNAPSHOT_INTERVAL_SECONDS,
+        description=(
+            "How often each worker shares its metrics with the others. `GET /metrics` "
+            "reports those of the other workers as of up to this long ago."
+        ),
+    )
+
+    model_config = SettingsConfigDict(
+        env_prefix="SERVER_",
+        cli_kebab_case=True,
+        cli_prog_name="python -m files_api.server",
+    )
+
+
+def get_uvicorn_config(
+    server_settings: ServerSettings, settings: Optional[Settings] = None
+) -> uvicorn.Config:
+    return uvicorn.Config(
+        create_app(settings),
+        host=server_settings.host,
+        port=server_settings.port,
+        loop="uvloop",
+        http="httptools",
+        backlog=server_settings.backlog,
+        timeout_keep_alive=server_settings.timeout_keep_alive,
+        timeout_graceful_shutdown=server_settings.timeout_graceful_shutdown,
+        limit_max_requests=server_settings.limit_max_requests,
+        # spread the restarts of workers started at the same time
+        limit_max_requests_jitter=(server_settings.limit_max_requests or 0) // 10,
+        access_log=server_settings.access_log,
+    )
+
+
+class Supervisor:
+    """Fork the workers, replace those that die, and shut them down on SIGTERM."""
+
+    def __init__(
+        self,
+        config: uvicorn.Config,
+        sock: socket.socket,
+        worker_count: int,
+        metrics_snapshot_interval_seconds: float = DEFAULT_SNAPSHOT_INTERVAL_SECONDS,
+    ) -> None:
+        self.config = config
+        self.sock = sock
+        self.worker_count = worker_count
+        self.metrics_snapshot_interval_seconds = metrics_snapshot_interval_seconds
+        self.worker_pids: Set[int] = set()
+        self.should_exit = False
+
+    def run(self) -> int:
+        """
+        Serve until SIGTERM, or until a worker fails to start.
+
+        :return: The exit code of the server: 1 if a worker failed to start, else 0.
+        """
+        signal.signal(signal.SIGTERM, self.handle_sigterm)
+        # the workers are in the same process group, so the terminal interrupts them too
+        signal.signal(signal.SIGINT, self.handle_sigint)
+
+        for _ in range(self.worker_count):
+            self.spawn_worker()
+
+        exit_code = 0
+        while self.worker_pids:
+            try:
+                pid, wait_status = os.wait()
+            except ChildProcessError:
+                break
+            self.worker_pids.discard(pid)
+            METRICS.archive_snapshot(pid)
+            if self.should_exit:
+                continue
+            if (
+                os.waitstatus_to_exitcode(wait_status)
+                == WORKER_STARTUP_FAILED_EXIT_CODE
+            ):
+                print(f"Worker {pid} failed to start; stopping.", file=sys.stderr)
+                exit_code = 1
+                self.handle_sigterm()
+                continue
+            print(f"Worker {pid} exited; starting a new one.", file=sys.stderr)
+            time.sleep(MIN_WORKER_RESTART_INTERVAL_SECONDS)
+            self.spawn_worker()
+        return exit_code
+
+    def spawn_worker(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            server = uvicorn.Server(self.config)
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                METRICS.start_writing_snapshots(self.metrics_snapshot_interval_seconds)
+                # uvicorn drains connections on SIGTERM/SIGINT, then returns
+                server.run(sockets=[self.sock])
+            except SystemExit:
+                pass  # uvicorn has logged why, e.g. its lifespan startup failed
+            except BaseException:  # pylint: disable=broad-except
+                traceback.print_exc()
+                exit_code = 1
+            # depending on the uvicorn version, a failed lifespan startup makes `run`
+            # return or exit, in both cases without the server having started
+            if not server.started:
+                exit_code = WORKER_STARTUP_FAILED_EXIT_CODE
+            METRICS.write_snapshot()
+            os._exit(exit_code)  # pylint: disable=protected-access
+        self.worker_pids.add(pid)
+
+    def handle_sigterm(self, *_) -> None:
+        self.should_exit = True
+        for pid in self.worker_pids:
+            os.kill(pid, signal.SIGTERM)
+
+    def handle_sigint(self, *_) -> None:
+        self.should_exit = True
+
+
+def serve(server_settings: ServerSettings, settings: Optional[Settings] = None) -> int:
+    """
+    Build the app, then fork workers to serve it until SIGTERM.
+
+    :return: The exit code of the server, non-zero if a worker failed to start.
+    """
+    config = get_uvicorn_config(server_settings, settings)
+    config.load()
+    sock = config.bind_socket()
+    metrics_directory = tempfile.mkdtemp(prefix="files-api-metrics-")
+    METRICS.share_across_processes(metrics_directory)
+
+    # move everything allocated so far to a generation the collector never scans, so
+    # collections in the workers don't write to (and so copy) the pages they share
+    gc.collect()
+    gc.freeze()
+
+    print(
+        f"Serving on http://{server_settings.host}:{server_settings.port} "
+        f"with {server_settings.workers} workers.",
+        file=sys.stderr,
+    )
+    exit_code = Supervisor(
+        config,
+        sock,
+        worker_count=server_settings.workers,
+        metrics_snapshot_interval_seconds=server_settings.metrics_snapshot_interval_seconds,
+    ).run()
+    sock.close()
+    shutil.rmtree(metrics_directory, ignore_errors=True)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(serve(ServerSettings(_cli_parse_args=True)))  # type: ignore[call-arg]
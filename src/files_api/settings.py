@@ -1,5 +1,11 @@
 """Define app-wide settings for our API."""
 
+from pathlib import Path
+from typing import (
+    Literal,
+    Optional,
+)
+
 from pydantic import Field
 from pydantic_settings import (
     BaseSettings,
@@ -16,6 +22,176 @@ class Settings(BaseSettings):
 
     s3_bucket_name: str = Field(...)
 
+    compress_responses: bool = Field(
+        default=True,
+        description="Compress compressible responses based on the `Accept-Encoding` header.",
+    )
+    compression_minimum_size_bytes: int = Field(
+        default=1024,
+        description="Responses smaller than this are sent uncompressed.",
+    )
+    compress_uploads_at_rest: bool = Field(
+        default=False,
+        description="Store compressible uploads (text, JSON, CSV, ...) compressed in S3.",
+    )
+    content_addressed_storage: bool = Field(
+        default=False,
+        description="Store each unique file content once and point file paths at it.",
+    )
+    internal_key_prefix: str = Field(
+        default=".files-api/",
+        description="Key prefix reserved for objects the API manages internally.",
+    )
+    presigned_url_expiration_seconds: int = Field(
+        default=300,
+        description="Default lifetime of presigned S3 URLs handed out by the API.",
+    )
+    redirect_downloads_above_bytes: Optional[int] = Field(
+        default=None,
+        description="If set, `GET /v1/files` redirects to a presigned URL for larger files.",
+    )
+    coalesce_concurrent_reads: bool = Field(
+        default=True,
+        description=(
+            "Let concurrent `GET` and `HEAD` requests for the same file share their S3 "
+            "calls, and small bodies, rather than each make their own."
+        ),
+    )
+    coalesced_read_wait_timeout_seconds: Optional[float] = Field(
+        default=5.0,
+        description=(
+            "How long a request waits for another's S3 call for the same file before "
+            "making its own, so that a stuck call doesn't hold up every request sharing "
+            "it. None waits for as long as the shared call takes."
+        ),
+    )
+    record_request_metrics: bool = Field(
+        default=True,
+        description="Record the latency, status and bytes of requests, served at `GET /metrics`.",
+    )
+    metrics_emf_namespace: Optional[str] = Field(
+        default=None,
+        description=(
+            "If set, the Lambda handlers print the metrics recorded during each invocation "
+            "as CloudWatch Embedded Metric Format log lines, in this namespace."
+        ),
+    )
+    server_timing_header: bool = Field(
+        default=False,
+        description=(
+            "Add a `Server-Timing` header to responses, breaking their time down into "
+            "S3 calls, OpenAI calls, the endpoint, and serialization or stream setup."
+        ),
+    )
+    request_accounting_log: bool = Field(
+        default=False,
+        description=(
+            "Print a JSON line per request with the breakdown of `server_timing_header`, "
+            "the S3 operations made and their estimated cost. Not to be confused with the "
+            "server's access log (`SERVER_ACCESS_LOG`)."
+        ),
+    )
+    openapi_schema_path: Optional[Path] = Field(
+        default=None,
+        description=(
+            "If set, serve this prebuilt OpenAPI schema (see `scripts/generate-openapi.py`) "
+            "instead of generating it from the routes on the first docs request."
+        ),
+    )
+    prime_openai_on_start: bool = Field(
+        default=True,
+        description=(
+            "Connect to OpenAI when the Lambda function starts, ahead of the first generate "
+            "request. This imports the OpenAI SDK, which lengthens on-demand cold starts."
+        ),
+    )
+    generated_image_response_format: Literal["url", "b64_json"] = Field(
+        default="url",
+        description=(
+            "Have OpenAI return generated images as a URL to download them from, or "
+            "inline as base64, which saves a connection to another host."
+        ),
+    )
+    generation_cache_ttl_seconds: int = Field(
+        default=24 * 60 * 60,
+        description=(
+            "How long a generated file is reused for generations with the same parameters. "
+            "0 disables the generation cache."
+        ),
+    )
+    idempotency_key_ttl_seconds: int = Field(
+        default=24 * 60 * 60,
+        description=(
+            "How long the response to a generation made with an `Idempotency-Key` header is "
+            "replayed to retries with the same key. 0 disables idempotency keys."
+        ),
+    )
+    generation_batch_concurrency: int = Field(
+        default=8,
+        description=(
+            "Most items of generation batches generated at once, across all the batches "
+            "in flight in a process. Tune it to the OpenAI rate limits of the account."
+        ),
+    )
+    generation_jobs_enabled: bool = Field(
+        default=True,
+        description=(
+            "Accept generation jobs (`respond_async=true`). Jobs run in the background of "
+            "the server, so the Lambda handlers disable them: Lambda freezes the process "
+            "between invocations."
+        ),
+    )
+    generation_job_concurrency: int = Field(
+        default=4,
+        description="Most generation jobs (`respond_async=true`) each process runs at once.",
+    )
+    generation_job_queue_size: int = Field(
+        default=100,
+        description="Most generation jobs each process queues before refusing new ones.",
+    )
+    generation_job_shutdown_timeout_seconds: float = Field(
+        default=30,
+        description="How long shutdown waits for generation jobs before cancelling them.",
+    )
+    openai_requests_per_minute: int = Field(
+        default=500,
+        description=(
+            "Requests per minute each process sends to each OpenAI model until OpenAI's "
+            "`x-ratelimit-*` response headers report the actual limit."
+        ),
+    )
+    openai_tokens_per_minute: int = Field(
+        default=200_000,
+        description="Like `openai_requests_per_minute`, for tokens per minute.",
+    )
+    openai_max_retries: int = Field(
+        default=5,
+        description=(
+            "Retries of OpenAI calls failing with 429s, timeouts or 5xx errors, with "
+            "jittered exponential backoff."
+        ),
+    )
+    generation_client_max_connections: int = Field(
+        default=100,
+        description="Most concurrent connections to OpenAI, and to download generated images.",
+    )
+    generation_client_max_keepalive_connections: int = Field(
+        default=20,
+        description="Most idle connections kept open for reuse by the generation clients.",
+    )
+    generation_client_timeout_seconds: float = Field(
+        default=60,
+        description="Timeout of each read, write or pool wait of the generation clients.",
+    )
+    generation_client_connect_timeout_seconds: float = Field(
+        default=5,
+        description="Timeout to establish a connection for the generation clients.",
+    )
+    generation_client_http2: bool = Field(
+        default=False,
+        description="Use HTTP/2 where supported. Requires the `http2` extra (`h2`).",
+    )
+
     model_config = SettingsConfigDict(
         case_sensitive=False,
     )
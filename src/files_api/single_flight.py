@@ -0,0 +1,109 @@
+"""
+Single-flight calls: concurrent callers asking for the same thing share one call.
+
+When many requests look up the same key at once (e.g. a popular file just published),
+the first caller makes the call and the others wait for its result instead of making
+their own, so the load on the backend collapses to about one call per key. Errors are
+shared like results, and nothing is cached once the call is over. Callers can be given
+a limit on how long they wait for another's call, past which they make their own, so
+that a call stuck on a slow backend doesn't hold up every caller that shares it.
+
+`AsyncSingleFlight` shares coroutines among the tasks of an event loop, so callers wait
+for a shared call without holding a thread.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+ResultT = TypeVar("ResultT")
+
+
+@dataclass
+class SingleFlightStats:
+    """Per-process counters for the calls made through an `AsyncSingleFlight`."""
+
+    calls: int = 0
+    shared_results: int = 0
+    wait_timeouts: int = 0
+
+    def record_call(self) -> None:
+        self.calls += 1
+
+    def record_shared_result(self) -> None:
+        self.shared_results += 1
+
+    def record_wait_timeout(self) -> None:
+        self.wait_timeouts += 1
+
+    @property
+    def calls_saved_ratio(self) -> float:
+        """Share of lookups served by another caller's call; 0.0 before any lookup."""
+        lookups = self.calls + self.shared_results
+        if lookups == 0:
+            return 0.0
+        return self.shared_results / lookups
+
+
+class AsyncSingleFlight:
+    """
+    Share each in-flight coroutine among the tasks that start it concurrently.
+
+    :param wait_timeout_seconds: How long a caller waits for another's run of the same
+        key before making its own; None to wait for as long as the run takes.
+    """
+
+    def __init__(self, wait_timeout_seconds: Optional[float] = None) -> None:
+        self.stats = SingleFlightStats()
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self._tasks: Dict[Hashable, "asyncio.Task[Any]"] = {}
+
+    async def run(
+        self, key: Hashable, function: Callable[[], Awaitable[ResultT]]
+    ) -> Tuple[ResultT, bool]:
+        """
+        Call `function`, unless a run with the same key is in flight, then share its outcome.
+
+        The run goes on if the caller that started it is cancelled, e.g. because its
+        client disconnected, so the callers sharing it still get its outcome. A caller
+        that waits for another's run longer than `wait_timeout_seconds` calls `function`
+        itself.
+
+        :return: The result, and whether it came from another caller's run. Callers
+            must not mutate a shared result.
+        :raises: Whatever `function` raised, including for callers sharing the run.
+        """
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            self.stats.record_call()
+            task = asyncio.ensure_future(function())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            return await asyncio.shield(task), False
+
+        try:
+            result = await asyncio.wait_for(
+                asyncio.shield(task), self.wait_timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            if task.done():
+                raise  # the run itself timed out
+            self.stats.record_wait_timeout()
+            self.stats.record_call()
+            return await function(), False
+
+        self.stats.record_shared_result()
+        return result, True
+
+    def _forget(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
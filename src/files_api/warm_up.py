@@ -0,0 +1,92 @@
+"""
+Warm-up of the AWS Lambda function.
+
+Instances are kept warm by scheduled pings, which are answered without going through
+the app, and prepared for their first request by priming the clients during the init
+phase (ahead of time, with provisioned concurrency). Priming creates the S3 and OpenAI
+clients and opens their pooled connections, so the first request after a scale-out does
+not pay for loading service models, resolving credentials and TLS handshakes.
+"""
+
+import asyncio
+import json
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+)
+
+from files_api.generation_clients import GenerationClients
+from files_api.s3.client import get_s3_client
+from files_api.settings import Settings
+
+WARM_UP_RESPONSE = {"warmed_up": True}
+
+
+def is_warm_up_event(event: Any) -> bool:
+    """
+    Whether a Lambda event is a warm-up ping rather than an HTTP request.
+
+    Recognized pings are EventBridge scheduled events, those sent by
+    `serverless-plugin-warmup`, and `{"warm_up": true}` for manual or custom schedules.
+    """
+    if not isinstance(event, dict):
+        return False
+    if event.get("warm_up") is True:
+        return True
+    source = event.get("source")
+    return source == "serverless-plugin-warmup" or (
+        source == "aws.events" and event.get("detail-type") == "Scheduled Event"
+    )
+
+
+def prime_clients(
+    settings: Settings,
+    generation_clients: GenerationClients,
+    event_loop: asyncio.AbstractEventLoop,
+) -> Dict[str, Any]:
+    """
+    Create the shared clients and connect them, logging how long each took.
+
+    Priming is best effort: a client that fails to connect is logged and left for the
+    first request to retry.
+
+    :param generation_clients: The app's clients, from `app.state` once it has started.
+    :param event_loop: The event loop requests will run in, which the OpenAI client's
+        connections are bound to.
+
+    :return: The logged report, e.g. `{"s3_seconds": 0.05, "openai_seconds": 0.2}`.
+    """
+    report: Dict[str, Any] = {"message": "Primed clients"}
+    report.update(_timed("s3", lambda: prime_s3_client(settings)))
+    if settings.prime_openai_on_start:
+        report.update(
+            _timed(
+                "openai",
+                lambda: event_loop.run_until_complete(
+                    prime_openai_client(generation_clients)
+                ),
+            )
+        )
+    print(json.dumps(report))
+    return report
+
+
+def prime_s3_client(settings: Settings) -> None:
+    get_s3_client().head_bucket(Bucket=settings.s3_bucket_name)
+
+
+async def prime_openai_client(generation_clients: GenerationClients) -> None:
+    # the copy shares the client's connection pool; listing models is free
+    openai_client = generation_clients.openai_client
+    await openai_client.with_options(max_retries=0).models.list()
+
+
+def _timed(name: str, prime: Callable[[], Any]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        prime()
+    except Exception as err:  # pylint: disable=broad-except
+        return {f"{name}_error": repr(err)}
+    return {f"{name}_seconds": round(time.perf_counter() - start, 4)}
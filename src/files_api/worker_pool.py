@@ -0,0 +1,106 @@
+"""
+A bounded pool of asyncio workers that run jobs in the background of the app.
+
+Jobs wait in a queue of limited size and at most `concurrency` of them run at once, so
+a burst of submissions neither starts unbounded work nor grows memory without limit;
+once the queue is full, submissions are refused and the caller can ask clients to
+retry later.
+
+Jobs still queued when the pool is closed are dropped; each can come with an `on_drop`
+callback, e.g. to record that it will never run.
+"""
+
+import asyncio
+import traceback
+from typing import (
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    Tuple,
+)
+
+Job = Callable[[], Awaitable[None]]
+
+
+class WorkerPoolFullError(Exception):
+    """Raised when a job is submitted while the queue of the pool is full."""
+
+
+class WorkerPool:
+    """Run submitted jobs with at most `concurrency` of them in flight."""
+
+    def __init__(self, concurrency: int, max_queued: int) -> None:
+        self.concurrency = concurrency
+        self._queue: "asyncio.Queue[Tuple[Job, Optional[Job]]]" = asyncio.Queue(
+            maxsize=max_queued
+        )
+        self._workers: List["asyncio.Task[None]"] = []
+        self.running = 0
+
+    @property
+    def queued(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._queue.qsize()
+
+    def is_full(self) -> bool:
+        return self._queue.full()
+
+    def start(self) -> None:
+        """Start the workers; must be called with the event loop running."""
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"worker-pool-{index}")
+            for index in range(self.concurrency)
+        ]
+
+    def submit(self, job: Job, on_drop: Optional[Job] = None) -> None:
+        """
+        Queue a job to run once a worker is free.
+
+        :param on_drop: Run instead of the job if the pool is closed before it starts.
+        :raises WorkerPoolFullError: If the queue is full.
+        """
+        try:
+            self._queue.put_nowait((job, on_drop))
+        except asyncio.QueueFull as err:
+            raise WorkerPoolFullError("Too many jobs are queued.") from err
+
+    async def aclose(self, timeout_seconds: Optional[float] = None) -> None:
+        """
+        Stop the workers, letting queued and running jobs finish first.
+
+        :param timeout_seconds: How long to wait for the jobs. Jobs still running after
+            that are cancelled, and those still queued are dropped, running their
+            `on_drop` callbacks.
+        """
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout_seconds)
+        except asyncio.TimeoutError:
+            pass
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        dropped_callbacks = []
+        while not self._queue.empty():
+            _, on_drop = self._queue.get_nowait()
+            self._queue.task_done()
+            if on_drop is not None:
+                dropped_callbacks.append(on_drop())
+        for result in await asyncio.gather(*dropped_callbacks, return_exceptions=True):
+            if isinstance(result, Exception):
+                traceback.print_exception(result)
+
+    async def _work(self) -> None:
+        while True:
+            job, _ = await self._queue.get()
+            self.running += 1
+            try:
+                await job()
+            except Exception:  # pylint: disable=broad-except
+                # a failing job must not take its worker down with it
+                traceback.print_exc()
+            finally:
+                self.running -= 1
+                self._queue.task_done()
@@ -8,6 +8,7 @@ import botocore.exceptions
 from moto import mock_aws
 from pytest import fixture
 
+from files_api.s3.client import reset_s3_client
 from tests.consts import TEST_BUCKET_NAME
 from tests.utils import delete_s3_bucket
 
@@ -24,6 +25,8 @@ def point_away_from_aws():
 def mocked_aws():
     with mock_aws():
         point_away_from_aws()
+        # the shared client may have been created with another test's mock credentials
+        reset_s3_client()
 
         s3_client = boto3.client("s3")
         s3_client.create_bucket(Bucket=TEST_BUCKET_NAME)
@@ -0,0 +1,145 @@
+"""
+Emulate the parts of the Lambda Runtime API used by `aws_lambda_streaming_handler`.
+
+Events are queued with `invoke`, and streamed responses are recorded chunk by chunk
+as they arrive, so tests can check when the first bytes came in.
+"""
+
+import json
+import queue
+import threading
+import time
+import uuid
+from dataclasses import (
+    dataclass,
+    field,
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+)
+
+HOST = "127.0.0.1"
+
+
+@dataclass
+class EmulatedResponse:  # pylint: disable=too-many-instance-attributes
+    """A response received for an invocation."""
+
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: bytearray = field(default_factory=bytearray)
+    trailers: Dict[str, str] = field(default_factory=dict)
+    size_bytes: int = 0
+    chunk_count: int = 0
+    first_chunk_received: threading.Event = field(default_factory=threading.Event)
+    first_chunk_received_at: Optional[float] = None
+    completed: threading.Event = field(default_factory=threading.Event)
+    completed_at: Optional[float] = None
+    error: Optional[Dict[str, Any]] = None
+
+    def get_prelude_and_body(self) -> tuple:
+        prelude, _, body = bytes(self.body).partition(b"\x00" * 8)
+        return json.loads(prelude), body
+
+
+class LambdaRuntimeApiEmulator:
+    """Serve the Runtime API on a local port in a background thread."""
+
+    def __init__(self, keep_bodies: bool = True) -> None:
+        """:param keep_bodies: Whether to keep response bodies, or only count their bytes."""
+        self.keep_bodies = keep_bodies
+        self.events: "queue.Queue[tuple]" = queue.Queue()
+        self.responses: Dict[str, EmulatedResponse] = {}
+        self.init_errors: List[Dict[str, Any]] = []
+        self.server = ThreadingHTTPServer((HOST, 0), self._get_handler_class())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def address(self) -> str:
+        return f"{HOST}:{self.server.server_port}"
+
+    def __enter__(self) -> "LambdaRuntimeApiEmulator":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def invoke(self, event: Dict[str, Any]) -> EmulatedResponse:
+        """Queue an event; the returned response is filled in as it arrives."""
+        request_id = str(uuid.uuid4())
+        response = self.responses[request_id] = EmulatedResponse()
+        self.events.put((request_id, event))
+        return response
+
+    def _get_handler_class(self):
+        emulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Answer the runtime's requests from the emulator's events and responses."""
+
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                ...
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                request_id, event = emulator.events.get()
+                body = json.dumps(event).encode()
+                self.send_response(200)
+                self.send_header("Lambda-Runtime-Aws-Request-Id", request_id)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                parts = self.path.strip("/").split("/")
+                if parts[-2:] == ["init", "error"]:
+                    emulator.init_errors.append(json.loads(self._read_body()))
+                else:
+                    response = emulator.responses[parts[-2]]
+                    response.headers = dict(self.headers.items())
+                    if parts[-1] == "error":
+                        response.error = json.loads(self._read_body())
+                    elif self.headers.get("Transfer-Encoding") == "chunked":
+                        self._read_chunked_body(response)
+                    else:
+                        response.body.extend(self._read_body())
+                    response.completed_at = time.perf_counter()
+                    response.completed.set()
+
+                self.send_response(202)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def _read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def _read_chunked_body(self, response: EmulatedResponse) -> None:
+                while True:
+                    size = int(self.rfile.readline().strip(), 16)
+                    if size == 0:
+                        break
+                    chunk = self.rfile.read(size)
+                    self.rfile.readline()  # the CRLF ending the chunk
+                    if emulator.keep_bodies:
+                        response.body.extend(chunk)
+                    response.size_bytes += size
+                    response.chunk_count += 1
+                    if response.first_chunk_received_at is None:
+                        response.first_chunk_received_at = time.perf_counter()
+                        response.first_chunk_received.set()
+
+                while line := self.rfile.readline().strip():
+                    name, _, value = line.decode().partition(":")
+                    response.trailers[name] = value.strip()
+
+        return Handler
@@ -3,17 +3,33 @@ Define a FastAPI app emulates two of OpenAI's text and image generation endpoint
 
 No matter the prompt, it always returns the same text or image.
 
+Responses carry OpenAI's `x-ratelimit-*` headers. To simulate rate limiting,
+`POST /mock/rate-limit` with `{"fail_next": 3}` makes the next 3 generation calls fail
+with `429 Too Many Requests`.
+
 Access the server at `http://localhost:1080`.
 """
 
 # pylint: disable=R0801
 
+import base64
+import json
 import os
+import time
 from io import BytesIO
 from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    List,
+)
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import (
+    Body,
+    FastAPI,
+    Request,
+)
 from fastapi.responses import (
     JSONResponse,
     StreamingResponse,
@@ -23,11 +39,76 @@ MOCK_PORT = int(os.getenv("OPENAI_MOCK_PORT", "1080"))  # Configurable port vari
 
 THIS_DIR = Path(__file__).parent
 SAMPLE_TTS_AUDIO_FPATH = THIS_DIR / "speech.mp3"
+# returned as the image when base64 data is requested
+SAMPLE_IMAGE_CONTENT = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 1024
+
+MOCK_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_MOCK_REQUESTS_PER_MINUTE", "10000"))
+GENERATION_PATHS = {"/chat/completions", "/images/generations", "/audio/speech"}
 
 app = FastAPI(docs_url="/")
 
+# calls to fail with a 429, and the number of calls made in the current minute
+rate_limit_state = {
+    "fail_next": 0,
+    "retry_after_ms": 10,
+    "window_start": time.monotonic(),
+    "window_calls": 0,
+}
+
+
+@app.middleware("http")
+async def simulate_rate_limits(request: Request, call_next):
+    if request.url.path not in GENERATION_PATHS:
+        return await call_next(request)
+
+    if time.monotonic() - rate_limit_state["window_start"] >= 60:
+        rate_limit_state["window_start"] = time.monotonic()
+        rate_limit_state["window_calls"] = 0
+    rate_limit_state["window_calls"] += 1
+    remaining = max(0, MOCK_REQUESTS_PER_MINUTE - rate_limit_state["window_calls"])
+    headers = {
+        "x-ratelimit-limit-requests": str(MOCK_REQUESTS_PER_MINUTE),
+        "x-ratelimit-remaining-requests": str(remaining),
+        "x-ratelimit-reset-requests": "1s",
+    }
+
+    if rate_limit_state["fail_next"] > 0:
+        rate_limit_state["fail_next"] -= 1
+        retry_after_ms = rate_limit_state["retry_after_ms"]
+        return JSONResponse(
+            status_code=429,
+            content={
+                "error": {
+                    "message": "Rate limit reached for requests",
+                    "type": "requests",
+                    "code": "rate_limit_exceeded",
+                }
+            },
+            headers={
+                **headers,
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": f"{retry_after_ms}ms",
+                "retry-after-ms": str(retry_after_ms),
+            },
+        )
+
+    response = await call_next(request)
+    response.headers.update(headers)
+    return response
+
+
+@app.post("/mock/rate-limit")
+async def set_rate_limit(
+    fail_next: int = Body(0, embed=True), retry_after_ms: int = Body(10, embed=True)
+):
+    """Make the next `fail_next` generation calls fail with a 429."""
+    rate_limit_state["fail_next"] = fail_next
+    rate_limit_state["retry_after_ms"] = retry_after_ms
+    return {"fail_next": fail_next, "retry_after_ms": retry_after_ms}
+
+
 # Mock response configuration
-mock_responses = [
+mock_responses: List[Dict[str, Any]] = [
     {
         "httpRequest": {"method": "POST", "path": "/chat/completions"},
         "httpResponse": {
@@ -83,8 +164,13 @@ mock_responses = [
 
 
 @app.post("/chat/completions")
-async def chat_completions():
+async def chat_completions(stream: bool = Body(False, embed=True)):
     response_config = mock_responses[0]["httpResponse"]
+    if stream:
+        return StreamingResponse(
+            content=iter_chat_completion_events(response_config["body"]),
+            media_type="text/event-stream",
+        )
     return JSONResponse(
         content=response_config["body"],
         status_code=response_config["statusCode"],
@@ -92,11 +178,33 @@ async def chat_completions():
     )
 
 
+def iter_chat_completion_events(completion: dict):
+    """Send a completion as server-sent events, a word at a time, like `stream=True` does."""
+    content = completion["choices"][0]["message"]["content"]
+    words = content.split(" ")
+    for index, word in enumerate(words):
+        delta = {"content": word if index == 0 else f" {word}"}
+        finish_reason = "stop" if index == len(words) - 1 else None
+        chunk = {
+            "id": completion["id"],
+            "object": "chat.completion.chunk",
+            "created": completion["created"],
+            "model": completion["model"],
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
 @app.post("/images/generations")
-async def images_generations():
+async def images_generations(response_format: str = Body("url", embed=True)):
     response_config = mock_responses[1]["httpResponse"]
+    body = response_config["body"]
+    if response_format == "b64_json":
+        image_data = base64.b64encode(SAMPLE_IMAGE_CONTENT).decode()
+        body = {**body, "data": [{"b64_json": image_data}]}
     return JSONResponse(
-        content=response_config["body"],
+        content=body,
         status_code=response_config["statusCode"],
         headers=response_config["headers"],
     )
@@ -113,5 +221,20 @@ async def create_speech():
     )
 
 
+@app.get("/models")
+async def list_models():
+    return {
+        "object": "list",
+        "data": [
+            {
+                "id": "gpt-4.1-nano",
+                "object": "model",
+                "created": 1677628902,
+                "owned_by": "openai",
+            }
+        ],
+    }
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=MOCK_PORT)
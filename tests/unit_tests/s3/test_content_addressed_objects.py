@@ -0,0 +1,235 @@
+"""Test content-addressed objects module."""
+
+import hashlib
+import threading
+
+import boto3
+import pytest
+
+from files_api.s3.content_addressed_objects import (
+    BlobNotFoundError,
+    copy_content_addressed_s3_object,
+    delete_content_addressed_s3_object,
+    get_blob_key,
+    resolve_blob_pointer,
+    upload_content_addressed_s3_object,
+)
+from files_api.s3.read_objects import (
+    fetch_s3_object,
+    object_exists_in_s3,
+)
+from tests.consts import TEST_BUCKET_NAME
+
+INTERNAL_KEY_PREFIX = ".files-api/"
+TEST_CONTENT = b"the same bytes, uploaded again and again"
+TEST_CONTENT_SHA256 = hashlib.sha256(TEST_CONTENT).hexdigest()
+
+
+def upload(object_key: str, content: bytes = TEST_CONTENT) -> bool:
+    """Upload content to the given key, returning whether it was deduplicated."""
+    upload_result = upload_content_addressed_s3_object(
+        bucket_name=TEST_BUCKET_NAME,
+        object_key=object_key,
+        file_content=content,
+        internal_key_prefix=INTERNAL_KEY_PREFIX,
+        content_type="text/plain",
+    )
+    return upload_result.deduplicated
+
+
+def delete(object_key: str) -> None:
+    delete_content_addressed_s3_object(
+        bucket_name=TEST_BUCKET_NAME,
+        object_key=object_key,
+        internal_key_prefix=INTERNAL_KEY_PREFIX,
+    )
+
+
+def test_identical_uploads_are_stored_once(
+    mocked_aws: None,
+):  # pylint: disable=unused-argument
+    assert not upload("a.txt")
+    assert upload("b.txt")
+
+    blob_key = get_blob_key(INTERNAL_KEY_PREFIX, TEST_CONTENT_SHA256)
+    blobs = boto3.client("s3").list_objects_v2(
+        Bucket=TEST_BUCKET_NAME, Prefix=f"{INTERNAL_KEY_PREFIX}blobs/"
+    )
+    assert [blob["Key"] for blob in blobs["Contents"]] == [blob_key]
+
+    for object_key in ["a.txt", "b.txt"]:
+        response = resolve_blob_pointer(
+            bucket_name=TEST_BUCKET_NAME,
+            object_response=fetch_s3_object(TEST_BUCKET_NAME, object_key),
+            internal_key_prefix=INTERNAL_KEY_PREFIX,
+        )
+        assert response["Body"].read() == TEST_CONTENT
+        assert response["ContentType"] == "text/plain"
+
+
+def test_blob_is_deleted_with_its_last_reference(
+    mocked_aws: None,
+):  # pylint: disable=unused-argument
+    blob_key = get_blob_key(INTERNAL_KEY_PREFIX, TEST_CONTENT_SHA256)
+    upload("a.txt")
+    upload("b.txt")
+
+    delete("a.txt")
+    assert not object_exists_in_s3(TEST_BUCKET_NAME, "a.txt")
+    assert object_exists_in_s3(TEST_BUCKET_NAME, blob_key)
+
+    delete("b.txt")
+    assert not object_exists_in_s3(TEST_BUCKET_NAME, blob_key)
+
+
+def test_overwriting_a_pointer_releases_the_old_blob(
+    mocked_aws: None,
+):  # pylint: disable=unused-argument
+    upload("a.txt")
+    upload("a.txt", content=b"new content")
+
+    old_blob_key = get_blob_key(INTERNAL_KEY_PREFIX, TEST_CONTENT_SHA256)
+    assert not object_exists_in_s3(TEST_BUCKET_NAME, old_blob_key)
+
+
+class PausingS3Client:
+    """Wrap an S3 client to pause just before it deletes a key starting with a prefix."""
+
+    def __init__(self, s3_client, paused_key_prefix: str) -> None:
+        self._s3_client = s3_client
+        self.paused_key_prefix = paused_key_prefix
+        self.paused = threading.Event()
+        self.resume = threading.Event()
+
+    def delete_object(self, **kwargs):
+        if kwargs["Key"].startswith(self.paused_key_prefix):
+            self.paused.set()
+            self.resume.wait()
+        return self._s3_client.delete_object(**kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._s3_client, name)
+
+
+def test_upload_during_the_delete_of_the_last_reference_keeps_the_blob(
+    mocked_aws: None,
+):  # pylint: disable=unused-argument
+    blob_key = get_blob_key(INTERNAL_KEY_PREFIX, TEST_CONTENT_SHA256)
+    upload("a.txt")
+
+    # the delete of a.txt has found no other reference and is about to delete the blob
+    pausing_s3_client = PausingS3Client(boto3.client("s3"), paused_key_prefix=blob_key)
+    deleter = threading.Thread(
+        target=delete_content_addressed_s3_object,
+        kwargs={
+            "bucket_name": TEST_BUCKET_NAME,
+            "object_key": "a.txt",
+            "internal_key_prefix": INTERNAL_KEY_PREFIX,
+            "s3_client": pausing_s3_client,
+        },
+    )
+    deleter.start()
+    assert pausing_s3_client.paused.wait(timeout=5)
+
+    # meanwhile, the same content is uploaded again, and would be deduplicated
+    # against the blob that is about to be deleted
+    uploader = threading.Thread(target=upload, args=("b.txt",))
+    uploader.start()
+    try:
+        uploader.join(timeout=0.5)
+        assert uploader.is_alive(), "the upload should wait for the delete"
+    finally:
+        pausing_s3_client.resume.set()
+        deleter.join()
+        uploader.join()
+
+    response = resolve_blob_pointer(
+        bucket_name=TEST_BUCKET_NAME,
+        object_response=fetch_s3_object(TEST_BUCKET_NAME, "b.txt"),
+        internal_key_prefix=INTERNAL_KEY_PREFIX,
+    )
+    assert response["Body"].read() == TEST_CONTENT
+    tombstones = boto3.client("s3").list_objects_v2(
+        Bucket=TEST_BUCKET_NAME, Prefix=f"{INTERNAL_KEY_PREFIX}tombstones/"
+    )
+    assert "Contents" not in tombstones
+
+
+def test_upload_during_a_delete_of_the_same_key_keeps_its_reference(
+    mocked_aws: None,
+):  # pylint: disable=unused-argument
+    blob_key = get_blob_key(INTERNAL_KEY_PREFIX, TEST_CONTENT_SHA256)
+    upload("a.txt")
+
+    # the delete of a.txt has deleted the pointer and is about to release its reference
+    pausing_s3_client = PausingS3Client(
+        boto3.client("s3"),
+        paused_key_prefix=f"{INTERNAL_KEY_PREFIX}refs/{TEST_CONTENT_SHA256}/",
+    )
+    deleter = threading.Thread(
+        target=delete_content_addressed_s3_object,
+        kwargs={
+            "bucket_name": TEST_BUCKET_NAME,
+            "object_key": "a.txt",
+            "internal_key_prefix": INTERNAL_KEY_PREFIX,
+            "s3_client": pausing_s3_client,
+        },
+    )
+    deleter.start()
+    try:
+        assert pausing_s3_client.paused.wait(timeout=5)
+
+        # meanwhile, the same content is uploaded to the same key again
+        upload("a.txt")
+    finally:
+        pausing_s3_client.resume.set()
+        deleter.join()
+
+    # the delete released the reference of the pointer it deleted, not the new one's
+    assert object_exists_in_s3(TEST_BUCKET_NAME, blob_key)
+    response = resolve_blob_pointer(
+        bucket_name=TEST_BUCKET_NAME,
+        object_response=fetch_s3_object(TEST_BUCKET_NAME, "a.txt"),
+        internal_key_prefix=INTERNAL_KEY_PREFIX,
+    )
+    assert response["Body"].read() == TEST_CONTENT
+
+
+def test_copy_of_a_pointer_references_the_blob_on_its_own(
+    mocked_aws: None,
+):  # pylint: disable=unused-argument
+    blob_key = get_blob_key(INTERNAL_KEY_PREFIX, TEST_CONTENT_SHA256)
+    upload("a.txt")
+    copy_content_addressed_s3_object(
+        bucket_name=TEST_BUCKET_NAME,
+        source_key="a.txt",
+        object_key="b.txt",
+        internal_key_prefix=INTERNAL_KEY_PREFIX,
+    )
+
+    delete("a.txt")
+    assert object_exists_in_s3(TEST_BUCKET_NAME, blob_key)
+
+    delete("b.txt")
+    assert not object_exists_in_s3(TEST_BUCKET_NAME, blob_key)
+
+
+def test_copy_of_a_pointer_whose_blob_is_gone_is_not_made(
+    mocked_aws: None,
+):  # pylint: disable=unused-argument
+    upload("a.txt")
+    s3_client = boto3.client("s3")
+    s3_client.delete_object(
+        Bucket=TEST_BUCKET_NAME,
+        Key=get_blob_key(INTERNAL_KEY_PREFIX, TEST_CONTENT_SHA256),
+    )
+
+    with pytest.raises(BlobNotFoundError):
+        copy_content_addressed_s3_object(
+            bucket_name=TEST_BUCKET_NAME,
+            source_key="a.txt",
+            object_key="b.txt",
+            internal_key_prefix=INTERNAL_KEY_PREFIX,
+        )
+
+    assert not object_exists_in_s3(TEST_BUCKET_NAME, "b.txt")
@@ -0,0 +1,121 @@
+"""Test patch objects module."""
+
+import io
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+
+from files_api.s3.patch_objects import (
+    CopiedRange,
+    ObjectPatch,
+    assemble_s3_object,
+    patch_s3_object,
+    write_patched_content,
+)
+from files_api.s3.read_objects import object_exists_in_s3
+from tests.consts import TEST_BUCKET_NAME
+
+MIB = 1024 * 1024
+LARGE_CONTENT = bytes(range(256)) * (48 * 1024)  # 12 MiB
+
+
+def put(object_key: str, content: bytes) -> None:
+    boto3.client("s3").put_object(
+        Bucket=TEST_BUCKET_NAME,
+        Key=object_key,
+        Body=content,
+        ContentType="application/x-test",
+        Metadata={"checksum-sha256": "stale", "keep": "me"},
+    )
+
+
+def get(object_key: str) -> bytes:
+    response = boto3.client("s3").get_object(Bucket=TEST_BUCKET_NAME, Key=object_key)
+    return response["Body"].read()
+
+
+@pytest.mark.parametrize(
+    "offset, replace_length",
+    [
+        (0, 3),  # start of the file
+        (6 * MIB, 3),  # middle, with copied ranges large enough to be parts
+        (len(LARGE_CONTENT) - 3, 3),  # end of the file
+        (len(LARGE_CONTENT), 0),  # append
+        (MIB, 0),  # insert, with a copied range too small to be a part
+    ],
+)
+def test_patch_large_object(
+    mocked_aws: None, offset: int, replace_length: int
+):  # pylint: disable=unused-argument
+    put("big.bin", LARGE_CONTENT)
+
+    size_bytes = patch_s3_object(
+        TEST_BUCKET_NAME,
+        "big.bin",
+        ObjectPatch(offset=offset, content=b"new", replace_length=replace_length),
+    )
+
+    replaced_end = offset + replace_length
+    expected = LARGE_CONTENT[:offset] + b"new" + LARGE_CONTENT[replaced_end:]
+    assert size_bytes == len(expected)
+    assert get("big.bin") == expected
+
+    response = boto3.client("s3").head_object(Bucket=TEST_BUCKET_NAME, Key="big.bin")
+    assert response["ContentType"] == "application/x-test"
+    assert response["Metadata"] == {"keep": "me"}
+
+
+def test_patch_small_object(mocked_aws: None):  # pylint: disable=unused-argument
+    put("small.txt", b"hello world")
+
+    patch_s3_object(
+        TEST_BUCKET_NAME,
+        "small.txt",
+        ObjectPatch(offset=6, content=io.BytesIO(b"there"), replace_length=5),
+    )
+
+    assert get("small.txt") == b"hello there"
+
+
+def test_patch_past_the_end(mocked_aws: None):  # pylint: disable=unused-argument
+    put("small.txt", b"hello")
+
+    with pytest.raises(ValueError):
+        patch_s3_object(
+            TEST_BUCKET_NAME,
+            "small.txt",
+            ObjectPatch(offset=6, content=b"!", replace_length=0),
+        )
+
+
+def test_assemble_fails_if_source_changed(
+    mocked_aws: None,
+):  # pylint: disable=unused-argument
+    put("source.bin", b"small enough to be downloaded rather than copied")
+
+    with pytest.raises(ClientError):
+        assemble_s3_object(
+            TEST_BUCKET_NAME,
+            "target.bin",
+            [CopiedRange("source.bin", 0, 5, '"outdated-etag"'), b"new"],
+        )
+
+    assert not object_exists_in_s3(TEST_BUCKET_NAME, "target.bin")
+
+
+def test_write_patched_content():
+    chunks = [b"abc", b"def", b"ghi"]
+    for offset in range(10):  # up to and including the end of the content
+        for replace_length in range(4):
+            output = io.BytesIO()
+            write_patched_content(
+                output,
+                chunks,
+                ObjectPatch(
+                    offset=offset, content=b"XY", replace_length=replace_length
+                ),
+            )
+            replaced_end = offset + replace_length
+            expected = b"abcdefghi"[:offset] + b"XY" + b"abcdefghi"[replaced_end:]
+            assert output.getvalue() == expected
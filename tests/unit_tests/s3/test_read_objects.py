@@ -1,13 +1,25 @@
 """Test read objects module."""
 
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+
 import boto3
 
 from files_api.s3.read_objects import (
+    fetch_s3_multipart_uploads,
     fetch_s3_objects_metadata,
     fetch_s3_objects_using_page_token,
+    multipart_upload_exists_in_s3,
     object_exists_in_s3,
 )
-from files_api.s3.write_objects import upload_s3_object
+from files_api.s3.write_objects import (
+    abort_multipart_upload,
+    create_multipart_upload,
+    upload_s3_object,
+)
 from tests.consts import TEST_BUCKET_NAME
 
 
@@ -119,3 +131,36 @@ def test_directory_queries(mocked_aws: None):  # pylint: disable=unused-argument
     assert files[3]["Key"] == "folder2/file3.txt"
     assert files[4]["Key"] == "folder2/subfolder1/file4.txt"
     assert next_page_token is None
+
+
+def test_fetch_s3_multipart_uploads(
+    mocked_aws: None,
+):  # pylint: disable=unused-argument
+    upload_id = create_multipart_upload(TEST_BUCKET_NAME, "videos/talk.mp4")
+    create_multipart_upload(TEST_BUCKET_NAME, "other/file.bin")
+    assert multipart_upload_exists_in_s3(TEST_BUCKET_NAME, "videos/talk.mp4", upload_id)
+
+    uploads = fetch_s3_multipart_uploads(TEST_BUCKET_NAME, prefix="videos/")
+    assert [upload["UploadId"] for upload in uploads] == [upload_id]
+
+    # filter by age, with a cutoff before the uploads were initiated
+    initiated = uploads[0]["Initiated"]
+    assert (
+        fetch_s3_multipart_uploads(
+            TEST_BUCKET_NAME, initiated_before=initiated - timedelta(seconds=1)
+        )
+        == []
+    )
+    assert (
+        len(
+            fetch_s3_multipart_uploads(
+                TEST_BUCKET_NAME, initiated_before=datetime.now(timezone.utc)
+            )
+        )
+        == 2
+    )
+
+    abort_multipart_upload(TEST_BUCKET_NAME, "videos/talk.mp4", upload_id)
+    assert not multipart_upload_exists_in_s3(
+        TEST_BUCKET_NAME, "videos/talk.mp4", upload_id
+    )
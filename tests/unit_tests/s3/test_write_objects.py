@@ -1,9 +1,25 @@
 """Write object tests."""
 
+import asyncio
+import base64
+import hashlib
+from typing import (
+    AsyncIterator,
+    List,
+)
+
 import boto3
+import pytest
 from moto import mock_aws
 
-from files_api.s3.write_objects import upload_s3_object
+from files_api.checksums import ChecksumMismatchError
+from files_api.s3.object_metadata import get_checksums
+from files_api.s3.read_objects import fetch_s3_object_head
+from files_api.s3.write_objects import (
+    MIN_MULTIPART_PART_SIZE_BYTES,
+    upload_s3_object,
+    upload_s3_object_from_stream,
+)
 from tests.consts import TEST_BUCKET_NAME
 
 
@@ -24,3 +40,119 @@ def test_upload_s3_object(mocked_aws: None):  # pylint: disable=unused-argument
     response = s3_client.get_object(Bucket=TEST_BUCKET_NAME, Key=object_key)
     assert response["ContentType"] == content_type
     assert response["Body"].read() == file_content
+
+
+def test_upload_s3_object_has_s3_keep_its_checksum(
+    mocked_aws: None,
+):  # pylint: disable=unused-argument
+    file_content = b"Hello world"
+
+    checksums = upload_s3_object(
+        bucket_name=TEST_BUCKET_NAME, object_key="test.txt", file_content=file_content
+    )
+
+    # boto3 reads the content once to sign it and again to send it, which must
+    # not be hashed twice
+    assert checksums.sha256 == base64.b64encode(
+        hashlib.sha256(file_content).digest()
+    ).decode("ascii")
+    response = fetch_s3_object_head(TEST_BUCKET_NAME, "test.txt")
+    assert get_checksums(response) == {"sha256": checksums.sha256}
+
+
+@pytest.mark.parametrize("file_content", [b"Hello world", b""], ids=["full", "empty"])
+def test_upload_s3_object_with_mismatched_checksum_stores_nothing(
+    mocked_aws: None, file_content: bytes
+):  # pylint: disable=unused-argument
+    with pytest.raises(ChecksumMismatchError):
+        upload_s3_object(
+            bucket_name=TEST_BUCKET_NAME,
+            object_key="test.txt",
+            file_content=file_content,
+            expected_checksums={"sha256": "bm90IHRoZSBjaGVja3N1bQ=="},
+        )
+
+    s3_client = boto3.client("s3")
+    assert "Contents" not in s3_client.list_objects_v2(Bucket=TEST_BUCKET_NAME)
+
+
+@pytest.mark.parametrize("file_content", [b"Hello world", b""], ids=["full", "empty"])
+def test_upload_s3_object_with_mismatched_checksum_keeps_the_previous_object(
+    mocked_aws: None, file_content: bytes
+):  # pylint: disable=unused-argument
+    upload_s3_object(TEST_BUCKET_NAME, "test.txt", b"previous content")
+
+    with pytest.raises(ChecksumMismatchError):
+        upload_s3_object(
+            bucket_name=TEST_BUCKET_NAME,
+            object_key="test.txt",
+            file_content=file_content,
+            expected_checksums={"sha256": "bm90IHRoZSBjaGVja3N1bQ=="},
+        )
+
+    response = boto3.client("s3").get_object(Bucket=TEST_BUCKET_NAME, Key="test.txt")
+    assert response["Body"].read() == b"previous content"
+
+
+async def iter_chunks(chunks: List[bytes]) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.parametrize(
+    "chunks",
+    [
+        [b"Hello ", b"world"],
+        # spans three parts, the last one partial
+        [b"x" * 1024 * 1024] * (2 * MIN_MULTIPART_PART_SIZE_BYTES // (1024 * 1024) + 1),
+    ],
+    ids=["single-put", "multipart"],
+)
+def test_upload_s3_object_from_stream(
+    mocked_aws: None, chunks: List[bytes]
+):  # pylint: disable=unused-argument
+    object_key = "streamed.bin"
+
+    checksums = asyncio.run(
+        upload_s3_object_from_stream(
+            bucket_name=TEST_BUCKET_NAME,
+            object_key=object_key,
+            chunks=iter_chunks(chunks),
+            content_type="application/octet-stream",
+        )
+    )
+
+    s3_client = boto3.client("s3")
+    response = s3_client.get_object(Bucket=TEST_BUCKET_NAME, Key=object_key)
+    assert response["Body"].read() == b"".join(chunks)
+    assert response["ContentType"] == "application/octet-stream"
+
+    # content that fits in a single `PUT` has its checksums recorded up front; past
+    # that, S3 verifies the CRC32 of the whole content and keeps it
+    stored_checksums = get_checksums(fetch_s3_object_head(TEST_BUCKET_NAME, object_key))
+    if len(chunks) > 2:
+        assert stored_checksums == {"crc32": checksums.crc32}
+        assert response["ETag"].endswith('-3"')
+    else:
+        assert stored_checksums == checksums.as_dict()
+
+
+def test_upload_s3_object_from_stream_aborts_on_error(
+    mocked_aws: None,
+):  # pylint: disable=unused-argument
+    async def failing_chunks() -> AsyncIterator[bytes]:
+        yield b"x" * MIN_MULTIPART_PART_SIZE_BYTES
+        raise ConnectionError("download interrupted")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(
+            upload_s3_object_from_stream(
+                bucket_name=TEST_BUCKET_NAME,
+                object_key="streamed.bin",
+                chunks=failing_chunks(),
+            )
+        )
+
+    s3_client = boto3.client("s3")
+    assert not s3_client.list_multipart_uploads(Bucket=TEST_BUCKET_NAME).get("Uploads")
+    assert "Contents" not in s3_client.list_objects_v2(Bucket=TEST_BUCKET_NAME)
@@ -0,0 +1,46 @@
+"""Test what the app does, and doesn't do, when it starts."""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.main import create_app
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+
+def test_generated_files_stack_is_imported_lazily():
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, files_api.main; print(sorted({'openai', 'httpx'} & set(sys.modules)))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert completed.stdout.strip() == "[]"
+
+
+def test_prebuilt_openapi_schema_is_served(
+    mocked_aws, tmp_path: Path
+):  # pylint: disable=unused-argument
+    openapi_schema_path = tmp_path / "openapi.json"
+    openapi_schema_path.write_text(
+        json.dumps({"openapi": "3.1.0", "info": {"title": "Prebuilt"}, "paths": {}})
+    )
+    settings = Settings(
+        s3_bucket_name=TEST_BUCKET_NAME, openapi_schema_path=openapi_schema_path
+    )
+
+    with TestClient(create_app(settings)) as client:
+        response = client.get("/openapi.json")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["info"]["title"] == "Prebuilt"
+    assert response.json()["servers"] == [{"url": "/prod"}]
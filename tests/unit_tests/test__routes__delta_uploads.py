@@ -0,0 +1,146 @@
+"""Test delta upload endpoints."""
+
+import json
+import random
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.delta import (
+    BlockSignature,
+    CopyBlocks,
+    compute_delta,
+    get_delta_data,
+)
+from files_api.main import create_app
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+TEST_FILE_PATH = "artifacts/model.bin"
+BLOCK_SIZE = 64 * 1024
+# large enough for unchanged ranges to be copied within S3 rather than downloaded
+CURRENT_CONTENT = random.Random(0).randbytes(12 * 1024 * 1024 + 1000)
+PATCH_OFFSET = 6 * 1024 * 1024
+NEW_CONTENT = (
+    CURRENT_CONTENT[: PATCH_OFFSET + 7] + b"patched" + CURRENT_CONTENT[PATCH_OFFSET:]
+)
+
+
+def upload(client: TestClient, content: bytes = CURRENT_CONTENT) -> None:
+    response = client.put(
+        f"/v1/files/{TEST_FILE_PATH}",
+        files={"file_content": ("model.bin", content, "application/octet-stream")},
+    )
+    assert response.is_success
+
+
+def upload_delta(client: TestClient, new_content: bytes = NEW_CONTENT):
+    """Upload new content as a delta against the stored file, like a client would."""
+    response = client.get(
+        f"/v1/delta/signatures/{TEST_FILE_PATH}", params={"block_size": BLOCK_SIZE}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    signatures_response = response.json()
+    signatures = [BlockSignature(**block) for block in signatures_response["blocks"]]
+
+    instructions = compute_delta(signatures, BLOCK_SIZE, new_content)
+    data = b"".join(get_delta_data(signatures, instructions, new_content))
+    delta = {
+        "base_version": signatures_response["version"],
+        "block_size": BLOCK_SIZE,
+        "instructions": [
+            (
+                {"block_index": i.block_index, "block_count": i.block_count}
+                if isinstance(i, CopyBlocks)
+                else {"data_length": i.length}
+            )
+            for i in instructions
+        ],
+    }
+    return data, client.post(
+        f"/v1/delta/apply/{TEST_FILE_PATH}",
+        data={"delta": json.dumps(delta)},
+        files={"data": ("data", data)},
+    )
+
+
+def test_delta_upload(client: TestClient):
+    upload(client)
+
+    data, response = upload_delta(client)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["size_bytes"] == len(NEW_CONTENT)
+    assert len(data) < 2 * BLOCK_SIZE
+
+    response = client.get(f"/v1/files/{TEST_FILE_PATH}")
+    assert response.content == NEW_CONTENT
+
+
+def test_delta_against_outdated_version(client: TestClient):
+    upload(client)
+    response = client.get(f"/v1/delta/signatures/{TEST_FILE_PATH}")
+    outdated_version = response.json()["version"]
+
+    upload(client, content=b"changed in the meantime")
+    response = client.post(
+        f"/v1/delta/apply/{TEST_FILE_PATH}",
+        data={
+            "delta": json.dumps(
+                {
+                    "base_version": outdated_version,
+                    "block_size": BLOCK_SIZE,
+                    "instructions": [{"data_length": 0}],
+                }
+            )
+        },
+        files={"data": ("data", b"")},
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+
+def test_delta_with_invalid_instructions(client: TestClient):
+    upload(client, content=b"small file")
+    version = client.get(f"/v1/delta/signatures/{TEST_FILE_PATH}").json()["version"]
+
+    for instructions in [
+        [{"block_index": 5, "block_count": 1}],  # past the end of the file
+        [{"data_length": 100}],  # more data than was sent
+    ]:
+        response = client.post(
+            f"/v1/delta/apply/{TEST_FILE_PATH}",
+            data={
+                "delta": json.dumps(
+                    {
+                        "base_version": version,
+                        "block_size": BLOCK_SIZE,
+                        "instructions": instructions,
+                    }
+                )
+            },
+            files={"data": ("data", b"short")},
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.get(f"/v1/files/{TEST_FILE_PATH}")
+    assert response.content == b"small file"
+
+
+@pytest.mark.parametrize(
+    "storage_settings",
+    [{"compress_uploads_at_rest": True}, {"content_addressed_storage": True}],
+)
+def test_delta_upload_to_file_stored_transformed(
+    mocked_aws, mocked_openai, storage_settings
+):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, **storage_settings)
+    content = b"".join(b"line %d\n" % i for i in range(20000))
+    new_content = content.replace(b"line 12345\n", b"changed line\n")
+    with TestClient(create_app(settings)) as client:
+        upload(client, content=content)
+
+        _, response = upload_delta(client, new_content=new_content)
+        assert response.status_code == status.HTTP_200_OK
+
+        response = client.get(f"/v1/files/{TEST_FILE_PATH}")
+        assert response.content == new_content
@@ -0,0 +1,144 @@
+"""Test streaming generated text to the client while it is stored."""
+
+import asyncio
+import zlib
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api import generate_files
+from files_api.main import create_app
+from files_api.schemas import GeneratedFileType
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+from tests.utils import stream_asgi_response
+
+GENERATED_TEXT = b"This is a mock response from the chat completion endpoint."
+
+
+def stream_text(client: TestClient, file_path: str, prompt: str, **params):
+    return client.post(
+        url=f"/v1/files/generated/{file_path}",
+        params={
+            "prompt": prompt,
+            "file_type": GeneratedFileType.TEXT.value,
+            "stream": True,
+            **params,
+        },
+    )
+
+
+def test_text_is_streamed_and_stored(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        with client.stream(
+            "POST",
+            "/v1/files/generated/streamed.txt",
+            params={
+                "prompt": "Stream a poem",
+                "file_type": GeneratedFileType.TEXT.value,
+                "stream": True,
+            },
+        ) as response:
+            assert response.status_code == status.HTTP_201_CREATED
+            assert response.headers["Content-Type"] == "text/plain; charset=utf-8"
+            assert response.headers["X-Generation-Cache"] == "miss"
+            pieces = list(response.iter_bytes())
+        assert b"".join(pieces) == GENERATED_TEXT
+
+        response = client.get("/v1/files/streamed.txt")
+        assert response.content == GENERATED_TEXT
+
+        # the stored text was cached, and is streamed from S3 when repeated
+        response = stream_text(client, "repeated.txt", "Stream a poem")
+        assert response.headers["X-Generation-Cache"] == "hit"
+        assert response.content == GENERATED_TEXT
+        assert client.get("/v1/files/repeated.txt").content == GENERATED_TEXT
+
+
+def test_interrupted_text_is_not_stored(
+    mocked_aws, mocked_openai, monkeypatch
+):  # pylint: disable=unused-argument
+    @asynccontextmanager
+    async def stream_failing_text(**_):
+        async def iter_text():
+            yield "The beginning"
+            raise RuntimeError("OpenAI dropped the connection")
+
+        yield iter_text()
+
+    monkeypatch.setattr(
+        generate_files, "stream_text_chat_completion", stream_failing_text
+    )
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        with pytest.raises(RuntimeError):
+            stream_text(client, "interrupted.txt", "Stream a poem")
+
+        response = client.head("/v1/files/interrupted.txt")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_compressed_text_is_streamed_as_it_is_generated(
+    mocked_aws, monkeypatch
+):  # pylint: disable=unused-argument
+    next_piece_requested = asyncio.Event()
+
+    @asynccontextmanager
+    async def stream_text_slowly(**_):
+        async def iter_text():
+            yield "The beginning"
+            await next_piece_requested.wait()
+            yield " and the end"
+
+        yield iter_text()
+
+    monkeypatch.setattr(
+        generate_files, "stream_text_chat_completion", stream_text_slowly
+    )
+
+    async def read_response(app):
+        messages = stream_asgi_response(
+            app,
+            "POST",
+            "/v1/files/generated/streamed.txt",
+            query_string=b"prompt=Stream+a+poem&file_type=text&stream=true",
+            headers={"Accept-Encoding": "gzip"},
+        )
+        start = await anext(messages)
+        first_chunk = await anext(messages)
+        next_piece_requested.set()
+        return start, first_chunk, [message async for message in messages]
+
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        start, first_chunk, rest = client.portal.call(read_response, client.app)
+        assert (b"content-encoding", b"gzip") in start["headers"]
+
+        # the client reads the first piece while the rest is still being generated
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        assert decompressor.decompress(first_chunk["body"]) == b"The beginning"
+        rest_body = b"".join(message["body"] for message in rest)
+        assert decompressor.decompress(rest_body) == b" and the end"
+
+        response = client.get("/v1/files/streamed.txt")
+        assert response.content == b"The beginning and the end"
+
+
+def test_only_text_is_streamed(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        response = client.post(
+            url="/v1/files/generated/image.png",
+            params={
+                "prompt": "A cat",
+                "file_type": GeneratedFileType.IMAGE.value,
+                "stream": True,
+            },
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+        response = stream_text(client, "poem.txt", "A poem", respond_async=True)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
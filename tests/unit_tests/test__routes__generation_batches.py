@@ -0,0 +1,192 @@
+"""Test generating many files with one batch request."""
+
+import asyncio
+import json
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api import routes
+from files_api.main import create_app
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+from tests.utils import stream_asgi_response
+
+GENERATED_TEXT = b"This is a mock response from the chat completion endpoint."
+
+
+def text_item(file_path: str, prompt: str = "Write a poem"):
+    return {"file_path": file_path, "prompt": prompt, "file_type": "text"}
+
+
+def test_generation_batch(mocked_aws, mocked_openai):  # pylint: disable=unused-argument
+    items = [text_item("a.txt"), text_item("b.txt", "Another poem"), text_item("c.txt")]
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        response = client.post("/v1/generation-batches", json={"items": items})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["Content-Type"] == "application/x-ndjson"
+
+        results = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(result["index"] for result in results) == [0, 1, 2]
+        assert all(result["status"] == "done" for result in results)
+
+        for item in items:
+            assert (
+                client.get(f"/v1/files/{item['file_path']}").content == GENERATED_TEXT
+            )
+
+
+def test_items_run_concurrently_up_to_the_limit(
+    mocked_aws, monkeypatch
+):  # pylint: disable=unused-argument
+    running = 0
+    max_running = 0
+
+    async def generate_slowly(*_, **__):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.2)
+        running -= 1
+
+    monkeypatch.setattr(routes, "generate_and_store_file", generate_slowly)
+    settings = Settings(
+        s3_bucket_name=TEST_BUCKET_NAME,
+        generation_batch_concurrency=4,
+        generation_cache_ttl_seconds=0,
+    )
+    items = [text_item(f"{index}.txt") for index in range(12)]
+
+    with TestClient(create_app(settings)) as client:
+        start = time.perf_counter()
+        response = client.post("/v1/generation-batches", json={"items": items})
+        elapsed_seconds = time.perf_counter() - start
+
+    assert len(response.text.splitlines()) == 12
+    assert max_running == 4
+    # three rounds of four, rather than twelve items one after another
+    assert elapsed_seconds < 12 * 0.2 / 2
+
+
+def test_concurrent_batches_share_the_limit(
+    mocked_aws, monkeypatch
+):  # pylint: disable=unused-argument
+    running = 0
+    max_running = 0
+
+    async def generate_slowly(*_, **__):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.2)
+        running -= 1
+
+    monkeypatch.setattr(routes, "generate_and_store_file", generate_slowly)
+    settings = Settings(
+        s3_bucket_name=TEST_BUCKET_NAME,
+        generation_batch_concurrency=4,
+        generation_cache_ttl_seconds=0,
+    )
+
+    with TestClient(create_app(settings)) as client:
+
+        def post_batch(batch_index: int):
+            items = [text_item(f"{batch_index}/{index}.txt") for index in range(6)]
+            return client.post("/v1/generation-batches", json={"items": items})
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            responses = list(executor.map(post_batch, range(3)))
+
+    assert all(len(response.text.splitlines()) == 6 for response in responses)
+    assert max_running == 4
+
+
+def test_compressed_progress_is_streamed_as_items_finish(
+    mocked_aws, monkeypatch
+):  # pylint: disable=unused-argument
+    last_item_released = asyncio.Event()
+
+    async def generate_b_last(settings, clients, file_type, prompt, file_path):
+        if file_path == "b.txt":
+            await last_item_released.wait()
+
+    monkeypatch.setattr(routes, "generate_and_store_file", generate_b_last)
+    items = [text_item("a.txt"), text_item("b.txt", "Another poem")]
+
+    async def read_response(app):
+        messages = stream_asgi_response(
+            app,
+            "POST",
+            "/v1/generation-batches",
+            headers={"Accept-Encoding": "gzip", "Content-Type": "application/json"},
+            body=json.dumps({"items": items}).encode(),
+        )
+        start = await anext(messages)
+        first_chunk = await anext(messages)
+        last_item_released.set()
+        return start, first_chunk, [message async for message in messages]
+
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, generation_cache_ttl_seconds=0)
+    with TestClient(create_app(settings)) as client:
+        start, first_chunk, rest = client.portal.call(read_response, client.app)
+    assert (b"content-encoding", b"gzip") in start["headers"]
+
+    # the client reads the line of the first item while the last is still generating
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    first_line = json.loads(decompressor.decompress(first_chunk["body"]))
+    assert (first_line["file_path"], first_line["status"]) == ("a.txt", "done")
+    rest_body = b"".join(message["body"] for message in rest)
+    last_line = json.loads(decompressor.decompress(rest_body))
+    assert (last_line["file_path"], last_line["status"]) == ("b.txt", "done")
+
+
+def test_failed_items_are_reported(
+    mocked_aws, mocked_openai, monkeypatch
+):  # pylint: disable=unused-argument
+    generate_and_store_file = routes.generate_and_store_file
+
+    async def fail_for_b(settings, clients, file_type, prompt, file_path):
+        if file_path == "b.txt":
+            raise ConnectionError("OpenAI is unreachable")
+        await generate_and_store_file(settings, clients, file_type, prompt, file_path)
+
+    monkeypatch.setattr(routes, "generate_and_store_file", fail_for_b)
+    items = [text_item("a.txt"), text_item("b.txt", "Another poem")]
+
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        response = client.post("/v1/generation-batches", json={"items": items})
+
+    results = {
+        result["file_path"]: result
+        for result in map(json.loads, response.text.splitlines())
+    }
+    assert results["a.txt"]["status"] == "done"
+    assert results["b.txt"] == {
+        "index": 1,
+        "file_path": "b.txt",
+        "status": "failed",
+        "generation_cache": None,
+        "error": "ConnectionError: OpenAI is unreachable",
+    }
+
+
+def test_invalid_batches_are_rejected(mocked_aws):  # pylint: disable=unused-argument
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        response = client.post("/v1/generation-batches", json={"items": []})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+        response = client.post(
+            "/v1/generation-batches",
+            json={
+                "items": [{"file_path": "a.png", "prompt": "x", "file_type": "text"}]
+            },
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+        response = client.post(
+            "/v1/generation-batches", json={"items": [text_item(".files-api/a.txt")]}
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
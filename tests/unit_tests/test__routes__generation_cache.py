@@ -0,0 +1,120 @@
+"""Test serving repeated generations from the generation cache."""
+
+import time
+
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.main import create_app
+from files_api.s3.generation_cache import (
+    GENERATION_CACHE_STATS,
+    get_generation_cache_key,
+    normalize_prompt,
+)
+from files_api.schemas import GeneratedFileType
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+GENERATED_TEXT = b"This is a mock response from the chat completion endpoint."
+
+
+def generate_text(client: TestClient, file_path: str, prompt: str, **params):
+    return client.post(
+        url=f"/v1/files/generated/{file_path}",
+        params={"prompt": prompt, "file_type": GeneratedFileType.TEXT.value, **params},
+    )
+
+
+def test_repeated_generation_is_copied(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME)
+    hits_before = GENERATION_CACHE_STATS.hits
+    with TestClient(create_app(settings)) as client:
+        response = generate_text(client, "first.txt", "Write a poem")
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.headers["X-Generation-Cache"] == "miss"
+
+        response = generate_text(client, "second.txt", "  Write   a poem ")
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.headers["X-Generation-Cache"] == "hit"
+
+        response = client.get("/v1/files/second.txt")
+        assert response.content == GENERATED_TEXT
+        assert "text/plain" in response.headers["Content-Type"]
+
+        # cache entries are internal, so they are not listed
+        response = client.get("/v1/files")
+        assert [file["file_path"] for file in response.json()["files"]] == [
+            "first.txt",
+            "second.txt",
+        ]
+
+        response = client.get("/v1/stats/generation-cache")
+        assert response.json()["hits"] == hits_before + 1
+        assert 0 < response.json()["hit_ratio"] <= 1
+
+    assert GENERATION_CACHE_STATS.hits == hits_before + 1
+
+
+def test_cache_can_be_bypassed(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        generate_text(client, "first.txt", "Write a poem")
+        response = generate_text(
+            client, "second.txt", "Write a poem", use_cache="false"
+        )
+        assert response.headers["X-Generation-Cache"] == "bypass"
+
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, generation_cache_ttl_seconds=0)
+    with TestClient(create_app(settings)) as client:
+        response = generate_text(client, "third.txt", "Write a poem")
+        assert response.headers["X-Generation-Cache"] == "bypass"
+
+
+def test_expired_entries_are_replaced(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, generation_cache_ttl_seconds=1)
+    with TestClient(create_app(settings)) as client:
+        generate_text(client, "first.txt", "Write a poem")
+        time.sleep(1.5)
+        response = generate_text(client, "second.txt", "Write a poem")
+        assert response.headers["X-Generation-Cache"] == "miss"
+
+
+def test_cached_copies_share_content_addressed_blobs(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, content_addressed_storage=True)
+    with TestClient(create_app(settings)) as client:
+        generate_text(client, "first.txt", "Write a poem")
+        response = generate_text(client, "second.txt", "Write a poem")
+        assert response.headers["X-Generation-Cache"] == "hit"
+
+        # the copy and the cache entry keep the blob alive
+        assert client.delete("/v1/files/first.txt").status_code == 204
+        assert client.get("/v1/files/second.txt").content == GENERATED_TEXT
+        assert client.delete("/v1/files/second.txt").status_code == 204
+
+        response = generate_text(client, "third.txt", "Write a poem")
+        assert response.headers["X-Generation-Cache"] == "hit"
+        assert client.get("/v1/files/third.txt").content == GENERATED_TEXT
+
+
+def test_cache_key_normalizes_parameters():
+    def get_key(prompt: str, response_format: str = "mp3") -> str:
+        return get_generation_cache_key(
+            internal_key_prefix=".files-api/",
+            file_type="text-to-speech",
+            model="gpt-4o-mini-tts",
+            prompt=prompt,
+            response_format=response_format,
+        )
+
+    assert normalize_prompt(" Say\n hello\t") == "Say hello"
+    assert get_key("Say hello") == get_key("  Say  hello\n")
+    assert get_key("Say hello", "MP3") == get_key("Say hello", "mp3")
+    assert get_key("Say hello") != get_key("say hello")
+    assert get_key("Say hello") != get_key("Say hello", "wav")
@@ -0,0 +1,138 @@
+"""Test generating files asynchronously with generation jobs."""
+
+import asyncio
+import threading
+import time
+
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api import routes
+from files_api.main import create_app
+from files_api.schemas import GeneratedFileType
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+GENERATED_TEXT = b"This is a mock response from the chat completion endpoint."
+
+
+def generate_text_async(client: TestClient, file_path: str):
+    return client.post(
+        url=f"/v1/files/generated/{file_path}",
+        params={
+            "prompt": "Write a poem",
+            "file_type": GeneratedFileType.TEXT.value,
+            "respond_async": "true",
+        },
+    )
+
+
+def wait_for_job(client: TestClient, job_url: str, timeout_seconds: float = 10):
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        job = client.get(job_url).json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(f"The job did not finish: {job}")
+
+
+def test_generation_job(mocked_aws, mocked_openai):  # pylint: disable=unused-argument
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        response = generate_text_async(client, "poem.txt")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.json()["status"] in ("queued", "running", "done")
+        assert response.json()["file_path"] == "poem.txt"
+        job_url = response.headers["Location"]
+        assert job_url.endswith(f"/v1/generation-jobs/{response.json()['job_id']}")
+
+        job = wait_for_job(client, job_url)
+        assert job["status"] == "done"
+        assert job["error"] is None
+        assert client.get("/v1/files/poem.txt").content == GENERATED_TEXT
+
+
+def test_failed_generation_job(
+    mocked_aws, mocked_openai, monkeypatch
+):  # pylint: disable=unused-argument
+    async def fail_to_generate(*_, **__):
+        raise ConnectionError("OpenAI is unreachable")
+
+    monkeypatch.setattr(routes, "generate_and_store_file", fail_to_generate)
+
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        response = generate_text_async(client, "poem.txt")
+        job = wait_for_job(client, response.headers["Location"])
+        assert job["status"] == "failed"
+        assert job["error"] == "ConnectionError: OpenAI is unreachable"
+
+
+def test_unknown_generation_job(mocked_aws):  # pylint: disable=unused-argument
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        for job_id in ["0" * 32, "not-a-job-id"]:
+            response = client.get(f"/v1/generation-jobs/{job_id}")
+            assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_full_queue_refuses_generation_jobs(
+    mocked_aws, mocked_openai, monkeypatch
+):  # pylint: disable=unused-argument
+    async def generate_slowly(*_, **__):
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(routes, "generate_and_store_file", generate_slowly)
+    settings = Settings(
+        s3_bucket_name=TEST_BUCKET_NAME,
+        generation_job_concurrency=1,
+        generation_job_queue_size=1,
+        generation_job_shutdown_timeout_seconds=0,
+    )
+
+    with TestClient(create_app(settings)) as client:
+        responses = [generate_text_async(client, f"poem-{i}.txt") for i in range(3)]
+
+    assert responses[0].status_code == status.HTTP_202_ACCEPTED
+    assert responses[-1].status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert responses[-1].headers["Retry-After"] == "10"
+
+
+def test_queued_generation_jobs_fail_on_shutdown(
+    mocked_aws, mocked_openai, monkeypatch
+):  # pylint: disable=unused-argument
+    generation_started = threading.Event()
+
+    async def generate_slowly(*_, **__):
+        generation_started.set()
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(routes, "generate_and_store_file", generate_slowly)
+    settings = Settings(
+        s3_bucket_name=TEST_BUCKET_NAME,
+        generation_job_concurrency=1,
+        generation_job_shutdown_timeout_seconds=0,
+    )
+
+    with TestClient(create_app(settings)) as client:
+        running = generate_text_async(client, "poem-0.txt")
+        # the second job only queues once the first is running, not before it starts
+        assert generation_started.wait(timeout=5)
+        queued = generate_text_async(client, "poem-1.txt")
+
+    with TestClient(create_app(settings)) as client:
+        running_job = client.get(running.headers["Location"]).json()
+        queued_job = client.get(queued.headers["Location"]).json()
+
+    assert running_job["error"] == "Interrupted by a shutdown of the server."
+    assert queued_job["status"] == "failed"
+    assert (
+        queued_job["error"] == "Dropped by a shutdown of the server before it started."
+    )
+
+
+def test_generation_jobs_can_be_disabled(mocked_aws):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, generation_jobs_enabled=False)
+    with TestClient(create_app(settings)) as client:
+        response = generate_text_async(client, "poem.txt")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "disabled" in response.json()["detail"]
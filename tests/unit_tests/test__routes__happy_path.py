@@ -1,18 +1,36 @@
 """Test fastapi app."""
 
+import base64
+import hashlib
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
 
+from files_api import routes
+from files_api.main import create_app
 from files_api.s3.write_objects import upload_s3_object
 from files_api.schemas import GeneratedFileType
+from files_api.settings import Settings
 from tests.consts import TEST_BUCKET_NAME
+from tests.mocks.openai_fastapi_mock_app import SAMPLE_IMAGE_CONTENT
 
 TEST_FILE_PATH = "some/nested/file.txt"
 TEST_FILE_CONTENT = b"test"
 TEST_FILE_CONTENT_TYPE = "text/plain"
 
 
+def b64_sha256(content: bytes) -> str:
+    return base64.b64encode(hashlib.sha256(content).digest()).decode()
+
+
+def b64_crc32(content: bytes) -> str:
+    return base64.b64encode(zlib.crc32(content).to_bytes(4, "big")).decode()
+
+
 def test_upload_file(client: TestClient):
     response = client.put(
         f"/v1/files/{TEST_FILE_PATH}",
@@ -25,6 +43,8 @@ def test_upload_file(client: TestClient):
     assert response.json() == {
         "file_path": TEST_FILE_PATH,
         "message": f"New file uploaded at path: /{TEST_FILE_PATH}",
+        "checksum_sha256": b64_sha256(TEST_FILE_CONTENT),
+        "checksum_crc32": b64_crc32(TEST_FILE_CONTENT),
     }
 
     updated_content = b"new content"
@@ -39,9 +59,37 @@ def test_upload_file(client: TestClient):
     assert response.json() == {
         "file_path": TEST_FILE_PATH,
         "message": f"Existing file updated at path: /{TEST_FILE_PATH}",
+        "checksum_sha256": b64_sha256(updated_content),
+        "checksum_crc32": b64_crc32(updated_content),
     }
 
 
+def test_upload_file_with_mismatched_checksum(client: TestClient):
+    response = client.put(
+        f"/v1/files/{TEST_FILE_PATH}",
+        files={
+            "file_content": (TEST_FILE_PATH, TEST_FILE_CONTENT, TEST_FILE_CONTENT_TYPE)
+        },
+        headers={"x-checksum-sha256": b64_sha256(b"other content")},
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "sha256 checksum mismatch" in response.json()["detail"]
+    assert client.head(f"/v1/files/{TEST_FILE_PATH}").status_code == (
+        status.HTTP_404_NOT_FOUND
+    )
+
+    content_md5 = base64.b64encode(hashlib.md5(TEST_FILE_CONTENT).digest()).decode()
+    response = client.put(
+        f"/v1/files/{TEST_FILE_PATH}",
+        files={
+            "file_content": (TEST_FILE_PATH, TEST_FILE_CONTENT, TEST_FILE_CONTENT_TYPE)
+        },
+        headers={"Content-MD5": content_md5},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+
 @pytest.mark.xfail(reason="Currently a bug in pagination mutual exclusivity condition.")
 def test_list_files_with_pagination(client: TestClient):
     for i in range(1, 12):
@@ -94,6 +142,9 @@ def test_get_file_metadata(client: TestClient):
     assert headers["Content-Type"] == TEST_FILE_CONTENT_TYPE
     assert headers["Content-Length"] == str(len(TEST_FILE_CONTENT))
     assert "Last-Modified" in headers
+    # S3 keeps the SHA-256 it verified, the only checksum of content hashed as it is sent
+    assert headers["x-checksum-sha256"] == b64_sha256(TEST_FILE_CONTENT)
+    assert "x-checksum-crc32" not in headers
 
 
 def test_get_file(client: TestClient):
@@ -171,6 +222,27 @@ def test_generate_image(client: TestClient):
     assert response.headers["Content-Type"] == "image/png"
 
 
+def test_generate_image_from_base64(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    settings = Settings(
+        s3_bucket_name=TEST_BUCKET_NAME, generated_image_response_format="b64_json"
+    )
+    with TestClient(create_app(settings)) as client:
+        response = client.post(
+            url="/v1/files/generated/image.png",
+            params={
+                "prompt": "Test Prompt",
+                "file_type": GeneratedFileType.IMAGE.value,
+            },
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+
+        response = client.get("/v1/files/image.png")
+        assert response.content == SAMPLE_IMAGE_CONTENT
+        assert response.headers["Content-Type"] == "image/png"
+
+
 def test_generate_audio(client: TestClient):
     """Test generating an audio file using the POST method."""
     audio_file_path = "some-audio.mp3"
@@ -190,3 +262,155 @@ def test_generate_audio(client: TestClient):
     assert response.status_code == status.HTTP_200_OK
     assert response.content is not None
     assert response.headers["Content-Type"] == "audio/mpeg"
+
+
+def test_content_addressed_upload(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, content_addressed_storage=True)
+    with TestClient(create_app(settings)) as client:
+        for file_path in ["copy_1.txt", "copy_2.txt"]:
+            response = client.put(
+                f"/v1/files/{file_path}",
+                files={"file_content": (file_path, TEST_FILE_CONTENT, "text/plain")},
+            )
+            assert response.status_code == status.HTTP_201_CREATED
+
+        response = client.get("/v1/files/copy_2.txt")
+        assert response.content == TEST_FILE_CONTENT
+
+        response = client.get("/v1/files")
+        assert [file["file_path"] for file in response.json()["files"]] == [
+            "copy_1.txt",
+            "copy_2.txt",
+        ]
+        assert response.json()["files"][0]["size_bytes"] == len(TEST_FILE_CONTENT)
+
+        response = client.get("/v1/stats/deduplication")
+        assert response.json()["deduplicated_uploads"] >= 1
+
+
+def test_list_files_pages_are_full_despite_internal_objects(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, content_addressed_storage=True)
+    with TestClient(create_app(settings)) as client:
+        # the internal objects of content-addressed files sort right after the first path
+        file_paths = ["-first.txt"] + [f"file_{i:02}.txt" for i in range(10)]
+        for file_path in file_paths:
+            client.put(
+                f"/v1/files/{file_path}",
+                files={"file_content": (file_path, file_path.encode(), "text/plain")},
+            )
+
+        response = client.get("/v1/files?page_size=10")
+        assert [file["file_path"] for file in response.json()["files"]] == file_paths[
+            :10
+        ]
+        assert isinstance(response.json()["next_page_token"], str)
+
+
+def test_concurrent_reads_are_coalesced(client: TestClient):
+    client.put(
+        f"/v1/files/{TEST_FILE_PATH}",
+        files={
+            "file_content": (TEST_FILE_PATH, TEST_FILE_CONTENT, TEST_FILE_CONTENT_TYPE)
+        },
+    )
+    stats = client.get("/v1/stats/read-coalescing").json()
+    lookups_before = stats["s3_calls"] + stats["shared_results"]
+
+    def read_file(_) -> bytes:
+        return client.get(f"/v1/files/{TEST_FILE_PATH}").content
+
+    with ThreadPoolExecutor(8) as executor:
+        assert set(executor.map(read_file, range(8))) == {TEST_FILE_CONTENT}
+
+    # each read looks up the file with a `head_object` and a `get_object` call,
+    # which it makes or shares with concurrent reads
+    stats = client.get("/v1/stats/read-coalescing").json()
+    assert stats["s3_calls"] + stats["shared_results"] - lookups_before == 16
+    assert 0 <= stats["calls_saved_ratio"] <= 1
+
+
+def test_reads_stop_waiting_for_a_stuck_shared_read(
+    mocked_aws, monkeypatch
+):  # pylint: disable=unused-argument
+    settings = Settings(
+        s3_bucket_name=TEST_BUCKET_NAME, coalesced_read_wait_timeout_seconds=0.1
+    )
+    fetch_object_head_if_exists = routes.fetch_object_head_if_exists
+    first_read_started = threading.Event()
+    first_read_released = threading.Event()
+
+    def fetch_stuck_once(bucket_name, object_key):
+        if not first_read_started.is_set():
+            first_read_started.set()
+            first_read_released.wait(timeout=5)
+        return fetch_object_head_if_exists(bucket_name, object_key)
+
+    with TestClient(create_app(settings)) as client:
+        upload_s3_object(TEST_BUCKET_NAME, TEST_FILE_PATH, TEST_FILE_CONTENT)
+        monkeypatch.setattr(routes, "fetch_object_head_if_exists", fetch_stuck_once)
+
+        with ThreadPoolExecutor(1) as executor:
+            stuck_read = executor.submit(client.head, f"/v1/files/{TEST_FILE_PATH}")
+            assert first_read_started.wait(timeout=5)
+
+            # a read of the same file makes its own lookup rather than wait for it
+            response = client.head(f"/v1/files/{TEST_FILE_PATH}")
+            assert response.status_code == status.HTTP_200_OK
+            assert not stuck_read.done()
+
+            first_read_released.set()
+            assert stuck_read.result().status_code == status.HTTP_200_OK
+
+        stats = client.get("/v1/stats/read-coalescing").json()
+        assert stats["wait_timeouts"] == 1
+
+
+def test_large_bodies_are_not_shared(client: TestClient, monkeypatch):
+    monkeypatch.setattr(routes, "MAX_SHARED_BODY_SIZE_BYTES", 1)
+    client.put(
+        f"/v1/files/{TEST_FILE_PATH}",
+        files={
+            "file_content": (TEST_FILE_PATH, TEST_FILE_CONTENT, TEST_FILE_CONTENT_TYPE)
+        },
+    )
+
+    def read_file(_) -> bytes:
+        return client.get(f"/v1/files/{TEST_FILE_PATH}").content
+
+    # requests sharing a read of a large body stream their own copy of it
+    with ThreadPoolExecutor(8) as executor:
+        assert list(executor.map(read_file, range(8))) == [TEST_FILE_CONTENT] * 8
+
+
+def test_file_metadata_is_read_without_bodies(
+    mocked_aws, mocked_openai, monkeypatch
+):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, content_addressed_storage=True)
+    with TestClient(create_app(settings)) as client:
+        client.put(
+            f"/v1/files/{TEST_FILE_PATH}",
+            files={
+                "file_content": (
+                    TEST_FILE_PATH,
+                    TEST_FILE_CONTENT,
+                    TEST_FILE_CONTENT_TYPE,
+                )
+            },
+        )
+        fetched_bodies = []
+        monkeypatch.setattr(
+            routes, "fetch_s3_object", lambda **kwargs: fetched_bodies.append(kwargs)
+        )
+
+        response = client.head(f"/v1/files/{TEST_FILE_PATH}")
+
+    # the file is a pointer, whose blob holds the content
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Type"] == TEST_FILE_CONTENT_TYPE
+    assert response.headers["Content-Length"] == str(len(TEST_FILE_CONTENT))
+    assert response.headers["x-checksum-sha256"] == b64_sha256(TEST_FILE_CONTENT)
+    assert not fetched_bodies
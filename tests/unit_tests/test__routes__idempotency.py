@@ -0,0 +1,139 @@
+"""Test sharing identical generation requests, and replaying them by idempotency key."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api import routes
+from files_api.main import create_app
+from files_api.schemas import GeneratedFileType
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+
+@pytest.fixture
+def generations(monkeypatch):
+    """Count the generations, which are slow enough for requests to overlap."""
+    generated_paths = []
+
+    async def generate_slowly(
+        settings, clients, file_type, prompt, file_path
+    ):  # pylint: disable=unused-argument
+        generated_paths.append(file_path)
+        await asyncio.sleep(0.3)
+
+    monkeypatch.setattr(routes, "generate_and_store_file", generate_slowly)
+    return generated_paths
+
+
+def generate_text(client: TestClient, prompt: str = "Write a poem", **headers):
+    return client.post(
+        url="/v1/files/generated/poem.txt",
+        # the fake generations store nothing, so there is nothing to cache
+        params={
+            "prompt": prompt,
+            "file_type": GeneratedFileType.TEXT.value,
+            "use_cache": False,
+        },
+        headers=headers,
+    )
+
+
+def test_identical_requests_in_flight_share_a_generation(
+    mocked_aws, generations
+):  # pylint: disable=unused-argument
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        with ThreadPoolExecutor(5) as executor:
+            responses = list(executor.map(lambda _: generate_text(client), range(5)))
+
+        assert [response.status_code for response in responses] == [
+            status.HTTP_201_CREATED
+        ] * 5
+        assert generations == ["poem.txt"]
+
+        # once it is over, the same request generates again
+        assert generate_text(client).status_code == status.HTTP_201_CREATED
+        assert generations == ["poem.txt"] * 2
+
+
+def test_responses_are_replayed_by_idempotency_key(
+    mocked_aws, generations
+):  # pylint: disable=unused-argument
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        first_response = generate_text(client, **{"Idempotency-Key": "abc"})
+        assert first_response.status_code == status.HTTP_201_CREATED
+        assert "Idempotent-Replayed" not in first_response.headers
+
+        response = generate_text(client, **{"Idempotency-Key": "abc"})
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.headers["Idempotent-Replayed"] == "true"
+        assert response.headers["X-Generation-Cache"] == "bypass"
+        assert response.json() == first_response.json()
+        assert generations == ["poem.txt"]
+
+        # another key is another request
+        generate_text(client, **{"Idempotency-Key": "def"})
+        assert generations == ["poem.txt"] * 2
+
+
+def test_idempotency_key_cannot_be_reused_for_another_request(
+    mocked_aws, generations
+):  # pylint: disable=unused-argument
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        generate_text(client, **{"Idempotency-Key": "abc"})
+
+        response = generate_text(client, "Write a song", **{"Idempotency-Key": "abc"})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert generations == ["poem.txt"]
+
+
+def test_failed_requests_are_not_replayed(
+    mocked_aws, monkeypatch
+):  # pylint: disable=unused-argument
+    attempts = []
+
+    async def fail_once(*_, **__):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("OpenAI is unreachable")
+
+    monkeypatch.setattr(routes, "generate_and_store_file", fail_once)
+    app = create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))
+    with TestClient(app, raise_server_exceptions=False) as client:
+        response = generate_text(client, **{"Idempotency-Key": "abc"})
+        assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+
+        response = generate_text(client, **{"Idempotency-Key": "abc"})
+        assert response.status_code == status.HTTP_201_CREATED
+        assert "Idempotent-Replayed" not in response.headers
+        assert len(attempts) == 2
+
+
+@pytest.mark.parametrize(
+    "second_prompt, conflict_status",
+    [
+        ("Write a poem", status.HTTP_409_CONFLICT),
+        ("Write a song", status.HTTP_422_UNPROCESSABLE_ENTITY),
+    ],
+)
+def test_concurrent_requests_with_one_idempotency_key_generate_once(
+    mocked_aws, generations, second_prompt, conflict_status
+):  # pylint: disable=unused-argument
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        with ThreadPoolExecutor(2) as executor:
+            responses = list(
+                executor.map(
+                    lambda prompt: generate_text(
+                        client, prompt, **{"Idempotency-Key": "abc"}
+                    ),
+                    ["Write a poem", second_prompt],
+                )
+            )
+
+        assert sorted(response.status_code for response in responses) == sorted(
+            [status.HTTP_201_CREATED, conflict_status]
+        )
+        assert generations == ["poem.txt"]
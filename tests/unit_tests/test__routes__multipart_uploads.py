@@ -0,0 +1,105 @@
+"""Test multipart upload endpoints."""
+
+import requests
+from fastapi import status
+from fastapi.testclient import TestClient
+
+TEST_FILE_PATH = "videos/talk.mp4"
+MIN_PART_SIZE_BYTES = 5 * 1024 * 1024
+TEST_PARTS = [b"a" * MIN_PART_SIZE_BYTES, b"the last part may be small"]
+
+
+def initiate(client: TestClient, file_path: str = TEST_FILE_PATH) -> str:
+    response = client.post(
+        f"/v1/multipart-uploads/initiate/{file_path}",
+        params={"content_type": "video/mp4"},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()["upload_id"]
+
+
+def test_multipart_upload(client: TestClient):
+    upload_id = initiate(client)
+
+    response = client.post(
+        f"/v1/multipart-uploads/part-urls/{TEST_FILE_PATH}",
+        params={"upload_id": upload_id, "part_count": len(TEST_PARTS)},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    part_urls = response.json()["parts"]
+    assert [part["part_number"] for part in part_urls] == [1, 2]
+
+    uploaded_parts = []
+    for part_url, content in zip(part_urls, TEST_PARTS):
+        s3_response = requests.put(part_url["url"], data=content, timeout=10)
+        assert s3_response.status_code == status.HTTP_200_OK
+        uploaded_parts.append(
+            {
+                "part_number": part_url["part_number"],
+                "etag": s3_response.headers["ETag"],
+            }
+        )
+
+    response = client.post(
+        f"/v1/multipart-uploads/complete/{TEST_FILE_PATH}",
+        params={"upload_id": upload_id},
+        json={"parts": uploaded_parts[::-1]},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = client.get(f"/v1/files/{TEST_FILE_PATH}")
+    assert response.headers["Content-Type"] == "video/mp4"
+    assert response.content == b"".join(TEST_PARTS)
+
+    response = client.get("/v1/multipart-uploads")
+    assert response.json() == {"uploads": []}
+
+
+def test_complete_with_invalid_etag(client: TestClient):
+    upload_id = initiate(client)
+
+    response = client.post(
+        f"/v1/multipart-uploads/complete/{TEST_FILE_PATH}",
+        params={"upload_id": upload_id},
+        json={"parts": [{"part_number": 1, "etag": '"not-an-etag"'}]},
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_unknown_upload_id(client: TestClient):
+    params = {"upload_id": "does-not-exist"}
+
+    response = client.post(
+        f"/v1/multipart-uploads/part-urls/{TEST_FILE_PATH}", params=params
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = client.delete(
+        f"/v1/multipart-uploads/abort/{TEST_FILE_PATH}", params=params
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_part_numbers_past_the_limit(client: TestClient):
+    upload_id = initiate(client)
+
+    response = client.post(
+        f"/v1/multipart-uploads/part-urls/{TEST_FILE_PATH}",
+        params={"upload_id": upload_id, "first_part_number": 9999, "part_count": 5},
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_list_and_abort_stale_uploads(client: TestClient):
+    upload_id = initiate(client)
+    other_upload_id = initiate(client, file_path="other/file.bin")
+
+    response = client.get("/v1/multipart-uploads", params={"directory": "videos/"})
+    assert [upload["upload_id"] for upload in response.json()["uploads"]] == [upload_id]
+
+    response = client.delete("/v1/multipart-uploads", params={"older_than_seconds": 0})
+    aborted_upload_ids = {upload["upload_id"] for upload in response.json()["uploads"]}
+    assert aborted_upload_ids == {upload_id, other_upload_id}
+
+    response = client.get("/v1/multipart-uploads")
+    assert response.json() == {"uploads": []}
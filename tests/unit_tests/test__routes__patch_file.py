@@ -0,0 +1,78 @@
+"""Test patching files by byte range."""
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.main import create_app
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+TEST_FILE_PATH = "logs/app.log"
+TEST_FILE_CONTENT = b"line 1\nline 2\n"
+
+
+def upload(client: TestClient, content: bytes = TEST_FILE_CONTENT) -> None:
+    response = client.put(
+        f"/v1/files/{TEST_FILE_PATH}",
+        files={"file_content": ("app.log", content, "text/plain")},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+
+def test_append_to_file(client: TestClient):
+    upload(client)
+
+    response = client.patch(f"/v1/files/{TEST_FILE_PATH}", content=b"line 3\n")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["size_bytes"] == len(TEST_FILE_CONTENT) + 7
+
+    response = client.get(f"/v1/files/{TEST_FILE_PATH}")
+    assert response.content == TEST_FILE_CONTENT + b"line 3\n"
+    assert response.headers["Content-Type"].startswith("text/plain")
+
+
+def test_overwrite_and_insert(client: TestClient):
+    upload(client)
+
+    client.patch(f"/v1/files/{TEST_FILE_PATH}", params={"offset": 5}, content=b"A")
+    client.patch(
+        f"/v1/files/{TEST_FILE_PATH}",
+        params={"offset": 0, "replace_length": 0},
+        content=b"# log\n",
+    )
+
+    response = client.get(f"/v1/files/{TEST_FILE_PATH}")
+    assert response.content == b"# log\nline A\nline 2\n"
+
+
+def test_patch_errors(client: TestClient):
+    response = client.patch("/v1/files/missing.txt", content=b"x")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    upload(client)
+    response = client.patch(
+        f"/v1/files/{TEST_FILE_PATH}", params={"offset": 100}, content=b"x"
+    )
+    assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+    assert response.headers["Content-Range"] == f"bytes */{len(TEST_FILE_CONTENT)}"
+
+
+@pytest.mark.parametrize(
+    "storage_settings",
+    [{"compress_uploads_at_rest": True}, {"content_addressed_storage": True}],
+)
+def test_patch_file_stored_transformed(
+    mocked_aws, mocked_openai, storage_settings
+):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, **storage_settings)
+    with TestClient(create_app(settings)) as client:
+        upload(client, content=TEST_FILE_CONTENT * 100)
+
+        response = client.patch(
+            f"/v1/files/{TEST_FILE_PATH}", params={"offset": 5}, content=b"A"
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        response = client.get(f"/v1/files/{TEST_FILE_PATH}")
+        assert response.content == b"line A" + (TEST_FILE_CONTENT * 100)[6:]
@@ -0,0 +1,104 @@
+"""Test presigned URL endpoints and download redirects."""
+
+import pytest
+import requests
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.main import create_app
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+TEST_FILE_PATH = "videos/talk.mp4"
+TEST_FILE_CONTENT = b"pretend this is a large video"
+
+
+def test_presigned_upload_and_download_urls(client: TestClient):
+    response = client.post(
+        f"/v1/presigned-urls/upload/{TEST_FILE_PATH}",
+        params={"content_type": "video/mp4", "expires_in_seconds": 60},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    upload = response.json()
+    assert upload["method"] == "PUT"
+    assert upload["fields"] is None
+
+    s3_response = requests.put(
+        upload["url"],
+        data=TEST_FILE_CONTENT,
+        headers={"Content-Type": "video/mp4"},
+        timeout=10,
+    )
+    assert s3_response.status_code == status.HTTP_200_OK
+
+    response = client.post(f"/v1/presigned-urls/download/{TEST_FILE_PATH}")
+    assert response.status_code == status.HTTP_200_OK
+    download = response.json()
+    assert download["method"] == "GET"
+
+    s3_response = requests.get(download["url"], timeout=10)
+    assert s3_response.content == TEST_FILE_CONTENT
+    assert s3_response.headers["Content-Type"] == "video/mp4"
+
+
+def test_presigned_upload_post_policy(client: TestClient):
+    response = client.post(
+        f"/v1/presigned-urls/upload/{TEST_FILE_PATH}",
+        params={"method": "POST", "max_size_bytes": 1024},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    upload = response.json()
+    assert upload["fields"]["key"] == TEST_FILE_PATH
+
+    s3_response = requests.post(
+        upload["url"],
+        data=upload["fields"],
+        files={"file": TEST_FILE_CONTENT},
+        timeout=10,
+    )
+    assert s3_response.ok
+
+    response = client.get(f"/v1/files/{TEST_FILE_PATH}")
+    assert response.content == TEST_FILE_CONTENT
+
+
+def test_presigned_download_url_for_missing_file(client: TestClient):
+    response = client.post("/v1/presigned-urls/download/missing.txt")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_presigned_upload_url_for_reserved_path(client: TestClient):
+    response = client.post("/v1/presigned-urls/upload/.files-api/blobs/x")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.fixture
+def redirecting_client(mocked_aws, mocked_openai):  # pylint: disable=unused-argument
+    settings = Settings(
+        s3_bucket_name=TEST_BUCKET_NAME,
+        redirect_downloads_above_bytes=len(TEST_FILE_CONTENT) - 1,
+        content_addressed_storage=True,
+    )
+    with TestClient(create_app(settings), follow_redirects=False) as client:
+        yield client
+
+
+def test_large_downloads_redirect_to_s3(redirecting_client: TestClient):
+    redirecting_client.put(
+        f"/v1/files/{TEST_FILE_PATH}",
+        files={"file_content": ("talk.mp4", TEST_FILE_CONTENT, "video/mp4")},
+    )
+    redirecting_client.put(
+        "/v1/files/small.txt",
+        files={"file_content": ("small.txt", b"tiny", "text/plain")},
+    )
+
+    response = redirecting_client.get(f"/v1/files/{TEST_FILE_PATH}")
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    s3_response = requests.get(response.headers["Location"], timeout=10)
+    assert s3_response.content == TEST_FILE_CONTENT
+    assert s3_response.headers["Content-Type"] == "video/mp4"
+
+    response = redirecting_client.get("/v1/files/small.txt")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == b"tiny"
@@ -0,0 +1,181 @@
+"""Test resumable upload session endpoints."""
+
+import boto3
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api import routes
+from files_api.main import create_app
+from files_api.s3 import upload_sessions
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+TEST_FILE_PATH = "videos/talk.mp4"
+TEST_FILE_CONTENT = bytes(range(256)) * (24 * 1024)  # 6 MiB, so more than one part
+
+
+def create_session(client: TestClient, **params) -> str:
+    response = client.post(
+        f"/v1/upload-sessions/create/{TEST_FILE_PATH}",
+        params={"content_type": "video/mp4", **params},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json()["offset"] == 0
+    return response.json()["session_id"]
+
+
+def append(client: TestClient, session_id: str, offset: int, chunk: bytes):
+    return client.patch(
+        f"/v1/upload-sessions/{session_id}",
+        content=chunk,
+        headers={
+            "Upload-Offset": str(offset),
+            "Content-Type": "application/offset+octet-stream",
+        },
+    )
+
+
+def test_resumable_upload(client: TestClient):
+    session_id = create_session(client, size_bytes=len(TEST_FILE_CONTENT))
+
+    chunk_size = 2 * 1024 * 1024
+    for offset in range(0, len(TEST_FILE_CONTENT), chunk_size):
+        chunk_end = offset + chunk_size
+        chunk = TEST_FILE_CONTENT[offset:chunk_end]
+        response = append(client, session_id, offset, chunk)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["Upload-Offset"] == str(offset + len(chunk))
+
+    response = client.post(f"/v1/upload-sessions/{session_id}/complete")
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = client.get(f"/v1/files/{TEST_FILE_PATH}")
+    assert response.headers["Content-Type"] == "video/mp4"
+    assert response.content == TEST_FILE_CONTENT
+
+    # the session and its internal objects are gone once completed
+    response = client.get(f"/v1/upload-sessions/{session_id}")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    internal_objects = boto3.client("s3").list_objects_v2(
+        Bucket=TEST_BUCKET_NAME, Prefix=".files-api/"
+    )
+    assert internal_objects["KeyCount"] == 0
+
+
+def test_small_chunks_are_held_back_without_rewriting_earlier_ones(client: TestClient):
+    session_id = create_session(client)
+    chunks = [b"first chunk, ", b"second chunk, ", b"third chunk"]
+    offset = 0
+    for chunk in chunks:
+        append(client, session_id, offset, chunk)
+        offset += len(chunk)
+
+    tail_objects = boto3.client("s3").list_objects_v2(
+        Bucket=TEST_BUCKET_NAME, Prefix=f".files-api/upload-sessions/{session_id}.tail/"
+    )["Contents"]
+    assert sorted(tail_object["Size"] for tail_object in tail_objects) == sorted(
+        len(chunk) for chunk in chunks
+    )
+
+    client.post(f"/v1/upload-sessions/{session_id}/complete")
+    assert client.get(f"/v1/files/{TEST_FILE_PATH}").content == b"".join(chunks)
+
+
+def test_large_chunks_are_split_into_parts(client: TestClient, monkeypatch):
+    monkeypatch.setattr(
+        upload_sessions, "MAX_MULTIPART_PART_SIZE_BYTES", 6 * 1024 * 1024
+    )
+    content = bytes(range(256)) * (52 * 1024)  # 13 MiB: two full parts, 1 MiB held back
+    session_id = create_session(client)
+
+    response = append(client, session_id, 0, content)
+    assert response.headers["Upload-Offset"] == str(len(content))
+    session = upload_sessions.fetch_upload_session(
+        TEST_BUCKET_NAME, session_id, ".files-api/"
+    )
+    assert [part.size_bytes for part in session.parts] == [6 * 1024 * 1024] * 2
+    assert session.tail_chunk_sizes == [1024 * 1024]
+
+    client.post(f"/v1/upload-sessions/{session_id}/complete")
+    assert client.get(f"/v1/files/{TEST_FILE_PATH}").content == content
+
+
+def test_resume_after_interruption(client: TestClient):
+    session_id = create_session(client)
+    append(client, session_id, 0, b"first chunk, ")
+
+    # a chunk that was already (partly) received is rejected with the current offset
+    response = append(client, session_id, 6, b"chunk, second chunk")
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.headers["Upload-Offset"] == "13"
+
+    # another API instance picks the session up where it left off
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME)
+    with TestClient(create_app(settings)) as other_client:
+        response = other_client.get(f"/v1/upload-sessions/{session_id}")
+        offset = response.json()["offset"]
+        assert offset == 13
+
+        append(other_client, session_id, offset, b"second chunk")
+        other_client.post(f"/v1/upload-sessions/{session_id}/complete")
+
+    response = client.get(f"/v1/files/{TEST_FILE_PATH}")
+    assert response.content == b"first chunk, second chunk"
+
+
+def test_concurrent_appends_at_the_same_offset_keep_one(
+    client: TestClient, monkeypatch
+):
+    session_id = create_session(client)
+
+    def append_after_another_request(**kwargs):
+        # another request appends its chunk after this one read the session
+        other_session = upload_sessions.fetch_upload_session(
+            TEST_BUCKET_NAME, session_id, ".files-api/"
+        )
+        upload_sessions.append_to_upload_session(
+            TEST_BUCKET_NAME, other_session, 0, b"other chunk", ".files-api/"
+        )
+        return upload_sessions.append_to_upload_session(**kwargs)
+
+    monkeypatch.setattr(
+        routes, "append_to_upload_session", append_after_another_request
+    )
+    response = append(client, session_id, 0, b"first chunk")
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    client.post(f"/v1/upload-sessions/{session_id}/complete")
+    assert client.get(f"/v1/files/{TEST_FILE_PATH}").content == b"other chunk"
+
+
+def test_declared_size_is_enforced(client: TestClient):
+    session_id = create_session(client, size_bytes=5)
+
+    response = append(client, session_id, 0, b"too long")
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    append(client, session_id, 0, b"shor")
+    response = client.post(f"/v1/upload-sessions/{session_id}/complete")
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+
+def test_empty_file(client: TestClient):
+    session_id = create_session(client)
+
+    response = client.post(f"/v1/upload-sessions/{session_id}/complete")
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = client.get(f"/v1/files/{TEST_FILE_PATH}")
+    assert response.content == b""
+
+
+def test_delete_upload_session(client: TestClient):
+    session_id = create_session(client)
+    append(client, session_id, 0, b"some content")
+
+    response = client.delete(f"/v1/upload-sessions/{session_id}")
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = append(client, session_id, 12, b"more content")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert client.get("/v1/multipart-uploads").json() == {"uploads": []}
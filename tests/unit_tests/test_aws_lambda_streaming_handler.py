@@ -0,0 +1,123 @@
+"""Test the Lambda handler with response streaming against an emulated Runtime API."""
+
+import asyncio
+import json
+import tracemalloc
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from files_api.aws_lambda_streaming_handler import (
+    LambdaRuntimeApi,
+    handle_next_invocation,
+)
+from files_api.main import create_app
+from files_api.settings import Settings
+from files_api.warm_up import WARM_UP_RESPONSE
+from tests.consts import TEST_BUCKET_NAME
+from tests.mocks.lambda_runtime_api import LambdaRuntimeApiEmulator
+
+CHUNK = b"x" * 64 * 1024
+
+
+def get_function_url_event(path: str, method: str = "GET") -> dict:
+    return {
+        "version": "2.0",
+        "rawPath": path,
+        "rawQueryString": "",
+        "headers": {"host": "example.lambda-url.us-east-1.on.aws"},
+        "requestContext": {"http": {"method": method, "sourceIp": "127.0.0.1"}},
+        "isBase64Encoded": False,
+    }
+
+
+@pytest.fixture
+def event_loop():
+    event_loop = asyncio.new_event_loop()
+    yield event_loop
+    event_loop.close()
+
+
+def test_stream_file_download(
+    mocked_aws, event_loop
+):  # pylint: disable=unused-argument, redefined-outer-name
+    content = bytes(range(256)) * 4096  # 1 MiB
+    app = create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))
+    with TestClient(app) as client:
+        client.put(
+            "/v1/files/big.bin",
+            files={"file_content": ("big.bin", content, "application/octet-stream")},
+        )
+
+    with LambdaRuntimeApiEmulator() as emulator:
+        response = emulator.invoke(get_function_url_event("/v1/files/big.bin"))
+        handle_next_invocation(app, LambdaRuntimeApi(emulator.address), event_loop)
+
+    assert response.headers["Lambda-Runtime-Function-Response-Mode"] == "streaming"
+    prelude, body = response.get_prelude_and_body()
+    assert prelude["statusCode"] == 200
+    assert prelude["headers"]["content-type"] == "application/octet-stream"
+    assert body == content
+    assert response.chunk_count > 2
+
+
+def test_first_byte_is_sent_before_the_response_is_complete(
+    event_loop,
+):  # pylint: disable=redefined-outer-name
+    app = FastAPI()
+
+    with LambdaRuntimeApiEmulator() as emulator:
+        response = emulator.invoke(get_function_url_event("/slow"))
+
+        def iter_content():
+            yield CHUNK
+            # only continue once the emulator has received the first chunk
+            assert response.first_chunk_received.wait(timeout=10)
+            yield CHUNK
+
+        app.get("/slow")(lambda: StreamingResponse(iter_content()))
+        handle_next_invocation(app, LambdaRuntimeApi(emulator.address), event_loop)
+
+    assert response.first_chunk_received_at < response.completed_at
+    assert response.size_bytes > 2 * len(CHUNK)
+
+
+def test_memory_is_bounded(event_loop):  # pylint: disable=redefined-outer-name
+    response_size_bytes = 64 * 1024 * 1024
+    app = FastAPI()
+    app.get("/large")(
+        lambda: StreamingResponse(
+            CHUNK for _ in range(response_size_bytes // len(CHUNK))
+        )
+    )
+
+    with LambdaRuntimeApiEmulator(keep_bodies=False) as emulator:
+        response = emulator.invoke(get_function_url_event("/large"))
+        tracemalloc.start()
+        try:
+            handle_next_invocation(app, LambdaRuntimeApi(emulator.address), event_loop)
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    assert response.size_bytes > response_size_bytes
+    assert peak_bytes < 4 * 1024 * 1024
+
+
+def test_errors_and_warm_up_events(event_loop):  # pylint: disable=redefined-outer-name
+    async def failing_app(scope, receive, send):
+        raise ValueError("boom")
+
+    with LambdaRuntimeApiEmulator() as emulator:
+        runtime_api = LambdaRuntimeApi(emulator.address)
+        error_response = emulator.invoke(get_function_url_event("/"))
+        handle_next_invocation(failing_app, runtime_api, event_loop)
+        warm_up_response = emulator.invoke(
+            {"source": "aws.events", "detail-type": "Scheduled Event"}
+        )
+        handle_next_invocation(failing_app, runtime_api, event_loop)
+
+    assert error_response.error["errorType"] == "ValueError"
+    assert json.loads(warm_up_response.body) == WARM_UP_RESPONSE
@@ -0,0 +1,251 @@
+"""Test on-the-fly response compression."""
+
+import asyncio
+import gzip
+import zlib
+
+import boto3
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api import compression
+from files_api.compression import (
+    CompressionMiddleware,
+    get_at_rest_encoding,
+    is_compressible_content_type,
+    iter_decompressed,
+    negotiate_content_encoding,
+)
+from files_api.main import create_app
+from files_api.s3.write_objects import upload_s3_object
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+from tests.utils import stream_asgi_response
+
+LARGE_TEXT_CONTENT = b"some very compressible log line\n" * 1_000
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected_encoding",
+    [
+        ("gzip", "gzip"),
+        ("gzip, deflate, br, zstd", "zstd"),
+        ("gzip;q=1.0, zstd;q=0.5", "gzip"),
+        ("*", "zstd"),
+        ("*, zstd;q=0", "br"),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_negotiate_content_encoding(accept_encoding: str, expected_encoding: str):
+    supported_encodings = ["zstd", "br", "gzip"]
+    assert (
+        negotiate_content_encoding(accept_encoding, supported_encodings)
+        == expected_encoding
+    )
+
+
+@pytest.mark.parametrize(
+    "content_type, expected",
+    [
+        ("text/plain", True),
+        ("text/csv; charset=utf-8", True),
+        ("application/json", True),
+        ("application/vnd.api+json", True),
+        ("text/event-stream", False),
+        ("image/png", False),
+        ("audio/mpeg", False),
+        ("application/octet-stream", False),
+        (None, False),
+    ],
+)
+def test_is_compressible_content_type(content_type: str, expected: bool):
+    assert is_compressible_content_type(content_type) == expected
+
+
+def test_get_file_is_gzip_compressed(client: TestClient):
+    upload_s3_object(TEST_BUCKET_NAME, "logs/app.log", LARGE_TEXT_CONTENT, "text/plain")
+
+    with client.stream(
+        "GET", "/v1/files/logs/app.log", headers={"Accept-Encoding": "gzip"}
+    ) as response:
+        raw_body = b"".join(response.iter_raw())
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert len(raw_body) < len(LARGE_TEXT_CONTENT)
+    assert gzip.decompress(raw_body) == LARGE_TEXT_CONTENT
+
+
+def test_get_file_is_zstd_compressed(client: TestClient):
+    zstandard = pytest.importorskip("zstandard")
+    upload_s3_object(TEST_BUCKET_NAME, "logs/app.log", LARGE_TEXT_CONTENT, "text/plain")
+
+    with client.stream(
+        "GET", "/v1/files/logs/app.log", headers={"Accept-Encoding": "gzip, zstd"}
+    ) as response:
+        raw_body = b"".join(response.iter_raw())
+
+    assert response.headers["Content-Encoding"] == "zstd"
+    decompressor = zstandard.ZstdDecompressor()
+    assert decompressor.decompressobj().decompress(raw_body) == LARGE_TEXT_CONTENT
+
+
+@pytest.mark.parametrize(
+    "object_key, content, content_type, request_headers",
+    [
+        ("image.png", LARGE_TEXT_CONTENT, "image/png", {}),
+        ("small.txt", b"tiny", "text/plain", {}),
+        ("logs/app.log", LARGE_TEXT_CONTENT, "text/plain", {"Range": "bytes=0-9"}),
+    ],
+)
+def test_get_file_is_not_compressed(
+    client: TestClient,
+    object_key: str,
+    content: bytes,
+    content_type: str,
+    request_headers: dict,
+):
+    upload_s3_object(TEST_BUCKET_NAME, object_key, content, content_type)
+
+    response = client.get(
+        f"/v1/files/{object_key}",
+        headers={"Accept-Encoding": "gzip, br, zstd", **request_headers},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert "Content-Encoding" not in response.headers
+    assert response.content == content
+
+
+@pytest.fixture
+def compressing_client(mocked_aws, mocked_openai):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, compress_uploads_at_rest=True)
+    with TestClient(create_app(settings)) as client:
+        yield client
+
+
+def test_upload_file_is_compressed_at_rest(compressing_client: TestClient):
+    response = compressing_client.put(
+        "/v1/files/logs/app.log",
+        files={"file_content": ("app.log", LARGE_TEXT_CONTENT, "text/plain")},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    stored_object = boto3.client("s3").head_object(
+        Bucket=TEST_BUCKET_NAME, Key="logs/app.log"
+    )
+    assert stored_object["ContentLength"] < len(LARGE_TEXT_CONTENT)
+    assert stored_object["Metadata"]["logical-size"] == str(len(LARGE_TEXT_CONTENT))
+
+    # sizes reported by the API are the logical sizes
+    response = compressing_client.head("/v1/files/logs/app.log")
+    assert response.headers["Content-Length"] == str(len(LARGE_TEXT_CONTENT))
+
+    response = compressing_client.get("/v1/files")
+    assert response.json()["files"][0]["size_bytes"] == len(LARGE_TEXT_CONTENT)
+
+    # unless the stored sizes are asked for, to list without a request per file
+    response = compressing_client.get("/v1/files", params={"logical_sizes": "false"})
+    assert response.json()["files"][0]["size_bytes"] == stored_object["ContentLength"]
+
+    # clients that don't accept the stored encoding get decompressed content
+    response = compressing_client.get(
+        "/v1/files/logs/app.log", headers={"Accept-Encoding": "identity"}
+    )
+    assert "Content-Encoding" not in response.headers
+    assert response.content == LARGE_TEXT_CONTENT
+
+
+def test_get_file_passes_through_stored_encoding(compressing_client: TestClient):
+    stored_encoding = get_at_rest_encoding()
+    upload_s3_object(
+        TEST_BUCKET_NAME, "data.csv", LARGE_TEXT_CONTENT, "text/csv", compress=True
+    )
+
+    with compressing_client.stream(
+        "GET", "/v1/files/data.csv", headers={"Accept-Encoding": stored_encoding}
+    ) as response:
+        raw_body = b"".join(response.iter_raw())
+
+    assert response.headers["Content-Encoding"] == stored_encoding
+    assert b"".join(iter_decompressed([raw_body], stored_encoding)) == (
+        LARGE_TEXT_CONTENT
+    )
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd", "br"])
+def test_streamed_chunks_are_not_held_back(encoding: str):
+    next_chunk_requested = asyncio.Event()
+
+    async def app(scope, receive, send):  # pylint: disable=unused-argument
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"first", "more_body": True})
+        await next_chunk_requested.wait()
+        await send({"type": "http.response.body", "body": b" second"})
+
+    async def read_response():
+        messages = stream_asgi_response(
+            CompressionMiddleware(app),
+            "GET",
+            "/",
+            headers={"Accept-Encoding": encoding},
+        )
+        start = await anext(messages)
+        first_chunk = await anext(messages)
+        next_chunk_requested.set()
+        return start, first_chunk, [message async for message in messages]
+
+    start, first_chunk, rest = asyncio.run(read_response())
+    assert (b"content-encoding", encoding.encode()) in start["headers"]
+
+    # the client can decode the first chunk before the app sends the next one
+    decompress = {
+        "gzip": zlib.decompressobj(16 + zlib.MAX_WBITS).decompress,
+        "zstd": compression.zstandard.ZstdDecompressor().decompressobj().decompress,
+        "br": compression.brotli.Decompressor().process,
+    }[encoding]
+    assert decompress(first_chunk["body"]) == b"first"
+    assert decompress(b"".join(message["body"] for message in rest)) == b" second"
+
+
+def test_decompression_flushes_held_back_output(monkeypatch):
+    class HoldingDecompressor:
+        """Hold back all output until flushed, as decompressors may."""
+
+        def __init__(self) -> None:
+            self.held_back = b""
+
+        def decompress(self, data: bytes) -> bytes:
+            self.held_back += data
+            return b""
+
+        def flush(self) -> bytes:
+            return self.held_back
+
+    monkeypatch.setattr(
+        compression, "create_decompressor", lambda encoding: HoldingDecompressor()
+    )
+    assert b"".join(iter_decompressed([b"held ", b"back"], "gzip")) == b"held back"
+
+
+def test_incompressible_upload_is_stored_as_is(
+    compressing_client: TestClient,
+):  # pylint: disable=unused-argument
+    upload_s3_object(
+        TEST_BUCKET_NAME, "image.png", LARGE_TEXT_CONTENT, "image/png", compress=True
+    )
+
+    stored_object = boto3.client("s3").head_object(
+        Bucket=TEST_BUCKET_NAME, Key="image.png"
+    )
+    assert stored_object["ContentLength"] == len(LARGE_TEXT_CONTENT)
+    assert "stored-encoding" not in stored_object["Metadata"]
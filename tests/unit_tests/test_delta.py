@@ -0,0 +1,76 @@
+"""Test the delta upload algorithm."""
+
+import random
+
+import pytest
+
+from files_api.delta import (
+    CopyBlocks,
+    SendData,
+    compute_block_signatures,
+    compute_delta,
+    get_delta_data,
+)
+
+BLOCK_SIZE = 4096
+CURRENT_CONTENT = random.Random(0).randbytes(25 * BLOCK_SIZE + 1000)
+
+
+def apply_delta(instructions, data: bytes) -> bytes:
+    """Rebuild content from the current content, like the server does."""
+    content, position = b"", 0
+    for instruction in instructions:
+        if isinstance(instruction, CopyBlocks):
+            start = instruction.block_index * BLOCK_SIZE
+            end = start + instruction.block_count * BLOCK_SIZE
+            content += CURRENT_CONTENT[start:end]
+        else:
+            data_end = position + instruction.length
+            content += data[position:data_end]
+            position = data_end
+    return content
+
+
+@pytest.mark.parametrize(
+    "new_content",
+    [
+        CURRENT_CONTENT,
+        CURRENT_CONTENT[:30000] + b"inserted" + CURRENT_CONTENT[30000:],
+        CURRENT_CONTENT[:30000] + CURRENT_CONTENT[31000:],
+        b"prepended" + CURRENT_CONTENT + b"appended",
+        CURRENT_CONTENT[50000:] + CURRENT_CONTENT[:50000],
+        b"",
+        b"completely different",
+    ],
+)
+def test_delta_rebuilds_new_content(new_content: bytes):
+    signatures = compute_block_signatures([CURRENT_CONTENT], BLOCK_SIZE)
+
+    instructions = compute_delta(signatures, BLOCK_SIZE, new_content)
+    data = b"".join(get_delta_data(signatures, instructions, new_content))
+
+    assert apply_delta(instructions, data) == new_content
+
+
+def test_delta_only_sends_changes():
+    signatures = compute_block_signatures(
+        # signatures don't depend on how the content is chunked
+        [
+            CURRENT_CONTENT[start:][:1000]
+            for start in range(0, len(CURRENT_CONTENT), 1000)
+        ],
+        BLOCK_SIZE,
+    )
+    assert signatures == compute_block_signatures([CURRENT_CONTENT], BLOCK_SIZE)
+
+    new_content = CURRENT_CONTENT[:30000] + b"inserted" + CURRENT_CONTENT[30000:]
+    instructions = compute_delta(signatures, BLOCK_SIZE, new_content)
+
+    # only the block containing the insertion is sent, including the short last block
+    sent_bytes = sum(
+        instruction.length
+        for instruction in instructions
+        if isinstance(instruction, SendData)
+    )
+    assert sent_bytes == BLOCK_SIZE + len(b"inserted")
+    assert instructions[-1] == CopyBlocks(block_index=8, block_count=18)
@@ -0,0 +1,45 @@
+"""Test the app-wide error handling."""
+
+import pytest
+from fastapi import (
+    FastAPI,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from files_api.errors import BroadExceptionMiddleware
+
+
+def get_failing_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(BroadExceptionMiddleware)  # type: ignore[call-arg,arg-type]
+
+    @app.get("/fails")
+    async def fails():
+        raise RuntimeError("unforeseen")
+
+    @app.get("/fails-while-streaming")
+    async def fails_while_streaming():
+        def iter_content():
+            yield b"partial "
+            raise RuntimeError("unforeseen")
+
+        return StreamingResponse(iter_content())
+
+    return app
+
+
+def test_exception_before_response_is_a_500():
+    with TestClient(get_failing_app()) as client:
+        response = client.get("/fails")
+
+    assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+    assert response.json() == {"detail": "Internal server error"}
+
+
+def test_exception_while_streaming_is_raised():
+    """The status was already sent, so the response can only be cut short."""
+    with TestClient(get_failing_app()) as client:
+        with pytest.raises(RuntimeError):
+            client.get("/fails-while-streaming")
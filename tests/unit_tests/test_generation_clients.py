@@ -0,0 +1,30 @@
+"""Test the clients shared by requests that generate files."""
+
+from fastapi.testclient import TestClient
+
+from files_api.generation_clients import GenerationClients
+from files_api.main import create_app
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+
+def test_clients_live_as_long_as_the_app(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    settings = Settings(
+        s3_bucket_name=TEST_BUCKET_NAME,
+        generation_client_timeout_seconds=7,
+        generation_client_connect_timeout_seconds=2,
+    )
+    app = create_app(settings)
+
+    with TestClient(app):
+        clients: GenerationClients = app.state.generation_clients
+        openai_client = clients.openai_client
+        http_client = clients.http_client
+        assert clients.openai_client is openai_client
+        assert http_client.timeout.read == 7
+        assert http_client.timeout.connect == 2
+
+    assert http_client.is_closed
+    assert openai_client.is_closed()
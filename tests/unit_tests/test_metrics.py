@@ -0,0 +1,189 @@
+"""Test recording metrics and exposing them."""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.main import create_app
+from files_api.metrics import (
+    DEPENDENCY_CALL_DURATION,
+    MetricsRegistry,
+    instrument_calls,
+)
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+
+def test_histogram_is_rendered_with_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram(
+        "latency_seconds", "Latency.", ["route"], buckets=(0.1, 1)
+    )
+    for value in (0.05, 0.1, 0.5, 2):
+        latency.labels('/a "b"').observe(value)
+
+    assert registry.render_prometheus().splitlines() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a \\"b\\"",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a \\"b\\"",le="1"} 3',
+        'latency_seconds_bucket{route="/a \\"b\\"",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a \\"b\\""} 2.65',
+        'latency_seconds_count{route="/a \\"b\\""} 4',
+    ]
+
+
+def test_metrics_are_added_up_across_processes(tmp_path):
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests.", ["route"])
+    in_flight = registry.gauge("requests_in_flight", "Requests being handled.")
+    registry.share_across_processes(str(tmp_path))
+
+    # a worker forked from this process records, and exits with a request in flight
+    pid = os.fork()
+    if pid == 0:
+        requests.labels("/a").inc(2)
+        in_flight.labels().inc()
+        registry.write_snapshot()
+        os._exit(0)  # pylint: disable=protected-access
+    os.waitpid(pid, 0)
+    requests.labels("/a").inc()
+    requests.labels("/b").inc()
+
+    assert registry.render_prometheus().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/a"} 3',
+        'requests_total{route="/b"} 1',
+        "# HELP requests_in_flight Requests being handled.",
+        "# TYPE requests_in_flight gauge",
+        "requests_in_flight 1",
+    ]
+
+    # what the worker counted is kept once it has exited, but not what it had in flight
+    registry.archive_snapshot(pid)
+    assert registry.render_prometheus().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/a"} 3',
+        'requests_total{route="/b"} 1',
+        "# HELP requests_in_flight Requests being handled.",
+        "# TYPE requests_in_flight gauge",
+    ]
+
+
+def test_emf_reports_what_changed_since_last_drain():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency.", ["route"])
+    requests = registry.counter("requests_total", "Requests.", ["route"])
+    registry.start_recording_emf()
+
+    latency.labels("/a").observe(0.5)
+    latency.labels("/a").observe(1.5)
+    requests.labels("/a").inc(2)
+
+    documents = registry.drain_emf("FilesApi", timestamp_ms=1)
+    assert documents == [
+        {
+            "_aws": {
+                "Timestamp": 1,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": "FilesApi",
+                        "Dimensions": [["route"]],
+                        "Metrics": [{"Name": "latency_seconds", "Unit": "Seconds"}],
+                    }
+                ],
+            },
+            "route": "/a",
+            "latency_seconds": [0.5, 1.5],
+        },
+        {
+            "_aws": {
+                "Timestamp": 1,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": "FilesApi",
+                        "Dimensions": [["route"]],
+                        "Metrics": [{"Name": "requests_total", "Unit": "Count"}],
+                    }
+                ],
+            },
+            "route": "/a",
+            "requests_total": 2,
+        },
+    ]
+    assert not registry.drain_emf("FilesApi")
+
+
+def test_calls_are_recorded_by_outcome():
+    @instrument_calls("test")
+    def divide(dividend, divisor):
+        return dividend / divisor
+
+    @instrument_calls("test")
+    async def fetch():
+        return "content"
+
+    @asynccontextmanager
+    @instrument_calls("test")
+    async def open_stream():
+        yield "stream"
+
+    assert divide(1, 2) == 0.5
+    with pytest.raises(ZeroDivisionError):
+        divide(1, 0)
+    assert asyncio.run(fetch()) == "content"
+
+    async def use_stream():
+        async with open_stream() as stream:
+            assert stream == "stream"
+        with pytest.raises(KeyError):
+            async with open_stream():
+                raise KeyError("failed while the stream was open")
+
+    asyncio.run(use_stream())
+
+    def count(function: str, outcome: str) -> int:
+        return DEPENDENCY_CALL_DURATION.labels("test", function, outcome).count
+
+    assert (count("divide", "ok"), count("divide", "error")) == (1, 1)
+    assert count("fetch", "ok") == 1
+    assert (count("open_stream", "ok"), count("open_stream", "error")) == (1, 1)
+
+
+def test_metrics_endpoint(mocked_aws):  # pylint: disable=unused-argument
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        client.put(
+            "/v1/files/metrics.txt",
+            files={"file_content": ("metrics.txt", b"hello", "text/plain")},
+        )
+        client.get("/v1/files/metrics.txt")
+        client.get("/not-a-route")
+
+        response = client.get("/metrics")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+
+    metrics = response.text
+    assert (
+        'files_api_http_requests_total{method="GET",route="/v1/files/{file_path:path}",status="200"}'
+        in metrics
+    )
+    assert (
+        'files_api_http_requests_total{method="GET",route="unmatched",status="404"}'
+        in metrics
+    )
+    assert (
+        'files_api_http_request_bytes_total{method="PUT",route="/v1/files/{file_path:path}"}'
+        in metrics
+    )
+    assert (
+        'files_api_dependency_call_duration_seconds_count{dependency="s3",function="upload_s3_object",outcome="ok"}'
+        in metrics
+    )
+    assert "files_api_http_requests_in_flight 1" in metrics
@@ -0,0 +1,154 @@
+"""Test the rate limiting and retries of OpenAI calls."""
+
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+import requests  # type: ignore
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.main import create_app
+from files_api.openai_scheduler import (
+    OpenAIRateLimitedError,
+    OpenAIScheduler,
+    TokenBucket,
+    parse_duration_seconds,
+)
+from files_api.schemas import GeneratedFileType
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+MOCK_OPENAI_URL = "http://localhost:5005"
+
+
+def set_mock_rate_limit(fail_next: int) -> None:
+    """Make the next `fail_next` calls to the mocked OpenAI server fail with a 429."""
+    requests.post(
+        f"{MOCK_OPENAI_URL}/mock/rate-limit", json={"fail_next": fail_next}, timeout=5
+    ).raise_for_status()
+
+
+def make_api_error(status_code: int, headers=None) -> openai.APIStatusError:
+    response = httpx.Response(
+        status_code,
+        headers=headers or {},
+        request=httpx.Request("POST", f"{MOCK_OPENAI_URL}/chat/completions"),
+    )
+    error_class = {
+        400: openai.BadRequestError,
+        429: openai.RateLimitError,
+        500: openai.InternalServerError,
+    }[status_code]
+    return error_class("failed", response=response, body=None)
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [("1s", 1), ("120ms", 0.12), ("6m0s", 360), ("1h2m3.5s", 3723.5), ("", None)],
+)
+def test_parse_duration_seconds(value, seconds):
+    assert parse_duration_seconds(value) == seconds
+
+
+def test_token_bucket_queues_when_empty():
+    async def main() -> float:
+        bucket = TokenBucket(capacity=2, refill_per_second=20)
+        await bucket.acquire()
+        await bucket.acquire()
+        return await bucket.acquire()
+
+    waited_seconds = asyncio.run(main())
+    assert 0.03 < waited_seconds < 0.5
+
+
+def test_token_bucket_follows_reported_quota():
+    async def main() -> float:
+        bucket = TokenBucket(capacity=1000, refill_per_second=1000)
+        # the server says the quota is used up for the next 100ms
+        bucket.update(limit=6000, remaining=0, reset_seconds=0.1)
+        assert bucket.capacity == 6000
+        return await bucket.acquire()
+
+    assert asyncio.run(main()) >= 0.09
+
+
+def test_retries_retryable_errors():
+    errors = [make_api_error(429, {"retry-after-ms": "1"}), make_api_error(500)]
+
+    async def send_request():
+        if errors:
+            raise errors.pop(0)
+        return "response"
+
+    scheduler = OpenAIScheduler(
+        requests_per_minute=600, tokens_per_minute=10_000, initial_backoff_seconds=0.01
+    )
+    assert asyncio.run(scheduler.call("model", send_request)) == "response"
+    assert scheduler.stats.calls == 3
+    assert scheduler.stats.retries == 2
+    assert scheduler.stats.rate_limited_responses == 1
+
+
+def test_does_not_retry_other_errors():
+    async def send_request():
+        raise make_api_error(400)
+
+    scheduler = OpenAIScheduler(requests_per_minute=600, tokens_per_minute=10_000)
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(scheduler.call("model", send_request))
+    assert scheduler.stats.calls == 1
+
+
+def test_gives_up_after_max_retries():
+    async def send_request():
+        raise make_api_error(429, {"retry-after": "2"})
+
+    scheduler = OpenAIScheduler(
+        requests_per_minute=600,
+        tokens_per_minute=10_000,
+        max_retries=2,
+        max_backoff_seconds=0.01,
+    )
+    start = time.perf_counter()
+    with pytest.raises(OpenAIRateLimitedError):
+        asyncio.run(scheduler.call("model", send_request))
+    assert scheduler.stats.calls == 3
+    assert time.perf_counter() - start < 1
+
+
+def generate_text(client: TestClient, file_path: str, prompt: str):
+    return client.post(
+        url=f"/v1/files/generated/{file_path}",
+        params={"prompt": prompt, "file_type": GeneratedFileType.TEXT.value},
+    )
+
+
+def test_generation_survives_rate_limiting(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    app = create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))
+    try:
+        set_mock_rate_limit(fail_next=2)
+        with TestClient(app) as client:
+            response = generate_text(client, "poem.txt", "A rate limited poem")
+            assert response.status_code == status.HTTP_201_CREATED
+            assert app.state.generation_clients.openai_scheduler.stats.retries == 2
+    finally:
+        set_mock_rate_limit(fail_next=0)
+
+
+def test_persistent_rate_limiting_is_reported_as_unavailable(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, openai_max_retries=1)
+    try:
+        set_mock_rate_limit(fail_next=10)
+        with TestClient(create_app(settings)) as client:
+            response = generate_text(client, "poem.txt", "Another rate limited poem")
+            assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+            assert response.headers["Retry-After"] == "1"
+    finally:
+        set_mock_rate_limit(fail_next=0)
@@ -0,0 +1,135 @@
+"""Test accounting for the time and S3 calls of each request."""
+
+import json
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from files_api.main import create_app
+from files_api.request_accounting import (
+    RequestAccounting,
+    estimate_s3_cost_usd,
+)
+from files_api.schemas import GeneratedFileType
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+
+def parse_server_timing(header: str) -> dict:
+    """Map each metric of a `Server-Timing` header to its parameters."""
+    metrics = {}
+    for metric in header.split(", "):
+        name, *params = metric.split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+def read_request_accounting_log(capsys) -> list:
+    return [
+        json.loads(line)
+        for line in capsys.readouterr().out.splitlines()
+        if line.startswith('{"type": "request_accounting"')
+    ]
+
+
+def test_s3_cost_is_estimated_by_request_class():
+    cost = estimate_s3_cost_usd(
+        {"GetObject": 1000, "HeadObject": 1000, "PutObject": 1000, "DeleteObject": 1000}
+    )
+    assert cost == pytest.approx(0.0004 + 0.0004 + 0.005)
+
+
+def test_repeated_calls_on_a_resource_are_counted():
+    accounting = RequestAccounting(started_at=0.0)
+    accounting.record_call("s3", "HeadObject", 0.01, resource="bucket/a.txt")
+    accounting.record_call("s3", "GetObject", 0.02, resource="bucket/a.txt")
+    accounting.record_call("s3", "GetObject", 0.02, resource="bucket/b.txt")
+
+    usage = accounting.dependencies["s3"]
+    assert (usage.calls, usage.repeated_calls) == (3, 1)
+    assert usage.operations == {"HeadObject": 1, "GetObject": 2}
+    assert usage.seconds == pytest.approx(0.05)
+
+
+def test_server_timing_header(mocked_aws):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, server_timing_header=True)
+    with TestClient(create_app(settings)) as client:
+        client.put(
+            "/v1/files/timed.txt",
+            files={"file_content": ("timed.txt", b"hello", "text/plain")},
+        )
+        response = client.get("/v1/files/timed.txt")
+        not_found = client.get("/not-a-route")
+
+    assert response.status_code == status.HTTP_200_OK
+    metrics = parse_server_timing(response.headers["Server-Timing"])
+    assert list(metrics) == ["s3", "endpoint", "serialization", "total"]
+    assert metrics["s3"]["desc"].endswith(' calls"')
+    assert float(metrics["s3"]["dur"]) <= float(metrics["endpoint"]["dur"])
+    assert float(metrics["endpoint"]["dur"]) <= float(metrics["total"]["dur"])
+
+    # nothing ran but the app itself
+    assert list(parse_server_timing(not_found.headers["Server-Timing"])) == ["total"]
+
+
+def test_no_accounting_by_default(
+    mocked_aws, capsys
+):  # pylint: disable=unused-argument
+    with TestClient(create_app(Settings(s3_bucket_name=TEST_BUCKET_NAME))) as client:
+        response = client.get("/v1/files")
+
+    assert "Server-Timing" not in response.headers
+    assert read_request_accounting_log(capsys) == []
+
+
+def test_request_accounting_log_shows_s3_calls_and_cost(
+    mocked_aws, capsys
+):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, request_accounting_log=True)
+    with TestClient(create_app(settings)) as client:
+        client.put(
+            "/v1/files/logged.txt",
+            files={"file_content": ("logged.txt", b"hello", "text/plain")},
+        )
+        capsys.readouterr()
+        client.get("/v1/files/logged.txt")
+        client.get("/v1/files")
+
+    read_entry, list_entry = read_request_accounting_log(capsys)
+    assert read_entry["method"] == "GET"
+    assert read_entry["route"] == "/v1/files/{file_path:path}"
+    assert read_entry["status"] == status.HTTP_200_OK
+    assert read_entry["response_bytes"] == len(b"hello")
+    assert read_entry["endpoint_ms"] <= read_entry["duration_ms"]
+
+    # the file is looked up before it is read, which shows as a repeated call
+    s3_usage = read_entry["dependencies"]["s3"]
+    assert s3_usage["operations"]["GetObject"] == 1
+    assert s3_usage["repeated_calls"] == s3_usage["calls"] - 1
+    assert read_entry["estimated_s3_cost_usd"] == pytest.approx(
+        s3_usage["calls"] * 0.0004 / 1000
+    )
+
+    assert list_entry["dependencies"]["s3"]["operations"] == {"ListObjectsV2": 1}
+    assert list_entry["estimated_s3_cost_usd"] == pytest.approx(0.005 / 1000)
+
+
+def test_openai_calls_are_accounted(
+    mocked_aws, mocked_openai
+):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME, server_timing_header=True)
+    with TestClient(create_app(settings)) as client:
+        response = client.post(
+            url="/v1/files/generated/accounted.txt",
+            params={
+                "prompt": "Write a poem",
+                "file_type": GeneratedFileType.TEXT.value,
+                "use_cache": False,
+            },
+        )
+
+    assert response.status_code == status.HTTP_201_CREATED
+    metrics = parse_server_timing(response.headers["Server-Timing"])
+    assert metrics["openai"]["desc"] == '"1 call"'
+    assert "s3" in metrics
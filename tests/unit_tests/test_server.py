@@ -0,0 +1,107 @@
+"""Test the production server."""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from files_api.server import (
+    ServerSettings,
+    get_uvicorn_config,
+)
+from files_api.settings import Settings
+from tests.consts import TEST_BUCKET_NAME
+
+
+def test_uvicorn_config():
+    config = get_uvicorn_config(
+        ServerSettings(workers=2, timeout_keep_alive=90, limit_max_requests=1000),
+        Settings(s3_bucket_name=TEST_BUCKET_NAME),
+    )
+
+    assert (config.loop, config.http) == ("uvloop", "httptools")
+    assert config.timeout_keep_alive == 90
+    assert config.limit_max_requests_jitter == 100
+
+
+@pytest.mark.slow
+def test_serve_with_workers_and_stop_on_sigterm():
+    port = 8765
+    server = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "files_api.server", "--workers", "2"],
+        env={
+            **os.environ,
+            "S3_BUCKET_NAME": TEST_BUCKET_NAME,
+            "SERVER_HOST": "127.0.0.1",
+            "SERVER_PORT": str(port),
+            "SERVER_METRICS_SNAPSHOT_INTERVAL_SECONDS": "0.1",
+        },
+    )
+    try:
+        for _ in range(100):
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/v1/stats/deduplication")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        assert response.status_code == 200
+
+        # each request on a new connection, so they are spread across the workers
+        for _ in range(20):
+            httpx.get(f"http://127.0.0.1:{port}/v1/stats/deduplication")
+        time.sleep(0.5)
+
+        # whichever worker is scraped reports the requests of both
+        requests_total = (
+            'files_api_http_requests_total{method="GET",'
+            'route="/v1/stats/deduplication",status="200"} 21'
+        )
+        for _ in range(5):
+            metrics = httpx.get(f"http://127.0.0.1:{port}/metrics").text
+            assert requests_total in metrics.splitlines()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
+
+
+FAILING_STARTUP_SERVER_PY = """
+import socket
+import sys
+from contextlib import asynccontextmanager
+
+import uvicorn
+from fastapi import FastAPI
+
+from files_api.server import Supervisor
+
+
+@asynccontextmanager
+async def lifespan(app):
+    raise RuntimeError("no")
+    yield
+
+
+config = uvicorn.Config(FastAPI(lifespan=lifespan), host="127.0.0.1", port=0)
+config.load()
+sock = config.bind_socket()
+sys.exit(Supervisor(config, sock, worker_count=2).run())
+"""
+
+
+@pytest.mark.slow
+def test_server_stops_when_workers_fail_to_start():
+    # rather than replace them every second, forever
+    server = subprocess.run(
+        [sys.executable, "-c", FAILING_STARTUP_SERVER_PY],
+        capture_output=True,
+        text=True,
+        timeout=30,
+        check=False,
+    )
+
+    assert server.returncode == 1
+    assert "failed to start; stopping." in server.stderr
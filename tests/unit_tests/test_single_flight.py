@@ -0,0 +1,99 @@
+"""Test sharing concurrent calls with the same key."""
+
+import asyncio
+
+from files_api.single_flight import AsyncSingleFlight
+
+CONCURRENT_CALLERS = 20
+
+
+def test_concurrent_calls_are_shared():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "result"
+
+    async def main():
+        single_flight = AsyncSingleFlight()
+        results = await asyncio.gather(
+            *(single_flight.run("key", fetch) for _ in range(CONCURRENT_CALLERS))
+        )
+        # nothing is cached once the call is over
+        return single_flight, results, await single_flight.run("key", fetch)
+
+    single_flight, results, later_result = asyncio.run(main())
+    assert results == [("result", False)] + [("result", True)] * (
+        CONCURRENT_CALLERS - 1
+    )
+    assert later_result == ("result", False)
+    assert len(calls) == 2
+    assert single_flight.stats.calls == 2
+    assert single_flight.stats.shared_results == CONCURRENT_CALLERS - 1
+
+
+def test_errors_are_shared():
+    async def fetch():
+        await asyncio.sleep(0.1)
+        raise KeyError("missing")
+
+    async def main():
+        single_flight = AsyncSingleFlight()
+        return await asyncio.gather(
+            *(single_flight.run("key", fetch) for _ in range(CONCURRENT_CALLERS)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, KeyError) for result in results)
+
+
+def test_concurrent_coroutines_are_shared():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "result"
+
+    async def main():
+        single_flight = AsyncSingleFlight()
+        first = asyncio.ensure_future(single_flight.run("key", fetch))
+        await asyncio.sleep(0)
+        # the caller that started the run going away does not stop it for the others
+        first.cancel()
+        results = await asyncio.gather(
+            *(single_flight.run("key", fetch) for _ in range(5))
+        )
+        return results, await single_flight.run("key", fetch)
+
+    results, later_result = asyncio.run(main())
+    assert results == [("result", True)] * 5
+    assert later_result == ("result", False)
+    assert len(calls) == 2
+
+
+def test_waiting_for_a_stuck_run_is_bounded():
+    stuck = asyncio.Event()
+
+    async def fetch():
+        if not stuck.is_set():
+            stuck.set()
+            await asyncio.sleep(10)
+        return "result"
+
+    async def main():
+        single_flight = AsyncSingleFlight(wait_timeout_seconds=0.1)
+        first = asyncio.ensure_future(single_flight.run("key", fetch))
+        await stuck.wait()
+        # the second caller gives up on the stuck run, and makes its own
+        result = await single_flight.run("key", fetch)
+        first.cancel()
+        return single_flight, result
+
+    single_flight, result = asyncio.run(main())
+    assert result == ("result", False)
+    assert single_flight.stats.calls == 2
+    assert single_flight.stats.shared_results == 0
+    assert single_flight.stats.wait_timeouts == 1
@@ -0,0 +1,71 @@
+"""Test warming up the Lambda function."""
+
+import asyncio
+import importlib
+
+import pytest
+
+from files_api.generation_clients import GenerationClients
+from files_api.settings import Settings
+from files_api.warm_up import (
+    WARM_UP_RESPONSE,
+    is_warm_up_event,
+    prime_clients,
+)
+from tests.consts import TEST_BUCKET_NAME
+
+
+@pytest.mark.parametrize(
+    "event, expected",
+    [
+        ({"source": "aws.events", "detail-type": "Scheduled Event"}, True),
+        ({"source": "serverless-plugin-warmup"}, True),
+        ({"warm_up": True}, True),
+        ({"httpMethod": "GET", "path": "/v1/files"}, False),
+        ({"source": "aws.s3", "detail-type": "Object Created"}, False),
+        ("not a dict", False),
+    ],
+)
+def test_is_warm_up_event(event, expected: bool):
+    assert is_warm_up_event(event) is expected
+
+
+def test_prime_clients(mocked_aws, mocked_openai):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name=TEST_BUCKET_NAME)
+    generation_clients = GenerationClients(settings)
+    event_loop = asyncio.new_event_loop()
+    try:
+        report = prime_clients(settings, generation_clients, event_loop=event_loop)
+        event_loop.run_until_complete(generation_clients.aclose())
+    finally:
+        event_loop.close()
+
+    assert set(report) == {"message", "s3_seconds", "openai_seconds"}
+
+
+def test_prime_clients_is_best_effort(mocked_aws):  # pylint: disable=unused-argument
+    settings = Settings(s3_bucket_name="missing-bucket", prime_openai_on_start=False)
+
+    event_loop = asyncio.new_event_loop()
+    try:
+        report = prime_clients(
+            settings, GenerationClients(settings), event_loop=event_loop
+        )
+    finally:
+        event_loop.close()
+
+    assert "s3_error" in report
+    assert "openai_seconds" not in report
+
+
+def test_lambda_handler_answers_warm_up_events(
+    mocked_aws, mocked_openai, monkeypatch
+):  # pylint: disable=unused-argument
+    monkeypatch.setenv("S3_BUCKET_NAME", TEST_BUCKET_NAME)
+    aws_lambda_handler = importlib.import_module("files_api.aws_lambda_handler")
+
+    response = aws_lambda_handler.handler(
+        {"source": "aws.events", "detail-type": "Scheduled Event"}, None
+    )
+
+    assert response == WARM_UP_RESPONSE
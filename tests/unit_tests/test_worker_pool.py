@@ -0,0 +1,117 @@
+"""Test the bounded pool of background workers."""
+
+import asyncio
+
+import pytest
+
+from files_api.worker_pool import (
+    WorkerPool,
+    WorkerPoolFullError,
+)
+
+
+def test_concurrency_is_bounded():
+    running = 0
+    max_running = 0
+    finished = 0
+
+    async def job() -> None:
+        nonlocal running, max_running, finished
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        finished += 1
+
+    async def main() -> None:
+        pool = WorkerPool(concurrency=2, max_queued=10)
+        pool.start()
+        for _ in range(6):
+            pool.submit(job)
+        await pool.aclose()
+
+    asyncio.run(main())
+
+    assert max_running == 2
+    assert finished == 6
+
+
+def test_full_queue_refuses_jobs():
+    async def main() -> None:
+        pool = WorkerPool(concurrency=1, max_queued=1)
+        # no workers started, so the first job stays queued
+        pool.submit(asyncio.sleep)  # type: ignore[arg-type]
+        assert pool.is_full()
+        with pytest.raises(WorkerPoolFullError):
+            pool.submit(asyncio.sleep)  # type: ignore[arg-type]
+
+    asyncio.run(main())
+
+
+def test_failing_jobs_do_not_stop_workers():
+    finished = []
+
+    async def failing_job() -> None:
+        raise RuntimeError("job failed")
+
+    async def job() -> None:
+        finished.append(True)
+
+    async def main() -> None:
+        pool = WorkerPool(concurrency=1, max_queued=10)
+        pool.start()
+        pool.submit(failing_job)
+        pool.submit(job)
+        await pool.aclose()
+
+    asyncio.run(main())
+
+    assert finished == [True]
+
+
+def test_close_cancels_jobs_after_timeout():
+    cancelled = []
+
+    async def slow_job() -> None:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main() -> None:
+        pool = WorkerPool(concurrency=1, max_queued=10)
+        pool.start()
+        pool.submit(slow_job)
+        await asyncio.sleep(0)
+        await pool.aclose(timeout_seconds=0.01)
+
+    asyncio.run(main())
+
+    assert cancelled == [True]
+
+
+def test_close_drops_queued_jobs_after_timeout():
+    started = []
+    dropped = []
+
+    async def slow_job() -> None:
+        started.append(True)
+        await asyncio.sleep(10)
+
+    async def on_drop() -> None:
+        dropped.append(True)
+
+    async def main() -> None:
+        pool = WorkerPool(concurrency=1, max_queued=10)
+        pool.start()
+        pool.submit(slow_job, on_drop=on_drop)
+        pool.submit(slow_job, on_drop=on_drop)
+        await asyncio.sleep(0)
+        await pool.aclose(timeout_seconds=0.01)
+        assert pool.queued == 0
+
+    asyncio.run(main())
+
+    assert started == [True]
+    assert dropped == [True]
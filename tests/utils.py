@@ -1,6 +1,17 @@
 """Define testing utility functions."""
 
+import asyncio
+from typing import (
+    AsyncIterator,
+    Dict,
+    Optional,
+)
+
 import boto3
+from starlette.types import (
+    ASGIApp,
+    Message,
+)
 
 
 def delete_s3_bucket(bucket_name: str) -> None:
@@ -11,3 +22,61 @@ def delete_s3_bucket(bucket_name: str) -> None:
     bucket.objects.all().delete()
 
     bucket.delete()
+
+
+async def stream_asgi_response(  # pylint: disable=too-many-arguments
+    app: ASGIApp,
+    method: str,
+    path: str,
+    query_string: bytes = b"",
+    headers: Optional[Dict[str, str]] = None,
+    body: bytes = b"",
+) -> AsyncIterator[Message]:
+    """
+    Send a request straight to an ASGI app, yielding response messages as they are sent.
+
+    Unlike `TestClient`, which waits for the whole response, this lets tests check what
+    a client receives while the app is still streaming.
+    """
+    messages: asyncio.Queue = asyncio.Queue()
+    request_messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive() -> Message:
+        if request_messages:
+            return request_messages.pop()
+        await asyncio.Event().wait()  # the client never disconnects
+        raise AssertionError("unreachable")
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "client": ("testclient", 50000),
+        "root_path": "",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string,
+        "headers": [
+            (name.lower().encode(), value.encode())
+            for name, value in (headers or {}).items()
+        ],
+    }
+
+    async def run_app() -> None:
+        await app(scope, receive, messages.put)
+
+    task = asyncio.create_task(run_app())
+    try:
+        while True:
+            message = await asyncio.wait_for(messages.get(), timeout=5)
+            yield message
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                break
+        await task
+    finally:
+        task.cancel()